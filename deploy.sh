@@ -1,3 +1,3 @@
-docker-compose build django
+docker-compose build django reconciler retention
 docker build -f deploy/playwright.Dockerfile -t dj_pw_officesud_worker:latest .
-docker-compose up -d django
+docker-compose up -d django reconciler retention
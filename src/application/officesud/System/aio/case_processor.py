@@ -0,0 +1,284 @@
+# System/aio/case_processor.py
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright
+from ..case_processor import (
+    LEASE_SECONDS,
+    MAX_CASE_ATTEMPTS,
+    MAX_CONSECUTIVE_FAILURES,
+    RETRY_POLL_SECONDS,
+    SLOW_MO_MS,
+    VIEWPORT,
+    CaseProcessor,
+    iter_participants,
+)
+from ..control import BatchCancelled
+from .. import errors
+from ..heartbeat import Heartbeat
+from ..logger import get_logger
+from .. import sqlite
+from .filler import AsyncFiller
+
+log = get_logger("AsyncCaseProcessor")
+
+# Сколько дел одновременно ведёт один процесс (по контексту браузера на дело)
+ASYNC_CONCURRENCY = int(os.environ.get("OFFICESUD_ASYNC_CONCURRENCY", "4"))
+
+
+class AsyncCaseProcessor(CaseProcessor):
+    """
+    CaseProcessor на asyncio и playwright.async_api: один процесс, один драйвер
+    и один браузер ведут concurrency дел сразу — каждое в своём контексте
+    с общей сессией кабинета. Дела берутся в аренду так же, как у sync-движка,
+    поэтому оба движка могут разбирать один пакет одновременно.
+
+    Вызовы SQLite и токены лимитов идут в потоках (asyncio.to_thread), паузы —
+    через asyncio.sleep. Постоянный профиль браузера, конвейер, трассы сбоев
+    и перезапуск контекста по памяти есть только у sync-движка.
+    """
+
+    def __init__(
+        self,
+        batch_id,
+        stop_event,
+        heartbeat: Heartbeat = None,
+        lease_seconds: float = LEASE_SECONDS,
+        max_attempts: int = MAX_CASE_ATTEMPTS,
+        concurrency: int = ASYNC_CONCURRENCY,
+    ):
+        super().__init__(
+            batch_id,
+            stop_event,
+            heartbeat=heartbeat,
+            lease_seconds=lease_seconds,
+            max_attempts=max_attempts,
+            pipeline=False,
+        )
+        self.concurrency = max(1, concurrency)
+        self._fillers = []
+        self._failed = False
+        self._failures = 0
+
+    def _claim(self):
+        """Одно дело в аренду; вызывается из потока, поэтому без общего генератора _iter_cases."""
+        case_data = sqlite.claim_case(
+            self.heartbeat.worker_id,
+            self.lease_seconds,
+            batch_id=self.batch_id,
+            max_attempts=self.max_attempts,
+        )
+        if case_data is not None and case_data.get("AttemptCount", 1) > 1:
+            log.info("Дело %s: попытка %s", case_data["InternalID"], case_data["AttemptCount"])
+        return case_data
+
+    def _step_details(self):
+        details = self.pacer.metrics()
+        details.update(self.watchdog.metrics())
+        for filler in self._fillers:
+            for key, value in filler.take_form_metrics().items():
+                details[key] = details.get(key, 0) + value
+        waited = self.governor.take_waited()
+        if waited:
+            details["rate_wait_ms"] = int(waited * 1000)
+        details["concurrency"] = self.concurrency
+        return details
+
+    @asynccontextmanager
+    async def _step(self, case_data, step, cancellable=True):
+        if cancellable:
+            self._checkpoint()
+        self.heartbeat.update(step=step, internal_id=case_data["InternalID"])
+        started = time.monotonic()
+        status, error = "ok", None
+        try:
+            yield
+        except BatchCancelled:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            status, error = "error", f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            event = self._step_event(case_data, step, status, error, started)
+            try:
+                await asyncio.to_thread(self._record_event, event)
+            except Exception:
+                log.exception("Failed to record step event %s for %s", step, case_data["InternalID"])
+
+    async def _process_single_case(self, filler, case_data):
+        internal_id = case_data["InternalID"]
+        self._check_case(case_data)
+
+        async with self._step(case_data, "open_form"):
+            await filler.open_lawsuit_filing_form(case_data["RegionID"], case_data["CourtID"])
+
+        async with self._step(case_data, "participants"):
+            await self._add_participants(filler, case_data)
+
+        self._checkpoint()
+        if not await asyncio.to_thread(self._renew_lease, case_data):
+            log.warning("Дело %s не подано: аренда потеряна", internal_id)
+            await filler.return_to_cabinet_home()
+            return
+        async with self._step(case_data, "payment_and_lawsuit", cancellable=False):
+            await filler.fill_payment_and_lawsuit_data(
+                PaymentDocPath=case_data["PaymentDocPath"],
+                MainDocPath=case_data["MainDocPath"],
+                OtherDocPath=case_data["OtherDocPath"],
+                ClaimSummary=case_data["ClaimSummary"],
+                ClaimBasis=case_data["ClaimBasis"],
+                ClaimAmount=case_data["ClaimAmount"],
+                StateDuty=case_data["StateDuty"],
+            )
+
+        async with self._step(case_data, "save_talon", cancellable=False):
+            talon_id = await filler.read_talonid(internal_id)
+            if not talon_id:
+                raise errors.SubmittedWithoutTalon(f"Талон дела {internal_id} не получен после отправки формы")
+            if not await asyncio.to_thread(self._save_talon, case_data, talon_id):
+                raise errors.SubmittedWithoutTalon(
+                    f"Дело {internal_id} подано, талон {talon_id} не записан: аренда потеряна"
+                )
+            case_data["TalonID"] = talon_id
+            log.info("TalonID successfully saved for internal_id=%s", internal_id)
+        log.info("Дело %s успешно подготовлено.", internal_id)
+        self.heartbeat.case_done()
+        self.watchdog.case_done()
+
+        async with self._step(case_data, "return_home"):
+            await filler.return_to_cabinet_home()
+
+    async def _add_participants(self, filler, data):
+        for role, index, participant in iter_participants(data):
+            self._checkpoint()
+            self.heartbeat.update(step=f"participant:{role}:{index}")
+            await filler.add_participant(**participant)
+
+    async def _login(self, browser):
+        """Вход один раз на процесс; возвращает storage_state для контекстов всех дел."""
+        session_state = self.session.load()
+        context = await browser.new_context(viewport=VIEWPORT, storage_state=session_state)
+        try:
+            filler = AsyncFiller(await context.new_page(), governor=self.governor, pacer=self.pacer)
+            self.heartbeat.update(step="login")
+            started = time.monotonic()
+            resumed = session_state is not None and await filler.resume_session()
+            if not resumed:
+                if session_state is not None:
+                    log.info("Saved session for %s expired on the site", self.session.account)
+                    self.session.invalidate()
+                await filler.starting_process()
+                if await filler.wait_for_login():
+                    self.session.save_state(await context.storage_state())
+            log.info(
+                "Logged in (%s) in %.1f sec",
+                "saved session" if resumed else "full login",
+                time.monotonic() - started,
+            )
+            return await context.storage_state()
+        finally:
+            await context.close()
+
+    async def _fresh_page(self, context, filler):
+        """Сбой дела: следующее дело этой полосы идёт на новой вкладке того же контекста."""
+        try:
+            await filler.page.close()
+        except Exception:
+            log.debug("Failed to close page of failed case", exc_info=True)
+        fresh = AsyncFiller(await context.new_page(), governor=self.governor, pacer=self.pacer)
+        self._fillers[self._fillers.index(filler)] = fresh
+        await fresh.open_cabinet()
+        return fresh
+
+    async def _lane(self, lane, browser, storage_state):
+        context = await browser.new_context(viewport=VIEWPORT, storage_state=storage_state)
+        try:
+            filler = AsyncFiller(await context.new_page(), governor=self.governor, pacer=self.pacer)
+            self._fillers.append(filler)
+            if not await filler.resume_session():
+                raise RuntimeError(f"Lane {lane}: cabinet did not open with the shared session")
+
+            # после сбоя всего воркера в соседней полосе новые дела не берём, текущее доводим до конца
+            while not self._failed:
+                # пауза — до аренды: на паузе полоса не держит дел
+                await asyncio.to_thread(self._wait_while_paused)
+                if self.stop_event.is_set():
+                    return
+                case_data = await asyncio.to_thread(self._claim)
+                if case_data is None:
+                    # свежих дел нет: ждём очередь повторов, проверяя отмену
+                    delay = await asyncio.to_thread(self._next_retry_in)
+                    if delay is None:
+                        return
+                    self.heartbeat.update(step="retry_wait", internal_id=None)
+                    await asyncio.sleep(min(max(delay, 0.5), RETRY_POLL_SECONDS))
+                    continue
+
+                log.info("Lane %s: начало дела № %s", lane, case_data["InternalID"])
+                try:
+                    await self._process_single_case(filler, case_data)
+                except BaseException as e:
+                    if isinstance(e, BatchCancelled) or not isinstance(e, Exception):
+                        if not case_data.get("TalonID"):
+                            failed = not isinstance(e, (BatchCancelled, asyncio.CancelledError))
+                            await asyncio.to_thread(self._release_case, case_data, failed=failed)
+                        raise
+                    if case_data.get("TalonID"):
+                        log.exception("Case %s filed, but returning home failed", case_data["InternalID"])
+                    else:
+                        await asyncio.to_thread(self._fail_case, case_data, e, filler.submitted)
+                        self._failures += 1
+                        if self._failures >= MAX_CONSECUTIVE_FAILURES:
+                            raise RuntimeError(
+                                f"{self._failures} дел подряд не поданы, последний сбой: {type(e).__name__}: {e}"
+                            ) from e
+                    filler = await self._fresh_page(context, filler)
+                    continue
+                self._failures = 0
+        except BatchCancelled:
+            raise
+        except Exception:
+            self._failed = True
+            raise
+        finally:
+            await context.close()
+
+    async def run_async(self):
+        async with async_playwright() as playwright:
+            from ..config import HEADLESS
+
+            browser = await playwright.chromium.launch(headless=HEADLESS, slow_mo=SLOW_MO_MS, channel="chrome")
+            try:
+                storage_state = await self._login(browser)
+                results = await asyncio.gather(
+                    *(self._lane(lane, browser, storage_state) for lane in range(self.concurrency)),
+                    return_exceptions=True,
+                )
+            finally:
+                await browser.close()
+
+        errors = [result for result in results if isinstance(result, BaseException)]
+        for error in errors:
+            if not isinstance(error, BatchCancelled):
+                raise error
+        if errors:
+            raise errors[0]
+
+    def run_process(self):
+        if not self._has_work():
+            return
+
+        self.heartbeat.start()
+        try:
+            asyncio.run(self.run_async())
+        except BatchCancelled:
+            log.info("Пакет %s отменён, незавершённые дела не поданы.", self.batch_id)
+            self.heartbeat.stop(step="cancelled")
+            return
+        except Exception as e:
+            self.heartbeat.error(f"{type(e).__name__}: {e}")
+            self.heartbeat.stop(step="failed")
+            raise
+        self.heartbeat.stop(step="cancelled" if self.stop_event.is_set() else "finished")
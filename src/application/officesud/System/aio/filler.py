@@ -0,0 +1,359 @@
+# System/aio/filler.py
+import time
+from typing import Awaitable, Callable, Optional
+from playwright.async_api import Page, TimeoutError
+from ..logger import get_logger
+from ..filler import (
+    CABINET_URL,
+    COURT_LABEL,
+    FILING_FORM_URL,
+    LOGIN_TIMEOUT,
+    REGION_LABEL,
+    SITE_URL,
+    TALON_POLL_MS,
+    TALON_WAIT_SECONDS,
+    Filler,
+)
+from ..governor import RateGovernor
+from ..pacing import AdaptivePacer
+from ..talon import AsyncTalonCapture, parse_talon_xml
+from .modal import AsyncParticipantModal
+from .uploader import AsyncFileUploader
+
+log = get_logger("AsyncFiller")
+
+
+class AsyncFiller(Filler):
+    """
+    Filler на playwright.async_api: те же шаги формы и те же метрики
+    повторного использования формы, но каждое действие — корутина, поэтому
+    на одном цикле событий и одном драйвере Playwright идут сразу несколько дел.
+    """
+
+    def __init__(
+        self,
+        page: Page,
+        governor: Optional[RateGovernor] = None,
+        pacer: Optional[AdaptivePacer] = None,
+    ):
+        super().__init__(page, governor=governor, pacer=pacer)
+        self.uploader = AsyncFileUploader(page, self.pacer)
+        self.modal = AsyncParticipantModal(page, self.pacer)
+        self.talon_capture = AsyncTalonCapture(page)
+
+    async def throttle(self, court_id=None):
+        if self.governor is not None:
+            await self.governor.acquire_async(court_id)
+
+    async def wait_loader(self, timeout: int = 100000):
+        loader = self.page.locator(".loader")
+        if await loader.count() > 0:
+            log.debug("Waiting for loader to disappear (timeout=%s ms)", timeout)
+            started = time.monotonic()
+            try:
+                await loader.wait_for(state="hidden", timeout=timeout)
+            except TimeoutError:
+                self.pacer.failure("loader_timeout")
+                raise
+            self.pacer.observe("loader", time.monotonic() - started)
+        else:
+            log.debug("Loader element not found, skipping wait")
+        sleep_time = await self.pacer.pause_async(1, 2)
+        log.debug("Extra sleep after loader: %.2f sec", sleep_time)
+
+    async def _current_value(self, locator) -> Optional[str]:
+        try:
+            return await locator.input_value(timeout=2000)
+        except Exception:
+            return None
+
+    async def select(
+        self,
+        label: str,
+        value,
+        settle: Optional[Callable[[], Awaitable]] = None,
+        reuse: bool = True,
+    ) -> bool:
+        value = str(value)
+        locator = self.page.get_by_label(label)
+        if reuse and self.form_reuse and await self._current_value(locator) == value:
+            log.debug("Form reuse: '%s' already set to %s", label, value)
+            self._form_reused += 1
+            self._form_saved += self._select_cost.get(label, 0.0)
+            return False
+
+        started = time.monotonic()
+        await locator.select_option(value)
+        if settle is not None:
+            await settle()
+        cost = time.monotonic() - started
+        previous = self._select_cost.get(label)
+        self._select_cost[label] = cost if previous is None else (previous + cost) / 2
+        return True
+
+    async def starting_process(self):
+        log.info("Opening cabinet home page")
+        await self.throttle()
+        await self.page.goto(f"{SITE_URL}/", timeout=0)
+
+    async def is_logged_in(self, timeout: float = 15000) -> bool:
+        try:
+            await self.page.get_by_role("link", name="Құжаттарды жіберу").wait_for(state="visible", timeout=timeout)
+            return True
+        except TimeoutError:
+            return False
+
+    async def wait_for_login(self) -> bool:
+        log.info("Waiting up to %.0f sec for login", LOGIN_TIMEOUT)
+        return await self.is_logged_in(timeout=LOGIN_TIMEOUT * 1000)
+
+    async def resume_session(self) -> bool:
+        log.info("Resuming saved session")
+        await self.throttle()
+        await self.page.goto(CABINET_URL)
+        return await self.is_logged_in()
+
+    async def _open_form_by_deep_link(self) -> bool:
+        await self.throttle()
+        await self.page.goto(FILING_FORM_URL)
+        try:
+            await self.page.get_by_label("Сот ісін жүргізу түрі").wait_for(state="visible", timeout=15000)
+            return True
+        except TimeoutError:
+            log.warning("Deep link %s did not open the filing form, falling back to cabinet", FILING_FORM_URL)
+            await self.throttle()
+            await self.page.goto(CABINET_URL)
+            return False
+
+    async def open_lawsuit_filing_form(self, RegionID, CourtID):
+        log.info("Opening lawsuit filing form (RegionID=%s, CourtID=%s)", RegionID, CourtID)
+        await self.page.wait_for_load_state("domcontentloaded", timeout=0)
+        self.court_id = None
+        self.last_talon_id = None
+        self.submitted = False
+
+        if not (FILING_FORM_URL and await self._open_form_by_deep_link()):
+            await self.throttle()
+            await self.page.get_by_role("link", name="Құжаттарды жіберу").click()
+            await self.wait_loader()
+
+        await self.select("Сот ісін жүргізу түрі", "CIVIL", settle=self.wait_loader)
+
+        await self.select("Саты", "FIRSTINSTANCE")
+        await self.select("Құжат түрі", "3", settle=self.wait_loader)
+
+        await self.throttle()
+        await self.page.get_by_role("button", name="Жіберу").click()
+        await self.wait_loader()
+
+        await self.select("Іс бойынша іс жүргізу түрі", "2", settle=self.wait_loader)
+        await self.select("Іс санаты", "27", settle=self.wait_loader)
+        await self.select("Арыз сипаты", "1", settle=self.wait_loader)
+
+        max_retries = 3
+        for attempt in range(max_retries):
+            await self.throttle(CourtID)
+            try:
+                log.debug("Attempt %s to select Region/Court", attempt + 1)
+                reuse = attempt == 0
+                await self.select(REGION_LABEL, RegionID, settle=lambda: self.pacer.pause_async(1, 2), reuse=reuse)
+                court_selector = self.page.get_by_label(COURT_LABEL)
+                if await court_selector.is_visible(timeout=10000):
+                    await self.select(COURT_LABEL, CourtID, settle=lambda: self.pacer.pause_async(2, 3), reuse=reuse)
+                    self.court_id = CourtID
+                    log.info("Region/Court successfully selected")
+                    return
+                else:
+                    log.warning("Court selector not visible on attempt %s", attempt + 1)
+            except Exception:
+                self.pacer.failure("court_select")
+                log.exception("Error while selecting Region/Court on attempt %s", attempt + 1)
+
+            if attempt < max_retries - 1:
+                log.debug("Retrying region/court selection")
+                await self.page.get_by_label("Іс бойынша іс жүргізу түрі").select_option("2")
+                await self.page.get_by_label("Іс санаты").select_option("27")
+                await self.page.get_by_label("Арыз сипаты").select_option("1")
+                await self.pacer.pause_async(1, 2)
+            else:
+                log.error("Failed to select region and court after %s attempts", max_retries)
+                raise Exception("Не удалось выбрать регион и суд после нескольких попыток.")
+
+    async def add_participant(
+        self,
+        side_value,
+        participant_type,
+        id_value,
+        address="",
+        bank_details="",
+        phone="",
+        email="",
+    ):
+        is_jur = str(participant_type).strip() in ["1", "True", "true", "TRUE"]
+        log.info(
+            "Adding participant: side=%s, is_juridical=%s, id_value=%s",
+            side_value,
+            is_jur,
+            id_value,
+        )
+        MAX_ATTEMPTS = 3
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                log.debug("add_participant attempt %s", attempt)
+                if not await self.modal.add_participant(side_value=side_value, is_juridical=is_jur):
+                    raise RuntimeError(
+                        "First modal step failed to proceed (did not open/disappeared)."
+                    )
+                if is_jur:
+                    await self.modal.fill_juridical_data(
+                        bin_num=id_value,
+                        address=address,
+                        bank_details=bank_details or "",
+                    )
+                else:
+                    await self.modal.fill_physical_data(
+                        iin=id_value,
+                        phone=phone or "",
+                        email=email or "",
+                    )
+                await self.pacer.pause_async(1, 3)
+                log.info("Participant added successfully")
+                return
+            except (RuntimeError, TimeoutError) as e:
+                self.pacer.failure("modal_runtime_error")
+                log.warning("Participant modal %s on attempt %s", type(e).__name__, attempt)
+                if attempt == MAX_ATTEMPTS:
+                    log.error("Giving up after %s attempts", MAX_ATTEMPTS)
+                    raise
+                await self.pacer.pause_async(1, 3)
+                continue
+            except Exception:
+                log.exception("Unexpected error during add_participant on attempt %s", attempt)
+                raise
+        await self.pacer.pause_async(1, 2)
+
+    async def fill_payment_and_lawsuit_data(
+        self,
+        PaymentDocPath,
+        MainDocPath,
+        OtherDocPath,
+        ClaimSummary,
+        ClaimBasis,
+        ClaimAmount,
+        StateDuty,
+    ):
+        log.info(
+            "Filling payment and lawsuit data: ClaimAmount=%s, StateDuty=%s, "
+            "PaymentDocPath=%s, MainDocPath=%s, OtherDocPath=%s",
+            ClaimAmount,
+            StateDuty,
+            PaymentDocPath,
+            MainDocPath,
+            OtherDocPath,
+        )
+        self.talon_capture.start()
+        await self.throttle(self.court_id)
+        await self.page.locator(".button-orange").get_by_text("Ары қарай").click()
+        await self.wait_loader()
+
+        await self.page.get_by_role("combobox").first.select_option("2")
+        await self.wait_loader()
+
+        await self.page.locator("input[name$=':edit-totalSum']").fill(str(ClaimAmount))
+        await self.wait_loader()
+        await self.page.locator("input[name$=':edit-duty']").fill(str(StateDuty))
+
+        log.debug("Uploading payment documents")
+        await self.uploader.handle_payment_files(PaymentDocPath)
+        await self.wait_loader()
+
+        await self.throttle(self.court_id)
+        await self.page.locator(".button-orange").get_by_text("Ары қарай").click()
+        await self.wait_loader()
+
+        text_areas = self.page.locator("textarea")
+        ta_count = await text_areas.count()
+        log.debug("Found %s textareas on lawsuit page", ta_count)
+
+        if ta_count >= 1:
+            await text_areas.nth(0).fill(ClaimSummary)
+            await self.pacer.pause_async(1, 2)
+        if ta_count >= 2:
+            await text_areas.nth(1).fill(ClaimBasis)
+            await self.pacer.pause_async(1, 2)
+
+        log.debug("Uploading main and additional documents")
+        await self.uploader.upload_file("Талап арызды жүктеу", MainDocPath)
+        await self.pacer.pause_async(1, 2)
+        await self.uploader.upload_file("Файлды қоса тіркеу", OtherDocPath)
+
+        try:
+            await self.page.locator(".loader").wait_for(state="hidden", timeout=60000)
+        except TimeoutError:
+            self.pacer.failure("upload_timeout")
+            log.warning("Timeout while waiting for loader after file upload")
+
+        await self.pacer.pause_async(1, 2)
+        await self.wait_loader()
+
+        log.debug("Clicking 'Ары қарай' to proceed to next step (before talon)")
+        await self.throttle(self.court_id)
+        await self.page.locator(".button-orange").get_by_text("Ары қарай").click()
+        self.submitted = True
+        await self.page.wait_for_load_state("load")
+        log.info("Payment and lawsuit data filled; moved to next page")
+
+    async def _read_talon_from_dom(self, internal_id: str) -> Optional[str]:
+        locator = self.page.locator("#xmlToSign0")
+        if await locator.count() == 0:
+            log.debug("#xmlToSign0 element not found yet (internal_id=%s)", internal_id)
+            return None
+        xml_value = await locator.get_attribute("value")
+        if not xml_value or not xml_value.strip():
+            log.debug("xmlToSign0.value is empty yet (internal_id=%s)", internal_id)
+            return None
+        return parse_talon_xml(xml_value)
+
+    async def read_talonid(self, internal_id: str, timeout: float = TALON_WAIT_SECONDS) -> Optional[str]:
+        log.info("Attempting to read TalonID for internal_id=%s", internal_id)
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                talon_id = self.talon_capture.talon_id
+                if talon_id is None:
+                    try:
+                        talon_id = await self._read_talon_from_dom(internal_id)
+                    except Exception:
+                        log.exception("Unexpected error while reading #xmlToSign0 for internal_id=%s", internal_id)
+                if talon_id:
+                    log.info("Parsed TalonID='%s' for internal_id=%s", talon_id, internal_id)
+                    self.last_talon_id = talon_id
+                    return talon_id
+                if time.monotonic() >= deadline:
+                    log.warning("TalonID not found within %.0f sec for internal_id=%s", timeout, internal_id)
+                    return None
+                await self.page.wait_for_timeout(TALON_POLL_MS)
+        finally:
+            self.talon_capture.stop()
+
+    async def open_cabinet(self):
+        if FILING_FORM_URL:
+            return
+        log.info("Returning to cabinet home page")
+        await self.throttle()
+        await self.page.goto(CABINET_URL)
+        await self.page.get_by_role("link", name="Құжаттарды жіберу").wait_for(
+            state="visible", timeout=20000
+        )
+
+    async def return_to_cabinet_home(self):
+        wait_sec = await self.pacer.pause_async(2, 3) if self.last_talon_id else await self.pacer.pause_async(10, 15)
+        log.debug("Waited %.2f sec before returning to cabinet home", wait_sec)
+
+        if FILING_FORM_URL:
+            return
+
+        await self.open_cabinet()
+
+        after_wait_sec = await self.pacer.pause_async(5, 7)
+        log.debug("Extra wait after cabinet home load: %.2f sec", after_wait_sec)
@@ -0,0 +1,198 @@
+# System/aio/modal.py
+import logging
+import re
+import time
+from typing import Any, Dict, Optional, Sequence
+
+from playwright.async_api import Locator, expect
+
+from ..modal import BULK_FILL_JS, PROBE_JS, ParticipantModal, field_ready
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncParticipantModal(ParticipantModal):
+    """
+    ParticipantModal на playwright.async_api: селекторы и конструктор общие
+    с sync-версией, все шаги модалки — корутины.
+    """
+
+    async def probe(self, modal_selector: str, fields: Sequence[str] = ()) -> Dict[str, Any]:
+        return await self.page.evaluate(PROBE_JS, self._probe_args(modal_selector, fields))
+
+    async def _settle(
+        self,
+        modal_selector: str,
+        modal_name: str,
+        fields: Sequence[str] = (),
+        richfaces: bool = False,
+    ) -> Dict[str, Any]:
+        state = await self.probe(modal_selector, fields)
+        waited = 0
+        if state["loader_busy"]:
+            await self._wait_for_loader()
+            waited += 1
+        if richfaces and not state["richfaces_idle"]:
+            await self._wait_for_richfaces_stop()
+            waited += 1
+        if waited:
+            state = await self.probe(modal_selector, fields)
+        self.calls_saved += (2 + richfaces) - (1 + waited + (1 if waited else 0))
+        return self._require_modal(state, modal_selector, modal_name)
+
+    async def fill_fields(self, modal_selector: str, modal_name: str, values: Dict[str, str]) -> None:
+        if self.bulk_fill:
+            result = await self.page.evaluate(BULK_FILL_JS, {"modal": modal_selector, "values": values})
+            self._require_modal(result, modal_selector, modal_name)
+            if result["filled"]:
+                self.calls_saved += 2 * len(values) - 1
+                await self.pacer.pause_async(1, 2)
+                return
+            self.calls_saved -= 1
+            logger.debug("Bulk fill skipped, fields not ready: %s", result["missing"])
+
+        for selector, value in values.items():
+            await self.page.locator(selector).fill(value)
+            await self.pacer.pause_async(1, 2)
+            await self._check_modal_visibility(modal_selector, modal_name)
+
+    async def _wait_for_loader(self, timeout: int = 15000) -> None:
+        started = time.monotonic()
+        try:
+            await expect(self.page.locator(self.LOADER)).to_have_class(re.compile(r'd-none'), timeout=timeout)
+        except Exception:
+            self.pacer.failure("loader_timeout")
+            logger.warning("Loader did not disappear, continuing execution.")
+        else:
+            self.pacer.observe("loader", time.monotonic() - started)
+
+    async def _wait_for_richfaces_stop(self, timeout: int = 15000) -> None:
+        started = time.monotonic()
+        try:
+            await self.page.locator(self.RICHFACES_STATUS_STOP).wait_for(state="attached", timeout=timeout)
+            logger.info("RichFaces AJAX stop indicator found.")
+        except Exception:
+            self.pacer.failure("richfaces_timeout")
+            logger.warning("RichFaces AJAX stop indicator not found/not attached in time.")
+        else:
+            self.pacer.observe("richfaces", time.monotonic() - started)
+
+    async def _handle_modal_click(self, button: Locator) -> None:
+        await self._wait_for_loader()
+
+        if await button.is_visible():
+            await button.click()
+            await self._wait_for_richfaces_stop()
+            return
+
+        await self.page.locator('body').focus()
+
+        if await button.is_visible():
+            await button.click()
+            await self._wait_for_richfaces_stop()
+            return
+
+        logger.warning("Add participant button still not visible. Clicking with force=True.")
+        await button.click(force=True)
+        await self._wait_for_richfaces_stop()
+
+    async def _check_modal_visibility(self, modal_selector: str, modal_name: str) -> None:
+        visible = await self.page.locator(modal_selector).is_visible()
+        self._require_modal({"modal": visible}, modal_selector, modal_name)
+
+    async def _handle_modal_fill_and_next(self, modal_locator: str, next_button_locator: str) -> bool:
+        await self._check_modal_visibility(modal_locator, "Select Side Modal")
+        await self.page.locator(next_button_locator).click()
+        await self._wait_for_richfaces_stop()
+        return True
+
+    async def add_participant(self, side_value: str, is_juridical: bool) -> bool:
+        await self._handle_modal_click(self.page.locator(self.ADD_PARTICIPANT_BUTTON))
+
+        modal_locator = self.MODAL_SELECT_SIDE
+        try:
+            await self.page.locator(modal_locator).wait_for(state="visible", timeout=10000)
+        except Exception:
+            logger.error(f"First modal window {modal_locator} is not visible after clicking button.")
+            return False
+
+        person_type_option = "true" if is_juridical else "false"
+        await self.page.locator(self.PERSON_TYPE_SELECT).select_option(person_type_option)
+        await self._wait_for_richfaces_stop()
+
+        await self.page.locator(self.PARTICIPANT_SIDE_SELECT).select_option(str(side_value))
+        await self._wait_for_richfaces_stop()
+
+        return await self._handle_modal_fill_and_next(modal_locator, self.NEXT_BUTTON_SELECT_SIDE)
+
+    async def fill_juridical_data(self, bin_num: str, address: str, bank_details: str) -> None:
+        modal_selector = self.MODAL_JURIDICAL
+
+        try:
+            await self.page.locator(modal_selector).wait_for(state="visible", timeout=10000)
+        except Exception:
+            raise RuntimeError(f"Juridical modal window {modal_selector} did not appear/is not visible.")
+
+        await self._settle(modal_selector, "Juridical Modal (Start)")
+
+        await self.page.locator(self.BIN_TEXTBOX_JUR).type(bin_num, delay=50)
+        await self.pacer.pause_async(1, 2)
+        await self._check_modal_visibility(modal_selector, "Juridical Modal (Post-BIN Input)")
+
+        await self.page.locator(self.GBD_SEARCH_JUR).click()
+        await self.pacer.pause_async(1, 2)
+        await self._settle(modal_selector, "Juridical Modal (Post-GBD Search)")
+
+        await self.fill_fields(modal_selector, "Juridical Modal (Post-Details Input)", {
+            self.FACT_ADDRESS_TEXTBOX: address,
+            self.BANK_DETAILS_TEXTBOX: bank_details,
+        })
+
+        await self.page.locator(self.SAVE_BUTTON_JUR).click()
+        await self._wait_for_loader()
+
+    async def fill_physical_data(self, iin: str, phone: Optional[str] = None, email: Optional[str] = None) -> None:
+        modal_selector = self.MODAL_PHYSICAL
+
+        try:
+            await self.page.locator(modal_selector).wait_for(state="visible", timeout=10000)
+        except Exception:
+            raise RuntimeError(f"Physical modal window {modal_selector} did not appear/is not visible.")
+
+        await self._settle(modal_selector, "Physical Modal (Start)")
+
+        await self.page.locator(self.IIN_TEXTBOX_PHYS).type(iin, delay=50)
+        await self._check_modal_visibility(modal_selector, "Physical Modal (Post-IIN Input)")
+
+        await self.page.locator(self.GBD_SEARCH_PHYS).click()
+        await self.pacer.pause_async(1, 2)
+        state = await self._settle(
+            modal_selector,
+            "Physical Modal (Post-GBD Search)",
+            fields=[self.PHONE_TEXTBOX] if phone else (),
+            richfaces=True,
+        )
+
+        if phone:
+            phone_locator = self.page.locator(self.PHONE_TEXTBOX)
+            if field_ready(state, self.PHONE_TEXTBOX):
+                self.calls_saved += 1
+            else:
+                try:
+                    await phone_locator.wait_for(state="visible", timeout=5000)
+                except Exception:
+                    logger.error(f"Phone field {self.PHONE_TEXTBOX} is not visible/ready.")
+                    raise RuntimeError("Phone field is not ready for input.")
+
+            await phone_locator.clear()
+            await phone_locator.type(phone, delay=50)
+            await self.pacer.pause_async(1, 2)
+            await self._check_modal_visibility(modal_selector, "Physical Modal (Post-Phone Input)")
+
+        if email:
+            await self.page.locator(self.EMAIL_TEXTBOX).type(email, delay=60)
+            await self.pacer.pause_async(1, 2)
+
+        await self._check_modal_visibility(modal_selector, "Physical Modal (Pre-Save)")
+        await self.page.locator(self.SAVE_BUTTON_PHYS).click()
+        await self._wait_for_loader()
@@ -0,0 +1,37 @@
+# System/aio/uploader.py
+import os
+from .. import docstore
+from ..logger import get_logger
+from ..uploader import FileUploader
+
+log = get_logger("AsyncUploader")
+
+
+class AsyncFileUploader(FileUploader):
+    """FileUploader на playwright.async_api: те же кнопки и пути к файлам через '*'."""
+
+    async def upload_file(self, button_name, file_paths_string):
+        paths = [p.strip() for p in file_paths_string.split('*') if p.strip()]
+        if not paths:
+            return
+        absolute_paths = []
+        for file_name in paths:
+            file_path = docstore.resolve(file_name)
+            if not os.path.exists(file_path):
+                log.error(f"Файл не найден и пропущен: {file_path}")
+            else:
+                absolute_paths.append(file_path)
+        if not absolute_paths:
+            return
+        async with self.page.expect_file_chooser() as fc_info:
+            await self.page.get_by_role("button", name=button_name).first.click()
+        file_chooser = await fc_info.value
+        await file_chooser.set_files(absolute_paths)
+        await self.pacer.pause_async(1, 2)
+
+    async def handle_payment_files(self, PaymentDocPath):
+        checkbox = self.page.locator("input[name$='isonline-payment']")
+        if not await checkbox.is_checked():
+            await checkbox.check()
+            await self.pacer.pause_async(1, 2)
+        await self.upload_file("Файлды қоса тіркеу", PaymentDocPath)
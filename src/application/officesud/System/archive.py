@@ -0,0 +1,170 @@
+# System/archive.py
+"""
+Архив завершённых пакетов: дела и события шагов пакета переносятся из общей SQLite
+в сжатый файл <BatchID>.jsonl.gz и удаляются из БД. Архив читается потоково —
+выгрузка результатов (System/export.py) работает и для архивных пакетов —
+и возвращается в БД через restore_batch.
+
+Формат: первая строка — заголовок {"format", "batch_id", "archived_at", "counts"},
+дальше по строке на запись: {"table": "Cases" | "StepEvents", "row": {...}}.
+"""
+import gzip
+import json
+import os
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .logger import get_logger
+from . import sqlite
+
+log = get_logger("Archive")
+
+ARCHIVE_DIR = os.environ.get(
+    "OFFICESUD_ARCHIVE_DIR",
+    os.path.join(os.path.dirname(sqlite.DB_PATH), "archive"),
+)
+FORMAT_VERSION = 1
+CHUNK_ROWS = 1000
+TABLES = ("Cases", "StepEvents")
+
+_BATCH_ID_RE = re.compile(r"^[\w.-]+$")
+
+
+class ArchiveError(RuntimeError):
+    """Архив не создан или не восстановлен; данные пакета в БД не тронуты."""
+
+
+def archive_path(batch_id: str, directory: Optional[str] = None) -> str:
+    if not _BATCH_ID_RE.match(batch_id or ""):
+        raise ArchiveError(f"Недопустимый BatchID для архива: {batch_id!r}")
+    return os.path.join(directory or ARCHIVE_DIR, f"{batch_id}.jsonl.gz")
+
+
+def is_archived(batch_id: str, directory: Optional[str] = None) -> bool:
+    try:
+        return os.path.isfile(archive_path(batch_id, directory))
+    except ArchiveError:
+        return False
+
+
+def read_header(path: str) -> Dict[str, Any]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.loads(f.readline())
+
+
+def iter_records(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """(таблица, строка) архива по одной, без распаковки файла целиком."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != FORMAT_VERSION:
+            raise ArchiveError(f"{path}: неизвестный формат архива {header.get('format')}")
+        for line in f:
+            record = json.loads(line)
+            yield record["table"], record["row"]
+
+
+def iter_archived_rows(
+    batch_id: str,
+    columns: List[str],
+    chunk_size: int = CHUNK_ROWS,
+    directory: Optional[str] = None,
+) -> Iterator[List[tuple]]:
+    """Дела архивного пакета порциями кортежей в порядке columns — как sqlite.iter_batch_rows."""
+    chunk = []
+    for table, row in iter_records(archive_path(batch_id, directory)):
+        if table != "Cases":
+            continue
+        chunk.append(tuple(row.get(column) for column in columns))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def archive_batch(batch_id: str, directory: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Пишет архив пакета (через временный файл), сверяет его с БД и только потом
+    удаляет пакет из БД. Если за это время пакет изменился — архив удаляется, БД остаётся как была.
+    """
+    path = archive_path(batch_id, directory)
+    if os.path.exists(path):
+        raise ArchiveError(f"Пакет {batch_id} уже в архиве: {path}")
+    expected = sqlite.count_batch_rows(batch_id)
+    if not expected[0]:
+        raise ArchiveError(f"В БД нет дел пакета {batch_id}")
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    counts = {}
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            f.write(json.dumps({
+                "format": FORMAT_VERSION,
+                "batch_id": batch_id,
+                "archived_at": sqlite.utc_now(),
+                "counts": dict(zip(TABLES, expected)),
+            }) + "\n")
+            for table, chunks in (
+                ("Cases", lambda columns: sqlite.iter_batch_rows(batch_id, columns, CHUNK_ROWS)),
+                ("StepEvents", lambda columns: sqlite.iter_batch_events(batch_id, columns, CHUNK_ROWS)),
+            ):
+                columns = [name for name, _ in sqlite.get_case_columns(table)]
+                counts[table] = 0
+                for rows in chunks(columns):
+                    for row in rows:
+                        f.write(json.dumps({"table": table, "row": dict(zip(columns, row))}, ensure_ascii=False) + "\n")
+                    counts[table] += len(rows)
+        _verify(tmp_path, counts)
+        if (counts["Cases"], counts["StepEvents"]) != expected:
+            raise ArchiveError(f"Пакет {batch_id} изменился во время архивации")
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    if not sqlite.delete_batch(batch_id, expected):
+        os.remove(path)
+        raise ArchiveError(f"Пакет {batch_id} изменился или в работе у воркера — не архивирован")
+    stats = {"batch_id": batch_id, "cases": expected[0], "events": expected[1], "bytes": os.path.getsize(path)}
+    log.info("Batch archived: %s", stats)
+    return stats
+
+
+def _verify(path: str, counts: Dict[str, int]) -> None:
+    """Архив читается до конца и содержит ровно записанное."""
+    read = dict.fromkeys(TABLES, 0)
+    for table, _ in iter_records(path):
+        read[table] += 1
+    if read != counts:
+        raise ArchiveError(f"{path}: прочитано {read}, записано {counts}")
+
+
+def restore_batch(batch_id: str, directory: Optional[str] = None, keep_archive: bool = False) -> Dict[str, Any]:
+    """Возвращает пакет из архива в БД (исходные DB_Case_ID и EventID сохраняются)."""
+    path = archive_path(batch_id, directory)
+    if not os.path.isfile(path):
+        raise ArchiveError(f"Архива пакета {batch_id} нет: {path}")
+    if sqlite.count_batch_rows(batch_id)[0]:
+        raise ArchiveError(f"Пакет {batch_id} уже есть в БД")
+
+    sqlite.check_and_initialize_db()
+    counts = dict(dict.fromkeys(TABLES, 0), **sqlite.restore_rows(iter_records(path)))
+
+    if not keep_archive:
+        os.remove(path)
+    stats = {"batch_id": batch_id, "cases": counts["Cases"], "events": counts["StepEvents"]}
+    log.info("Batch restored from archive: %s", stats)
+    return stats
+
+
+def list_archives(directory: Optional[str] = None) -> List[Dict[str, Any]]:
+    directory = directory or ARCHIVE_DIR
+    archives = []
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        if name.endswith(".jsonl.gz"):
+            path = os.path.join(directory, name)
+            archives.append(dict(read_header(path), bytes=os.path.getsize(path)))
+    return archives
+
@@ -0,0 +1,115 @@
+# System/browser_profile.py
+import fcntl
+import os
+from typing import List, Optional, Tuple
+
+from .logger import get_logger
+
+log = get_logger("BrowserProfile")
+
+# Каталог постоянных профилей Chromium (HTTP-кэш переживает перезапуск контейнера).
+# Пусто — как раньше: одноразовый контекст с пустым кэшем.
+BROWSER_CACHE_DIR = os.environ.get("OFFICESUD_BROWSER_CACHE_DIR", "")
+BROWSER_CACHE_MAX_MB = int(os.environ.get("OFFICESUD_BROWSER_CACHE_MAX_MB", "512"))
+BROWSER_PROFILE_SLOTS = int(os.environ.get("OFFICESUD_BROWSER_PROFILE_SLOTS", "16"))
+
+# Подкаталоги профиля, которые можно удалять без потери сессии.
+CACHE_SUBDIRS = ("Cache", "Code Cache", "GPUCache", os.path.join("Service Worker", "CacheStorage"))
+
+
+class BrowserProfile:
+    """
+    Постоянный user-data-dir для launch_persistent_context. Один профиль Chromium
+    нельзя открыть двумя процессами, поэтому воркер занимает свободный слот
+    <dir>/profile-<n> под flock. Общий размер кэшей всех слотов ограничен
+    max_mb: перед запуском старые файлы кэша удаляются (LRU по mtime), а
+    Chromium дополнительно получает --disk-cache-size на свою долю.
+    """
+
+    def __init__(
+        self,
+        root: str = BROWSER_CACHE_DIR,
+        max_mb: int = BROWSER_CACHE_MAX_MB,
+        slots: int = BROWSER_PROFILE_SLOTS,
+    ):
+        self.root = root
+        self.max_bytes = max_mb * 1024 * 1024
+        self.slots = slots
+        self.path: Optional[str] = None
+        self._lock_file = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.root)
+
+    def acquire(self) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        for slot in range(self.slots):
+            lock_file = open(os.path.join(self.root, f"profile-{slot}.lock"), "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                continue
+            self._lock_file = lock_file
+            self.path = os.path.join(self.root, f"profile-{slot}")
+            os.makedirs(self.path, exist_ok=True)
+            freed = self.enforce_limit()
+            log.info("Using browser profile %s (evicted %s KiB of cache)", self.path, freed // 1024)
+            return self.path
+        raise RuntimeError(f"All {self.slots} browser profile slots in {self.root} are busy")
+
+    def release(self) -> None:
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    def launch_args(self) -> List[str]:
+        return [f"--disk-cache-size={max(self.max_bytes // self.slots, 16 * 1024 * 1024)}"]
+
+    def _is_busy(self, profile: str) -> bool:
+        """Профиль открыт другим воркером — его кэш трогать нельзя."""
+        if profile == self.path:
+            return False
+        try:
+            with open(profile + ".lock", "w") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        return False
+
+    def _cache_files(self) -> List[Tuple[float, int, str]]:
+        files = []
+        for entry in os.listdir(self.root):
+            profile = os.path.join(self.root, entry)
+            if not entry.startswith("profile-") or not os.path.isdir(profile) or self._is_busy(profile):
+                continue
+            for subdir in CACHE_SUBDIRS:
+                for dirpath, _, filenames in os.walk(os.path.join(profile, "Default", subdir)):
+                    for name in filenames:
+                        path = os.path.join(dirpath, name)
+                        try:
+                            stat = os.stat(path)
+                        except OSError:
+                            continue
+                        files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def enforce_limit(self) -> int:
+        """
+        Удаляет самые старые файлы кэша свободных профилей, пока их общий
+        размер не уложится в лимит. Кэш занятых профилей ограничивает сам Chromium.
+        """
+        files = self._cache_files()
+        total = sum(size for _, size, _ in files)
+        freed = 0
+        for _, size, path in sorted(files):
+            if total - freed <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            freed += size
+        return freed
@@ -1,163 +1,675 @@
 # System/case_processor.py
 import time
 import os
+from contextlib import contextmanager
 from playwright.sync_api import sync_playwright
 from .logger import get_logger
-from . import sqlite
+from . import docstore, errors, sqlite, tracing
+from .heartbeat import Heartbeat
+from .governor import RateGovernor
+from .pacing import AdaptivePacer
+from .session import SessionStore
+from .browser_profile import BrowserProfile
+from .watchdog import BROWSER, MemoryWatchdog
+from .control import BatchCancelled
 import random
 import threading
 
 log = get_logger("CaseProcessor")
 
+VIEWPORT = {'width': 1920, 'height': 1080}
+
+LEASE_SECONDS = float(os.environ.get("OFFICESUD_LEASE_SECONDS", "900"))
+MAX_CASE_ATTEMPTS = int(os.environ.get("OFFICESUD_MAX_CASE_ATTEMPTS", "3"))
+SLOW_MO_MS = float(os.environ.get("OFFICESUD_SLOW_MO_MS", "1000"))
+# Конвейер: форма следующего дела открывается на второй вкладке, пока оседает текущая подача
+PIPELINE = os.environ.get("OFFICESUD_PIPELINE", "0") in ("1", "true", "True")
+# Столько дел подряд упало — сайт или сессия сломаны, дальше пакет не жжём
+MAX_CONSECUTIVE_FAILURES = int(os.environ.get("OFFICESUD_MAX_CONSECUTIVE_FAILURES", "5"))
+RETRY_POLL_SECONDS = 2
+
 class CaseProcessor:
-    def __init__(self, batch_id, stop_event: threading.Event):
+    def __init__(
+        self,
+        batch_id,
+        stop_event: threading.Event,
+        heartbeat: Heartbeat = None,
+        lease_seconds: float = LEASE_SECONDS,
+        max_attempts: int = MAX_CASE_ATTEMPTS,
+        pipeline: bool = PIPELINE,
+    ):
         self.batch_id = batch_id
         self.stop_event = stop_event
-        self.internal_ids_to_process = sqlite.get_unique_internal_ids(batch_id)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.pipeline = pipeline
+        self._cases = None
+        self._upcoming = None
+        self._spare_filler = None
+        self._prefetched = False
+        self.internal_ids_to_process = self._load_internal_ids()
+        self.heartbeat = heartbeat or Heartbeat(batch_id)
+        self.governor = self._make_governor()
+        # один регулятор пауз на воркер: он переживает смену дел и страниц
+        self.pacer = AdaptivePacer()
+        self.filler = None
+        self.session = SessionStore()
+        self.profile = BrowserProfile()
+        self.trace = tracing.FailureTrace()
+        self.watchdog = MemoryWatchdog()
+        self._browser = None
+        self._context = None
+
+    def _load_internal_ids(self):
+        return sqlite.get_unique_internal_ids(self.batch_id)
+
+    def _make_governor(self):
+        return RateGovernor()
+
+    def _has_work(self):
+        return bool(self.internal_ids_to_process)
+
+    def _checkpoint(self):
+        """Точка отмены между шагами: дело ещё не подано, его можно бросить."""
+        if self.stop_event.is_set():
+            raise BatchCancelled(f"Batch {self.batch_id} cancelled")
+
+    def _wait_while_paused(self):
+        """
+        Пауза проверяется до аренды следующего дела: на паузе воркер не держит дел,
+        иначе аренда истечёт и после resume дело могут подать два воркера.
+        """
+        wait = getattr(self.stop_event, "wait_while_paused", None)
+        if wait is None:
+            return
+        wait(on_pause=self._on_pause)
+
+    def _on_pause(self):
+        self.heartbeat.update(step="paused", internal_id=None)
+        self._drop_upcoming()
+
+    def _drop_upcoming(self):
+        """Заранее взятое дело возвращается в пул; его форму откроем заново."""
+        if self._upcoming is None:
+            return
+        self._release_case(self._upcoming, failed=False)
+        self._upcoming = None
+        if self._spare_filler is not None:
+            self._spare_filler.prepared_case_id = None
+
+    def _iter_cases(self):
+        """
+        Источник дел: дела пакета берутся из общей SQLite в аренду по одному,
+        поэтому один пакет могут параллельно разбирать несколько воркеров.
+        """
+        while True:
+            case_data = sqlite.claim_case(
+                self.heartbeat.worker_id,
+                self.lease_seconds,
+                batch_id=self.batch_id,
+                max_attempts=self.max_attempts,
+            )
+            if case_data is None:
+                # свежие дела кончились — дожидаемся очереди повторов, а не выходим
+                if self._wait_for_retry():
+                    continue
+                return
+            if case_data.get("AttemptCount", 1) > 1:
+                log.info("Дело %s: попытка %s", case_data["InternalID"], case_data["AttemptCount"])
+            yield case_data
+
+    def _next_retry_in(self):
+        return sqlite.next_retry_in(self.batch_id, self.max_attempts)
+
+    def _wait_for_retry(self):
+        """
+        Ждёт ближайшего повтора упавшего дела пакета. False — повторять нечего
+        (или пакет отменили), пакет пройден.
+        """
+        delay = self._next_retry_in()
+        if delay is None:
+            return False
+        log.info("Свежих дел нет, повтор упавших через %.0f сек", delay)
+        self.heartbeat.update(step="retry_wait", internal_id=None)
+        # не меньше интервала опроса: пакет на паузе не выдаёт даже «созревшие» повторы
+        deadline = time.monotonic() + max(delay, RETRY_POLL_SECONDS)
+        while time.monotonic() < deadline:
+            if self.stop_event.is_set():
+                return False
+            time.sleep(min(RETRY_POLL_SECONDS, max(deadline - time.monotonic(), 0)))
+        return not self.stop_event.is_set()
+
+    def _save_talon(self, case_data, talon_id):
+        return sqlite.save_case_talon(case_data["DB_Case_ID"], talon_id, self.heartbeat.worker_id)
+
+    def _release_case(self, case_data, failed=True, **failure):
+        """Дело не подано: возвращаем его в пул, не дожидаясь истечения аренды."""
+        sqlite.release_case(case_data["DB_Case_ID"], self.heartbeat.worker_id, failed=failed, **failure)
+
+    def _check_case(self, case_data):
+        """Проверки до открытия формы: то, что на сайте упадёт заведомо, в браузер не несём."""
+        missing = [
+            column for column in ("RegionID", "CourtID", "PlaintiffID", "DefendantID")
+            if not str(case_data.get(column) or "").strip()
+        ]
+        if missing:
+            raise errors.CaseValidationError(f"Не заполнены колонки: {', '.join(missing)}")
+        for column in sqlite.DOCUMENT_COLUMNS:
+            for path in (case_data.get(column) or "").split("*"):
+                if path.strip() and not os.path.exists(docstore.resolve(path.strip())):
+                    raise errors.MissingDocument(f"{column}: файл не найден: {path.strip()}")
+
+    def _fail_case(self, case_data, error, submitted=False):
+        """
+        Классифицирует сбой дела, пишет событие case_failed и возвращает дело в пул
+        по политике класса: повтор с паузой или разбор человеком (NeedsReview).
+        """
+        kind = errors.SUBMITTED_NO_TALON if submitted else errors.classify(error)
+        attempt = case_data.get("AttemptCount") or 1
+        retry_in = errors.retry_delay(kind, attempt)
+        needs_review = retry_in is None or attempt >= self.max_attempts
+        message = f"{type(error).__name__}: {error}"
+        log.warning(
+            "Дело %s: сбой %s (попытка %s), %s",
+            case_data["InternalID"], kind, attempt,
+            "на разбор" if needs_review else f"повтор через {retry_in:.0f} сек",
+        )
+        try:
+            # до release: событие продлевает аренду, а после release дело уже не наше
+            self._record_event({
+                "DB_Case_ID": case_data.get("DB_Case_ID"),
+                "BatchID": case_data.get("BatchID") or self.batch_id,
+                "InternalID": case_data["InternalID"],
+                "WorkerID": self.heartbeat.worker_id,
+                "Step": "case_failed",
+                "Status": kind,
+                "Details": {
+                    "error": message[:2000],
+                    "attempt": attempt,
+                    "retry_in": None if needs_review else retry_in,
+                    "needs_review": needs_review,
+                },
+            })
+        except Exception:
+            log.exception("Failed to record failure of case %s", case_data["InternalID"])
+        self._release_case(
+            case_data,
+            error_class=kind,
+            error=message,
+            retry_in=None if needs_review else retry_in,
+            needs_review=needs_review,
+        )
+        return kind
+
+    def _renew_lease(self, case_data):
+        return sqlite.renew_lease(case_data["DB_Case_ID"], self.heartbeat.worker_id, self.lease_seconds)
+
+    def _record_event(self, event):
+        sqlite.record_step_event(event)
+        case_id = event.get("DB_Case_ID")
+        if case_id and not sqlite.renew_lease(case_id, self.heartbeat.worker_id, self.lease_seconds):
+            log.warning("Аренда дела %s истекла и могла перейти другому воркеру", event["InternalID"])
+
+    def _store_trace(self, case_data, path, details):
+        name = tracing.trace_name(case_data)
+        tracing.store_trace(name, path)
+        # не через _record_event: после сбоя аренда дела уже отпущена
+        sqlite.record_step_event({
+            "DB_Case_ID": case_data.get("DB_Case_ID"),
+            "BatchID": case_data.get("BatchID") or self.batch_id,
+            "InternalID": case_data["InternalID"],
+            "WorkerID": self.heartbeat.worker_id,
+            "Step": "trace",
+            "Status": details["reason"],
+            "Details": dict(details, file=name),
+        })
+
+    def _persist_trace(self, filler, case_data, reason, error=None):
+        """Кольцевой буфер действий и снимков — на диск, только при сбое или повторной попытке."""
+        if not self.trace.enabled:
+            return
+        try:
+            trace = self.trace.write(filler.page if filler is not None else None, {
+                "BatchID": case_data.get("BatchID") or self.batch_id,
+                "InternalID": case_data["InternalID"],
+                "DB_Case_ID": case_data.get("DB_Case_ID"),
+                "AttemptCount": case_data.get("AttemptCount"),
+                "WorkerID": self.heartbeat.worker_id,
+                "reason": reason,
+                "error": f"{type(error).__name__}: {error}" if error is not None else None,
+            })
+            self._store_trace(case_data, trace.pop("path"), dict(trace, reason=reason))
+            log.info("Trace of case %s saved (%s, %s KiB)", case_data["InternalID"], reason, trace["bytes"] // 1024)
+        except Exception:
+            log.exception("Failed to save trace of case %s", case_data["InternalID"])
+
+    def _open_browser(self, playwright, session_state):
+        """
+        (browser, context). С OFFICESUD_BROWSER_CACHE_DIR — постоянный профиль
+        с HTTP-кэшем (browser=None: закрывается вместе с контекстом).
+        """
+        from .config import HEADLESS
+
+        if self.profile.enabled:
+            # при перезапуске браузера остаёмся в уже занятом слоте профиля
+            context = playwright.chromium.launch_persistent_context(
+                self.profile.path or self.profile.acquire(),
+                headless=HEADLESS,
+                slow_mo=SLOW_MO_MS,
+                channel="chrome",
+                viewport=VIEWPORT,
+                args=self.profile.launch_args(),
+            )
+            if session_state is not None:
+                self.session.apply(context, session_state)
+            return None, context
+
+        browser = playwright.chromium.launch(headless=HEADLESS, slow_mo=SLOW_MO_MS, channel="chrome")
+        return browser, self._new_context(browser, session_state)
+
+    def _new_context(self, browser, session_state):
+        return browser.new_context(viewport=VIEWPORT, storage_state=session_state)
+
+    def _open_pages(self, context, session_state):
+        """Рабочая вкладка (и запасная в конвейере) с входом в кабинет; возвращает основной Filler."""
+        from .filler import Filler
+
+        page = context.pages[0] if context.pages else context.new_page()
+        filler = self.filler = Filler(page, governor=self.governor, pacer=self.pacer)
+        self.trace.attach(page)
+
+        self.heartbeat.update(step="login", internal_id=None)
+        self._login(context, filler, session_state)
+        self._spare_filler = None
+        if self.pipeline:
+            self._spare_filler = Filler(context.new_page(), governor=self.governor, pacer=self.pacer)
+            self.trace.attach(self._spare_filler.page)
+        return filler
+
+    def _recycle(self, playwright, kind, reason):
+        """
+        Между делами: сохранить сессию, закрыть контекст (или весь браузер) и открыть
+        заново с той же сессией. Постоянный профиль — это и есть браузер,
+        поэтому для него перезапуск контекста всегда означает перезапуск браузера.
+        """
+        self.heartbeat.update(step=f"recycle_{kind}", internal_id=None)
+        started = time.monotonic()
+        self.session.save(self._context)
+        session_state = self.session.load()
+        self._context.close()
+        if kind == BROWSER or self._browser is None:
+            kind = BROWSER
+            if self._browser is not None:
+                self._browser.close()
+            self._browser, self._context = self._open_browser(playwright, session_state)
+        else:
+            self._context = self._new_context(self._browser, session_state)
+        filler = self._open_pages(self._context, session_state)
+        self.watchdog.recycled(kind, reason, time.monotonic() - started)
+        return filler
+
+    def _fresh_page(self, filler):
+        """
+        После сбоя дела вкладка могла застрять в модалке или на чужом шаге формы:
+        закрываем её и продолжаем на новой в том же контексте (сессия та же).
+        """
+        from .filler import Filler
+
+        try:
+            filler.page.close()
+        except Exception:
+            log.debug("Failed to close page of failed case", exc_info=True)
+        page = self._context.new_page()
+        fresh = self.filler = Filler(page, governor=self.governor, pacer=self.pacer)
+        self.trace.attach(page)
+        fresh.open_cabinet()
+        return fresh
+
+    def _login(self, context, filler, session_state):
+        """
+        Вход в кабинет: с сохранённым storage_state — сразу в кабинет,
+        иначе (или если сессия на сайте истекла) — обычный вход с сохранением состояния.
+        """
+        started = time.monotonic()
+        resumed = session_state is not None and filler.resume_session()
+        if not resumed:
+            if session_state is not None:
+                log.info("Saved session for %s expired on the site", self.session.account)
+                self.session.invalidate()
+            filler.starting_process()
+            if filler.wait_for_login():
+                self.session.save(context)
+        log.info(
+            "Logged in (%s) in %.1f sec",
+            "saved session" if resumed else "full login",
+            time.monotonic() - started,
+        )
+
+    def _step_details(self):
+        """Дополнительные метрики, которые пишутся в каждое событие шага."""
+        details = self.pacer.metrics()
+        details.update(self.watchdog.metrics())
+        for filler in (self.filler, self._spare_filler):
+            if filler is not None:
+                for key, value in filler.take_form_metrics().items():
+                    details[key] = details.get(key, 0) + value
+        waited = self.governor.take_waited()
+        if waited:
+            details["rate_wait_ms"] = int(waited * 1000)
+        return details
+
+    def _step_event(self, case_data, step, status, error, started):
+        details = self._step_details()
+        if error:
+            details["error"] = error[:2000]
+        return {
+            "DB_Case_ID": case_data.get("DB_Case_ID"),
+            "BatchID": case_data.get("BatchID") or self.batch_id,
+            "InternalID": case_data["InternalID"],
+            "WorkerID": self.heartbeat.worker_id,
+            "Step": step,
+            "Status": status,
+            "DurationMs": int((time.monotonic() - started) * 1000),
+            "Details": details,
+        }
+
+    @contextmanager
+    def _step(self, case_data, step, cancellable=True, filler=None):
+        if cancellable:
+            self._checkpoint()
+        self.heartbeat.update(step=step, internal_id=case_data["InternalID"])
+        self.trace.action("step", step=step, internal_id=case_data["InternalID"])
+        started = time.monotonic()
+        status, error = "ok", None
+        try:
+            yield
+        except BatchCancelled:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            status, error = "error", f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            event = self._step_event(case_data, step, status, error, started)
+            self.trace.action("step_done", step=step, status=status, error=error)
+            filler = filler or self.filler
+            if filler is not None:
+                self.trace.snapshot(filler.page, step)
+            try:
+                self._record_event(event)
+            except Exception:
+                log.exception("Failed to record step event %s for %s", step, case_data["InternalID"])
 
     def _process_single_case(self, filler, case_data):
      
         internal_id = case_data["InternalID"]
+        self._check_case(case_data)
         
-        filler.open_lawsuit_filing_form(
-            case_data["RegionID"],
-            case_data["CourtID"]
-        )
+        with self._step(case_data, "open_form"):
+            if filler.prepared_case_id is not None and filler.prepared_case_id == case_data.get("DB_Case_ID"):
+                log.info("Форма дела %s уже открыта заранее", internal_id)
+            else:
+                filler.open_lawsuit_filing_form(
+                    case_data["RegionID"],
+                    case_data["CourtID"]
+                )
+            filler.prepared_case_id = None
 
-        self._add_participants(filler, case_data)
+        with self._step(case_data, "participants"):
+            self._add_participants(filler, case_data)
 
-        filler.fill_payment_and_lawsuit_data(
-            PaymentDocPath=case_data["PaymentDocPath"],
-            MainDocPath=case_data["MainDocPath"],
-            OtherDocPath=case_data["OtherDocPath"],
-            ClaimSummary=case_data["ClaimSummary"],
-            ClaimBasis=case_data["ClaimBasis"],
-            ClaimAmount=case_data["ClaimAmount"],
-            StateDuty=case_data["StateDuty"]
-        )
+        # дальше дело отправляется на сайт — его доводим до конца даже при отмене
+        self._checkpoint()
+        if not self._renew_lease(case_data):
+            # аренда истекла (воркер долго висел) — дело уже мог взять другой воркер
+            log.warning("Дело %s не подано: аренда потеряна", internal_id)
+            filler.return_to_cabinet_home()
+            return
+        with self._step(case_data, "payment_and_lawsuit", cancellable=False):
+            filler.fill_payment_and_lawsuit_data(
+                PaymentDocPath=case_data["PaymentDocPath"],
+                MainDocPath=case_data["MainDocPath"],
+                OtherDocPath=case_data["OtherDocPath"],
+                ClaimSummary=case_data["ClaimSummary"],
+                ClaimBasis=case_data["ClaimBasis"],
+                ClaimAmount=case_data["ClaimAmount"],
+                StateDuty=case_data["StateDuty"]
+            )
         
-        filler.save_talonid(internal_id)
+        with self._step(case_data, "save_talon", cancellable=False):
+            talon_id = filler.read_talonid(internal_id)
+            if not talon_id:
+                # форма ушла на сайт: без талона дело не повторяем, иначе подадим его дважды
+                raise errors.SubmittedWithoutTalon(f"Талон дела {internal_id} не получен после отправки формы")
+            if not self._save_talon(case_data, talon_id):
+                # дело уже у другого воркера: талон остаётся в событии case_failed для разбора
+                raise errors.SubmittedWithoutTalon(
+                    f"Дело {internal_id} подано, талон {talon_id} не записан: аренда потеряна"
+                )
+            case_data["TalonID"] = talon_id
+            log.info("TalonID successfully saved for internal_id=%s", internal_id)
         log.info(f"Дело {internal_id} (Ответчик ID: {case_data.get('DefendantID', 'N/A')}) успешно подготовлено.")
+        self.heartbeat.case_done()
+        self.watchdog.case_done()
 
-        filler.return_to_cabinet_home()
+        with self._step(case_data, "return_home"):
+            self._after_case(filler)
 
-    def _add_participants(self, filler, data):
-        
-        def get_split_list(key, num_participants, enforce_list=False):
-
-            value = data.get(key)
-            if value is None or not isinstance(value, str) or value.strip() == "":
-                return [None] * num_participants
-            
-            split_values = [v.strip() for v in value.split('*')]
-            
-            if enforce_list and len(split_values) == 1 and num_participants > 0:
-                return [split_values[0]] * num_participants
-            
-            if num_participants > 0:
-                return split_values + [None] * (num_participants - len(split_values))
-            return split_values
-
-        plaintiff_ids_raw = data.get("PlaintiffID")
-        plaintiff_ids = [v.strip() for v in plaintiff_ids_raw.split('*')] if plaintiff_ids_raw else []
-        num_plaintiffs = len(plaintiff_ids) if plaintiff_ids and plaintiff_ids[0] else 0
-
-        plaintiff_sides = get_split_list("PlaintiffSide", num_plaintiffs, enforce_list=True)
-        plaintiff_types = get_split_list("PlaintiffType", num_plaintiffs, enforce_list=True)
-        
-        plaintiff_addresses = get_split_list("PlaintiffAddress", num_plaintiffs, enforce_list=False)
-        plaintiff_banks = get_split_list("PlaintiffBank", num_plaintiffs, enforce_list=False)
-        plaintiff_phones = get_split_list("PlaintiffPhone", num_plaintiffs, enforce_list=False)
-        plaintiff_emails = get_split_list("PlaintiffEmail", num_plaintiffs, enforce_list=False)
-        
-        for i in range(num_plaintiffs):
-            filler.add_participant(
-                side_value=plaintiff_sides[i], 
-                participant_type=plaintiff_types[i],
-                id_value=plaintiff_ids[i], 
-                address=plaintiff_addresses[i] if plaintiff_addresses[i] else "",
-                bank_details=plaintiff_banks[i] if plaintiff_banks[i] else "", 
-                phone=plaintiff_phones[i] if plaintiff_phones[i] else "",
-                email=plaintiff_emails[i] if plaintiff_emails[i] else ""
-            )
+    def _next_case(self):
+        if self._upcoming is not None:
+            case_data, self._upcoming = self._upcoming, None
+            return case_data
+        return next(self._cases, None)
 
-        defendant_ids_raw = data.get("DefendantID")
-        defendant_ids = [v.strip() for v in defendant_ids_raw.split('*')] if defendant_ids_raw else []
-        num_defendants = len(defendant_ids) if defendant_ids and defendant_ids[0] else 0
+    def _after_case(self, filler):
+        if self._spare_filler is None or not self._prefetch_next_case():
+            filler.return_to_cabinet_home()
 
-        defendant_sides = get_split_list("DefendantSide", num_defendants, enforce_list=True)
-        defendant_types = get_split_list("DefendantType", num_defendants, enforce_list=True)
-        
-        defendant_phones = get_split_list("DefendantPhone", num_defendants, enforce_list=False)
-        defendant_emails = get_split_list("DefendantEmail", num_defendants, enforce_list=False)
-        
-        for i in range(num_defendants):
-            filler.add_participant(
-                side_value=defendant_sides[i], 
-                participant_type=defendant_types[i], 
-                id_value=defendant_ids[i], 
-                address="", 
-                bank_details="",
-                phone=defendant_phones[i] if defendant_phones[i] else "",
-                email=defendant_emails[i] if defendant_emails[i] else ""
-            )
+    def _prefetch_next_case(self):
+        """
+        Вместо паузы, пока подача текущего дела оседает, берём следующее дело
+        и открываем его форму (регион, суд, категория) на второй вкладке.
+        Текущая вкладка остаётся как есть и станет запасной для следующего дела.
+        False — брать нечего: вкладки не меняются, следующее дело основной цикл
+        запросит сам.
+        """
+        case_data = next(self._cases, None)
+        if case_data is None:
+            # источник исчерпан только на этот момент: повторы и брошенные аренды
+            # ещё могут вернуть дела в пул, поэтому основной цикл спросит заново
+            self._cases = self._iter_cases()
+            return False
+        self._prefetched = True
+        self._upcoming = case_data
+        spare = self._spare_filler
+        try:
+            # не отменяем: дело уже в аренде, при отмене его вернёт основной цикл
+            with self._step(case_data, "prefetch_form", cancellable=False, filler=spare):
+                spare.open_cabinet()
+                spare.open_lawsuit_filing_form(case_data["RegionID"], case_data["CourtID"])
+                spare.prepared_case_id = case_data.get("DB_Case_ID")
+        except Exception as e:
+            log.exception("Prefetch of case %s failed, its form will be opened again", case_data["InternalID"])
+            self._persist_trace(spare, case_data, "prefetch_failed", e)
+            spare.prepared_case_id = None
+            try:
+                spare.open_cabinet()
+            except Exception:
+                log.exception("Failed to return spare page to cabinet")
+        return True
 
-        rep_ids_raw = data.get("RepID")
-        rep_ids = [v.strip() for v in rep_ids_raw.split('*')] if rep_ids_raw else []
-        num_reps = len(rep_ids) if rep_ids and rep_ids[0] else 0
-
-        if num_reps > 0:
-            rep_sides = get_split_list("RepSide", num_reps, enforce_list=True)
-            rep_types = get_split_list("RepType", num_reps, enforce_list=True)
-            rep_addresses = get_split_list("RepAddress", num_reps, enforce_list=False)
-            rep_banks = get_split_list("RepBank", num_reps, enforce_list=False)
-            rep_phones = get_split_list("RepPhone", num_reps, enforce_list=False)
-            rep_emails = get_split_list("RepEmail", num_reps, enforce_list=False)
-
-            for i in range(num_reps):
-                filler.add_participant(
-                    side_value=rep_sides[i], 
-                    participant_type=rep_types[i], 
-                    id_value=rep_ids[i], 
-                    address=rep_addresses[i] if rep_addresses[i] else "",
-                    bank_details=rep_banks[i] if rep_banks[i] else "", 
-                    phone=rep_phones[i] if rep_phones[i] else "",
-                    email=rep_emails[i] if rep_emails[i] else ""
-                )
+    def _add_participants(self, filler, data):
+        for role, index, participant in iter_participants(data):
+            self._checkpoint()
+            self.heartbeat.update(step=f"participant:{role}:{index}")
+            self.trace.action("participant", role=role, index=index, id_value=participant["id_value"])
+            filler.add_participant(**participant)
 
     def run_process(self):
-        from .config import HEADLESS
+        if not self._has_work():
+            return
 
-        from .filler import Filler
+        self.heartbeat.start()
+        try:
+            with sync_playwright() as playwright:
+                session_state = self.session.load()
+                self._browser, self._context = self._open_browser(playwright, session_state)
+                filler = self._open_pages(self._context, session_state)
 
-        if not self.internal_ids_to_process:
+                self._cases = self._iter_cases()
+                failures = 0
+                while True:
+                    self._wait_while_paused()
+                    if self.stop_event.is_set():
+                        self._drop_upcoming()
+                        break
+
+                    case_data = self._next_case()
+                    if case_data is None:
+                        break
+
+                    log.info(f"Начало дела №: {case_data['InternalID']} | Ответчик: {case_data.get('DefendantID', 'N/A')}")
+                    try:
+                        recycle = self.watchdog.due()
+                        if recycle is not None:
+                            # заранее открытая форма теряется вместе со вкладкой — дело откроется заново
+                            filler = self._recycle(playwright, *recycle)
+                        self._process_single_case(filler, case_data)
+                    except BaseException as e:
+                        self._drop_upcoming()
+                        if isinstance(e, BatchCancelled) or not isinstance(e, Exception):
+                            if not case_data.get("TalonID"):
+                                self._release_case(case_data, failed=not isinstance(e, BatchCancelled))
+                            raise
+
+                        # сбой одного дела не останавливает пакет: дело уходит в очередь повторов
+                        if self._prefetched:
+                            self._prefetched = False
+                            self._spare_filler.prepared_case_id = None
+                        if case_data.get("TalonID"):
+                            # дело подано, упал только возврат в кабинет
+                            log.exception("Case %s filed, but returning home failed", case_data["InternalID"])
+                        else:
+                            self._persist_trace(filler, case_data, "failed", e)
+                            self._fail_case(case_data, e, submitted=filler.submitted)
+                            failures += 1
+                            if failures >= MAX_CONSECUTIVE_FAILURES:
+                                raise RuntimeError(
+                                    f"{failures} дел подряд не поданы, последний сбой: {type(e).__name__}: {e}"
+                                ) from e
+                        filler = self._fresh_page(filler)
+                        continue
+                    failures = 0
+
+                    if case_data.get("AttemptCount", 1) > 1:
+                        # повторная попытка прошла — трасса покажет, чем она отличалась от упавшей
+                        self._persist_trace(filler, case_data, "retry")
+
+                    if self._prefetched:
+                        # следующее дело идёт на вкладке, где его форма уже открыта
+                        self._prefetched = False
+                        filler, self._spare_filler = self._spare_filler, filler
+                        self.filler = filler
+
+                # свежие cookies пригодятся следующему запуску
+                self.session.save(self._context)
+                self._context.close()
+        except BatchCancelled:
+            log.info("Пакет %s отменён, текущее незавершённое дело не подано.", self.batch_id)
+            self.heartbeat.stop(step="cancelled")
             return
+        except Exception as e:
+            self.heartbeat.error(f"{type(e).__name__}: {e}")
+            self.heartbeat.stop(step="failed")
+            raise
+        finally:
+            self.profile.release()
+        self.heartbeat.stop(step="cancelled" if self.stop_event.is_set() else "finished")
 
-        with sync_playwright() as playwright:
-            browser = playwright.chromium.launch(headless=HEADLESS, slow_mo=1000, channel="chrome")
-            context = browser.new_context(viewport={'width': 1920, 'height': 1080})
-            page = context.new_page()
-            filler = Filler(page)
-            
-            filler.starting_process()
 
-            for internal_id in self.internal_ids_to_process:
+def iter_participants(data):
+    """
+    (роль, номер, kwargs для Filler.add_participant) по колонкам дела:
+    значения нескольких участников разделены '*', сторона и тип одного значения
+    применяются ко всем участникам роли. Общая для sync и async движков.
+    """
 
-                if self.stop_event.is_set():
-                    break
+    def get_split_list(key, num_participants, enforce_list=False):
 
-                case_data = sqlite.get_case_data_by_internal_id(internal_id)
-                if not case_data:
-                    continue
-                    
-                if case_data.get("TalonID"):
-                    log.info(f"Дело {internal_id} пропущено: TalonID (значение: {case_data['TalonID']}) уже имеется.")
-                    continue
-                
-                log.info(f"Начало дела №: {internal_id} | Ответчик: {case_data.get('DefendantID', 'N/A')}")
-                self._process_single_case(filler, case_data)
+        value = data.get(key)
+        if value is None or not isinstance(value, str) or value.strip() == "":
+            return [None] * num_participants
+
+        split_values = [v.strip() for v in value.split('*')]
+
+        if enforce_list and len(split_values) == 1 and num_participants > 0:
+            return [split_values[0]] * num_participants
+
+        if num_participants > 0:
+            return split_values + [None] * (num_participants - len(split_values))
+        return split_values
+
+    def get_ids(key):
+        raw = data.get(key)
+        ids = [v.strip() for v in raw.split('*')] if raw else []
+        return ids, (len(ids) if ids and ids[0] else 0)
+
+    plaintiff_ids, num_plaintiffs = get_ids("PlaintiffID")
+    plaintiff_sides = get_split_list("PlaintiffSide", num_plaintiffs, enforce_list=True)
+    plaintiff_types = get_split_list("PlaintiffType", num_plaintiffs, enforce_list=True)
+    plaintiff_addresses = get_split_list("PlaintiffAddress", num_plaintiffs, enforce_list=False)
+    plaintiff_banks = get_split_list("PlaintiffBank", num_plaintiffs, enforce_list=False)
+    plaintiff_phones = get_split_list("PlaintiffPhone", num_plaintiffs, enforce_list=False)
+    plaintiff_emails = get_split_list("PlaintiffEmail", num_plaintiffs, enforce_list=False)
+
+    for i in range(num_plaintiffs):
+        yield "plaintiff", i + 1, dict(
+            side_value=plaintiff_sides[i],
+            participant_type=plaintiff_types[i],
+            id_value=plaintiff_ids[i],
+            address=plaintiff_addresses[i] if plaintiff_addresses[i] else "",
+            bank_details=plaintiff_banks[i] if plaintiff_banks[i] else "",
+            phone=plaintiff_phones[i] if plaintiff_phones[i] else "",
+            email=plaintiff_emails[i] if plaintiff_emails[i] else "",
+        )
+
+    defendant_ids, num_defendants = get_ids("DefendantID")
+    defendant_sides = get_split_list("DefendantSide", num_defendants, enforce_list=True)
+    defendant_types = get_split_list("DefendantType", num_defendants, enforce_list=True)
+    defendant_phones = get_split_list("DefendantPhone", num_defendants, enforce_list=False)
+    defendant_emails = get_split_list("DefendantEmail", num_defendants, enforce_list=False)
+
+    for i in range(num_defendants):
+        yield "defendant", i + 1, dict(
+            side_value=defendant_sides[i],
+            participant_type=defendant_types[i],
+            id_value=defendant_ids[i],
+            address="",
+            bank_details="",
+            phone=defendant_phones[i] if defendant_phones[i] else "",
+            email=defendant_emails[i] if defendant_emails[i] else "",
+        )
+
+    rep_ids, num_reps = get_ids("RepID")
+    if num_reps > 0:
+        rep_sides = get_split_list("RepSide", num_reps, enforce_list=True)
+        rep_types = get_split_list("RepType", num_reps, enforce_list=True)
+        rep_addresses = get_split_list("RepAddress", num_reps, enforce_list=False)
+        rep_banks = get_split_list("RepBank", num_reps, enforce_list=False)
+        rep_phones = get_split_list("RepPhone", num_reps, enforce_list=False)
+        rep_emails = get_split_list("RepEmail", num_reps, enforce_list=False)
+
+        for i in range(num_reps):
+            yield "rep", i + 1, dict(
+                side_value=rep_sides[i],
+                participant_type=rep_types[i],
+                id_value=rep_ids[i],
+                address=rep_addresses[i] if rep_addresses[i] else "",
+                bank_details=rep_banks[i] if rep_banks[i] else "",
+                phone=rep_phones[i] if rep_phones[i] else "",
+                email=rep_emails[i] if rep_emails[i] else "",
+            )
 
-            context.close()
 
 def start_processing(batch_id, stop_event: threading.Event):
     processor = CaseProcessor(batch_id, stop_event)
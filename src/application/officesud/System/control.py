@@ -0,0 +1,57 @@
+# System/control.py
+import os
+import time
+from typing import Callable, Optional
+
+from .logger import get_logger
+from . import sqlite
+
+log = get_logger("BatchControl")
+
+COMMAND_RUN = "run"
+COMMAND_PAUSE = "pause"
+COMMAND_CANCEL = "cancel"
+
+CONTROL_POLL_INTERVAL = float(os.environ.get("OFFICESUD_CONTROL_POLL_INTERVAL", "2"))
+
+
+class BatchCancelled(Exception):
+    """Пакет отменён с сервера; текущее незавершённое дело бросается без подачи."""
+
+
+class BatchControl:
+    """
+    Замена threading.Event для серверного режима: is_set() == «пакет отменён».
+    Команда читается из таблицы BatchControl не чаще раза в poll_interval секунд,
+    так что проверки между шагами почти бесплатны.
+    """
+
+    def __init__(self, batch_id: str, poll_interval: float = CONTROL_POLL_INTERVAL):
+        self.batch_id = batch_id
+        self.poll_interval = poll_interval
+        self._command: Optional[str] = None
+        self._checked_at = 0.0
+
+    def command(self) -> str:
+        now = time.monotonic()
+        if now - self._checked_at >= self.poll_interval:
+            try:
+                self._command = sqlite.get_batch_command(self.batch_id)
+            except Exception:
+                log.exception("Failed to read control command for batch %s", self.batch_id)
+            self._checked_at = now
+        return self._command or COMMAND_RUN
+
+    def is_set(self) -> bool:
+        return self.command() == COMMAND_CANCEL
+
+    def wait_while_paused(self, on_pause: Optional[Callable[[], None]] = None) -> None:
+        """Блокирует, пока пакет на паузе. Выходит при resume или cancel."""
+        if self.command() != COMMAND_PAUSE:
+            return
+        log.info("Batch %s paused", self.batch_id)
+        if on_pause:
+            on_pause()
+        while self.command() == COMMAND_PAUSE:
+            time.sleep(self.poll_interval)
+        log.info("Batch %s resumed with command=%s", self.batch_id, self.command())
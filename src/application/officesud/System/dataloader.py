@@ -1,45 +1,239 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import re
 import sqlite3
 import pandas as pd
 import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from xml.etree import ElementTree
 
 from application.officesud.System import sqlite as office_sqlite
+from application.officesud.System.logger import get_logger
+
+log = get_logger("DataLoader")
 
 DB_PATH = office_sqlite.DB_PATH  # или office_sqlite.db_path
 
-def load_excel_to_db(excel_file_path): 
-    office_sqlite.check_and_initialize_db()
-    batch_id = f"BATCH-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+# Что делать с делами, уже поданными в других пакетах:
+# flag — загрузить на разбор (NeedsReview: воркер их не берёт, а для прогресса пакета
+# они обработаны — sqlite.get_batch_progress), skip — не загружать, allow — подать снова
+DUPLICATES = os.environ.get("OFFICESUD_DUPLICATE_CASES", "flag")
+# Процессов для разбора листов загрузки; разбор xlsx упирается в GIL, потоки не помогают
+IMPORT_WORKERS = int(os.environ.get("OFFICESUD_IMPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Класс сбоя дела-повтора (errors.DUPLICATE; errors.py тянет playwright, которого нет в контейнере Django)
+DUPLICATE = "duplicate"
+
+# Колонки, не входящие в содержимое дела: служебные, результат подачи и InternalID —
+# то же дело под другим номером тоже повтор (совпадение номеров ищется отдельно)
+_SERVICE_COLUMNS = {"DB_Case_ID", "BatchID", "TalonID", "InternalID"} | set(office_sqlite.EXTRA_CASE_COLUMNS)
+# Колонки, которые заполняет сам загрузчик, а не файл
+_LOADER_COLUMNS = {"DB_Case_ID", "BatchID", "RowHash", "SourceFile", "SourceSheet", "SourceRow"}
+_SPACES_RE = re.compile(r"\s+")
+
+
+def file_sha256(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _normalize(value: Any, numeric: bool) -> Optional[str]:
+    """Значение ячейки без различий, которые вносит Excel: пробелы, регистр, 1000 / 1000.0."""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return None
+    text = _SPACES_RE.sub(" ", str(value)).strip()
+    if not text:
+        return None
+    if numeric:
+        try:
+            return repr(float(text.replace(" ", "").replace(",", ".")))
+        except ValueError:
+            pass
+    return text.casefold()
+
+
+def row_hash(data: Dict[str, Any], numeric_columns=()) -> str:
+    """sha256 содержимого дела: одинаков для одной и той же строки в разных файлах и пакетах."""
+    normalized = {}
+    for column, value in data.items():
+        if column in _SERVICE_COLUMNS:
+            continue
+        value = _normalize(value, column in numeric_columns)
+        if value is not None:
+            normalized[column] = value
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _sheet_names(path) -> List[Optional[str]]:
+    """
+    Листы книги по порядку; [None] — файл не Excel и читается как CSV. Имена листов
+    xlsx берутся прямо из xl/workbook.xml: pd.ExcelFile разобрал бы всю таблицу строк.
+    """
+    if zipfile.is_zipfile(path):
+        try:
+            with zipfile.ZipFile(path) as archive:
+                root = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+            return [node.get("name") for node in root.iter() if node.tag.rsplit("}", 1)[-1] == "sheet"]
+        except (KeyError, ElementTree.ParseError):
+            pass
     try:
-        df = pd.read_excel(excel_file_path, dtype=str)
+        with pd.ExcelFile(path) as workbook:
+            return list(workbook.sheet_names)
     except Exception:
-        df = pd.read_csv(excel_file_path, dtype=str, sep=',')
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+        return [None]
 
-    cursor.execute("PRAGMA table_info(Cases);")
-    valid_columns = [col[1] for col in cursor.fetchall()]
 
+def _frame_rows(df, valid_columns: List[str]) -> Tuple[List[str], List[tuple]]:
     df = df[[col for col in df.columns if col in valid_columns]]
-    for _, row in df.iterrows():
-        data = row.to_dict()
+    df = df.astype(object).where(df.notna(), None)
+    return list(df.columns), [tuple(row) for row in df.itertuples(index=False, name=None)]
+
+
+def _parse_sheets(path, sheets: List[Optional[str]], valid_columns: List[str]) -> List[Tuple[List[str], List[tuple]]]:
+    """
+    Колонки Cases и строки листов файла (значения — str или None), за одно открытие
+    книги. Выполняется и в процессе пула: разбор xlsx — чистый Python и упирается в GIL.
+    """
+    if sheets == [None]:
+        return [_frame_rows(pd.read_csv(path, dtype=str, sep=','), valid_columns)]
+    frames = pd.read_excel(path, sheet_name=sheets, dtype=str)
+    return [_frame_rows(frames[sheet], valid_columns) for sheet in sheets]
+
+
+def _parse_all(files: List[Tuple[str, List[Optional[str]]]], valid_columns: List[str], workers: int):
+    """
+    (номер файла, лист, (колонки, строки)) по порядку файлов и листов. Больше
+    одного листа — по листу на процесс пула; иначе разбор в этом процессе.
+    """
+    tasks = [(index, path, sheet) for index, (path, sheets) in enumerate(files) for sheet in sheets]
+    if len(tasks) < 2 or workers < 2:
+        for index, (path, sheets) in enumerate(files):
+            for sheet, parsed in zip(sheets, _parse_sheets(path, sheets, valid_columns)):
+                yield index, sheet, parsed
+        return
+    # spawn, как в preprocess: fork процесса Django/gunicorn с потоками ненадёжен
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(tasks)), mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        futures = [pool.submit(_parse_sheets, path, [sheet], valid_columns) for _, path, sheet in tasks]
+        for (index, _, sheet), future in zip(tasks, futures):
+            yield index, sheet, future.result()[0]
+
+
+def load_files_to_db(paths, documents=None, duplicates=DUPLICATES, file_names=None, workers=IMPORT_WORKERS):
+    """
+    Загружает все листы всех файлов (Excel или CSV) в один пакет. Каждому делу
+    записывается источник: SourceFile (имя файла для пользователя из file_names),
+    SourceSheet и SourceRow (номер строки на листе, как в Excel). Пустые строки
+    и листы без колонок Cases пропускаются.
+
+    documents — BundleIndex из docstore.ingest_bundle: пути в колонках *DocPath,
+    найденные в загруженном архиве, заменяются ссылками на хранилище документов.
+
+    Каждой строке записывается RowHash; дела, уже поданные в других пакетах
+    (тот же RowHash или InternalID), и повторы строк внутри загрузки обрабатываются
+    по duplicates. Файлы и итог загрузки записываются в ImportFiles
+    (sqlite.get_batch_import).
+    """
+    office_sqlite.check_and_initialize_db()
+    batch_id = f"BATCH-{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    paths = [str(path) for path in paths]
+    file_names = list(file_names or [os.path.basename(path) for path in paths])
+
+    case_columns = office_sqlite.get_case_columns()
+    valid_columns = [name for name, _ in case_columns if name not in _LOADER_COLUMNS]
+    numeric_columns = {name for name, kind in case_columns if "REAL" in kind or "INT" in kind}
+
+    files = [(path, _sheet_names(path)) for path in paths]
+    rows = []
+    for index, sheet, (columns, values) in _parse_all(files, valid_columns, workers):
+        name = file_names[index]
+        if not columns:
+            log.warning("Лист %r файла %s пропущен: нет колонок таблицы Cases", sheet, name)
+            continue
+        for number, value in enumerate(values, start=2):
+            if all(item is None for item in value):
+                continue
+            data = dict(zip(columns, value))
+            if documents is not None:
+                for column in office_sqlite.DOCUMENT_COLUMNS:
+                    if column in data:
+                        data[column] = documents.rewrite(data[column])
+            data["RowHash"] = row_hash(data, numeric_columns)
+            data.update(SourceFile=name, SourceSheet=sheet, SourceRow=number)
+            rows.append((index, data))
+
+    filed_by_hash, filed_by_id = ({}, {}) if duplicates == "allow" else office_sqlite.find_filed_cases(
+        (data["RowHash"] for _, data in rows),
+        (data.get("InternalID") for _, data in rows if isinstance(data.get("InternalID"), str)),
+    )
+    seen = set()
+    per_file = [{"rows": 0, "duplicates": 0, "skipped": 0} for _ in paths]
+    # строки с одинаковым набором колонок вставляются одним executemany;
+    # отсутствующие колонки не передаются, чтобы сработали DEFAULT таблицы
+    groups: Dict[Tuple[str, ...], List[tuple]] = {}
+    for index, data in rows:
+        counters = per_file[index]
+        counters["rows"] += 1
+        if duplicates != "allow":
+            filed = filed_by_hash.get(data["RowHash"]) or filed_by_id.get(data.get("InternalID"))
+            if filed is not None:
+                reason = f"Уже подано: пакет {filed['BatchID']}, дело {filed['InternalID']}, талон {filed['TalonID']}"
+            elif data["RowHash"] in seen:
+                reason = "Повтор строки в этой же загрузке"
+            else:
+                reason = None
+            seen.add(data["RowHash"])
+            if reason:
+                counters["duplicates"] += 1
+                if duplicates == "skip":
+                    counters["skipped"] += 1
+                    continue
+                data.update(ErrorClass=DUPLICATE, LastError=reason, NeedsReview=1)
         data["BatchID"] = batch_id
-        columns = ', '.join(f'"{col}"' for col in data.keys())
-        placeholders = ', '.join('?' for _ in data)
-        values = list(data.values())
-        try:
-            cursor.execute(f"INSERT INTO Cases ({columns}) VALUES ({placeholders})", values)
-        except sqlite3.OperationalError as e:
-            print(f"Ошибка выполнения SQL: {e}")
-            print("Убедитесь, что заголовки столбцов в Excel совпадают с полями таблицы Cases.")
-            conn.close()
-            raise
-    conn.commit()
-    conn.close()
-    print(f"Данные из {excel_file_path} загружены в базу. BatchID: {batch_id}")
+        groups.setdefault(tuple(data), []).append(tuple(data.values()))
+
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        cursor = conn.cursor()
+        for columns, values in groups.items():
+            column_list = ', '.join(f'"{col}"' for col in columns)
+            placeholders = ', '.join('?' for _ in columns)
+            cursor.executemany(f"INSERT INTO Cases ({column_list}) VALUES ({placeholders})", values)
+        conn.commit()
+    except sqlite3.OperationalError as e:
+        log.error(
+            "Ошибка выполнения SQL: %s. Убедитесь, что заголовки столбцов в Excel совпадают с полями таблицы Cases.", e,
+        )
+        raise
+    finally:
+        conn.close()
+
+    for path, name, counters in zip(paths, file_names, per_file):
+        office_sqlite.save_import_file(
+            file_sha256(path), batch_id, name, counters["rows"], counters["duplicates"], counters["skipped"],
+        )
+    log.info(
+        "Данные из %s (%s лист.) загружены в базу. BatchID: %s, дел: %s, повторов: %s",
+        ", ".join(file_names), sum(len(sheets) for _, sheets in files), batch_id, len(rows),
+        sum(c["duplicates"] for c in per_file),
+    )
     return batch_id
 
+
+def load_excel_to_db(excel_file_path, documents=None, duplicates=DUPLICATES, file_name=None):
+    """Один файл (все его листы) — см. load_files_to_db."""
+    return load_files_to_db(
+        [excel_file_path], documents, duplicates, [file_name] if file_name else None,
+    )
+
 def write_data_to_excel(data: List[Dict[str, Any]], output_file_path: str):
     df = pd.DataFrame(data)
     columns_to_drop = []
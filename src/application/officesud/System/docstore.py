@@ -0,0 +1,343 @@
+# System/docstore.py
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Set, Tuple
+
+from .logger import get_logger
+from . import sqlite
+
+log = get_logger("DocumentStore")
+
+# Хранилище документов лежит рядом с общей БД: его видят и Django, и воркеры
+STORE_DIR = os.environ.get(
+    "OFFICESUD_DOCUMENT_STORE",
+    os.path.join(os.path.dirname(sqlite.DB_PATH), "documents"),
+)
+STORE_MAX_MB = int(os.environ.get("OFFICESUD_DOCUMENT_STORE_MAX_MB", "2048"))
+DOCUMENT_MAX_MB = int(os.environ.get("OFFICESUD_DOCUMENT_MAX_MB", "50"))
+
+# Ссылка на документ в колонках *DocPath: store:<sha256>/<имя файла для сайта>
+REF_PREFIX = "store:"
+DATA_NAME = ".data"
+CHUNK = 1024 * 1024
+MB = 1024 * 1024
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class BundleError(ValueError):
+    """Архив документов не читается или содержит недопустимые файлы."""
+
+
+def is_ref(path: str) -> bool:
+    return (path or "").startswith(REF_PREFIX)
+
+
+def make_ref(digest: str, name: str) -> str:
+    return f"{REF_PREFIX}{digest}/{_safe_name(name)}"
+
+
+def _safe_name(name: str) -> str:
+    name = os.path.basename(name.replace("\\", "/")).strip()
+    return re.sub(r"[\x00-\x1f/]", "_", name) or "document"
+
+
+def _object_dir(digest: str, directory: str) -> str:
+    return os.path.join(directory, digest[:2], digest)
+
+
+def data_path(digest: str, directory: str = STORE_DIR) -> str:
+    """Файл с содержимым документа в хранилище."""
+    return os.path.join(_object_dir(digest, directory), DATA_NAME)
+
+
+def parse_ref(ref: str) -> Optional[Tuple[str, str]]:
+    """(sha256, имя) ссылки или None, если это не ссылка хранилища."""
+    if not is_ref(ref):
+        return None
+    digest, _, name = ref[len(REF_PREFIX):].partition("/")
+    if not _HASH_RE.match(digest) or not name or name != _safe_name(name):
+        return None
+    return digest, name
+
+
+def resolve(path: str, directory: str = STORE_DIR) -> str:
+    """
+    Путь на диске для значения из колонки *DocPath. Для ссылки хранилища —
+    файл с исходным именем (жёсткая ссылка на содержимое, сайт видит это имя);
+    если документ вытеснен из хранилища, возвращается несуществующий путь.
+    Обращение отмечает документ как недавно использованный (LRU).
+    """
+    parsed = parse_ref(path)
+    if parsed is None:
+        return os.path.abspath(path)
+    digest, name = parsed
+    data = data_path(digest, directory)
+    named = os.path.join(os.path.dirname(data), name)
+    try:
+        os.utime(data)
+        if not os.path.exists(named):
+            _link(data, named)
+    except FileNotFoundError:
+        log.warning("Document %s is not in the store (evicted?)", path)
+    return named
+
+
+def _link(src: str, dest: str) -> None:
+    try:
+        os.link(src, dest)
+    except FileExistsError:
+        pass
+    except OSError:
+        # файловая система без жёстких ссылок
+        shutil.copyfile(src, dest)
+
+
+def _validate(name: str, head: bytes, size: int) -> Optional[str]:
+    """Причина отказа или None: проверяется один раз, при первом появлении содержимого."""
+    if size == 0:
+        return "пустой файл"
+    if name.lower().endswith(".pdf") and not head.startswith(b"%PDF-"):
+        return "файл .pdf не является PDF"
+    return None
+
+
+def ingest_stream(
+    source: BinaryIO,
+    name: str,
+    directory: str = STORE_DIR,
+    max_bytes: int = DOCUMENT_MAX_MB * MB,
+) -> Tuple[str, bool, int]:
+    """
+    Потоково пишет документ во временный файл хранилища, считая sha256 на лету.
+    Возвращает (ссылка, новый ли документ, размер). Одинаковое содержимое
+    хранится один раз, сколько бы пакетов и дел на него ни ссылались.
+    """
+    tmp_dir = os.path.join(directory, ".tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = source.read(CHUNK)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise BundleError(f"{name}: больше {max_bytes // MB} МБ")
+                if len(head) < 8:
+                    head += chunk[:8]
+                digest.update(chunk)
+                tmp.write(chunk)
+
+        hexdigest = digest.hexdigest()
+        data = data_path(hexdigest, directory)
+        object_dir = os.path.dirname(data)
+        ref = make_ref(hexdigest, name)
+        if os.path.exists(data):
+            os.utime(data)
+            _link(data, os.path.join(object_dir, parse_ref(ref)[1]))
+            return ref, False, size
+
+        reason = _validate(name, head, size)
+        if reason:
+            raise BundleError(f"{name}: {reason}")
+        os.makedirs(object_dir, exist_ok=True)
+        os.replace(tmp_path, data)
+        _link(data, os.path.join(object_dir, parse_ref(ref)[1]))
+        return ref, True, size
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class BundleIndex:
+    """
+    Документы распакованного архива: путь внутри архива -> ссылка хранилища.
+    Пути из Excel сопоставляются по самому длинному совпадающему хвосту пути,
+    так что «C:\\Иски\\Иванов\\иск.pdf» найдёт «Иванов/иск.pdf» в архиве.
+    """
+
+    def __init__(self):
+        self._by_name: Dict[str, List[Tuple[List[str], str]]] = {}
+        self.stats = {"files": 0, "new": 0, "deduplicated": 0, "bytes_new": 0, "bytes_deduplicated": 0}
+        self.unmatched: Set[str] = set()
+
+    @staticmethod
+    def _parts(path: str) -> List[str]:
+        return [part for part in path.replace("\\", "/").lower().split("/") if part and part != "."]
+
+    def add(self, member_path: str, ref: str) -> None:
+        parts = self._parts(member_path)
+        self._by_name.setdefault(parts[-1], []).append((parts, ref))
+
+    def refs(self) -> Iterable[str]:
+        for entries in self._by_name.values():
+            for _, ref in entries:
+                yield ref
+
+    def lookup(self, path: str) -> Optional[str]:
+        parts = self._parts(path)
+        if not parts:
+            return None
+        best, best_len = None, 0
+        for member_parts, ref in self._by_name.get(parts[-1], []):
+            common = 0
+            for a, b in zip(reversed(member_parts), reversed(parts)):
+                if a != b:
+                    break
+                common += 1
+            if common > best_len:
+                best, best_len = ref, common
+        return best
+
+    def rewrite(self, value: Any) -> Any:
+        """Значение колонки *DocPath с путями, заменёнными на ссылки хранилища."""
+        if not isinstance(value, str) or not value.strip():
+            return value
+        rewritten = []
+        for path in value.split("*"):
+            path = path.strip()
+            if not path:
+                continue
+            ref = self.lookup(path)
+            if ref is None:
+                # пути нет в архиве — оставляем как есть (файл может лежать на сервере)
+                self.unmatched.add(path)
+                rewritten.append(path)
+            else:
+                rewritten.append(ref)
+        return "*".join(rewritten)
+
+
+def _skip_member(info: zipfile.ZipInfo) -> bool:
+    name = info.filename.replace("\\", "/")
+    base = name.rsplit("/", 1)[-1]
+    return info.is_dir() or name.startswith("__MACOSX/") or base.startswith(".") or not base
+
+
+def ingest_bundle(
+    bundle: Any,
+    directory: str = STORE_DIR,
+    max_mb: int = STORE_MAX_MB,
+) -> BundleIndex:
+    """
+    Распаковывает ZIP (путь или файловый объект) в хранилище по одному файлу,
+    не распаковывая архив целиком. Недопустимые файлы — BundleError со списком.
+    После загрузки применяется лимит размера хранилища.
+    """
+    index = BundleIndex()
+    rejected = []
+    try:
+        archive = zipfile.ZipFile(bundle)
+    except zipfile.BadZipFile as e:
+        raise BundleError(f"Архив документов не читается: {e}") from e
+    with archive:
+        for info in archive.infolist():
+            if _skip_member(info):
+                continue
+            if info.file_size > DOCUMENT_MAX_MB * MB:
+                rejected.append(f"{info.filename}: больше {DOCUMENT_MAX_MB} МБ")
+                continue
+            try:
+                with archive.open(info) as source:
+                    ref, new, size = ingest_stream(source, info.filename, directory)
+            except BundleError as e:
+                rejected.append(str(e))
+                continue
+            index.add(info.filename, ref)
+            index.stats["files"] += 1
+            index.stats["new" if new else "deduplicated"] += 1
+            index.stats["bytes_new" if new else "bytes_deduplicated"] += size
+    if rejected:
+        raise BundleError("Недопустимые файлы в архиве: " + "; ".join(rejected[:20]))
+
+    keep = {parse_ref(ref)[0] for ref in index.refs()}
+    enforce_size(directory, max_mb, keep=keep)
+    log.info("Document bundle ingested: %s", index.stats)
+    return index
+
+
+def referenced_digests() -> Set[str]:
+    """Документы неподанных дел: их вытеснять нельзя."""
+    digests = set()
+    for ref in sqlite.get_pending_document_refs(REF_PREFIX):
+        parsed = parse_ref(ref)
+        if parsed is not None:
+            digests.add(parsed[0])
+    return digests
+
+
+def enforce_size(directory: str = STORE_DIR, max_mb: int = STORE_MAX_MB, keep: Optional[Set[str]] = None) -> int:
+    """
+    LRU: пока хранилище больше max_mb, удаляет документы с самым давним
+    использованием, кроме нужных неподанным делам. Возвращает число удалённых.
+    """
+    objects = []
+    total = 0
+    for prefix in os.listdir(directory) if os.path.isdir(directory) else []:
+        prefix_dir = os.path.join(directory, prefix)
+        if prefix.startswith(".") or not os.path.isdir(prefix_dir):
+            continue
+        for digest in os.listdir(prefix_dir):
+            try:
+                stat = os.stat(os.path.join(prefix_dir, digest, DATA_NAME))
+            except OSError:
+                continue
+            objects.append((stat.st_mtime, stat.st_size, digest))
+            total += stat.st_size
+    if total <= max_mb * MB:
+        return 0
+
+    keep = set(keep or ()) | referenced_digests()
+    removed = 0
+    for _, size, digest in sorted(objects):
+        if total <= max_mb * MB:
+            break
+        if digest in keep:
+            continue
+        shutil.rmtree(_object_dir(digest, directory), ignore_errors=True)
+        total -= size
+        removed += 1
+    if total > max_mb * MB:
+        log.warning("Document store is %s MiB over its cap: all of it is needed by pending cases",
+                    (total - max_mb * MB) // MB)
+    return removed
+
+
+def prune_unreferenced(directory: str = STORE_DIR, max_age_days: int = 30) -> int:
+    """
+    Удаляет документы, на которые не ссылается ни одно дело в БД (в том числе
+    после архивации пакетов) и которые не использовались max_age_days дней.
+    Возвращает число удалённых.
+    """
+    cutoff = time.time() - max_age_days * 86400
+    referenced = {
+        parsed[0]
+        for parsed in map(parse_ref, sqlite.get_pending_document_refs(REF_PREFIX, pending_only=False))
+        if parsed is not None
+    }
+    removed = 0
+    for prefix in os.listdir(directory) if os.path.isdir(directory) else []:
+        prefix_dir = os.path.join(directory, prefix)
+        if prefix.startswith(".") or not os.path.isdir(prefix_dir):
+            continue
+        for digest in os.listdir(prefix_dir):
+            try:
+                mtime = os.stat(os.path.join(prefix_dir, digest, DATA_NAME)).st_mtime
+            except OSError:
+                continue
+            if mtime < cutoff and digest not in referenced:
+                shutil.rmtree(os.path.join(prefix_dir, digest), ignore_errors=True)
+                removed += 1
+    if removed:
+        log.info("Pruned %s unreferenced documents from the store", removed)
+    return removed
@@ -0,0 +1,86 @@
+# System/errors.py
+import os
+from typing import Optional
+
+from playwright.sync_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+
+# Классы сбоев дела (колонка Cases.ErrorClass)
+TRANSIENT = "transient"
+VALIDATION = "validation"
+MISSING_DOCUMENT = "missing_document"
+SELECTOR_DRIFT = "selector_drift"
+TIMEOUT = "timeout"
+# Форма уже отправлена, а талона нет: повтор подал бы дело второй раз
+SUBMITTED_NO_TALON = "submitted_no_talon"
+# Дело уже подано в другом пакете (dataloader при загрузке): повтор подал бы его второй раз
+DUPLICATE = "duplicate"
+
+# Базовая пауза перед повтором (секунды, удваивается с каждой попыткой); None — без повтора,
+# дело ждёт разбора человеком (Cases.NeedsReview)
+RETRY_BACKOFF = {
+    TRANSIENT: float(os.environ.get("OFFICESUD_RETRY_TRANSIENT_SECONDS", "30")),
+    TIMEOUT: float(os.environ.get("OFFICESUD_RETRY_TIMEOUT_SECONDS", "60")),
+    # вёрстка могла не догрузиться; на свежей вкладке одна-две попытки обычно проходят
+    SELECTOR_DRIFT: float(os.environ.get("OFFICESUD_RETRY_SELECTOR_SECONDS", "10")),
+    VALIDATION: None,
+    MISSING_DOCUMENT: None,
+    SUBMITTED_NO_TALON: None,
+    DUPLICATE: None,
+}
+RETRY_MAX_BACKOFF = float(os.environ.get("OFFICESUD_RETRY_MAX_BACKOFF_SECONDS", "600"))
+
+# Фрагменты сообщений Playwright, по которым видно, что страница не та, что ждали
+_SELECTOR_DRIFT_MARKERS = ("strict mode violation", "element is not attached", "not an <select>", "element is not a")
+_VALIDATION_MARKERS = ("did not find some options",)
+_TRANSIENT_MARKERS = ("net::", "navigation failed", "target closed", "has been closed", "connection")
+
+
+class CaseError(Exception):
+    """Сбой дела с известным классом; kind определяет политику повтора."""
+
+    kind = TRANSIENT
+
+
+class CaseValidationError(CaseError):
+    """Данные дела не годятся для формы (пустой суд, нет участников, сайт не принял значение)."""
+
+    kind = VALIDATION
+
+
+class MissingDocument(CaseError):
+    kind = MISSING_DOCUMENT
+
+
+class SelectorDrift(CaseError):
+    kind = SELECTOR_DRIFT
+
+
+class SubmittedWithoutTalon(CaseError):
+    kind = SUBMITTED_NO_TALON
+
+
+def classify(error: BaseException) -> str:
+    """Класс сбоя по исключению; всё неопознанное считается временным сбоем сайта."""
+    if isinstance(error, CaseError):
+        return error.kind
+    if isinstance(error, FileNotFoundError):
+        return MISSING_DOCUMENT
+    message = str(error).lower()
+    if any(marker in message for marker in _VALIDATION_MARKERS):
+        return VALIDATION
+    if isinstance(error, PlaywrightTimeoutError):
+        return TIMEOUT
+    if isinstance(error, PlaywrightError):
+        if any(marker in message for marker in _SELECTOR_DRIFT_MARKERS):
+            return SELECTOR_DRIFT
+        if any(marker in message for marker in _TRANSIENT_MARKERS):
+            return TRANSIENT
+    return TRANSIENT
+
+
+def retry_delay(kind: str, attempt: int) -> Optional[float]:
+    """Через сколько секунд повторить дело после попытки attempt; None — не повторять."""
+    base = RETRY_BACKOFF.get(kind, RETRY_BACKOFF[TRANSIENT])
+    if base is None:
+        return None
+    return min(RETRY_MAX_BACKOFF, base * 2 ** max(attempt - 1, 0))
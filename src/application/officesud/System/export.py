@@ -0,0 +1,217 @@
+# System/export.py
+"""
+Потоковая выгрузка результатов пакета в xlsx, CSV и Parquet. Строки читаются
+из SQLite порциями (sqlite.iter_batch_rows), а для архивного пакета — из его
+архива (archive.iter_archived_rows); память не растёт с размером пакета.
+"""
+import codecs
+import contextlib
+import csv
+import io
+import json
+import os
+from typing import Any, BinaryIO, Iterator, List, Tuple, Union
+
+import xlsxwriter
+
+from .logger import get_logger
+from . import archive, sqlite
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # необязательная зависимость: без неё нет только Parquet
+    pyarrow = None
+
+log = get_logger("Export")
+
+CHUNK_ROWS = int(os.environ.get("OFFICESUD_EXPORT_CHUNK_ROWS", "2000"))
+# Служебные колонки, которые не выгружаются (как в dataloader.write_data_to_excel)
+EXCLUDED_COLUMNS = ("DB_Case_ID", "BatchID", "RowHash")
+SHEET_NAME = "Экспорт_Пакет"
+XLSX_MAX_ROWS = 1048576
+
+FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+# Лента изменений: курсор клиента — ChangeSeq последнего полученного изменения
+CHANGE_FORMATS = {
+    "jsonl": "application/x-ndjson; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+}
+CHANGES_LIMIT = int(os.environ.get("OFFICESUD_CHANGES_LIMIT", "10000"))
+
+Target = Union[str, BinaryIO]
+
+
+class ExportUnavailable(RuntimeError):
+    """Формат выгрузки требует необязательной зависимости, которой нет."""
+
+
+def available_formats() -> List[str]:
+    return [fmt for fmt in FORMATS if fmt != "parquet" or pyarrow is not None]
+
+
+def export_columns() -> List[Tuple[str, str]]:
+    return [(name, kind) for name, kind in sqlite.get_case_columns() if name not in EXCLUDED_COLUMNS]
+
+
+def _batch_rows(batch_id: str, columns: List[str], chunk_rows: int) -> Iterator[List[tuple]]:
+    if archive.is_archived(batch_id):
+        return archive.iter_archived_rows(batch_id, columns, chunk_rows)
+    return sqlite.iter_batch_rows(batch_id, columns, chunk_rows)
+
+
+def iter_csv(batch_id: str, chunk_rows: int = CHUNK_ROWS) -> Iterator[bytes]:
+    """CSV (UTF-8 с BOM — Excel открывает кириллицу без перекодировки) порциями байтов."""
+    columns = [name for name, _ in export_columns()]
+    yield codecs.BOM_UTF8
+    yield from _csv_chunks(columns, _batch_rows(batch_id, columns, chunk_rows))
+
+
+def _csv_chunks(columns: List[str], chunks: Iterator[List[tuple]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def write_csv(batch_id: str, target: Target, chunk_rows: int = CHUNK_ROWS) -> None:
+    with _open(target) as f:
+        for chunk in iter_csv(batch_id, chunk_rows):
+            f.write(chunk)
+
+
+def write_xlsx(batch_id: str, target: Target, chunk_rows: int = CHUNK_ROWS) -> int:
+    """
+    xlsx в режиме constant_memory: xlsxwriter держит в памяти одну строку, остальное
+    сразу уходит во временные файлы. Сверх лимита строк Excel — продолжение на новом листе.
+    Возвращает число строк.
+    """
+    columns = [name for name, _ in export_columns()]
+    workbook = xlsxwriter.Workbook(target, {
+        "constant_memory": True,
+        # значения выгружаем как есть: без превращения строк в числа и ссылки
+        "strings_to_numbers": False,
+        "strings_to_urls": False,
+        "strings_to_formulas": False,
+    })
+    header = workbook.add_format({"bold": True})
+    sheet, sheet_row, sheets, total = None, XLSX_MAX_ROWS, 0, 0
+    try:
+        for rows in _batch_rows(batch_id, columns, chunk_rows):
+            for row in rows:
+                if sheet_row >= XLSX_MAX_ROWS:
+                    sheets += 1
+                    sheet = workbook.add_worksheet(SHEET_NAME if sheets == 1 else f"{SHEET_NAME} ({sheets})")
+                    sheet.write_row(0, 0, columns, header)
+                    sheet_row = 1
+                for col, value in enumerate(row):
+                    if value is not None:
+                        sheet.write(sheet_row, col, value)
+                sheet_row += 1
+                total += 1
+        if sheet is None:
+            sheet = workbook.add_worksheet(SHEET_NAME)
+            sheet.write_row(0, 0, columns, header)
+    finally:
+        workbook.close()
+    return total
+
+
+def _parquet_type(kind: str):
+    if "INT" in kind:
+        return pyarrow.int64()
+    if "REAL" in kind or "FLOA" in kind or "DOUB" in kind:
+        return pyarrow.float64()
+    return pyarrow.string()
+
+
+def _coerce(value: Any, arrow_type) -> Any:
+    if value is None:
+        return None
+    if arrow_type == pyarrow.string():
+        return str(value)
+    try:
+        return int(value) if arrow_type == pyarrow.int64() else float(value)
+    except (TypeError, ValueError):
+        # SQLite хранит в числовой колонке текст, если он не число; в Parquet — пусто
+        return None
+
+
+def write_parquet(batch_id: str, target: Target, chunk_rows: int = CHUNK_ROWS) -> int:
+    """Parquet: одна группа строк на порцию курсора, типы — по объявленным типам Cases."""
+    if pyarrow is None:
+        raise ExportUnavailable("Для выгрузки в Parquet нужен pyarrow")
+    columns = export_columns()
+    schema = pyarrow.schema([(name, _parquet_type(kind)) for name, kind in columns])
+    total, skipped = 0, 0
+    with pyarrow.parquet.ParquetWriter(target, schema) as writer:
+        for rows in _batch_rows(batch_id, [name for name, _ in columns], chunk_rows):
+            arrays = []
+            for index, field in enumerate(schema):
+                values = [_coerce(row[index], field.type) for row in rows]
+                skipped += sum(1 for row, value in zip(rows, values) if value is None and row[index] is not None)
+                arrays.append(pyarrow.array(values, type=field.type))
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+            total += len(rows)
+    if skipped:
+        log.warning("Parquet export of %s: %s non-numeric values in numeric columns left empty", batch_id, skipped)
+    return total
+
+
+def _open(target: Target):
+    """Путь открывается на запись, уже открытый двоичный файл используется как есть."""
+    if isinstance(target, (str, os.PathLike)):
+        return open(target, "wb")
+    return contextlib.nullcontext(target)
+
+
+def change_columns() -> List[str]:
+    """Колонки ленты: номер изменения и ключи дела впереди, служебные колонки аренды — нет."""
+    head = ["ChangeSeq", "DB_Case_ID", "BatchID"]
+    return head + [
+        name for name, _ in sqlite.get_case_columns()
+        if name not in head and name not in sqlite.CHANGE_IGNORED_COLUMNS
+    ]
+
+
+def iter_changes(
+    since: int,
+    until: int,
+    fmt: str = "jsonl",
+    batch_id: str = None,
+    chunk_rows: int = CHUNK_ROWS,
+) -> Iterator[bytes]:
+    """Дела, изменённые в окне (since, until] из sqlite.get_change_window, в JSONL или CSV."""
+    columns = change_columns()
+    chunks = sqlite.iter_changes(since, until, columns, batch_id, chunk_rows)
+    if fmt == "jsonl":
+        for rows in chunks:
+            yield "".join(
+                json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows
+            ).encode("utf-8")
+        return
+    if fmt != "csv":
+        raise ValueError(f"Неизвестный формат ленты изменений: {fmt}")
+    yield from _csv_chunks(columns, chunks)
+
+
+def export_batch(batch_id: str, target: Target, fmt: str = "xlsx") -> None:
+    """Выгрузка пакета в файл (путь или двоичный файловый объект) в формате fmt."""
+    if fmt == "xlsx":
+        write_xlsx(batch_id, target)
+    elif fmt == "csv":
+        write_csv(batch_id, target)
+    elif fmt == "parquet":
+        write_parquet(batch_id, target)
+    else:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
@@ -1,79 +1,200 @@
 # System/filler.py
+import os
 import time
-import random
+from typing import Callable, Dict, Optional
 from playwright.sync_api import Page, expect, TimeoutError
 from .logger import get_logger
 from .uploader import FileUploader
 from .modal import ParticipantModal
-import xml.etree.ElementTree as ET
-from . import sqlite
+from .governor import RateGovernor
+from .pacing import AdaptivePacer
+from .talon import TalonCapture, parse_talon_xml
 
 log = get_logger("Filler")
 
+# Не выбирать заново значения, которые сайт сохранил в форме с прошлого дела.
+FORM_REUSE = os.environ.get("OFFICESUD_FORM_REUSE", "1") not in ("0", "false", "False")
+
+# Другой адрес — только для офлайн-стенда (benchmarks/standin.py)
+SITE_URL = os.environ.get("OFFICESUD_SITE_URL", "https://office.sud.kz").rstrip("/")
+CABINET_URL = f"{SITE_URL}/form/proceedings/services.xhtml"
+# Прямая ссылка на форму подачи, если сайт её поддерживает; пусто — через «Құжаттарды жіберу»
+FILING_FORM_URL = os.environ.get("OFFICESUD_FILING_FORM_URL", "")
+LOGIN_TIMEOUT = float(os.environ.get("OFFICESUD_LOGIN_TIMEOUT", "300"))
+TALON_WAIT_SECONDS = float(os.environ.get("OFFICESUD_TALON_WAIT_SECONDS", "20"))
+TALON_POLL_MS = 500
+
+REGION_LABEL = "Облыс (астана, республикалық маңызы бар қала)"
+COURT_LABEL = "Сот органы"
+
 
 class Filler:
-    def __init__(self, page: Page):
+    def __init__(
+        self,
+        page: Page,
+        governor: Optional[RateGovernor] = None,
+        pacer: Optional[AdaptivePacer] = None,
+    ):
         self.page = page
-        self.uploader = FileUploader(page)
-        self.modal = ParticipantModal(page)
+        self.pacer = pacer or AdaptivePacer()
+        self.uploader = FileUploader(page, self.pacer)
+        self.modal = ParticipantModal(page, self.pacer)
+        self.governor = governor
+        self.court_id = None
+        self.talon_capture = TalonCapture(page)
+        self.last_talon_id = None
+        # DB_Case_ID дела, форма которого уже открыта на этой странице (конвейер CaseProcessor)
+        self.prepared_case_id = None
+        # форма текущего дела отправлена на сайт: после этого дело нельзя повторять
+        self.submitted = False
+        self.form_reuse = FORM_REUSE
+        self._select_cost: Dict[str, float] = {}
+        self._form_reused = 0
+        self._form_saved = 0.0
         log.debug("Filler initialized with new Playwright page")
 
+    def throttle(self, court_id=None):
+        """Токен общего лимита перед навигацией или отправкой формы."""
+        if self.governor is not None:
+            self.governor.acquire(court_id)
+
     def wait_loader(self, timeout: int = 100000):
         loader = self.page.locator(".loader")
         if loader.count() > 0:
             log.debug("Waiting for loader to disappear (timeout=%s ms)", timeout)
-            loader.wait_for(state="hidden", timeout=timeout)
+            started = time.monotonic()
+            try:
+                loader.wait_for(state="hidden", timeout=timeout)
+            except TimeoutError:
+                self.pacer.failure("loader_timeout")
+                raise
+            self.pacer.observe("loader", time.monotonic() - started)
         else:
             log.debug("Loader element not found, skipping wait")
-        sleep_time = random.uniform(1, 2)
+        sleep_time = self.pacer.pause(1, 2)
         log.debug("Extra sleep after loader: %.2f sec", sleep_time)
-        time.sleep(sleep_time)
+
+    def _current_value(self, locator) -> Optional[str]:
+        try:
+            return locator.input_value(timeout=2000)
+        except Exception:
+            return None
+
+    def select(self, label: str, value, settle: Optional[Callable[[], None]] = None, reuse: bool = True) -> bool:
+        """
+        select_option по подписи поля и ожидание settle (лоадер/пауза).
+        Если поле уже содержит value — ничего не делаем: экономим выбор, AJAX
+        и ожидание; сэкономленное время оценивается по замерам прошлых выборов.
+        Возвращает True, если значение действительно выбиралось.
+        """
+        value = str(value)
+        locator = self.page.get_by_label(label)
+        if reuse and self.form_reuse and self._current_value(locator) == value:
+            log.debug("Form reuse: '%s' already set to %s", label, value)
+            self._form_reused += 1
+            self._form_saved += self._select_cost.get(label, 0.0)
+            return False
+
+        started = time.monotonic()
+        locator.select_option(value)
+        if settle is not None:
+            settle()
+        cost = time.monotonic() - started
+        previous = self._select_cost.get(label)
+        self._select_cost[label] = cost if previous is None else (previous + cost) / 2
+        return True
+
+    def take_form_metrics(self) -> Dict[str, int]:
+        """Пропущенные выборы и сэкономленные вызовы драйвера с прошлого вызова (для метрик шага)."""
+        metrics = {}
+        if self._form_reused:
+            metrics = {"form_reused": self._form_reused, "form_saved_ms": int(self._form_saved * 1000)}
+        if self.modal.calls_saved:
+            metrics["modal_calls_saved"] = self.modal.calls_saved
+        self._form_reused, self._form_saved = 0, 0.0
+        self.modal.calls_saved = 0
+        return metrics
 
     def starting_process(self):
         log.info("Opening cabinet home page")
-        self.page.goto("https://office.sud.kz/", timeout=0)
+        self.throttle()
+        self.page.goto(f"{SITE_URL}/", timeout=0)
+
+    def is_logged_in(self, timeout: float = 15000) -> bool:
+        """Кабинет открыт: видна ссылка «Құжаттарды жіберу»."""
+        try:
+            self.page.get_by_role("link", name="Құжаттарды жіберу").wait_for(state="visible", timeout=timeout)
+            return True
+        except TimeoutError:
+            return False
+
+    def wait_for_login(self) -> bool:
+        log.info("Waiting up to %.0f sec for login", LOGIN_TIMEOUT)
+        return self.is_logged_in(timeout=LOGIN_TIMEOUT * 1000)
+
+    def resume_session(self) -> bool:
+        """С сохранённым storage_state открываем сразу кабинет; False — сессия на сайте истекла."""
+        log.info("Resuming saved session")
+        self.throttle()
+        self.page.goto(CABINET_URL)
+        return self.is_logged_in()
+
+    def _open_form_by_deep_link(self) -> bool:
+        self.throttle()
+        self.page.goto(FILING_FORM_URL)
+        try:
+            self.page.get_by_label("Сот ісін жүргізу түрі").wait_for(state="visible", timeout=15000)
+            return True
+        except TimeoutError:
+            log.warning("Deep link %s did not open the filing form, falling back to cabinet", FILING_FORM_URL)
+            self.throttle()
+            self.page.goto(CABINET_URL)
+            return False
 
     def open_lawsuit_filing_form(self, RegionID, CourtID):
         log.info("Opening lawsuit filing form (RegionID=%s, CourtID=%s)", RegionID, CourtID)
         self.page.wait_for_load_state("domcontentloaded", timeout=0)
+        self.court_id = None
+        self.last_talon_id = None
+        self.submitted = False
 
-        self.page.get_by_role("link", name="Құжаттарды жіберу").click()
-        self.wait_loader()
+        if not (FILING_FORM_URL and self._open_form_by_deep_link()):
+            self.throttle()
+            self.page.get_by_role("link", name="Құжаттарды жіберу").click()
+            self.wait_loader()
 
-        self.page.get_by_label("Сот ісін жүргізу түрі").select_option("CIVIL")
-        self.wait_loader()
+        self.select("Сот ісін жүргізу түрі", "CIVIL", settle=self.wait_loader)
 
-        self.page.get_by_label("Саты").select_option("FIRSTINSTANCE")
-        self.page.get_by_label("Құжат түрі").select_option("3")
-        self.wait_loader()
+        self.select("Саты", "FIRSTINSTANCE")
+        self.select("Құжат түрі", "3", settle=self.wait_loader)
 
+        self.throttle()
         self.page.get_by_role("button", name="Жіберу").click()
         self.wait_loader()
 
-        self.page.get_by_label("Іс бойынша іс жүргізу түрі").select_option("2")
-        self.wait_loader()
-        self.page.get_by_label("Іс санаты").select_option("27")
-        self.wait_loader()
-        self.page.get_by_label("Арыз сипаты").select_option("1")
-        self.wait_loader()
+        self.select("Іс бойынша іс жүргізу түрі", "2", settle=self.wait_loader)
+        self.select("Іс санаты", "27", settle=self.wait_loader)
+        self.select("Арыз сипаты", "1", settle=self.wait_loader)
 
         max_retries = 3
         for attempt in range(max_retries):
+            # каждая попытка — отдельный запрос к суду, поэтому и токен отдельный
+            self.throttle(CourtID)
             try:
                 log.debug("Attempt %s to select Region/Court", attempt + 1)
-                self.page.get_by_label(
-                    "Облыс (астана, республикалық маңызы бар қала)"
-                ).select_option(str(RegionID))
-                time.sleep(random.uniform(1, 2))
-                court_selector = self.page.get_by_label("Сот органы")
+                # после неудачной попытки выбираем всё заново, не доверяя форме
+                reuse = attempt == 0
+                self.select(REGION_LABEL, RegionID, settle=lambda: self.pacer.pause(1, 2), reuse=reuse)
+                court_selector = self.page.get_by_label(COURT_LABEL)
                 if court_selector.is_visible(timeout=10000):
-                    court_selector.select_option(str(CourtID))
-                    time.sleep(random.uniform(2, 3))
+                    self.select(COURT_LABEL, CourtID, settle=lambda: self.pacer.pause(2, 3), reuse=reuse)
+                    self.court_id = CourtID
                     log.info("Region/Court successfully selected")
                     return
                 else:
                     log.warning("Court selector not visible on attempt %s", attempt + 1)
             except Exception:
+                self.pacer.failure("court_select")
                 log.exception("Error while selecting Region/Court on attempt %s", attempt + 1)
 
             if attempt < max_retries - 1:
@@ -81,7 +202,7 @@ class Filler:
                 self.page.get_by_label("Іс бойынша іс жүргізу түрі").select_option("2")
                 self.page.get_by_label("Іс санаты").select_option("27")
                 self.page.get_by_label("Арыз сипаты").select_option("1")
-                time.sleep(random.uniform(1, 2))
+                self.pacer.pause(1, 2)
             else:
                 log.error("Failed to select region and court after %s attempts", max_retries)
                 raise Exception("Не удалось выбрать регион и суд после нескольких попыток.")
@@ -123,20 +244,22 @@ class Filler:
                         phone=phone or "",
                         email=email or "",
                     )
-                time.sleep(random.uniform(1, 3))
+                self.pacer.pause(1, 3)
                 log.info("Participant added successfully")
                 return
-            except RuntimeError:
-                log.warning("Participant modal runtime error on attempt %s", attempt)
+            except (RuntimeError, TimeoutError) as e:
+                # модалка закрылась или не дождались элемента — открываем участника заново
+                self.pacer.failure("modal_runtime_error")
+                log.warning("Participant modal %s on attempt %s", type(e).__name__, attempt)
                 if attempt == MAX_ATTEMPTS:
                     log.error("Giving up after %s attempts", MAX_ATTEMPTS)
                     raise
-                time.sleep(random.uniform(1, 3))
+                self.pacer.pause(1, 3)
                 continue
             except Exception:
                 log.exception("Unexpected error during add_participant on attempt %s", attempt)
                 raise
-        time.sleep(random.uniform(1, 2))
+        self.pacer.pause(1, 2)
 
     def fill_payment_and_lawsuit_data(
         self,
@@ -157,6 +280,9 @@ class Filler:
             MainDocPath,
             OtherDocPath,
         )
+        # талон может прийти в любом ответе после отправки — слушаем заранее
+        self.talon_capture.start()
+        self.throttle(self.court_id)
         self.page.locator(".button-orange").get_by_text("Ары қарай").click()
         self.wait_loader()
 
@@ -171,6 +297,7 @@ class Filler:
         self.uploader.handle_payment_files(PaymentDocPath)
         self.wait_loader()
 
+        self.throttle(self.court_id)
         self.page.locator(".button-orange").get_by_text("Ары қарай").click()
         self.wait_loader()
 
@@ -180,88 +307,94 @@ class Filler:
 
         if ta_count >= 1:
             text_areas.nth(0).fill(ClaimSummary)
-            time.sleep(random.uniform(1, 2))
+            self.pacer.pause(1, 2)
         if ta_count >= 2:
             text_areas.nth(1).fill(ClaimBasis)
-            time.sleep(random.uniform(1, 2))
+            self.pacer.pause(1, 2)
 
         log.debug("Uploading main and additional documents")
         self.uploader.upload_file("Талап арызды жүктеу", MainDocPath)
-        time.sleep(random.uniform(1, 2))
+        self.pacer.pause(1, 2)
         self.uploader.upload_file("Файлды қоса тіркеу", OtherDocPath)
 
         try:
             self.page.locator(".loader").wait_for(state="hidden", timeout=60000)
         except TimeoutError:
+            self.pacer.failure("upload_timeout")
             log.warning("Timeout while waiting for loader after file upload")
 
-        time.sleep(random.uniform(1, 2))
+        self.pacer.pause(1, 2)
         self.wait_loader()
 
         log.debug("Clicking 'Ары қарай' to proceed to next step (before talon)")
+        self.throttle(self.court_id)
         self.page.locator(".button-orange").get_by_text("Ары қарай").click()
+        self.submitted = True
         self.page.wait_for_load_state("load")
         log.info("Payment and lawsuit data filled; moved to next page")
 
-    def save_talonid(self, internal_id: str):
-        log.info("Attempting to save TalonID for internal_id=%s", internal_id)
+    def _read_talon_from_dom(self, internal_id: str) -> Optional[str]:
+        """TalonID (<f1>) из #xmlToSign0; None, если талона на странице ещё нет."""
+        locator = self.page.locator("#xmlToSign0")
+        if locator.count() == 0:
+            log.debug("#xmlToSign0 element not found yet (internal_id=%s)", internal_id)
+            return None
+        xml_value = locator.get_attribute("value")
+        if not xml_value or not xml_value.strip():
+            log.debug("xmlToSign0.value is empty yet (internal_id=%s)", internal_id)
+            return None
+        log.debug("xmlToSign0.value preview (first 300 chars): %s", xml_value[:300].replace("\n", " "))
+        return parse_talon_xml(xml_value)
+
+    def read_talonid(self, internal_id: str, timeout: float = TALON_WAIT_SECONDS) -> Optional[str]:
+        """
+        TalonID подачи: сначала из ответа сайта (TalonCapture, слушает с начала
+        fill_payment_and_lawsuit_data), затем из #xmlToSign0. Ждёт не дольше
+        timeout секунд; None — талона так и нет.
+        """
+        log.info("Attempting to read TalonID for internal_id=%s", internal_id)
+        deadline = time.monotonic() + timeout
         try:
-            locator = self.page.locator("#xmlToSign0")
-            count = locator.count()
-            log.debug("#xmlToSign0 elements found: %s", count)
-            if count == 0:
-                log.warning("#xmlToSign0 element not found on page; cannot read TalonID")
-                return
-
-            xml_value = locator.get_attribute("value")
-            if xml_value is None:
-                log.warning("xmlToSign0.value is None for internal_id=%s", internal_id)
-                return
-
-            if not xml_value.strip():
-                log.warning("xmlToSign0.value is empty for internal_id=%s", internal_id)
-                return
-
-            preview = xml_value[:300].replace("\n", " ")
-            log.debug("xmlToSign0.value preview (first 300 chars): %s", preview)
-
-            xml_string = xml_value.replace("&lt;", "<").replace("&gt;", ">")
-            try:
-                root = ET.fromstring(xml_string)
-            except ET.ParseError:
-                log.exception("Failed to parse XML from xmlToSign0 for internal_id=%s", internal_id)
-                return
-
-            f1_element = root.find("f1")
-            if f1_element is None:
-                log.warning("<f1> element not found in XML for internal_id=%s", internal_id)
-                return
-
-            talon_id = (f1_element.text or "").strip()
-            if not talon_id:
-                log.warning(
-                    "<f1> element has empty text; cannot derive TalonID (internal_id=%s)",
-                    internal_id,
-                )
-                return
-
-            log.info("Parsed TalonID='%s' for internal_id=%s; updating DB", talon_id, internal_id)
-            sqlite.update_case_status(internal_id=internal_id, talon_id=talon_id)
-            log.info("TalONID successfully saved in DB for internal_id=%s", internal_id)
-        except Exception:
-            log.exception("Unexpected error in save_talonid for internal_id=%s", internal_id)
-
-    def return_to_cabinet_home(self):
-        wait_sec = random.uniform(10, 15)
-        log.debug("Waiting %.2f sec before returning to cabinet home", wait_sec)
-        time.sleep(wait_sec)
-
+            while True:
+                talon_id = self.talon_capture.talon_id
+                if talon_id is None:
+                    try:
+                        talon_id = self._read_talon_from_dom(internal_id)
+                    except Exception:
+                        log.exception("Unexpected error while reading #xmlToSign0 for internal_id=%s", internal_id)
+                if talon_id:
+                    log.info("Parsed TalonID='%s' for internal_id=%s", talon_id, internal_id)
+                    self.last_talon_id = talon_id
+                    return talon_id
+                if time.monotonic() >= deadline:
+                    log.warning("TalonID not found within %.0f sec for internal_id=%s", timeout, internal_id)
+                    return None
+                # wait_for_timeout, а не sleep: пока ждём, Playwright доставляет события response
+                self.page.wait_for_timeout(TALON_POLL_MS)
+        finally:
+            self.talon_capture.stop()
+
+    def open_cabinet(self):
+        """Кабинет без пауз; с прямой ссылкой на форму — ничего не делаем."""
+        if FILING_FORM_URL:
+            return
         log.info("Returning to cabinet home page")
-        self.page.goto("https://office.sud.kz/form/proceedings/services.xhtml")
+        self.throttle()
+        self.page.goto(CABINET_URL)
         self.page.get_by_role("link", name="Құжаттарды жіберу").wait_for(
             state="visible", timeout=20000
         )
 
-        after_wait_sec = random.uniform(5, 7)
+    def return_to_cabinet_home(self):
+        # талон уже получен — подача на сайте завершена, долго ждать незачем
+        wait_sec = self.pacer.pause(2, 3) if self.last_talon_id else self.pacer.pause(10, 15)
+        log.debug("Waited %.2f sec before returning to cabinet home", wait_sec)
+
+        if FILING_FORM_URL:
+            # следующее дело откроет форму прямой ссылкой — кабинет не нужен
+            return
+
+        self.open_cabinet()
+
+        after_wait_sec = self.pacer.pause(5, 7)
         log.debug("Extra wait after cabinet home load: %.2f sec", after_wait_sec)
-        time.sleep(after_wait_sec)
@@ -0,0 +1,86 @@
+# System/governor.py
+import asyncio
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+from .logger import get_logger
+from . import sqlite
+
+log = get_logger("RateGovernor")
+
+# Лимиты по умолчанию для корзин, которых ещё нет в RateLimits (правятся в админке).
+SITE_RATE_PER_MINUTE = float(os.environ.get("OFFICESUD_SITE_RATE_PER_MINUTE", "60"))
+SITE_BURST = float(os.environ.get("OFFICESUD_SITE_BURST", "10"))
+COURT_RATE_PER_MINUTE = float(os.environ.get("OFFICESUD_COURT_RATE_PER_MINUTE", "10"))
+COURT_BURST = float(os.environ.get("OFFICESUD_COURT_BURST", "3"))
+
+SITE_KEY = "site"
+
+
+def court_key(court_id) -> str:
+    return f"court:{court_id}"
+
+
+def default_limits(key: str):
+    if key.startswith("court:"):
+        return COURT_RATE_PER_MINUTE, COURT_BURST
+    return SITE_RATE_PER_MINUTE, SITE_BURST
+
+
+class RateGovernor:
+    """
+    Общий для всех воркеров token bucket: перед каждой навигацией и отправкой
+    формы Filler берёт токен сайта и, если суд уже выбран, токен суда.
+    Состояние корзин лежит в общей БД (RateLimits), поэтому лимит действует
+    на сумму всех воркеров, а не на каждый по отдельности.
+    """
+
+    def __init__(
+        self,
+        acquire: Callable[[str, float, float], float] = sqlite.acquire_rate_token,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self._acquire = acquire
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._waited = 0.0
+
+    def _reserve(self, court_id: Optional[str]) -> float:
+        """Берёт токены сайта и суда; возвращает, сколько секунд нужно подождать."""
+        keys = [SITE_KEY]
+        if court_id:
+            keys.append(court_key(court_id))
+
+        wait = 0.0
+        for key in keys:
+            try:
+                wait = max(wait, self._acquire(key, *default_limits(key)))
+            except Exception:
+                # недоступная БД лимитов не должна останавливать подачу
+                log.exception("Failed to acquire rate token %s", key)
+        if wait > 0:
+            log.debug("Rate limit: waiting %.2f sec (%s)", wait, ", ".join(keys))
+            with self._lock:
+                self._waited += wait
+        return wait
+
+    def acquire(self, court_id: Optional[str] = None) -> float:
+        wait = self._reserve(court_id)
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    async def acquire_async(self, court_id: Optional[str] = None) -> float:
+        """acquire() для async-движка: токены берутся в потоке (SQLite/HTTP), ожидание — asyncio.sleep."""
+        wait = await asyncio.to_thread(self._reserve, court_id)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def take_waited(self) -> float:
+        """Сколько секунд воркер простоял в лимитах с прошлого вызова."""
+        with self._lock:
+            waited, self._waited = self._waited, 0.0
+        return waited
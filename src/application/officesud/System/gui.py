@@ -5,7 +5,7 @@ import time
 import threading
 import logging
 import os 
-import sqlite, dataloader, config
+import sqlite, dataloader, config, export
 from .logger import get_logger
 import case_processor
 
@@ -122,13 +122,10 @@ class Application(tk.Frame):
             return
 
         try:
-            data_to_export = sqlite.get_case_participants(self.current_batch_id) 
-            
-            if not data_to_export:
+            if not export.write_xlsx(self.current_batch_id, output_file):
+                os.remove(output_file)
                 self.master.after(0, lambda: messagebox.showinfo("Скачивание", "Нет данных для скачивания в текущем пакете."))
                 return
-                
-            dataloader.write_data_to_excel(data_to_export, output_file)
             
             self.master.after(0, lambda: messagebox.showinfo("Скачать", f"Данные успешно скачаны в {os.path.basename(output_file)}."))
             
@@ -178,7 +175,7 @@ class Application(tk.Frame):
             if self.current_batch_id:
                 try:
 
-                    processed_count, total_count = sqlite.get_batch_progress(self.current_batch_id) 
+                    processed_count, _, total_count = sqlite.get_batch_progress(self.current_batch_id)
                     
                     if total_count > 0:
                         progress_value = int((processed_count / total_count) * 100)
@@ -221,7 +218,7 @@ class Application(tk.Frame):
         self.select_button.config(state=tk.NORMAL)
         if self.current_batch_id:
             try:
-                 processed_count, total_count = sqlite.get_batch_progress(self.current_batch_id)
+                 processed_count, _, total_count = sqlite.get_batch_progress(self.current_batch_id)
                  if processed_count == total_count and total_count > 0:
                       self.update_progress_gui(100, processed_count, total_count)
                  elif total_count > 0:
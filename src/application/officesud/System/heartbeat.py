@@ -0,0 +1,105 @@
+# System/heartbeat.py
+import os
+import socket
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from .logger import get_logger
+from . import procstats, sqlite
+
+log = get_logger("Heartbeat")
+
+HEARTBEAT_INTERVAL = float(os.environ.get("OFFICESUD_HEARTBEAT_INTERVAL", "5"))
+
+
+def default_worker_id() -> str:
+    # В Docker hostname совпадает с коротким ID контейнера.
+    return os.environ.get("OFFICESUD_WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+
+class Heartbeat:
+    """
+    Фоновый поток, который каждые HEARTBEAT_INTERVAL секунд пишет строку
+    в WorkerHeartbeats: текущее дело, шаг, число готовых дел, RSS процесса
+    и Chromium, последнюю ошибку. ProgressAt сдвигается только когда меняется
+    дело/шаг/счётчик — по нему сервер отличает живой воркер от зависшего.
+    """
+
+    def __init__(
+        self,
+        batch_id: str,
+        worker_id: Optional[str] = None,
+        interval: float = HEARTBEAT_INTERVAL,
+        writer: Callable[[Dict[str, Any]], None] = sqlite.upsert_heartbeat,
+    ):
+        self.worker_id = worker_id or default_worker_id()
+        self.interval = interval
+        self.writer = writer
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        now = sqlite.utc_now()
+        self._state: Dict[str, Any] = {
+            "WorkerID": self.worker_id,
+            "BatchID": batch_id,
+            "InternalID": None,
+            "Step": "starting",
+            "CasesDone": 0,
+            "LastError": None,
+            "StartedAt": now,
+            "ProgressAt": now,
+        }
+
+    def start(self) -> "Heartbeat":
+        self.beat()
+        self._thread = threading.Thread(target=self._run, name="heartbeat", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, step: str = "finished") -> None:
+        self.update(step=step)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+        self.beat()
+
+    def update(self, **changes: Any) -> None:
+        """update(step=..., internal_id=..., batch_id=...) — отметить прогресс воркера."""
+        mapping = {"step": "Step", "internal_id": "InternalID", "batch_id": "BatchID"}
+        with self._lock:
+            advanced = False
+            for key, value in changes.items():
+                column = mapping[key]
+                if self._state[column] != value:
+                    self._state[column] = value
+                    advanced = True
+            if advanced:
+                self._state["ProgressAt"] = sqlite.utc_now()
+
+    def case_done(self) -> None:
+        with self._lock:
+            self._state["CasesDone"] += 1
+            self._state["ProgressAt"] = sqlite.utc_now()
+
+    def error(self, message: str) -> None:
+        with self._lock:
+            self._state["LastError"] = message[:2000]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = dict(self._state)
+        state["ProcessRSS"] = procstats.process_rss()
+        state["BrowserRSS"] = procstats.browser_rss()
+        state["UpdatedAt"] = sqlite.utc_now()
+        return state
+
+    def beat(self) -> None:
+        try:
+            self.writer(self.snapshot())
+        except Exception:
+            # телеметрия не должна ронять подачу дел
+            log.exception("Failed to write heartbeat for worker %s", self.worker_id)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.beat()
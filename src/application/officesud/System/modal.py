@@ -2,13 +2,68 @@
 
 from playwright.sync_api import Page, expect, Locator
 import logging
-from typing import Optional
+import os
+from typing import Any, Dict, Optional, Sequence
 import re
 import time
-import random
+
+from .pacing import AdaptivePacer
 
 logger = logging.getLogger(__name__)
 
+# Простые поля модалки (адрес, реквизиты) заполняются одним evaluate;
+# поля с маской и AJAX по вводу (БИН/ИИН, телефон, email) по-прежнему печатаются.
+BULK_FILL = os.environ.get("OFFICESUD_BULK_FILL", "1") not in ("0", "false", "False")
+
+# Видимость считаем как Playwright: ненулевой размер и не visibility:hidden.
+_VISIBLE_JS = """
+const visible = (el) => !!el && !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length)
+    && getComputedStyle(el).visibility !== 'hidden';
+const find = (root, selector) => (root && root.querySelector(selector)) || document.querySelector(selector);
+"""
+
+# Модалка, лоадер, статус RichFaces и готовность полей за один обмен с драйвером
+PROBE_JS = """({modal, fields, loader, status}) => {
+%s
+  const root = document.querySelector(modal);
+  const loaderEl = document.querySelector(loader);
+  const state = {
+    modal: visible(root),
+    loader_busy: !!loaderEl && !loaderEl.classList.contains('d-none'),
+    richfaces_idle: !!document.querySelector(status),
+    fields: {},
+  };
+  for (const selector of fields) {
+    const el = find(root, selector);
+    state.fields[selector] = el ? {visible: visible(el), enabled: !el.disabled && !el.readOnly, value: el.value} : null;
+  }
+  return state;
+}""" % _VISIBLE_JS
+
+# Все поля сразу или ни одного: если что-то не готово, заполняем по одному через Playwright
+BULK_FILL_JS = """({modal, values}) => {
+%s
+  const root = document.querySelector(modal);
+  const targets = Object.entries(values).map(([selector, value]) => [selector, find(root, selector), value]);
+  const missing = targets.filter(([, el]) => !visible(el) || el.disabled || el.readOnly).map(([selector]) => selector);
+  if (!visible(root) || missing.length) {
+    return {modal: visible(root), filled: false, missing};
+  }
+  for (const [, el, value] of targets) {
+    el.focus();
+    el.value = value;
+    el.dispatchEvent(new Event('input', {bubbles: true}));
+    el.dispatchEvent(new Event('change', {bubbles: true}));
+    el.blur();
+  }
+  return {modal: true, filled: true, missing: []};
+}""" % _VISIBLE_JS
+
+
+def field_ready(state: Dict[str, Any], selector: str) -> bool:
+    field = state.get("fields", {}).get(selector)
+    return bool(field and field["visible"] and field["enabled"])
+
 class ParticipantModal:
 
     ADD_PARTICIPANT_BUTTON: str = 'button:has-text("Процесс қатысушысын қосу")'
@@ -37,24 +92,101 @@ class ParticipantModal:
     LOADER: str = '.loader'
     RICHFACES_STATUS_STOP: str = '.rf-st-stop[style=""]'
 
-    def __init__(self, page: Page):
+    def __init__(self, page: Page, pacer: Optional[AdaptivePacer] = None, bulk_fill: bool = BULK_FILL):
         self.page: Page = page
+        self.pacer: AdaptivePacer = pacer or AdaptivePacer()
+        self.bulk_fill = bulk_fill
+        # сколько обращений к драйверу сэкономили пробы и пакетное заполнение
+        self.calls_saved = 0
+
+    def _probe_args(self, modal_selector: str, fields: Sequence[str] = ()) -> Dict[str, Any]:
+        return {
+            "modal": modal_selector,
+            "fields": list(fields),
+            "loader": self.LOADER,
+            "status": self.RICHFACES_STATUS_STOP,
+        }
+
+    def _require_modal(self, state: Dict[str, Any], modal_selector: str, modal_name: str) -> Dict[str, Any]:
+        if not state["modal"]:
+            error_msg = f"Modal window **{modal_name} ({modal_selector})** disappeared unexpectedly. Must retry from step 1."
+            logger.error(error_msg)
+            raise RuntimeError(error_msg)
+        logger.debug(f"Modal **{modal_name}** is visible. Continuing.")
+        return state
+
+    def probe(self, modal_selector: str, fields: Sequence[str] = ()) -> Dict[str, Any]:
+        """Состояние модалки, лоадера, RichFaces и полей fields одним page.evaluate."""
+        return self.page.evaluate(PROBE_JS, self._probe_args(modal_selector, fields))
+
+    def _settle(
+        self,
+        modal_selector: str,
+        modal_name: str,
+        fields: Sequence[str] = (),
+        richfaces: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Лоадер (+ статус RichFaces) и проверка модалки с готовностью полей за
+        одну пробу. Ждём через expect/wait_for только то, что проба застала активным.
+        """
+        state = self.probe(modal_selector, fields)
+        waited = 0
+        if state["loader_busy"]:
+            self._wait_for_loader()
+            waited += 1
+        if richfaces and not state["richfaces_idle"]:
+            self._wait_for_richfaces_stop()
+            waited += 1
+        if waited:
+            state = self.probe(modal_selector, fields)
+        # раньше: ожидание лоадера (+ RichFaces) и is_visible модалки на каждом шаге
+        self.calls_saved += (2 + richfaces) - (1 + waited + (1 if waited else 0))
+        return self._require_modal(state, modal_selector, modal_name)
+
+    def fill_fields(self, modal_selector: str, modal_name: str, values: Dict[str, str]) -> None:
+        """
+        Заполняет поля модалки и проверяет, что она не закрылась. При bulk_fill —
+        один evaluate с событиями input/change/blur вместо fill + проверки на каждое поле.
+        """
+        if self.bulk_fill:
+            result = self.page.evaluate(BULK_FILL_JS, {"modal": modal_selector, "values": values})
+            self._require_modal(result, modal_selector, modal_name)
+            if result["filled"]:
+                self.calls_saved += 2 * len(values) - 1
+                self.pacer.pause(1, 2)
+                return
+            self.calls_saved -= 1
+            logger.debug("Bulk fill skipped, fields not ready: %s", result["missing"])
+
+        for selector, value in values.items():
+            self.page.locator(selector).fill(value)
+            self.pacer.pause(1, 2)
+            self._check_modal_visibility(modal_selector, modal_name)
 
 
     def _wait_for_loader(self, timeout: int = 15000) -> None:
+        started = time.monotonic()
         try:
             loader_locator = self.page.locator(self.LOADER)
             expect(loader_locator).to_have_class(re.compile(r'd-none'), timeout=timeout)
         except Exception:
+            self.pacer.failure("loader_timeout")
             logger.warning("Loader did not disappear, continuing execution.")
+        else:
+            self.pacer.observe("loader", time.monotonic() - started)
 
     def _wait_for_richfaces_stop(self, timeout: int = 15000) -> None:
+        started = time.monotonic()
         try:
             stop_locator = self.page.locator(self.RICHFACES_STATUS_STOP)
             stop_locator.wait_for(state="attached", timeout=timeout)
             logger.info("RichFaces AJAX stop indicator found.")
         except Exception:
+            self.pacer.failure("richfaces_timeout")
             logger.warning("RichFaces AJAX stop indicator not found/not attached in time.")
+        else:
+            self.pacer.observe("richfaces", time.monotonic() - started)
 
     def _handle_modal_click(self, locator: Locator) -> None:
 
@@ -79,11 +211,7 @@ class ParticipantModal:
 
     def _check_modal_visibility(self, modal_selector: str, modal_name: str) -> None:
  
-        if not self.page.locator(modal_selector).is_visible():
-            error_msg = f"Modal window **{modal_name} ({modal_selector})** disappeared unexpectedly. Must retry from step 1."
-            logger.error(error_msg)
-            raise RuntimeError(error_msg)
-        logger.debug(f"Modal **{modal_name}** is visible. Continuing.")
+        self._require_modal({"modal": self.page.locator(modal_selector).is_visible()}, modal_selector, modal_name)
         
     def _handle_modal_fill_and_next(self, modal_locator: str, next_button_locator: str) -> bool:
 
@@ -126,26 +254,21 @@ class ParticipantModal:
         except Exception:
             raise RuntimeError(f"Juridical modal window {modal_selector} did not appear/is not visible.")
         
-        self._wait_for_loader()
-        self._check_modal_visibility(modal_selector, "Juridical Modal (Start)")
+        self._settle(modal_selector, "Juridical Modal (Start)")
 
         bin_input = self.page.locator(self.BIN_TEXTBOX_JUR)
         bin_input.type(bin_num, delay=50)
-        time.sleep(random.uniform(1, 2))
+        self.pacer.pause(1, 2)
         self._check_modal_visibility(modal_selector, "Juridical Modal (Post-BIN Input)")
         
         self.page.locator(self.GBD_SEARCH_JUR).click()
-        self._wait_for_loader()
-        time.sleep(random.uniform(1, 2))
-        self._check_modal_visibility(modal_selector, "Juridical Modal (Post-GBD Search)")
+        self.pacer.pause(1, 2)
+        self._settle(modal_selector, "Juridical Modal (Post-GBD Search)")
 
-        self.page.locator(self.FACT_ADDRESS_TEXTBOX).fill(address)
-        time.sleep(random.uniform(1, 2))
-        self._check_modal_visibility(modal_selector, "Juridical Modal (Post-Address Input)")
-        
-        self.page.locator(self.BANK_DETAILS_TEXTBOX).fill(bank_details)
-        time.sleep(random.uniform(1, 2))
-        self._check_modal_visibility(modal_selector, "Juridical Modal (Post-Bank Details Input)")
+        self.fill_fields(modal_selector, "Juridical Modal (Post-Details Input)", {
+            self.FACT_ADDRESS_TEXTBOX: address,
+            self.BANK_DETAILS_TEXTBOX: bank_details,
+        })
 
         self.page.locator(self.SAVE_BUTTON_JUR).click()
         self._wait_for_loader()
@@ -160,8 +283,7 @@ class ParticipantModal:
         except Exception:
             raise RuntimeError(f"Physical modal window {modal_selector} did not appear/is not visible.")
             
-        self._wait_for_loader()
-        self._check_modal_visibility(modal_selector, "Physical Modal (Start)")
+        self._settle(modal_selector, "Physical Modal (Start)")
 
         iin_input = self.page.locator(self.IIN_TEXTBOX_PHYS)
         iin_input.type(iin , delay=50)
@@ -170,33 +292,38 @@ class ParticipantModal:
             
         self.page.locator(self.GBD_SEARCH_PHYS).click()
         
-        self._wait_for_loader() 
-        self._wait_for_richfaces_stop() 
-        time.sleep(random.uniform(1, 2))
+        self.pacer.pause(1, 2)
         
-        self._check_modal_visibility(modal_selector, "Physical Modal (Post-GBD Search)")
+        # лоадер, RichFaces, модалка и поле телефона — одной пробой
+        state = self._settle(
+            modal_selector,
+            "Physical Modal (Post-GBD Search)",
+            fields=[self.PHONE_TEXTBOX] if phone else (),
+            richfaces=True,
+        )
         
         if phone:
             phone_locator = self.page.locator(self.PHONE_TEXTBOX)
             
-            try:
-                phone_locator.wait_for(state="visible", timeout=5000) 
-            except Exception:
-                logger.error(f"Phone field {self.PHONE_TEXTBOX} is not visible/ready.")
-                raise RuntimeError("Phone field is not ready for input.")
+            if field_ready(state, self.PHONE_TEXTBOX):
+                self.calls_saved += 1
+            else:
+                try:
+                    phone_locator.wait_for(state="visible", timeout=5000) 
+                except Exception:
+                    logger.error(f"Phone field {self.PHONE_TEXTBOX} is not visible/ready.")
+                    raise RuntimeError("Phone field is not ready for input.")
                 
 
             phone_locator.clear()
             phone_locator.type(phone, delay=50) 
-            time.sleep(random.uniform(1, 2))
+            self.pacer.pause(1, 2)
             
             self._check_modal_visibility(modal_selector, "Physical Modal (Post-Phone Input)")
         
         if email:
             self.page.locator(self.EMAIL_TEXTBOX).type(email, delay=60)
-            time.sleep(random.uniform(1, 2))
-
-            self._check_modal_visibility(modal_selector, "Physical Modal (Post-Email Input)")
+            self.pacer.pause(1, 2)
 
         self._check_modal_visibility(modal_selector, "Physical Modal (Pre-Save)")
 
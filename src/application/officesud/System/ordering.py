@@ -0,0 +1,93 @@
+# System/ordering.py
+import os
+from typing import Any, Dict, List, Sequence, Tuple
+
+from .logger import get_logger
+from . import sqlite
+
+log = get_logger("CaseOrdering")
+
+# Оценка времени одного выбора в форме (select + пауза + slow_mo), сек.
+# Для прогноза; фактическая экономия считается Filler'ом по замерам.
+REGION_SELECT_SECONDS = float(os.environ.get("OFFICESUD_REGION_SELECT_SECONDS", "2.5"))
+COURT_SELECT_SECONDS = float(os.environ.get("OFFICESUD_COURT_SELECT_SECONDS", "3.5"))
+
+PARTICIPANT_ID_COLUMNS = ("PlaintiffID", "DefendantID", "RepID")
+
+
+def participant_shape(case: Dict[str, Any]) -> Tuple[int, ...]:
+    """Число истцов, ответчиков и представителей — «форма» дела."""
+    return tuple(
+        len([v for v in (case.get(column) or "").split("*") if v.strip()])
+        for column in PARTICIPANT_ID_COLUMNS
+    )
+
+
+def _court(case: Dict[str, Any]) -> Tuple[str, str]:
+    return str(case.get("RegionID") or ""), str(case.get("CourtID") or "")
+
+
+def count_reused_selects(cases: Sequence[Dict[str, Any]]) -> Tuple[int, int]:
+    """Сколько раз регион и суд совпадут с предыдущим делом (их не нужно выбирать заново)."""
+    regions = courts = 0
+    for previous, case in zip(cases, cases[1:]):
+        previous_region, previous_court = _court(previous)
+        region, court = _court(case)
+        if region == previous_region:
+            regions += 1
+            if court == previous_court:
+                courts += 1
+    return regions, courts
+
+
+def predicted_seconds(cases: Sequence[Dict[str, Any]]) -> float:
+    regions, courts = count_reused_selects(cases)
+    return regions * REGION_SELECT_SECONDS + courts * COURT_SELECT_SECONDS
+
+
+def plan_order(cases: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Группирует дела по (RegionID, CourtID), внутри группы — по числу участников.
+    Группы идут в порядке первого появления в Excel, внутри одинаковых ключей
+    порядок строк сохраняется.
+    """
+    first_seen: Dict[Tuple[str, str], int] = {}
+    for index, case in enumerate(cases):
+        first_seen.setdefault(_court(case), index)
+    return sorted(
+        cases,
+        key=lambda case: (first_seen[_court(case)], participant_shape(case)),
+    )
+
+
+def optimize_batch_order(batch_id: str) -> Dict[str, Any]:
+    """
+    Переупорядочивает неподанные дела пакета (Cases.ClaimOrder) и записывает
+    прогноз экономии событием order_optimizer в StepEvents.
+    """
+    cases = [
+        case for case in sqlite.get_case_participants(batch_id)
+        if not case.get("TalonID")
+    ]
+    cases.sort(key=lambda case: case["DB_Case_ID"])
+    ordered = plan_order(cases)
+    sqlite.set_claim_order([case["DB_Case_ID"] for case in ordered])
+
+    before, after = predicted_seconds(cases), predicted_seconds(ordered)
+    stats = {
+        "cases": len(cases),
+        "court_groups": len({_court(case) for case in cases}),
+        "reused_selects_before": sum(count_reused_selects(cases)),
+        "reused_selects_after": sum(count_reused_selects(ordered)),
+        # выигрыш от перестановки и общий прогноз повторного использования формы
+        "predicted_saved_seconds": round(after - before, 1),
+        "predicted_reuse_seconds": round(after, 1),
+    }
+    sqlite.record_step_event({
+        "BatchID": batch_id,
+        "Step": "order_optimizer",
+        "Status": "ok",
+        "Details": stats,
+    })
+    log.info("Batch %s reordered: %s", batch_id, stats)
+    return stats
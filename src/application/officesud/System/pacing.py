@@ -0,0 +1,106 @@
+# System/pacing.py
+import asyncio
+import os
+import random
+import time
+from typing import Any, Callable, Dict
+
+from .logger import get_logger
+
+log = get_logger("Pacer")
+
+ADAPTIVE_PACING = os.environ.get("OFFICESUD_ADAPTIVE_PACING", "1") not in ("0", "false", "False")
+PACE_MIN_FACTOR = float(os.environ.get("OFFICESUD_PACE_MIN_FACTOR", "0.3"))
+PACE_MAX_FACTOR = float(os.environ.get("OFFICESUD_PACE_MAX_FACTOR", "4"))
+PACE_DECREASE_STEP = float(os.environ.get("OFFICESUD_PACE_DECREASE_STEP", "0.05"))
+PACE_ERROR_BACKOFF = float(os.environ.get("OFFICESUD_PACE_ERROR_BACKOFF", "2"))
+PACE_SLOW_BACKOFF = float(os.environ.get("OFFICESUD_PACE_SLOW_BACKOFF", "1.25"))
+
+# Ответ дольше порога считается признаком перегрузки сайта, а не здоровья.
+SLOW_SECONDS = {
+    "loader": float(os.environ.get("OFFICESUD_PACE_SLOW_LOADER_SECONDS", "5")),
+    "richfaces": float(os.environ.get("OFFICESUD_PACE_SLOW_RICHFACES_SECONDS", "3")),
+}
+EWMA_WEIGHT = 0.2
+
+
+class AdaptivePacer:
+    """
+    AIMD-регулятор пауз между действиями воркера. Паузы по-прежнему задаются
+    диапазонами (pause(1, 2)), но умножаются на factor: пока лоадер и RichFaces
+    отвечают быстро, factor уменьшается на PACE_DECREASE_STEP, на таймаутах
+    и исчезнувших модалках — умножается на PACE_ERROR_BACKOFF.
+    При OFFICESUD_ADAPTIVE_PACING=0 factor всегда 1 — прежние фиксированные паузы.
+    """
+
+    def __init__(
+        self,
+        adaptive: bool = ADAPTIVE_PACING,
+        min_factor: float = PACE_MIN_FACTOR,
+        max_factor: float = PACE_MAX_FACTOR,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.adaptive = adaptive
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+        self.factor = 1.0
+        self._sleep = sleep
+        self._latency: Dict[str, float] = {}
+        self._errors: Dict[str, int] = {}
+        self._slept = 0.0
+
+    def delay(self, low: float, high: float) -> float:
+        return random.uniform(low, high) * self.factor
+
+    def pause(self, low: float, high: float) -> float:
+        seconds = self.delay(low, high)
+        self._sleep(seconds)
+        self._slept += seconds
+        return seconds
+
+    async def pause_async(self, low: float, high: float) -> float:
+        """pause() для async-движка: ждёт, не блокируя цикл событий."""
+        seconds = self.delay(low, high)
+        await asyncio.sleep(seconds)
+        self._slept += seconds
+        return seconds
+
+    def observe(self, kind: str, seconds: float) -> None:
+        """Успешное ожидание лоадера/RichFaces длительностью seconds."""
+        previous = self._latency.get(kind)
+        self._latency[kind] = seconds if previous is None else previous + EWMA_WEIGHT * (seconds - previous)
+        slow = SLOW_SECONDS.get(kind)
+        if slow is not None and seconds > slow:
+            self._increase(PACE_SLOW_BACKOFF, f"slow {kind} ({seconds:.1f}s)")
+        else:
+            self._decrease()
+
+    def failure(self, kind: str) -> None:
+        """Таймаут, исчезнувшая модалка и т.п. — сайт не успевает за воркером."""
+        self._errors[kind] = self._errors.get(kind, 0) + 1
+        self._increase(PACE_ERROR_BACKOFF, kind)
+
+    def _decrease(self) -> None:
+        if self.adaptive:
+            self.factor = max(self.min_factor, self.factor - PACE_DECREASE_STEP)
+
+    def _increase(self, multiplier: float, reason: str) -> None:
+        if not self.adaptive:
+            return
+        factor = min(self.max_factor, self.factor * multiplier)
+        if factor != self.factor:
+            log.info("Pacing backoff on %s: factor %.2f -> %.2f", reason, self.factor, factor)
+        self.factor = factor
+
+    def metrics(self) -> Dict[str, Any]:
+        """Текущее состояние для метрик шага; паузы считаются с прошлого вызова."""
+        metrics = {
+            "pace_factor": round(self.factor, 3),
+            "pace_sleep_ms": int(self._slept * 1000),
+        }
+        for kind, seconds in self._latency.items():
+            metrics[f"{kind}_ms_avg"] = int(seconds * 1000)
+        if self._errors:
+            metrics["pace_errors"] = dict(self._errors)
+        self._slept = 0.0
+        return metrics
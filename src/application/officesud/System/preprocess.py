@@ -0,0 +1,323 @@
+# System/preprocess.py
+"""
+Предобработка документов пакета перед подачей: PDF пересжимаются и линеаризуются,
+слишком крупные изображения (и сканы внутри PDF) уменьшаются, проверяются число
+страниц и размер файла. Работает с документами из хранилища (System/docstore.py),
+результат кэшируется по sha256 исходника — каждый файл оптимизируется один раз.
+
+Зависимости необязательные: без pikepdf PDF остаются как есть, без Pillow — изображения.
+"""
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, Optional
+
+from .logger import get_logger
+from . import docstore, sqlite
+
+try:
+    import pikepdf
+except ImportError:  # необязательная зависимость
+    pikepdf = None
+
+try:
+    from PIL import Image
+except ImportError:  # необязательная зависимость
+    Image = None
+
+log = get_logger("Preprocess")
+
+PREPROCESS_WORKERS = int(os.environ.get("OFFICESUD_PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Длинная сторона изображения в пикселях: ~A4 при 300 dpi, для сканов суда достаточно
+MAX_IMAGE_PX = int(os.environ.get("OFFICESUD_MAX_IMAGE_PX", "2480"))
+JPEG_QUALITY = int(os.environ.get("OFFICESUD_JPEG_QUALITY", "80"))
+# Ограничения сайта на файл; 0 — не проверять
+UPLOAD_MAX_MB = float(os.environ.get("OFFICESUD_UPLOAD_MAX_MB", "20"))
+PDF_MAX_PAGES = int(os.environ.get("OFFICESUD_PDF_MAX_PAGES", "0"))
+# Для оценки сэкономленного времени загрузки (set_files + ожидание .loader)
+UPLOAD_KBPS = float(os.environ.get("OFFICESUD_UPLOAD_KBPS", "500"))
+
+IMAGE_FORMATS = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG", ".tif": "TIFF", ".tiff": "TIFF", ".bmp": "BMP"}
+
+# Класс сбоя дела для нарушений лимитов (errors.VALIDATION; errors.py тянет playwright,
+# которого нет в контейнере Django)
+VALIDATION = "validation"
+
+
+def available() -> bool:
+    return pikepdf is not None or Image is not None
+
+
+def _downscale_pdf_image(raw) -> bool:
+    """Пережимает одно изображение PDF в JPEG меньшего размера; False — оставлено как было."""
+    if "/SMask" in raw or "/Mask" in raw or raw.get("/ImageMask", False):
+        return False
+    if max(int(raw.Width), int(raw.Height)) <= MAX_IMAGE_PX:
+        return False
+    image = pikepdf.PdfImage(raw)
+    if image.colorspace not in ("/DeviceRGB", "/DeviceGray") or image.bits_per_component != 8:
+        return False
+    mode = "L" if image.colorspace == "/DeviceGray" else "RGB"
+    pil = image.as_pil_image().convert(mode)
+    pil.thumbnail((MAX_IMAGE_PX, MAX_IMAGE_PX))
+    buffer = io.BytesIO()
+    pil.save(buffer, "JPEG", quality=JPEG_QUALITY, optimize=True)
+    # размер на странице задаёт матрица отрисовки, а не число пикселей
+    raw.write(buffer.getvalue(), filter=pikepdf.Name.DCTDecode)
+    raw.Width, raw.Height = pil.size
+    raw.ColorSpace = pikepdf.Name.DeviceGray if mode == "L" else pikepdf.Name.DeviceRGB
+    raw.BitsPerComponent = 8
+    for key in ("/DecodeParms", "/Decode"):
+        if key in raw:
+            del raw[key]
+    return True
+
+
+def _optimize_pdf(src: str, out: str, result: Dict[str, Any]) -> None:
+    with pikepdf.open(src) as pdf:
+        result["pages"] = len(pdf.pages)
+        if pdf.is_encrypted:
+            # пересохранение сняло бы защиту документа
+            return
+        if Image is not None:
+            seen = set()
+            for page in pdf.pages:
+                for raw in page.images.values():
+                    if raw.objgen in seen:
+                        continue
+                    seen.add(raw.objgen)
+                    try:
+                        result["images"] += _downscale_pdf_image(raw)
+                    except Exception as e:
+                        log.debug("PDF image left as is: %s", e)
+        pdf.remove_unreferenced_resources()
+        pdf.save(
+            out,
+            linearize=True,
+            compress_streams=True,
+            recompress_flate=True,
+            object_stream_mode=pikepdf.ObjectStreamMode.generate,
+        )
+    result["output"] = out
+
+
+def _optimize_image(src: str, out: str, image_format: str, result: Dict[str, Any]) -> None:
+    with Image.open(src) as image:
+        result["pages"] = getattr(image, "n_frames", 1)
+        # многостраничный TIFF ужимать по первому кадру нельзя
+        if result["pages"] > 1 or max(image.size) <= MAX_IMAGE_PX:
+            return
+        image.thumbnail((MAX_IMAGE_PX, MAX_IMAGE_PX))
+        options = {"optimize": True}
+        if image_format == "JPEG":
+            options["quality"] = JPEG_QUALITY
+        elif image_format == "TIFF":
+            options = {"compression": "tiff_adobe_deflate"}
+        elif image_format == "BMP":
+            options = {}
+        image.save(out, image_format, **options)
+    result["images"] = 1
+    result["output"] = out
+
+
+def optimize_file(src: str, name: str, out_dir: str) -> Dict[str, Any]:
+    """
+    Оптимизирует один файл (выполняется в процессе пула). Результат пишется
+    в out_dir только если он меньше исходника; имя файла не меняется.
+    """
+    ext = os.path.splitext(name)[1].lower()
+    result = {
+        "bytes_before": os.path.getsize(src),
+        "bytes_after": None,
+        "pages": None,
+        "images": 0,
+        "output": None,
+        "error": None,
+    }
+    fd, out = tempfile.mkstemp(dir=out_dir, suffix=ext)
+    os.close(fd)
+    try:
+        if ext == ".pdf" and pikepdf is not None:
+            _optimize_pdf(src, out, result)
+        elif ext in IMAGE_FORMATS and Image is not None:
+            _optimize_image(src, out, IMAGE_FORMATS[ext], result)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["output"] = None
+
+    if result["output"] and os.path.getsize(out) < result["bytes_before"]:
+        result["bytes_after"] = os.path.getsize(out)
+    else:
+        result["output"] = None
+        result["bytes_after"] = result["bytes_before"]
+        os.remove(out)
+    return result
+
+
+def _limit_violation(variant: Dict[str, Any]) -> Optional[str]:
+    if UPLOAD_MAX_MB and (variant.get("BytesAfter") or 0) > UPLOAD_MAX_MB * docstore.MB:
+        return f"больше {UPLOAD_MAX_MB:g} МБ после сжатия"
+    if PDF_MAX_PAGES and (variant.get("Pages") or 0) > PDF_MAX_PAGES:
+        return f"больше {PDF_MAX_PAGES} страниц"
+    return None
+
+
+def _cached_result_exists(variant: Dict[str, Any], directory: str) -> bool:
+    result_hash = variant.get("ResultHash")
+    return not result_hash or os.path.exists(docstore.data_path(result_hash, directory))
+
+
+def preprocess_batch_documents(
+    batch_id: str,
+    directory: str = docstore.STORE_DIR,
+    workers: int = PREPROCESS_WORKERS,
+) -> Dict[str, Any]:
+    """
+    Оптимизирует документы неподанных дел пакета в пуле процессов и подменяет
+    ссылки в *DocPath на уменьшенные копии. Дела с документами сверх лимитов сайта
+    уходят на разбор (NeedsReview). Итог пишется событием document_preprocess.
+    """
+    started = time.monotonic()
+    cases = [case for case in sqlite.get_case_participants(batch_id) if not case.get("TalonID")]
+    names: Dict[str, str] = {}
+    for case in cases:
+        for column in sqlite.DOCUMENT_COLUMNS:
+            for path in (case.get(column) or "").split("*"):
+                parsed = docstore.parse_ref(path.strip())
+                if parsed:
+                    names.setdefault(*parsed)
+
+    variants = {
+        digest: variant
+        for digest, variant in sqlite.get_document_variants(list(names)).items()
+        if _cached_result_exists(variant, directory)
+    }
+    todo = [
+        digest for digest in names
+        if digest not in variants
+        and os.path.exists(docstore.data_path(digest, directory))
+    ]
+    stats = {
+        "documents": len(names),
+        "cached": len(names) - len(todo),
+        "optimized": 0,
+        "failed": 0,
+        "pdf": pikepdf is not None,
+        "images": Image is not None,
+    }
+
+    if todo and available():
+        os.makedirs(os.path.join(directory, ".tmp"), exist_ok=True)
+        work_dir = tempfile.mkdtemp(dir=os.path.join(directory, ".tmp"))
+        try:
+            # spawn: процесс может держать открытый браузер/потоки, fork их не переживёт
+            with ProcessPoolExecutor(
+                max_workers=max(1, workers), mp_context=multiprocessing.get_context("spawn")
+            ) as pool:
+                futures = {
+                    pool.submit(
+                        optimize_file,
+                        docstore.data_path(digest, directory),
+                        names[digest],
+                        work_dir,
+                    ): digest
+                    for digest in todo
+                }
+                for future in as_completed(futures):
+                    digest = futures[future]
+                    result = future.result()
+                    variant = {
+                        "SourceHash": digest,
+                        "BytesBefore": result["bytes_before"],
+                        "BytesAfter": result["bytes_after"],
+                        "Pages": result["pages"],
+                        "Error": result["error"],
+                    }
+                    if result["output"]:
+                        with open(result["output"], "rb") as f:
+                            ref, _, _ = docstore.ingest_stream(f, names[digest], directory)
+                        os.remove(result["output"])
+                        variant["ResultHash"] = docstore.parse_ref(ref)[0]
+                        stats["optimized"] += 1
+                        # сжатая копия — уже конечный вариант, повторно её не обрабатываем
+                        sqlite.save_document_variant({
+                            "SourceHash": variant["ResultHash"],
+                            "BytesBefore": result["bytes_after"],
+                            "BytesAfter": result["bytes_after"],
+                            "Pages": result["pages"],
+                        })
+                    if result["error"]:
+                        stats["failed"] += 1
+                        log.warning("Preprocessing %s failed: %s", names[digest], result["error"])
+                    sqlite.save_document_variant(variant)
+                    variants[digest] = variant
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    updates, flagged, violations = {}, [], {}
+    bytes_before = bytes_after = 0
+    for case in cases:
+        changed, problems = {}, []
+        for column in sqlite.DOCUMENT_COLUMNS:
+            value = case.get(column) or ""
+            paths = []
+            for path in (path.strip() for path in value.split("*")):
+                parsed = docstore.parse_ref(path)
+                variant = variants.get(parsed[0]) if parsed else None
+                if variant is None:
+                    paths.append(path)
+                    continue
+                # экономия считается на каждую загрузку: один файл может быть в нескольких делах
+                bytes_before += variant["BytesBefore"] or 0
+                bytes_after += variant["BytesAfter"] or 0
+                if variant.get("ResultHash"):
+                    path = docstore.make_ref(variant["ResultHash"], parsed[1])
+                paths.append(path)
+                reason = _limit_violation(variant)
+                if reason:
+                    problems.append(f"{parsed[1]}: {reason}")
+                    violations[parsed[1]] = reason
+            new_value = "*".join(path for path in paths if path)
+            if new_value != value:
+                changed[column] = new_value
+        if changed:
+            updates[case["DB_Case_ID"]] = changed
+        if problems:
+            flagged.append(case["DB_Case_ID"])
+            sqlite.flag_cases_for_review([case["DB_Case_ID"]], VALIDATION, "; ".join(problems))
+    sqlite.update_case_documents(updates)
+
+    bytes_saved = bytes_before - bytes_after
+    stats.update({
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "bytes_saved": bytes_saved,
+        "predicted_upload_seconds_saved": round(bytes_saved / (UPLOAD_KBPS * 1024), 1) if UPLOAD_KBPS else None,
+        "cases_rewritten": len(updates),
+        "cases_flagged": len(flagged),
+        "violations": [f"{name}: {reason}" for name, reason in sorted(violations.items())][:50],
+        "seconds": round(time.monotonic() - started, 1),
+    })
+    sqlite.record_step_event({
+        "BatchID": batch_id,
+        "Step": "document_preprocess",
+        "Status": "ok",
+        "Details": stats,
+    })
+    log.info("Batch %s documents preprocessed: %s", batch_id, stats)
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Предобработка документов пакета Office.sud")
+    parser.add_argument("batch_id")
+    parser.add_argument("--workers", type=int, default=PREPROCESS_WORKERS)
+    args = parser.parse_args()
+    sqlite.check_and_initialize_db()
+    print(preprocess_batch_documents(args.batch_id, workers=args.workers))
@@ -0,0 +1,80 @@
+# System/procstats.py
+import os
+from typing import Dict, List, Optional
+
+PROC_DIR = "/proc"
+BROWSER_PROCESS_MARKERS = ("chrom", "headless_shell")
+
+
+def process_rss(pid: Optional[int] = None) -> Optional[int]:
+    """RSS процесса в байтах (по /proc/<pid>/status); None, если /proc недоступен."""
+    pid = pid or os.getpid()
+    try:
+        with open(os.path.join(PROC_DIR, str(pid), "status")) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    return 0
+
+
+def _process_table() -> Dict[int, tuple]:
+    table = {}
+    try:
+        pids = [int(name) for name in os.listdir(PROC_DIR) if name.isdigit()]
+    except OSError:
+        return table
+    for pid in pids:
+        try:
+            with open(os.path.join(PROC_DIR, str(pid), "stat")) as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # comm в скобках может содержать пробелы — режем по последней ')'
+        comm = stat[stat.find("(") + 1:stat.rfind(")")]
+        fields = stat[stat.rfind(")") + 2:].split()
+        table[pid] = (int(fields[1]), comm)
+    return table
+
+
+def descendant_pids(root_pid: Optional[int] = None) -> List[int]:
+    root_pid = root_pid or os.getpid()
+    table = _process_table()
+    children: Dict[int, List[int]] = {}
+    for pid, (ppid, _) in table.items():
+        children.setdefault(ppid, []).append(pid)
+
+    result, stack = [], [root_pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            result.append(child)
+            stack.append(child)
+    return result
+
+
+def browser_rss(root_pid: Optional[int] = None, renderer_only: bool = False) -> Optional[int]:
+    """
+    Суммарный RSS процессов Chromium, запущенных этим воркером (через драйвер Playwright).
+    renderer_only=True — только процессы рендерера (--type=renderer).
+    """
+    if not os.path.isdir(PROC_DIR):
+        return None
+    table = _process_table()
+    total = 0
+    for pid in descendant_pids(root_pid):
+        comm = table.get(pid, (None, ""))[1].lower()
+        if not any(marker in comm for marker in BROWSER_PROCESS_MARKERS):
+            continue
+        if renderer_only and not _is_renderer(pid):
+            continue
+        total += process_rss(pid) or 0
+    return total
+
+
+def _is_renderer(pid: int) -> bool:
+    try:
+        with open(os.path.join(PROC_DIR, str(pid), "cmdline"), "rb") as f:
+            return b"--type=renderer" in f.read()
+    except OSError:
+        return False
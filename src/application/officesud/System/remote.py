@@ -0,0 +1,282 @@
+# System/remote.py
+import json
+import os
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, Optional
+from urllib.parse import urlencode, urljoin
+
+from .case_processor import LEASE_SECONDS, CaseProcessor
+from .control import COMMAND_CANCEL, COMMAND_RUN, BatchCancelled
+from .governor import RateGovernor
+from .heartbeat import Heartbeat, default_worker_id
+from .logger import get_logger
+from . import sqlite
+
+log = get_logger("RemoteWorker")
+
+IDLE_POLL_INTERVAL = float(os.environ.get("OFFICESUD_IDLE_POLL_INTERVAL", "30"))
+
+
+class WorkerAPIError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Worker API error {status}: {message}")
+        self.status = status
+
+
+class WorkerAPI:
+    """HTTP-клиент к worker API Django (server/apps/applications/worker_api.py)."""
+
+    def __init__(self, base_url: str, token: str, timeout: float = 60):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.token = token
+        self.timeout = timeout
+        # Retry-After последнего пустого claim: через сколько секунд созреет повтор упавшего дела
+        self.retry_after: Optional[float] = None
+
+    def _open(
+        self,
+        path: str,
+        payload: Optional[Dict[str, Any]] = None,
+        data: Optional[bytes] = None,
+        content_type: str = "application/json",
+    ):
+        if payload is not None:
+            data = json.dumps(payload).encode()
+        request = urllib.request.Request(
+            urljoin(self.base_url, path.lstrip("/")),
+            data=data,
+            method="POST" if data is not None else "GET",
+            headers={
+                "Authorization": f"Bearer {self.token}",
+                "Content-Type": content_type,
+            },
+        )
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            raise WorkerAPIError(e.code, e.read().decode("utf-8", errors="replace")) from e
+
+    def _post(self, path: str, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._open(path, payload) as response:
+            body = response.read()
+            return json.loads(body) if body else None
+
+    def claim(self, worker_id: str, batch_id: Optional[str], lease_seconds: float) -> Optional[Dict[str, Any]]:
+        payload = {"worker_id": worker_id, "batch_id": batch_id, "lease_seconds": lease_seconds}
+        with self._open("api/apps/office-sud/worker/claim/", payload) as response:
+            body = response.read()
+            retry_after = response.headers.get("Retry-After")
+        self.retry_after = float(retry_after) if retry_after else None
+        return json.loads(body) if body else None
+
+    def download(self, url: str, dest_path: str) -> None:
+        with self._open(url) as response, open(dest_path, "wb") as dest:
+            shutil.copyfileobj(response, dest, 1024 * 1024)
+
+    def report_event(self, case_id: int, event: Dict[str, Any]) -> None:
+        self._post(f"api/apps/office-sud/worker/cases/{case_id}/events/", event)
+
+    def renew_lease(self, case_id: int, worker_id: str, lease_seconds: float) -> bool:
+        try:
+            self._post(
+                f"api/apps/office-sud/worker/cases/{case_id}/lease/",
+                {"worker_id": worker_id, "lease_seconds": lease_seconds},
+            )
+        except WorkerAPIError as e:
+            if e.status == 409:
+                return False
+            raise
+        return True
+
+    def report_talon(self, case_id: int, worker_id: str, talon_id: str) -> bool:
+        try:
+            self._post(
+                f"api/apps/office-sud/worker/cases/{case_id}/talon/",
+                {"worker_id": worker_id, "talon_id": talon_id},
+            )
+        except WorkerAPIError as e:
+            if e.status == 409:
+                return False
+            raise
+        return True
+
+    def release(self, case_id: int, worker_id: str, failed: bool = True, **failure) -> None:
+        self._post(
+            f"api/apps/office-sud/worker/cases/{case_id}/release/",
+            dict(failure, worker_id=worker_id, failed=failed),
+        )
+
+    def upload_trace(self, case_id: int, path: str, details: Dict[str, Any]) -> None:
+        with open(path, "rb") as f:
+            data = f.read()
+        query = urlencode({"details": json.dumps(details)})
+        with self._open(
+            f"api/apps/office-sud/worker/cases/{case_id}/trace/?{query}",
+            data=data,
+            content_type="application/zip",
+        ) as response:
+            response.read()
+
+    def acquire_rate_token(self, key: str, default_rate: float, default_burst: float) -> float:
+        response = self._post(
+            "api/apps/office-sud/worker/rate/",
+            {"key": key, "default_rate": default_rate, "default_burst": default_burst},
+        )
+        return float(response["wait"])
+
+    def heartbeat(self, heartbeat: Dict[str, Any]) -> Dict[str, Any]:
+        return self._post("api/apps/office-sud/worker/heartbeat/", heartbeat) or {}
+
+
+class RemoteControl:
+    """Команда пакета текущего дела; приходит в ответе на heartbeat."""
+
+    def __init__(self):
+        self.command = COMMAND_RUN
+
+    def is_set(self) -> bool:
+        return self.command == COMMAND_CANCEL
+
+
+class RemoteCaseProcessor(CaseProcessor):
+    """
+    CaseProcessor без общего тома: дела берутся в аренду через worker API,
+    документы скачиваются по HTTP во временный каталог, талоны, события шагов
+    и heartbeat отправляются обратно. Таких воркеров может быть сколько угодно
+    на любых машинах.
+    """
+
+    def __init__(
+        self,
+        api: WorkerAPI,
+        batch_id: Optional[str] = None,
+        worker_id: Optional[str] = None,
+        lease_seconds: float = LEASE_SECONDS,
+        idle_poll_interval: Optional[float] = None,
+    ):
+        self.api = api
+        self.idle_poll_interval = idle_poll_interval
+        self.control = RemoteControl()
+        self._current_case: Optional[Dict[str, Any]] = None
+        heartbeat = Heartbeat(batch_id or "", worker_id=worker_id or default_worker_id(), writer=self._send_heartbeat)
+        super().__init__(batch_id, self.control, heartbeat=heartbeat, lease_seconds=lease_seconds)
+
+    def _load_internal_ids(self):
+        return []
+
+    def _make_governor(self):
+        # корзины лимитов лежат в БД сервера — токены берём через worker API
+        return RateGovernor(acquire=self.api.acquire_rate_token)
+
+    def _has_work(self):
+        return True
+
+    def _send_heartbeat(self, heartbeat: Dict[str, Any]) -> None:
+        response = self.api.heartbeat(heartbeat)
+        if self._current_case and response.get("batch_id") == self._current_case["BatchID"]:
+            self.control.command = response.get("command") or COMMAND_RUN
+
+    def _iter_cases(self):
+        worker_id = self.heartbeat.worker_id
+        while True:
+            case = self.api.claim(worker_id, self.batch_id, self.lease_seconds)
+            if case is None:
+                if self._wait_for_retry():
+                    continue
+                if self.idle_poll_interval is None:
+                    return
+                self.heartbeat.update(step="idle", internal_id=None)
+                time.sleep(self.idle_poll_interval)
+                continue
+
+            workdir = tempfile.mkdtemp(prefix="officesud-case-")
+            try:
+                try:
+                    self._localize_documents(case, workdir)
+                except Exception:
+                    self._release_case(case, failed=False)
+                    raise
+                self.control.command = COMMAND_RUN
+                self._current_case = case
+                self.heartbeat.update(batch_id=case["BatchID"])
+                yield case
+            finally:
+                self._current_case = None
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    def _localize_documents(self, case: Dict[str, Any], workdir: str) -> None:
+        """Скачивает документы дела и подменяет пути в колонках *DocPath на локальные."""
+        documents = case.pop("Documents", {}) or {}
+        for column in sqlite.DOCUMENT_COLUMNS:
+            local_paths = []
+            for index, document in enumerate(documents.get(column, [])):
+                name = os.path.basename(document["name"]) or f"document-{index}"
+                dest = os.path.join(workdir, f"{column}-{index}-{name}")
+                try:
+                    self.api.download(document["url"], dest)
+                except WorkerAPIError as e:
+                    if e.status != 404:
+                        raise
+                    # путь остаётся, файла нет: дело упадёт в _check_case как missing_document
+                    log.error("Файл не найден на сервере: %s (%s)", document["name"], column)
+                local_paths.append(dest)
+            case[column] = "*".join(local_paths)
+
+    def _next_retry_in(self):
+        return self.api.retry_after
+
+    def _save_talon(self, case_data, talon_id):
+        return self.api.report_talon(case_data["DB_Case_ID"], self.heartbeat.worker_id, talon_id)
+
+    def _release_case(self, case_data, failed=True, **failure):
+        try:
+            self.api.release(case_data["DB_Case_ID"], self.heartbeat.worker_id, failed=failed, **failure)
+        except (WorkerAPIError, OSError):
+            log.exception("Failed to release case %s; it returns to the pool when the lease expires",
+                          case_data["DB_Case_ID"])
+
+    def _renew_lease(self, case_data):
+        return self.api.renew_lease(case_data["DB_Case_ID"], self.heartbeat.worker_id, self.lease_seconds)
+
+    def _record_event(self, event):
+        # событие шага заодно продлевает аренду дела на сервере;
+        # в конвейере событие может относиться к уже следующему делу
+        case_id = event.get("DB_Case_ID")
+        if case_id:
+            self.api.report_event(case_id, dict(event, lease_seconds=self.lease_seconds))
+
+    def _store_trace(self, case_data, path, details):
+        # архив уходит на сервер: в админке он лежит рядом с трассами локальных воркеров
+        try:
+            self.api.upload_trace(case_data["DB_Case_ID"], path, dict(details, WorkerID=self.heartbeat.worker_id))
+        finally:
+            os.remove(path)
+
+    def _process_single_case(self, filler, case_data):
+        try:
+            super()._process_single_case(filler, case_data)
+        except BatchCancelled:
+            # отменён пакет этого дела, а не весь воркер: возвращаем дело и берём следующее
+            log.info("Batch %s cancelled, case %s dropped", case_data["BatchID"], case_data["InternalID"])
+            self._release_case(case_data, failed=False)
+            filler.return_to_cabinet_home()
+
+
+def run_remote_worker(
+    api_url: str,
+    token: str,
+    batch_id: Optional[str] = None,
+    worker_id: Optional[str] = None,
+    idle_poll_interval: Optional[float] = None,
+) -> None:
+    processor = RemoteCaseProcessor(
+        WorkerAPI(api_url, token),
+        batch_id=batch_id,
+        worker_id=worker_id,
+        idle_poll_interval=idle_poll_interval,
+    )
+    processor.run_process()
@@ -0,0 +1,96 @@
+# System/session.py
+import json
+import os
+import re
+import tempfile
+import time
+from typing import Optional
+
+from .logger import get_logger
+from . import sqlite
+
+log = get_logger("Session")
+
+# Сессии лежат рядом с общей БД — на том же томе, что видят все воркеры пакета.
+SESSION_DIR = os.environ.get(
+    "OFFICESUD_SESSION_DIR",
+    os.path.join(os.path.dirname(sqlite.DB_PATH), "sessions"),
+)
+SESSION_ACCOUNT = os.environ.get("OFFICESUD_ACCOUNT", "default")
+SESSION_MAX_AGE = float(os.environ.get("OFFICESUD_SESSION_MAX_AGE", str(12 * 3600)))
+
+
+class SessionStore:
+    """
+    storage_state Playwright (cookies + localStorage) одного аккаунта office.sud.kz.
+    Новый контекст с сохранённым состоянием сразу попадает в кабинет, минуя вход.
+    Файл содержит авторизационные cookies — пишется с правами 0600.
+    """
+
+    def __init__(
+        self,
+        account: str = SESSION_ACCOUNT,
+        directory: str = SESSION_DIR,
+        max_age: float = SESSION_MAX_AGE,
+    ):
+        self.account = account
+        self.max_age = max_age
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", account) or "default"
+        self.path = os.path.join(directory, f"{safe_name}.json")
+
+    def load(self) -> Optional[str]:
+        """Путь к сохранённому состоянию для new_context(storage_state=...) или None."""
+        try:
+            age = time.time() - os.path.getmtime(self.path)
+        except OSError:
+            return None
+        if age > self.max_age:
+            log.info("Session state for %s is %.0f h old, logging in again", self.account, age / 3600)
+            return None
+        return self.path
+
+    def save(self, context) -> None:
+        self._write(lambda path: context.storage_state(path=path))
+
+    def save_state(self, state: dict) -> None:
+        """Состояние, уже полученное из контекста (async: await context.storage_state())."""
+
+        def dump(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+
+        self._write(dump)
+
+    def _write(self, write) -> None:
+        directory = os.path.dirname(self.path)
+        tmp_path = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            os.close(fd)
+            os.chmod(tmp_path, 0o600)
+            write(tmp_path)
+            # атомарная замена: соседний воркер не прочитает наполовину записанный файл
+            os.replace(tmp_path, self.path)
+            tmp_path = None
+            log.info("Session state for %s saved", self.account)
+        except Exception:
+            log.exception("Failed to save session state for %s", self.account)
+        finally:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def apply(self, context, state_path: str) -> None:
+        """Cookies сохранённой сессии в уже открытый контекст (launch_persistent_context не принимает storage_state)."""
+        try:
+            with open(state_path, encoding="utf-8") as f:
+                cookies = json.load(f).get("cookies") or []
+            context.add_cookies(cookies)
+        except Exception:
+            log.exception("Failed to apply session state for %s", self.account)
+
+    def invalidate(self) -> None:
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -1,8 +1,11 @@
 # System/sqlite.py
+import json
 import os
 import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import List, Optional, Any, Dict
+from typing import Iterable, Iterator, List, Optional, Any, Dict, Tuple
 
 BASE_DIR = Path(__file__).resolve().parents[3]
 
@@ -67,6 +70,7 @@ def check_and_initialize_db() -> bool:
             )
             """
         )
+        _create_service_tables(cursor)
         conn.commit()
         conn.close()
     return True
@@ -120,9 +124,761 @@ def initialize_db(recreate: bool = False):
         )
         """
     )
+    _create_service_tables(cursor)
     conn.commit()
     conn.close()
 
+
+def utc_now() -> str:
+    """UTC-время в формате, который понимает и Django (DateTimeField), и SQLite."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+# Колонки с путями к документам дела; несколько файлов разделяются '*'
+DOCUMENT_COLUMNS = ("PaymentDocPath", "MainDocPath", "OtherDocPath")
+
+# Колонки Cases, добавленные после первой версии схемы: имя -> тип.
+# Старые БД догоняются через ALTER TABLE в _ensure_case_columns.
+EXTRA_CASE_COLUMNS = {
+    "ClaimedBy": "TEXT",
+    "LeaseExpiresAt": "TEXT",
+    "AttemptCount": "INTEGER DEFAULT 0",
+    "ClaimOrder": "INTEGER",
+    # последний сбой дела (System/errors.py) и когда его можно повторить
+    "ErrorClass": "TEXT",
+    "LastError": "TEXT",
+    "RetryAfter": "TEXT",
+    "NeedsReview": "INTEGER DEFAULT 0",
+    # номер последнего изменения дела (ChangeSequence), для ленты изменений
+    "ChangeSeq": "INTEGER",
+    # sha256 нормализованной строки Excel (dataloader.row_hash) — поиск повторной подачи
+    "RowHash": "TEXT",
+    # откуда дело загружено: файл, лист и номер строки на листе (dataloader.load_files_to_db)
+    "SourceFile": "TEXT",
+    "SourceSheet": "TEXT",
+    "SourceRow": "INTEGER",
+}
+
+# Служебные колонки аренды: их обновления (продление, выдача) не считаются изменением дела
+CHANGE_IGNORED_COLUMNS = ("ChangeSeq", "ClaimedBy", "LeaseExpiresAt", "AttemptCount", "RetryAfter", "ClaimOrder")
+
+
+def _ensure_case_columns(cursor: sqlite3.Cursor) -> None:
+    cursor.execute("PRAGMA table_info(Cases);")
+    existing = {col[1] for col in cursor.fetchall()}
+    for column, column_type in EXTRA_CASE_COLUMNS.items():
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE Cases ADD COLUMN {column} {column_type}")
+
+
+def _change_triggers(columns: List[str]) -> Dict[str, str]:
+    """
+    Триггеры ленты изменений: вставка и изменение неслужебных колонок дела берут
+    следующий номер из ChangeSequence. Номер выдаётся внутри пишущей транзакции,
+    а SQLite пишет транзакции по одной, так что порядок номеров — порядок фиксации.
+    """
+    watched = [column for column in columns if column not in CHANGE_IGNORED_COLUMNS and column != "DB_Case_ID"]
+    changed = " OR ".join(f"NEW.[{column}] IS NOT OLD.[{column}]" for column in watched)
+    bump = """
+    UPDATE ChangeSequence SET Value = Value + 1 WHERE Id = 1;
+    UPDATE Cases SET ChangeSeq = (SELECT Value FROM ChangeSequence WHERE Id = 1) WHERE DB_Case_ID = NEW.DB_Case_ID;
+END"""
+    return {
+        "trg_cases_change_insert": "CREATE TRIGGER trg_cases_change_insert AFTER INSERT ON Cases\nBEGIN" + bump,
+        "trg_cases_change_update": (
+            "CREATE TRIGGER trg_cases_change_update AFTER UPDATE ON Cases\n"
+            f"WHEN NEW.ChangeSeq IS OLD.ChangeSeq AND ({changed})\nBEGIN" + bump
+        ),
+    }
+
+
+def _ensure_change_sequence(cursor: sqlite3.Cursor) -> None:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ChangeSequence (
+            Id INTEGER PRIMARY KEY CHECK (Id = 1),
+            Value INTEGER NOT NULL
+        )
+        """
+    )
+    cursor.execute("SELECT 1 FROM ChangeSequence WHERE Id = 1")
+    if cursor.fetchone() is None:
+        # первый запуск на старой БД: существующим делам — номера в порядке создания
+        cursor.execute("UPDATE Cases SET ChangeSeq = DB_Case_ID WHERE ChangeSeq IS NULL")
+        cursor.execute("INSERT INTO ChangeSequence (Id, Value) SELECT 1, COALESCE(MAX(DB_Case_ID), 0) FROM Cases")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cases_change_seq ON Cases (ChangeSeq)")
+
+    # триггер пересоздаётся, только если изменился список колонок Cases
+    cursor.execute("PRAGMA table_info(Cases);")
+    triggers = _change_triggers([col[1] for col in cursor.fetchall()])
+    cursor.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({', '.join('?' for _ in triggers)})",
+        list(triggers),
+    )
+    existing = dict(cursor.fetchall())
+    for name, sql in triggers.items():
+        if existing.get(name) != sql:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(sql)
+
+
+def _create_service_tables(cursor: sqlite3.Cursor) -> None:
+    """Служебные таблицы воркеров (телеметрия и т.п.) рядом с Cases."""
+    _ensure_case_columns(cursor)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cases_batch ON Cases (BatchID)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cases_internal_id ON Cases (InternalID)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cases_row_hash ON Cases (RowHash)")
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS WorkerHeartbeats (
+            WorkerID TEXT PRIMARY KEY,
+            BatchID TEXT,
+            InternalID TEXT,
+            Step TEXT,
+            CasesDone INTEGER DEFAULT 0,
+            ProcessRSS INTEGER,
+            BrowserRSS INTEGER,
+            LastError TEXT,
+            StartedAt TEXT,
+            UpdatedAt TEXT,
+            ProgressAt TEXT
+        )
+        """
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_heartbeats_batch ON WorkerHeartbeats (BatchID)")
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS BatchControl (
+            BatchID TEXT PRIMARY KEY,
+            Command TEXT,
+            UpdatedAt TEXT
+        )
+        """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS StepEvents (
+            EventID INTEGER PRIMARY KEY AUTOINCREMENT,
+            BatchID TEXT,
+            InternalID TEXT,
+            WorkerID TEXT,
+            Step TEXT,
+            Status TEXT,
+            DurationMs INTEGER,
+            Details TEXT,
+            CreatedAt TEXT
+        )
+        """
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_step_events_batch ON StepEvents (BatchID, InternalID)")
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS RateLimits (
+            LimitKey TEXT PRIMARY KEY,
+            RatePerMinute REAL,
+            Burst REAL,
+            Tokens REAL,
+            RefilledAt REAL,
+            UpdatedAt TEXT
+        )
+        """
+    )
+    _ensure_change_sequence(cursor)
+    # кэш предобработки документов (System/preprocess.py): sha256 исходника -> sha256 результата
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS DocumentVariants (
+            SourceHash TEXT PRIMARY KEY,
+            ResultHash TEXT,
+            BytesBefore INTEGER,
+            BytesAfter INTEGER,
+            Pages INTEGER,
+            Error TEXT,
+            CreatedAt TEXT
+        )
+        """
+    )
+    # загруженные файлы Excel: sha256 файла -> пакет, в который он загружен
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ImportFiles (
+            FileHash TEXT PRIMARY KEY,
+            BatchID TEXT,
+            FileName TEXT,
+            Rows INTEGER,
+            Duplicates INTEGER,
+            Skipped INTEGER,
+            CreatedAt TEXT
+        )
+        """
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_import_files_batch ON ImportFiles (BatchID)")
+    # поданные дела архивированных пакетов (System/archive.py): по ним тоже ищутся повторы
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS FiledCases (
+            RowHash TEXT,
+            InternalID TEXT,
+            BatchID TEXT,
+            TalonID TEXT
+        )
+        """
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_filed_cases_row_hash ON FiledCases (RowHash)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_filed_cases_internal_id ON FiledCases (InternalID)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_filed_cases_batch ON FiledCases (BatchID)")
+
+
+def upsert_heartbeat(heartbeat: Dict[str, Any]) -> None:
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO WorkerHeartbeats (
+            WorkerID, BatchID, InternalID, Step, CasesDone,
+            ProcessRSS, BrowserRSS, LastError, StartedAt, UpdatedAt, ProgressAt
+        )
+        VALUES (
+            :WorkerID, :BatchID, :InternalID, :Step, :CasesDone,
+            :ProcessRSS, :BrowserRSS, :LastError, :StartedAt, :UpdatedAt, :ProgressAt
+        )
+        ON CONFLICT(WorkerID) DO UPDATE SET
+            BatchID = excluded.BatchID,
+            InternalID = excluded.InternalID,
+            Step = excluded.Step,
+            CasesDone = excluded.CasesDone,
+            ProcessRSS = excluded.ProcessRSS,
+            BrowserRSS = excluded.BrowserRSS,
+            LastError = excluded.LastError,
+            UpdatedAt = excluded.UpdatedAt,
+            ProgressAt = excluded.ProgressAt
+    """, heartbeat)
+    conn.commit()
+    conn.close()
+
+
+def get_batch_heartbeat(batch_id: str) -> Optional[Dict[str, Any]]:
+    """Самый свежий heartbeat воркера, обрабатывающего пакет."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT *
+        FROM WorkerHeartbeats
+        WHERE BatchID = ?
+        ORDER BY UpdatedAt DESC
+        LIMIT 1
+    """, (batch_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def set_batch_command(batch_id: str, command: str) -> None:
+    """Команда воркеру пакета: run / pause / cancel (см. System/control.py)."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO BatchControl (BatchID, Command, UpdatedAt)
+        VALUES (?, ?, ?)
+        ON CONFLICT(BatchID) DO UPDATE SET
+            Command = excluded.Command,
+            UpdatedAt = excluded.UpdatedAt
+    """, (batch_id, command, utc_now()))
+    conn.commit()
+    conn.close()
+
+
+def get_batch_command(batch_id: str) -> Optional[str]:
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute("SELECT Command FROM BatchControl WHERE BatchID = ?", (batch_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def record_step_event(event: Dict[str, Any]) -> None:
+    """Метрика шага дела; Details — произвольный JSON-совместимый dict."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO StepEvents (BatchID, InternalID, WorkerID, Step, Status, DurationMs, Details, CreatedAt)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        event.get("BatchID"),
+        event.get("InternalID"),
+        event.get("WorkerID"),
+        event.get("Step"),
+        event.get("Status"),
+        event.get("DurationMs"),
+        json.dumps(event.get("Details") or {}, ensure_ascii=False),
+        event.get("CreatedAt") or utc_now(),
+    ))
+    conn.commit()
+    conn.close()
+
+
+def _lease_until(lease_seconds: float) -> str:
+    until = datetime.now(timezone.utc) + timedelta(seconds=lease_seconds)
+    return until.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _batch_filter(batch_id: Optional[str], batch_ids: Optional[Iterable[str]]) -> Tuple[str, List[Any]]:
+    """Условие на BatchID: один пакет, список пакетов или любой пакет."""
+    if batch_id:
+        return " AND BatchID = ?", [batch_id]
+    if batch_ids is not None:
+        batch_ids = list(batch_ids)
+        return f" AND BatchID IN ({', '.join('?' * len(batch_ids))})", batch_ids
+    return "", []
+
+
+def claim_case(
+    worker_id: str,
+    lease_seconds: float,
+    batch_id: Optional[str] = None,
+    max_attempts: Optional[int] = None,
+    batch_ids: Optional[Iterable[str]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Атомарно забирает следующее неподанное дело в аренду (lease) воркеру.
+    Дело с истёкшей арендой снова доступно — так дела упавших воркеров возвращаются в пул.
+    Каждая выдача увеличивает AttemptCount; дела, исчерпавшие max_attempts, больше не выдаются.
+    Упавшие дела выдаются не раньше RetryAfter и после свежих, дела на разборе (NeedsReview) — никогда.
+    Пакеты на паузе или отменённые не выдаются. Без batch_id дело берётся из batch_ids
+    (пустой список — ни из какого), а если не задан и он — из любого пакета.
+    """
+    if not batch_id and batch_ids is not None and not batch_ids:
+        return None
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    now = utc_now()
+    try:
+        # BEGIN IMMEDIATE берёт RESERVED-блокировку сразу: два воркера не выберут одну строку
+        cursor.execute("BEGIN IMMEDIATE")
+        query = """
+            SELECT DB_Case_ID
+            FROM Cases
+            WHERE (TalonID IS NULL OR TalonID = '')
+              AND (LeaseExpiresAt IS NULL OR LeaseExpiresAt < ?)
+              AND (RetryAfter IS NULL OR RetryAfter < ?)
+              AND COALESCE(NeedsReview, 0) = 0
+              AND BatchID NOT IN (
+                  SELECT BatchID FROM BatchControl WHERE Command IN ('pause', 'cancel')
+              )
+        """
+        params: List[Any] = [now, now]
+        batch_query, batch_params = _batch_filter(batch_id, batch_ids)
+        query += batch_query
+        params.extend(batch_params)
+        if max_attempts:
+            query += " AND COALESCE(AttemptCount, 0) < ?"
+            params.append(max_attempts)
+        # ClaimOrder — порядок из System/ordering.py; без него — порядок строк Excel.
+        # Упавшие дела — очередь повторов — идут после всех свежих.
+        query += " ORDER BY ErrorClass IS NOT NULL, COALESCE(ClaimOrder, DB_Case_ID), DB_Case_ID LIMIT 1"
+        cursor.execute(query, params)
+        row = cursor.fetchone()
+        if row is None:
+            cursor.execute("COMMIT")
+            return None
+
+        cursor.execute("""
+            UPDATE Cases
+            SET ClaimedBy = ?, LeaseExpiresAt = ?, AttemptCount = COALESCE(AttemptCount, 0) + 1
+            WHERE DB_Case_ID = ?
+        """, (worker_id, _lease_until(lease_seconds), row["DB_Case_ID"]))
+        cursor.execute("SELECT * FROM Cases WHERE DB_Case_ID = ?", (row["DB_Case_ID"],))
+        case = dict(cursor.fetchone())
+        cursor.execute("COMMIT")
+        return case
+    except Exception:
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def renew_lease(case_id: int, worker_id: str, lease_seconds: float) -> bool:
+    """Продлевает аренду; False — аренда уже истекла и перешла другому воркеру."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE Cases
+        SET LeaseExpiresAt = ?
+        WHERE DB_Case_ID = ? AND ClaimedBy = ?
+    """, (_lease_until(lease_seconds), case_id, worker_id))
+    renewed = cursor.rowcount == 1
+    conn.commit()
+    conn.close()
+    return renewed
+
+
+def release_case(
+    case_id: int,
+    worker_id: str,
+    failed: bool = True,
+    error_class: Optional[str] = None,
+    error: Optional[str] = None,
+    retry_in: Optional[float] = None,
+    needs_review: bool = False,
+) -> None:
+    """
+    Возвращает дело в пул до истечения аренды.
+    failed=False (отмена пакета) — попытка не засчитывается.
+    error_class — класс сбоя (System/errors.py): дело снова выдаётся не раньше чем
+    через retry_in секунд, а с needs_review — не выдаётся вовсе.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+    if error_class is None:
+        cursor.execute("""
+            UPDATE Cases
+            SET ClaimedBy = NULL,
+                LeaseExpiresAt = NULL,
+                AttemptCount = MAX(COALESCE(AttemptCount, 0) - ?, 0)
+            WHERE DB_Case_ID = ? AND ClaimedBy = ?
+        """, (0 if failed else 1, case_id, worker_id))
+    else:
+        cursor.execute("""
+            UPDATE Cases
+            SET ClaimedBy = NULL,
+                LeaseExpiresAt = NULL,
+                ErrorClass = ?,
+                LastError = ?,
+                RetryAfter = ?,
+                NeedsReview = ?
+            WHERE DB_Case_ID = ? AND ClaimedBy = ?
+        """, (
+            error_class,
+            (error or "")[:2000],
+            _lease_until(retry_in) if retry_in else None,
+            1 if needs_review else 0,
+            case_id,
+            worker_id,
+        ))
+    conn.commit()
+    conn.close()
+
+
+def next_retry_in(
+    batch_id: Optional[str] = None,
+    max_attempts: Optional[int] = None,
+    batch_ids: Optional[Iterable[str]] = None,
+) -> Optional[float]:
+    """
+    Секунды до ближайшего повтора упавшего дела пакета (без batch_id — пакетов
+    batch_ids или любого); None — повторять нечего и воркер может завершаться.
+    """
+    if not batch_id and batch_ids is not None and not batch_ids:
+        return None
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+    query = """
+        SELECT MIN(RetryAfter)
+        FROM Cases
+        WHERE (TalonID IS NULL OR TalonID = '')
+          AND ErrorClass IS NOT NULL
+          AND COALESCE(NeedsReview, 0) = 0
+          AND ClaimedBy IS NULL
+    """
+    query_batch, params = _batch_filter(batch_id, batch_ids)
+    query += query_batch
+    if max_attempts:
+        query += " AND COALESCE(AttemptCount, 0) < ?"
+        params.append(max_attempts)
+    cursor.execute(query, params)
+    row = cursor.fetchone()
+    conn.close()
+    if row is None or row[0] is None:
+        return None
+    retry_at = datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S.%f").replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def get_batch_errors(batch_id: str) -> Dict[str, Any]:
+    """Неподанные дела пакета по классам сбоев и дела, ждущие разбора человеком."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT ErrorClass, COUNT(*) AS cases
+        FROM Cases
+        WHERE BatchID = ? AND ErrorClass IS NOT NULL AND (TalonID IS NULL OR TalonID = '')
+        GROUP BY ErrorClass
+        ORDER BY cases DESC
+    """, (batch_id,))
+    classes = {row["ErrorClass"]: row["cases"] for row in cursor.fetchall()}
+    cursor.execute("""
+        SELECT DB_Case_ID, InternalID, ErrorClass, LastError, AttemptCount
+        FROM Cases
+        WHERE BatchID = ? AND COALESCE(NeedsReview, 0) = 1 AND (TalonID IS NULL OR TalonID = '')
+        ORDER BY DB_Case_ID
+    """, (batch_id,))
+    review = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return {"classes": classes, "needs_review": review}
+
+
+def save_case_talon(case_id: int, talon_id: str, worker_id: Optional[str] = None) -> bool:
+    """
+    Записывает талон поданного дела. С worker_id — только если дело всё ещё в аренде
+    у этого воркера; False — аренду перехватил другой воркер, талон не записан.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+    query = """
+        UPDATE Cases
+        SET TalonID = ?, LeaseExpiresAt = NULL,
+            ErrorClass = NULL, LastError = NULL, RetryAfter = NULL, NeedsReview = 0
+        WHERE DB_Case_ID = ?
+    """
+    params: List[Any] = [talon_id, case_id]
+    if worker_id is not None:
+        query += " AND ClaimedBy = ?"
+        params.append(worker_id)
+    cursor.execute(query, params)
+    saved = cursor.rowcount == 1
+    conn.commit()
+    conn.close()
+    return saved
+
+
+def get_case_by_id(case_id: int) -> Optional[Dict[str, Any]]:
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM Cases WHERE DB_Case_ID = ?", (case_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def acquire_rate_token(key: str, default_rate: float, default_burst: float) -> float:
+    """
+    Берёт токен из корзины RateLimits[key] и возвращает, сколько секунд нужно
+    подождать до разрешённого действия (0 — можно сразу). Токен списывается
+    сразу, даже в долг: ожидающие воркеры выстраиваются в очередь, а не
+    соревнуются за один и тот же токен.
+    Новая корзина "court:<CourtID>" берёт лимиты из строки "court:*", если она
+    есть, иначе — default_rate/default_burst. RatePerMinute пустой или 0 — без лимита.
+    """
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    cursor = conn.cursor()
+    now = time.time()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            "SELECT RatePerMinute, Burst, Tokens, RefilledAt FROM RateLimits WHERE LimitKey = ?",
+            (key,),
+        )
+        row = cursor.fetchone()
+        if row is None:
+            rate, burst = default_rate, default_burst
+            if ":" in key:
+                cursor.execute(
+                    "SELECT RatePerMinute, Burst FROM RateLimits WHERE LimitKey = ?",
+                    (key.split(":", 1)[0] + ":*",),
+                )
+                template = cursor.fetchone()
+                if template is not None:
+                    rate, burst = template
+            tokens, refilled_at = None, now
+            cursor.execute(
+                "INSERT INTO RateLimits (LimitKey, RatePerMinute, Burst) VALUES (?, ?, ?)",
+                (key, rate, burst),
+            )
+        else:
+            rate, burst, tokens, refilled_at = row
+
+        if not rate or rate <= 0:
+            cursor.execute("COMMIT")
+            return 0.0
+
+        burst = max(burst or 1, 1)
+        if tokens is None:
+            tokens = burst
+        else:
+            tokens = min(burst, tokens + max(now - (refilled_at or now), 0) * rate / 60)
+        tokens -= 1
+        cursor.execute(
+            "UPDATE RateLimits SET Tokens = ?, RefilledAt = ?, UpdatedAt = ? WHERE LimitKey = ?",
+            (tokens, now, utc_now(), key),
+        )
+        cursor.execute("COMMIT")
+        return 0.0 if tokens >= 0 else -tokens * 60 / rate
+    except Exception:
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def set_claim_order(case_ids: List[int]) -> None:
+    """
+    Задаёт порядок выдачи дел: case_ids — DB_Case_ID пакета в нужном порядке.
+    ClaimOrder берётся из тех же DB_Case_ID по возрастанию, поэтому пакет
+    не обгоняет в очереди пакеты, загруженные раньше.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+    cursor.executemany(
+        "UPDATE Cases SET ClaimOrder = ? WHERE DB_Case_ID = ?",
+        list(zip(sorted(case_ids), case_ids)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def get_batch_order_savings(batch_id: str) -> Optional[Dict[str, Any]]:
+    """Прогноз оптимизатора порядка дел и фактическая экономия по событиям open_form."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT Details
+        FROM StepEvents
+        WHERE BatchID = ? AND Step = 'order_optimizer'
+        ORDER BY EventID DESC
+        LIMIT 1
+    """, (batch_id,))
+    row = cursor.fetchone()
+    cursor.execute("""
+        SELECT
+            COALESCE(SUM(json_extract(Details, '$.form_reused')), 0),
+            COALESCE(SUM(json_extract(Details, '$.form_saved_ms')), 0)
+        FROM StepEvents
+        WHERE BatchID = ? AND Step = 'open_form'
+    """, (batch_id,))
+    reused, saved_ms = cursor.fetchone()
+    conn.close()
+    if row is None and not reused:
+        return None
+    savings = json.loads(row[0]) if row else {}
+    savings["measured_reused_selects"] = reused
+    savings["measured_saved_seconds"] = round(saved_ms / 1000, 1)
+    return savings
+
+
+def get_batch_document_savings(batch_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Итог предобработки документов пакета (событие document_preprocess). Берётся первая:
+    после неё дела уже ссылаются на сжатые копии, и повторный запуск экономии не покажет.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT Details
+        FROM StepEvents
+        WHERE BatchID = ? AND Step = 'document_preprocess'
+        ORDER BY EventID
+        LIMIT 1
+    """, (batch_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return json.loads(row[0]) if row else None
+
+
+def get_batch_traces(batch_id: str) -> List[Dict[str, Any]]:
+    """Сохранённые трассы сбоев пакета (события trace), новые первыми."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT InternalID, WorkerID, Status, Details, CreatedAt
+        FROM StepEvents
+        WHERE BatchID = ? AND Step = 'trace'
+        ORDER BY EventID DESC
+    """, (batch_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    return [
+        dict(json.loads(details or "{}"), InternalID=internal_id, WorkerID=worker_id, Status=status, CreatedAt=created_at)
+        for internal_id, worker_id, status, details, created_at in rows
+    ]
+
+
+def get_document_variants(source_hashes: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Закэшированные результаты предобработки по sha256 исходных документов."""
+    if not source_hashes:
+        return {}
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    variants = {}
+    # порциями: у SQLite ограничено число параметров запроса
+    for start in range(0, len(source_hashes), 500):
+        chunk = source_hashes[start:start + 500]
+        cursor.execute(
+            f"SELECT * FROM DocumentVariants WHERE SourceHash IN ({', '.join('?' for _ in chunk)})",
+            chunk,
+        )
+        variants.update((row["SourceHash"], dict(row)) for row in cursor.fetchall())
+    conn.close()
+    return variants
+
+
+def save_document_variant(variant: Dict[str, Any]) -> None:
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("""
+        INSERT OR REPLACE INTO DocumentVariants
+            (SourceHash, ResultHash, BytesBefore, BytesAfter, Pages, Error, CreatedAt)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (
+        variant["SourceHash"],
+        variant.get("ResultHash"),
+        variant.get("BytesBefore"),
+        variant.get("BytesAfter"),
+        variant.get("Pages"),
+        variant.get("Error"),
+        utc_now(),
+    ))
+    conn.commit()
+    conn.close()
+
+
+def update_case_documents(updates: Dict[int, Dict[str, str]]) -> None:
+    """Новые значения колонок *DocPath: {DB_Case_ID: {колонка: значение}}."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    for case_id, columns in updates.items():
+        columns = {column: value for column, value in columns.items() if column in DOCUMENT_COLUMNS}
+        if columns:
+            conn.execute(
+                f"UPDATE Cases SET {', '.join(f'{column} = ?' for column in columns)} WHERE DB_Case_ID = ?",
+                (*columns.values(), case_id),
+            )
+    conn.commit()
+    conn.close()
+
+
+def flag_cases_for_review(case_ids: List[int], error_class: str, error: str) -> None:
+    """Дела, которые заведомо не пройдут на сайте: воркер их не берёт, ждут разбора человеком."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.executemany("""
+        UPDATE Cases
+        SET ErrorClass = ?, LastError = ?, NeedsReview = 1
+        WHERE DB_Case_ID = ? AND (TalonID IS NULL OR TalonID = '')
+    """, [(error_class, error, case_id) for case_id in case_ids])
+    conn.commit()
+    conn.close()
+
+
+def get_pending_document_refs(prefix: str, pending_only: bool = True) -> List[str]:
+    """Пути документов с данным префиксом у ещё не поданных (pending_only=False — у всех) дел."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+    refs = []
+    pending = "(TalonID IS NULL OR TalonID = '') AND" if pending_only else ""
+    for column in DOCUMENT_COLUMNS:
+        cursor.execute(f"""
+            SELECT {column}
+            FROM Cases
+            WHERE {pending} {column} LIKE ?
+        """, (prefix + "%",))
+        for (value,) in cursor.fetchall():
+            refs.extend(path.strip() for path in value.split("*") if path.strip())
+    conn.close()
+    return refs
+
+
 def get_case_participants(batch_id: str) -> List[Dict[str, Any]]:
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
@@ -139,6 +895,287 @@ def get_case_participants(batch_id: str) -> List[Dict[str, Any]]:
     return rows
 
 
+def get_case_columns(table: str = "Cases") -> List[Tuple[str, str]]:
+    """Колонки таблицы (по умолчанию Cases) в её порядке: (имя, объявленный тип)."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute(f"PRAGMA table_info({table});")
+    columns = [(col[1], (col[2] or "").upper()) for col in cursor.fetchall()]
+    conn.close()
+    return columns
+
+
+def _iter_rows(sql: str, params: tuple, chunk_size: int) -> Iterator[List[tuple]]:
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        conn.close()
+
+
+def _select_columns(columns: List[str]) -> str:
+    return ", ".join(f"[{column}]" for column in columns)
+
+
+def iter_batch_rows(batch_id: str, columns: List[str], chunk_size: int = 1000) -> Iterator[List[tuple]]:
+    """
+    Дела пакета порциями по chunk_size строк (кортежи в порядке columns) —
+    без загрузки всего пакета в память, как в get_case_participants.
+    """
+    return _iter_rows(
+        f"SELECT {_select_columns(columns)} FROM Cases WHERE BatchID = ? ORDER BY DB_Case_ID",
+        (batch_id,),
+        chunk_size,
+    )
+
+
+def iter_batch_events(batch_id: str, columns: List[str], chunk_size: int = 1000) -> Iterator[List[tuple]]:
+    """События шагов пакета (StepEvents) порциями, в порядке записи."""
+    return _iter_rows(
+        f"SELECT {_select_columns(columns)} FROM StepEvents WHERE BatchID = ? ORDER BY EventID",
+        (batch_id,),
+        chunk_size,
+    )
+
+
+def count_batch_rows(batch_id: str) -> Tuple[int, int]:
+    """(дел, событий шагов) пакета."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM Cases WHERE BatchID = ?", (batch_id,))
+    cases = cursor.fetchone()[0]
+    cursor.execute("SELECT COUNT(*) FROM StepEvents WHERE BatchID = ?", (batch_id,))
+    events = cursor.fetchone()[0]
+    conn.close()
+    return cases, events
+
+
+def delete_batch(batch_id: str, expected: Tuple[int, int]) -> bool:
+    """
+    Удаляет дела и события пакета одной транзакцией — только если их столько же,
+    сколько попало в архив (expected) и ни одно дело не в аренде у воркера.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*), COALESCE(SUM(LeaseExpiresAt IS NOT NULL AND LeaseExpiresAt > ?), 0)
+            FROM Cases WHERE BatchID = ?
+        """, (utc_now(), batch_id))
+        cases, leased = cursor.fetchone()
+        cursor.execute("SELECT COUNT(*) FROM StepEvents WHERE BatchID = ?", (batch_id,))
+        events = cursor.fetchone()[0]
+        if (cases, events) != tuple(expected) or leased:
+            conn.rollback()
+            return False
+        # поданные дела остаются в FiledCases: повторная загрузка их найдёт и после архивации
+        cursor.execute("DELETE FROM FiledCases WHERE BatchID = ?", (batch_id,))
+        cursor.execute("""
+            INSERT INTO FiledCases (RowHash, InternalID, BatchID, TalonID)
+            SELECT RowHash, InternalID, BatchID, TalonID
+            FROM Cases WHERE BatchID = ? AND TalonID IS NOT NULL AND TalonID != ''
+        """, (batch_id,))
+        cursor.execute("DELETE FROM Cases WHERE BatchID = ?", (batch_id,))
+        cursor.execute("DELETE FROM StepEvents WHERE BatchID = ?", (batch_id,))
+        cursor.execute("DELETE FROM WorkerHeartbeats WHERE BatchID = ?", (batch_id,))
+        cursor.execute("DELETE FROM BatchControl WHERE BatchID = ?", (batch_id,))
+        conn.commit()
+        return True
+    finally:
+        conn.close()
+
+
+def restore_rows(records: Iterator[Tuple[str, Dict[str, Any]]]) -> Dict[str, int]:
+    """
+    Вставляет записи (таблица, строка) одной транзакцией — восстановление из архива.
+    Колонки, которых больше нет в таблице, отбрасываются.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    counts: Dict[str, int] = {}
+    valid: Dict[str, set] = {}
+    try:
+        cursor = conn.cursor()
+        for table, row in records:
+            if table not in valid:
+                cursor.execute(f"PRAGMA table_info({table});")
+                valid[table] = {col[1] for col in cursor.fetchall()}
+            columns = [column for column in row if column in valid[table]]
+            cursor.execute(
+                f"INSERT INTO {table} ({_select_columns(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                [row[column] for column in columns],
+            )
+            counts[table] = counts.get(table, 0) + 1
+        conn.commit()
+    finally:
+        conn.close()
+    return counts
+
+
+def find_import_file(file_hash: str) -> Optional[Dict[str, Any]]:
+    """Последняя загрузка файла с таким содержимым или None."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM ImportFiles WHERE FileHash = ?", (file_hash,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def get_batch_import(batch_id: str) -> Optional[Dict[str, Any]]:
+    """Итог загрузки пакета по всем его файлам."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT BatchID, COUNT(*) AS Files, SUM(Rows) AS Rows,
+               SUM(Duplicates) AS Duplicates, SUM(Skipped) AS Skipped
+        FROM ImportFiles WHERE BatchID = ?
+        GROUP BY BatchID
+    """, (batch_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def find_filed_cases(
+    row_hashes: Iterable[str],
+    internal_ids: Iterable[str],
+    chunk_size: int = 500,
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """
+    Уже поданные дела (с TalonID) — в БД и в архивированных пакетах — с такими
+    RowHash или InternalID: ({RowHash: дело}, {InternalID: дело}). Поиск по индексам,
+    порциями, без просмотра всей таблицы.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    found: Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]] = ({}, {})
+    for index, (column, values) in enumerate((("RowHash", row_hashes), ("InternalID", internal_ids))):
+        values = sorted({value for value in values if value})
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start:start + chunk_size]
+            placeholders = ", ".join("?" for _ in chunk)
+            cursor.execute(f"""
+                SELECT RowHash, InternalID, BatchID, TalonID FROM Cases
+                WHERE {column} IN ({placeholders}) AND TalonID IS NOT NULL AND TalonID != ''
+                UNION ALL
+                SELECT RowHash, InternalID, BatchID, TalonID FROM FiledCases
+                WHERE {column} IN ({placeholders})
+            """, chunk + chunk)
+            for row in cursor.fetchall():
+                found[index].setdefault(row[column], dict(row))
+    conn.close()
+    return found
+
+
+def save_import_file(file_hash: str, batch_id: str, file_name: str, rows: int, duplicates: int, skipped: int) -> None:
+    """Файл загружен в пакет batch_id; повторная загрузка того же файла указывает на новый пакет."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("""
+        INSERT INTO ImportFiles (FileHash, BatchID, FileName, Rows, Duplicates, Skipped, CreatedAt)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(FileHash) DO UPDATE SET
+            BatchID = excluded.BatchID,
+            FileName = excluded.FileName,
+            Rows = excluded.Rows,
+            Duplicates = excluded.Duplicates,
+            Skipped = excluded.Skipped,
+            CreatedAt = excluded.CreatedAt
+    """, (file_hash, batch_id, file_name, rows, duplicates, skipped, utc_now()))
+    conn.commit()
+    conn.close()
+
+
+def compact_db(full_vacuum_ratio: float = 0.25, incremental_pages: int = 0) -> Dict[str, Any]:
+    """
+    Возвращает свободные страницы файла БД. Первый вызов переводит БД в
+    auto_vacuum=INCREMENTAL (для этого нужен один полный VACUUM); дальше —
+    incremental_vacuum (0 — все свободные страницы), а полный VACUUM только
+    когда свободных страниц больше full_vacuum_ratio (фрагментация).
+    """
+    conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    cursor = conn.cursor()
+    page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+    pages_before = cursor.execute("PRAGMA page_count").fetchone()[0]
+    free = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+    auto_vacuum = cursor.execute("PRAGMA auto_vacuum").fetchone()[0]
+    mode = "incremental"
+    try:
+        if auto_vacuum != 2:
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            mode = "full"
+        elif pages_before and free / pages_before > full_vacuum_ratio:
+            mode = "full"
+        if mode == "full":
+            cursor.execute("VACUUM")
+        else:
+            cursor.execute(f"PRAGMA incremental_vacuum({int(incremental_pages)})").fetchall()
+        cursor.execute("PRAGMA optimize")
+        pages_after = cursor.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        conn.close()
+    return {
+        "mode": mode,
+        "free_pages": free,
+        "bytes_before": pages_before * page_size,
+        "bytes_after": pages_after * page_size,
+    }
+
+
+def get_change_window(since: int, limit: int, batch_id: Optional[str] = None) -> Tuple[int, bool]:
+    """
+    Граница выдачи ленты изменений после курсора since: (until, есть ли ещё изменения).
+    Отдаются дела с since < ChangeSeq <= until; until — следующий курсор клиента.
+    """
+    batch_filter, params = ("AND BatchID = ?", (batch_id,)) if batch_id else ("", ())
+    conn = sqlite3.connect(db_path, timeout=30)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT ChangeSeq
+        FROM Cases
+        WHERE ChangeSeq > ? {batch_filter}
+        ORDER BY ChangeSeq
+        LIMIT 1 OFFSET ?
+    """, (since, *params, max(limit - 1, 0)))
+    row = cursor.fetchone()
+    if row is not None:
+        cursor.execute(f"SELECT 1 FROM Cases WHERE ChangeSeq > ? {batch_filter} LIMIT 1", (row[0], *params))
+        has_more = cursor.fetchone() is not None
+        conn.close()
+        return row[0], has_more
+    # меньше limit изменений: курсор — текущая вершина последовательности
+    cursor.execute("SELECT Value FROM ChangeSequence WHERE Id = 1")
+    top = cursor.fetchone()
+    conn.close()
+    return max(since, top[0] if top else 0), False
+
+
+def iter_changes(
+    since: int,
+    until: int,
+    columns: List[str],
+    batch_id: Optional[str] = None,
+    chunk_size: int = 1000,
+) -> Iterator[List[tuple]]:
+    """Изменённые дела окна (since, until] по возрастанию ChangeSeq, порциями."""
+    batch_filter, params = ("AND BatchID = ?", (batch_id,)) if batch_id else ("", ())
+    return _iter_rows(
+        f"SELECT {_select_columns(columns)} FROM Cases "
+        f"WHERE ChangeSeq > ? AND ChangeSeq <= ? {batch_filter} ORDER BY ChangeSeq",
+        (since, until, *params),
+        chunk_size,
+    )
+
+
 def get_unique_internal_ids(batch_id: str) -> List[str]:
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
@@ -151,18 +1188,23 @@ def get_unique_internal_ids(batch_id: str) -> List[str]:
     conn.close()
     return ids
 
-def get_case_data_by_internal_id(internal_id: str) -> Optional[Dict[str, Any]]:
+def get_case_data_by_internal_id(internal_id: str, batch_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Дело по InternalID. Один InternalID бывает в нескольких пакетах (повторная
+    загрузка): без batch_id возвращается поданное дело, если оно есть, иначе самое новое.
+    """
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT *
-        FROM Cases
-        WHERE InternalID = ?
-        LIMIT 1
-    """, (internal_id,))
-    
+
+    query = "SELECT * FROM Cases WHERE InternalID = ?"
+    params: List[Any] = [internal_id]
+    if batch_id:
+        query += " AND BatchID = ?"
+        params.append(batch_id)
+    query += " ORDER BY (TalonID IS NOT NULL AND TalonID != '') DESC, DB_Case_ID DESC LIMIT 1"
+    cursor.execute(query, params)
+
     row = cursor.fetchone()
     conn.close()
     
@@ -170,28 +1212,28 @@ def get_case_data_by_internal_id(internal_id: str) -> Optional[Dict[str, Any]]:
         return dict(row)
     return None
 
-def update_case_status(internal_id: str, talon_id: str):
-
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE Cases
-        SET TalonID = ?
-        WHERE InternalID = ?
-    """, (talon_id, internal_id))
-    conn.commit()
-    conn.close()
-
-
-def get_batch_progress(batch_id):
-    conn = sqlite3.connect(db_path)
+def get_batch_progress(batch_id: str, max_attempts: Optional[int] = None) -> Tuple[int, int, int]:
+    """
+    (подано, отложено, всего) дел пакета. Отложенные дела воркер больше не выдаёт:
+    ждут разбора человеком (NeedsReview) или исчерпали max_attempts попыток без
+    активной аренды. Пакет закончен, когда подано + отложено == всего.
+    """
+    conn = sqlite3.connect(db_path, timeout=30)
     cursor = conn.cursor()
-    
-    cursor.execute("SELECT COUNT(*) FROM cases WHERE BatchID = ?", (batch_id,))
-    total_count = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT COUNT(*) FROM cases WHERE BatchID = ? AND TalonID IS NOT NULL AND TalonID != ''", (batch_id,))
-    processed_count = cursor.fetchone()[0]
-    
+    filed = "TalonID IS NOT NULL AND TalonID != ''"
+    parked = "COALESCE(NeedsReview, 0) = 1"
+    params: List[Any] = []
+    if max_attempts:
+        parked += " OR (COALESCE(AttemptCount, 0) >= ? AND (LeaseExpiresAt IS NULL OR LeaseExpiresAt < ?))"
+        params += [max_attempts, utc_now()]
+    cursor.execute(f"""
+        SELECT
+            COALESCE(SUM({filed}), 0),
+            COALESCE(SUM(NOT ({filed}) AND ({parked})), 0),
+            COUNT(*)
+        FROM Cases
+        WHERE BatchID = ?
+    """, params + [batch_id])
+    filed_count, parked_count, total_count = cursor.fetchone()
     conn.close()
-    return processed_count, total_count
\ No newline at end of file
+    return filed_count, parked_count, total_count
\ No newline at end of file
@@ -0,0 +1,121 @@
+# System/talon.py
+import html
+import re
+import threading
+import xml.etree.ElementTree as ET
+from typing import Optional
+
+from .logger import get_logger
+
+log = get_logger("Talon")
+
+# value="..." у #xmlToSign0 — в полной странице и в partial-response RichFaces
+XML_TO_SIGN_RE = re.compile(r'id="[^"]*xmlToSign0"[^>]*?value="([^"]*)"|value="([^"]*)"[^>]*?id="[^"]*xmlToSign0"')
+F1_RE = re.compile(r"<f1>\s*([^<]*?)\s*</f1>")
+TALON_CONTENT_TYPES = ("html", "xml")
+TALON_RESOURCE_TYPES = ("document", "xhr", "fetch")
+
+
+def parse_talon_xml(xml_value: Optional[str]) -> Optional[str]:
+    """TalonID (<f1>) из значения xmlToSign0 (XML, экранированный как атрибут HTML)."""
+    if not xml_value or not xml_value.strip():
+        return None
+    # значение экранировано ещё раз (&lt;f1&gt;, &quot;) — снимаем этот слой целиком
+    xml_string = html.unescape(xml_value) if "&lt;" in xml_value else xml_value
+    try:
+        root = ET.fromstring(xml_string)
+    except ET.ParseError:
+        log.warning("Failed to parse xmlToSign0 XML")
+        return None
+    f1_element = root.find("f1")
+    if f1_element is None:
+        return None
+    return (f1_element.text or "").strip() or None
+
+
+def extract_talon(body: str) -> Optional[str]:
+    """Ищет талон в теле ответа: сначала через xmlToSign0, затем по самому тегу <f1>."""
+    if "xmlToSign0" not in body and "f1" not in body:
+        return None
+    match = XML_TO_SIGN_RE.search(body)
+    if match:
+        talon_id = parse_talon_xml(html.unescape(match.group(1) or match.group(2)))
+        if talon_id:
+            return talon_id
+    # partial-response может экранировать HTML ещё раз (CDATA/&amp;lt;)
+    unescaped = html.unescape(html.unescape(body))
+    if "xmlToSign0" not in unescaped:
+        return None
+    match = F1_RE.search(unescaped)
+    return match.group(1) if match and match.group(1) else None
+
+
+class TalonCapture:
+    """
+    Слушатель ответов страницы: ловит TalonID в HTML/XHR ответе сайта, как только
+    тот приходит, не дожидаясь отрисовки #xmlToSign0.
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.talon_id: Optional[str] = None
+        self._event = threading.Event()
+        self._active = False
+
+    def start(self) -> "TalonCapture":
+        self.talon_id = None
+        self._event.clear()
+        if not self._active:
+            self.page.on("response", self._on_response)
+            self._active = True
+        return self
+
+    def stop(self) -> None:
+        if self._active:
+            self.page.remove_listener("response", self._on_response)
+            self._active = False
+
+    def _on_response(self, response) -> None:
+        if self.talon_id:
+            return
+        try:
+            if response.request.resource_type not in TALON_RESOURCE_TYPES:
+                return
+            content_type = response.headers.get("content-type", "")
+            if not any(kind in content_type for kind in TALON_CONTENT_TYPES):
+                return
+            talon_id = extract_talon(response.text())
+        except Exception:
+            # ответ мог закрыться (редирект, уход со страницы) — это не ошибка подачи
+            log.debug("Failed to inspect response for TalonID", exc_info=True)
+            return
+        if talon_id:
+            log.info("TalonID '%s' captured from %s", talon_id, response.url)
+            self.talon_id = talon_id
+            self._event.set()
+
+    @property
+    def captured(self) -> bool:
+        return self._event.is_set()
+
+
+class AsyncTalonCapture(TalonCapture):
+    """TalonCapture для playwright.async_api: тело ответа читается через await."""
+
+    async def _on_response(self, response) -> None:
+        if self.talon_id:
+            return
+        try:
+            if response.request.resource_type not in TALON_RESOURCE_TYPES:
+                return
+            content_type = response.headers.get("content-type", "")
+            if not any(kind in content_type for kind in TALON_CONTENT_TYPES):
+                return
+            talon_id = extract_talon(await response.text())
+        except Exception:
+            log.debug("Failed to inspect response for TalonID", exc_info=True)
+            return
+        if talon_id:
+            log.info("TalonID '%s' captured from %s", talon_id, response.url)
+            self.talon_id = talon_id
+            self._event.set()
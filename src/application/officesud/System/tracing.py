@@ -0,0 +1,206 @@
+# System/tracing.py
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zipfile
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from .logger import get_logger
+from . import sqlite
+
+log = get_logger("FailureTrace")
+
+# Трассы лежат рядом с общей БД: их пишет воркер, а отдаёт админка Django.
+TRACE_DIR = os.environ.get(
+    "OFFICESUD_TRACE_DIR",
+    os.path.join(os.path.dirname(sqlite.DB_PATH), "traces"),
+)
+FAILURE_TRACE = os.environ.get("OFFICESUD_FAILURE_TRACE", "1") not in ("0", "false", "False")
+TRACE_ACTIONS = int(os.environ.get("OFFICESUD_TRACE_ACTIONS", "100"))
+# DOM + скриншот в конце каждого шага; 0 — только снимок в момент сбоя
+TRACE_SNAPSHOTS = int(os.environ.get("OFFICESUD_TRACE_SNAPSHOTS", "5"))
+TRACE_RETENTION_DAYS = float(os.environ.get("OFFICESUD_TRACE_RETENTION_DAYS", "14"))
+TRACE_MAX_MB = int(os.environ.get("OFFICESUD_TRACE_MAX_MB", "500"))
+SCREENSHOT_QUALITY = 40
+SNAPSHOT_TIMEOUT_MS = 5000
+
+
+def _safe(value: Any) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(value or "")) or "_"
+
+
+def trace_name(case_data: Dict[str, Any]) -> str:
+    """Имя архива относительно TRACE_DIR: <пакет>/<дело>-a<попытка>-<время>.zip."""
+    return "{}/{}-a{}-{}.zip".format(
+        _safe(case_data.get("BatchID")),
+        _safe(case_data.get("InternalID")),
+        case_data.get("AttemptCount") or 1,
+        time.strftime("%Y%m%d-%H%M%S"),
+    )
+
+
+def trace_path(name: str, directory: str = TRACE_DIR) -> Optional[str]:
+    """Абсолютный путь архива или None, если имя выходит за пределы каталога трасс."""
+    root = os.path.abspath(directory)
+    path = os.path.abspath(os.path.join(root, name))
+    if os.path.commonpath([root, path]) != root or not path.endswith(".zip"):
+        return None
+    return path
+
+
+def store_trace(name: str, src_path: str, directory: str = TRACE_DIR) -> str:
+    """Переносит готовый архив в каталог трасс и применяет ограничения хранения."""
+    path = trace_path(name, directory)
+    if path is None:
+        raise ValueError(f"Invalid trace name: {name}")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    shutil.move(src_path, path)
+    enforce_retention(directory)
+    return path
+
+
+def enforce_retention(
+    directory: str = TRACE_DIR,
+    max_age_days: float = TRACE_RETENTION_DAYS,
+    max_mb: int = TRACE_MAX_MB,
+) -> int:
+    """Удаляет трассы старше max_age_days, затем самые старые сверх max_mb. Возвращает число удалённых."""
+    files = []
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+    files.sort()
+
+    cutoff = time.time() - max_age_days * 86400
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for mtime, size, path in files:
+        if mtime >= cutoff and total <= max_mb * 1024 * 1024:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+
+    for dirpath, dirnames, filenames in os.walk(directory, topdown=False):
+        if dirpath != directory and not dirnames and not filenames:
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass
+    return removed
+
+
+class FailureTrace:
+    """
+    Кольцевой буфер последних действий воркера для разбора сбоев в headless-контейнере.
+    Действия (шаги, переходы, ошибки консоли и сети) — дешёвые dict в памяти;
+    DOM и JPEG-скриншот снимаются только в конце шага и хранятся для последних
+    snapshots шагов. На диск буфер попадает лишь при сбое или повторной попытке дела.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = FAILURE_TRACE,
+        actions: int = TRACE_ACTIONS,
+        snapshots: int = TRACE_SNAPSHOTS,
+    ):
+        self.enabled = enabled
+        self._actions = deque(maxlen=actions)
+        self._snapshots = deque(maxlen=snapshots) if snapshots > 0 else None
+        self._pages = []
+        self._tabs = 0
+
+    def attach(self, page) -> None:
+        """Подписка на события страницы; каждая вкладка подписывается один раз."""
+        if not self.enabled:
+            return
+        # вкладки закрываются при перезапуске контекста — их больше не держим
+        self._pages = [p for p in self._pages if not p.is_closed()]
+        if any(p is page for p in self._pages):
+            return
+        self._pages.append(page)
+        self._tabs += 1
+        tab = self._tabs
+
+        def on_navigated(frame):
+            if frame == page.main_frame:
+                self.action("navigate", tab=tab, url=frame.url)
+
+        def on_console(message):
+            if message.type == "error":
+                self.action("console_error", tab=tab, text=message.text[:500])
+
+        page.on("framenavigated", on_navigated)
+        page.on("console", on_console)
+        page.on("pageerror", lambda error: self.action("page_error", tab=tab, text=str(error)[:500]))
+        page.on(
+            "requestfailed",
+            lambda request: self.action("request_failed", tab=tab, url=request.url, error=request.failure),
+        )
+
+    def action(self, kind: str, **details: Any) -> None:
+        if self.enabled:
+            self._actions.append(dict(details, kind=kind, at=round(time.time(), 3)))
+
+    def _capture(self, page) -> Optional[Dict[str, Any]]:
+        try:
+            return {
+                "url": page.url,
+                "html": page.content(),
+                "screenshot": page.screenshot(type="jpeg", quality=SCREENSHOT_QUALITY, timeout=SNAPSHOT_TIMEOUT_MS),
+            }
+        except Exception as e:
+            # страница могла закрыться или зависнуть — трасса не должна ронять дело
+            log.debug("Snapshot failed: %s", e)
+            return None
+
+    def snapshot(self, page, label: str) -> None:
+        if not self.enabled or self._snapshots is None or page is None:
+            return
+        captured = self._capture(page)
+        if captured is not None:
+            self._snapshots.append(dict(captured, label=label, at=round(time.time(), 3)))
+
+    def write(self, page, meta: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Сжатый архив буфера во временном файле: meta.json, actions.json,
+        snapshots/NN-<шаг>.html/.jpg и final.* — состояние страницы в момент записи.
+        Возвращает путь и сводку для события trace.
+        """
+        fd, path = tempfile.mkstemp(prefix="officesud-trace-", suffix=".zip")
+        os.close(fd)
+        snapshots: List[Dict[str, Any]] = list(self._snapshots or [])
+        final = self._capture(page) if page is not None else None
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("meta.json", json.dumps(meta, ensure_ascii=False, indent=2))
+            archive.writestr("actions.json", json.dumps(list(self._actions), ensure_ascii=False, indent=2))
+            archive.writestr("snapshots.json", json.dumps(
+                [{key: snapshot[key] for key in ("label", "url", "at")} for snapshot in snapshots],
+                ensure_ascii=False,
+                indent=2,
+            ))
+            for index, snapshot in enumerate(snapshots, 1):
+                prefix = f"snapshots/{index:02d}-{_safe(snapshot['label'])}"
+                archive.writestr(f"{prefix}.html", snapshot["html"])
+                archive.writestr(f"{prefix}.jpg", snapshot["screenshot"])
+            if final is not None:
+                archive.writestr("final.html", final["html"])
+                archive.writestr("final.jpg", final["screenshot"])
+        return {
+            "path": path,
+            "bytes": os.path.getsize(path),
+            "actions": len(self._actions),
+            "snapshots": len(snapshots) + (1 if final is not None else 0),
+        }
@@ -1,15 +1,17 @@
 # System/uploader.py
 import os
-import time
+from typing import Optional
 from playwright.sync_api import Page, expect
 from .logger import get_logger
-import random
+from . import docstore
+from .pacing import AdaptivePacer
 
 log = get_logger("Uploader")
 
 class FileUploader:
-    def __init__(self, page: Page):
+    def __init__(self, page: Page, pacer: Optional[AdaptivePacer] = None):
         self.page = page
+        self.pacer = pacer or AdaptivePacer()
 
     def upload_file(self, button_name, file_paths_string):
         paths = [p.strip() for p in file_paths_string.split('*') if p.strip()]
@@ -17,7 +19,7 @@ class FileUploader:
             return
         absolute_paths = []
         for file_name in paths:
-            file_path = os.path.abspath(file_name)
+            file_path = docstore.resolve(file_name)
             if not os.path.exists(file_path):
                 log.error(f"Файл не найден и пропущен: {file_path}")
             else:
@@ -28,12 +30,12 @@ class FileUploader:
             self.page.get_by_role("button", name=button_name).first.click()
         file_chooser = fc_info.value
         file_chooser.set_files(absolute_paths)
-        time.sleep(random.uniform(1, 2)) 
+        self.pacer.pause(1, 2) 
 
 
     def handle_payment_files(self, PaymentDocPath):
         checkbox = self.page.locator("input[name$='isonline-payment']")
         if not checkbox.is_checked():
             checkbox.check()
-            time.sleep(random.uniform(1, 2))
+            self.pacer.pause(1, 2)
         self.upload_file("Файлды қоса тіркеу", PaymentDocPath)
@@ -0,0 +1,101 @@
+# System/watchdog.py
+import os
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .logger import get_logger
+from . import procstats
+
+log = get_logger("MemoryWatchdog")
+
+# Пороги перезапуска между делами; 0 — порог отключён.
+RECYCLE_RENDERER_MB = int(os.environ.get("OFFICESUD_RECYCLE_RENDERER_MB", "800"))
+RECYCLE_BROWSER_MB = int(os.environ.get("OFFICESUD_RECYCLE_BROWSER_MB", "1500"))
+RECYCLE_CONTEXT_CASES = int(os.environ.get("OFFICESUD_RECYCLE_CONTEXT_CASES", "50"))
+RECYCLE_BROWSER_CASES = int(os.environ.get("OFFICESUD_RECYCLE_BROWSER_CASES", "200"))
+
+CONTEXT = "context"
+BROWSER = "browser"
+MB = 1024 * 1024
+
+
+def sample_browser_memory() -> Tuple[Optional[int], Optional[int]]:
+    """(RSS всех процессов Chromium, RSS рендереров) в байтах."""
+    return procstats.browser_rss(), procstats.browser_rss(renderer_only=True)
+
+
+class MemoryWatchdog:
+    """
+    Следит за памятью Chromium воркера. Рендерер растёт с каждым AJAX-циклом
+    RichFaces и модалкой, поэтому между делами контекст пересоздаётся по порогу
+    RSS рендереров или числу дел, а браузер целиком — по порогу общего RSS
+    или числу дел с момента запуска. Сессия при этом сохраняется (SessionStore).
+    """
+
+    def __init__(
+        self,
+        renderer_mb: int = RECYCLE_RENDERER_MB,
+        browser_mb: int = RECYCLE_BROWSER_MB,
+        context_cases: int = RECYCLE_CONTEXT_CASES,
+        browser_cases: int = RECYCLE_BROWSER_CASES,
+        sample: Callable[[], Tuple[Optional[int], Optional[int]]] = sample_browser_memory,
+    ):
+        self.renderer_limit = renderer_mb * MB
+        self.browser_limit = browser_mb * MB
+        self.context_cases = context_cases
+        self.browser_cases = browser_cases
+        self._sample = sample
+        self.recycles = {CONTEXT: 0, BROWSER: 0}
+        self._context_cases = 0
+        self._browser_cases = 0
+        self._last: Tuple[Optional[int], Optional[int]] = (None, None)
+        self._pending: Dict[str, Any] = {}
+
+    def case_done(self) -> None:
+        self._context_cases += 1
+        self._browser_cases += 1
+
+    def due(self) -> Optional[Tuple[str, str]]:
+        """(что перезапустить, причина) или None. Браузер важнее контекста."""
+        browser_rss, renderer_rss = self._last = self._sample()
+        if self.browser_limit and browser_rss and browser_rss > self.browser_limit:
+            return BROWSER, f"browser RSS {browser_rss // MB} MiB"
+        if self.browser_cases and self._browser_cases >= self.browser_cases:
+            return BROWSER, f"{self._browser_cases} cases"
+        if self.renderer_limit and renderer_rss and renderer_rss > self.renderer_limit:
+            return CONTEXT, f"renderer RSS {renderer_rss // MB} MiB"
+        if self.context_cases and self._context_cases >= self.context_cases:
+            return CONTEXT, f"{self._context_cases} cases"
+        return None
+
+    def recycled(self, kind: str, reason: str, seconds: float) -> None:
+        before = self._last
+        self.recycles[kind] += 1
+        self._context_cases = 0
+        if kind == BROWSER:
+            self._browser_cases = 0
+        self._pending = {
+            "recycle": kind,
+            "recycle_reason": reason,
+            "recycle_ms": int(seconds * 1000),
+        }
+        log.info(
+            "Recycled %s (%s) in %.1f sec; browser RSS before %s MiB",
+            kind, reason, seconds, before[0] // MB if before[0] else "?",
+        )
+
+    def metrics(self) -> Dict[str, Any]:
+        """RSS на момент шага (кривая памяти по StepEvents) и счётчики перезапусков."""
+        browser_rss, renderer_rss = self._last = self._sample()
+        metrics: Dict[str, Any] = {
+            "cases_in_context": self._context_cases,
+            "recycles": dict(self.recycles),
+        }
+        if browser_rss is not None:
+            metrics["browser_rss_mb"] = browser_rss // MB
+        if renderer_rss is not None:
+            metrics["renderer_rss_mb"] = renderer_rss // MB
+        # сведения о перезапуске — один раз, в первом шаге после него
+        metrics.update(self._pending)
+        self._pending = {}
+        return metrics
+
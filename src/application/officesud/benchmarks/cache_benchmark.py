@@ -0,0 +1,103 @@
+"""
+Холодный и тёплый запуск браузера воркера: сколько байт уходит по сети и
+сколько длится навигация с пустым профилем и с профилем, где HTTP-кэш уже
+прогрет (см. System/browser_profile.py).
+
+    python -m application.officesud.benchmarks.cache_benchmark \\
+        --url https://office.sud.kz/ --url https://office.sud.kz/form/proceedings/services.xhtml --runs 3
+"""
+import argparse
+import json
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+from playwright.sync_api import sync_playwright
+
+from application.officesud.System.browser_profile import BrowserProfile
+
+
+def measure(playwright, user_data_dir: str, urls: List[str], headless: bool, channel: str) -> Dict[str, float]:
+    profile = BrowserProfile(root=user_data_dir)
+    context = playwright.chromium.launch_persistent_context(
+        user_data_dir,
+        headless=headless,
+        channel=channel or None,
+        args=profile.launch_args(),
+    )
+    page = context.pages[0] if context.pages else context.new_page()
+    stats = {"bytes": 0, "requests": 0, "from_disk_cache": 0}
+
+    def on_loading_finished(event):
+        stats["bytes"] += event.get("encodedDataLength", 0)
+
+    def on_response(event):
+        stats["requests"] += 1
+        if event["response"].get("fromDiskCache"):
+            stats["from_disk_cache"] += 1
+
+    # CDP видит и ответы из кэша, и реальный размер по сети (encodedDataLength)
+    cdp = context.new_cdp_session(page)
+    cdp.on("Network.loadingFinished", on_loading_finished)
+    cdp.on("Network.responseReceived", on_response)
+    cdp.send("Network.enable")
+
+    started = time.monotonic()
+    for url in urls:
+        page.goto(url, wait_until="load")
+    stats["navigation_ms"] = int((time.monotonic() - started) * 1000)
+    context.close()
+    return stats
+
+
+def summarize(runs: List[Dict[str, float]]) -> Dict[str, float]:
+    return {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+
+
+def run_benchmark(urls: List[str], runs: int, headless: bool = True, channel: str = "") -> Dict[str, Dict]:
+    cold_runs, warm_runs = [], []
+    warm_dir = tempfile.mkdtemp(prefix="officesud-warm-")
+    try:
+        with sync_playwright() as playwright:
+            # прогрев профиля, который потом меряется как «тёплый»
+            measure(playwright, warm_dir, urls, headless, channel)
+            for _ in range(runs):
+                cold_dir = tempfile.mkdtemp(prefix="officesud-cold-")
+                try:
+                    cold_runs.append(measure(playwright, cold_dir, urls, headless, channel))
+                finally:
+                    shutil.rmtree(cold_dir, ignore_errors=True)
+                warm_runs.append(measure(playwright, warm_dir, urls, headless, channel))
+    finally:
+        shutil.rmtree(warm_dir, ignore_errors=True)
+    return {"cold": summarize(cold_runs), "warm": summarize(warm_runs)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold vs warm browser cache benchmark")
+    parser.add_argument("--url", action="append", required=True, help="URL для навигации (можно несколько)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--headed", action="store_true")
+    parser.add_argument("--channel", default="", help='например "chrome", как у воркера')
+    parser.add_argument("--json", action="store_true", help="вывести результат в JSON")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.url, args.runs, headless=not args.headed, channel=args.channel)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    cold, warm = result["cold"], result["warm"]
+    print(f"{'':<16}{'cold':>12}{'warm':>12}")
+    for key in ("bytes", "requests", "from_disk_cache", "navigation_ms"):
+        print(f"{key:<16}{cold[key]:>12.0f}{warm[key]:>12.0f}")
+    if cold["bytes"]:
+        print(f"bytes saved: {100 * (1 - warm['bytes'] / cold['bytes']):.1f}%")
+    if cold["navigation_ms"]:
+        print(f"navigation time saved: {100 * (1 - warm['navigation_ms'] / cold['navigation_ms']):.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+Sync и async движки на офлайн-стенде (benchmarks/standin.py): дел в час и
+память на одно одновременно подаваемое дело. Sync масштабируется процессами
+(как server_worker --shards), async — числом дел на одном цикле событий.
+
+    python -m application.officesud.benchmarks.engine_benchmark --cases 40 --concurrency 4 --pace-factor 0.05
+
+Память — пиковый суммарный RSS всех дочерних процессов бенчмарка
+(Python-воркеры, драйверы Playwright, Chromium), делённый на concurrency.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List
+
+from application.officesud.benchmarks.standin import OPTION_IDS, StandInServer
+
+MB = 1024 * 1024
+
+
+class _NeverStop:
+    @staticmethod
+    def is_set() -> bool:
+        return False
+
+
+def _prepare_engine(processor, pace_factor: float) -> None:
+    from application.officesud.System import config
+    from application.officesud.System.governor import RateGovernor
+
+    config.HEADLESS = True
+    # лимиты сайта стенду не нужны, а паузы сокращаются одинаково для обоих движков
+    processor.governor = RateGovernor(acquire=lambda key, rate, burst: 0.0)
+    processor.pacer.adaptive = False
+    processor.pacer.factor = pace_factor
+
+
+def _run_sync_worker(batch_id: str, worker_id: str, pace_factor: float) -> None:
+    from application.officesud.System.case_processor import CaseProcessor
+    from application.officesud.System.heartbeat import Heartbeat
+
+    processor = CaseProcessor(batch_id, _NeverStop(), heartbeat=Heartbeat(batch_id, worker_id=worker_id))
+    _prepare_engine(processor, pace_factor)
+    processor.run_process()
+
+
+def _run_async_worker(batch_id: str, worker_id: str, pace_factor: float, concurrency: int) -> None:
+    from application.officesud.System.aio.case_processor import AsyncCaseProcessor
+    from application.officesud.System.heartbeat import Heartbeat
+
+    processor = AsyncCaseProcessor(
+        batch_id,
+        _NeverStop(),
+        heartbeat=Heartbeat(batch_id, worker_id=worker_id),
+        concurrency=concurrency,
+    )
+    _prepare_engine(processor, pace_factor)
+    processor.run_process()
+
+
+def create_batch(db_path: str, cases: int, documents: Dict[str, str]) -> str:
+    """Пакет синтетических дел: истец-юрлицо, ответчик-физлицо, документы из documents."""
+    from application.officesud.System import sqlite
+
+    sqlite.db_path = db_path
+    sqlite.check_and_initialize_db()
+    batch_id = f"bench-{uuid.uuid4().hex[:8]}"
+    rows = []
+    for index in range(cases):
+        option = OPTION_IDS[index % len(OPTION_IDS)]
+        rows.append((
+            batch_id, f"{batch_id}-{index}", str(option), str(option),
+            f"{100000000000 + index}", "1", "1",
+            f"{900000000000 + index}", "2", "0", "+77001234567",
+            documents["payment"], documents["main"], documents["other"],
+            "Краткое содержание", "Основание", "100000", "3000",
+        ))
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        """
+        INSERT INTO Cases (
+            BatchID, InternalID, RegionID, CourtID,
+            PlaintiffID, PlaintiffSide, PlaintiffType,
+            DefendantID, DefendantSide, DefendantType, DefendantPhone,
+            PaymentDocPath, MainDocPath, OtherDocPath,
+            ClaimSummary, ClaimBasis, ClaimAmount, StateDuty
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        rows,
+    )
+    conn.commit()
+    conn.close()
+    return batch_id
+
+
+class TreeMemorySampler:
+    """Пиковый и средний RSS дерева дочерних процессов (фоновый поток)."""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.samples: List[int] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self) -> None:
+        from application.officesud.System import procstats
+
+        while not self._stop.wait(self.interval):
+            self.samples.append(sum(procstats.process_rss(pid) or 0 for pid in procstats.descendant_pids()))
+
+    def __enter__(self) -> "TreeMemorySampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def run_engine(engine: str, db_path: str, cases: int, concurrency: int, pace_factor: float, documents) -> Dict:
+    from application.officesud.System import sqlite
+
+    batch_id = create_batch(db_path, cases, documents)
+    if engine == "sync":
+        processes = [
+            multiprocessing.Process(target=_run_sync_worker, args=(batch_id, f"bench-sync-{i}", pace_factor))
+            for i in range(concurrency)
+        ]
+    else:
+        processes = [
+            multiprocessing.Process(
+                target=_run_async_worker,
+                args=(batch_id, "bench-async", pace_factor, concurrency),
+            )
+        ]
+
+    started = time.monotonic()
+    with TreeMemorySampler() as sampler:
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    elapsed = time.monotonic() - started
+
+    done, _, total = sqlite.get_batch_progress(batch_id)
+    peak = max(sampler.samples, default=0)
+    return {
+        "engine": engine,
+        "concurrency": concurrency,
+        "cases": total,
+        "filed": done,
+        "seconds": round(elapsed, 1),
+        "cases_per_hour": round(done / elapsed * 3600, 1) if elapsed else 0,
+        "peak_rss_mb": peak // MB,
+        "mean_rss_mb": (sum(sampler.samples) // len(sampler.samples)) // MB if sampler.samples else 0,
+        "rss_per_concurrent_case_mb": peak // MB // concurrency,
+    }
+
+
+def run_benchmark(cases: int, concurrency: int, pace_factor: float, latency_ms: int, engines: List[str]) -> List[Dict]:
+    workdir = tempfile.mkdtemp(prefix="officesud-engine-bench-")
+    documents = {}
+    for name in ("payment", "main", "other"):
+        path = os.path.join(workdir, f"{name}.pdf")
+        with open(path, "wb") as f:
+            f.write(b"%PDF-1.4\n% stand-in document\n")
+        documents[name] = path
+
+    with StandInServer(latency_ms=latency_ms) as server:
+        # до импорта движков: адрес сайта, БД и каталог сессий читаются из окружения
+        os.environ.update({
+            "OFFICESUD_SITE_URL": server.url,
+            "OFFICESUD_DB_PATH": os.path.join(workdir, "db.sqlite3"),
+            "OFFICESUD_SESSION_DIR": os.path.join(workdir, "sessions"),
+            "OFFICESUD_SLOW_MO_MS": "0",
+            "OFFICESUD_FAILURE_TRACE": "0",
+        })
+        return [
+            run_engine(engine, os.environ["OFFICESUD_DB_PATH"], cases, concurrency, pace_factor, documents)
+            for engine in engines
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync vs async Playwright engine on the offline stand-in")
+    parser.add_argument("--cases", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4, help="процессов sync / дел на цикле async")
+    parser.add_argument("--pace-factor", type=float, default=0.05, help="множитель пауз AdaptivePacer")
+    parser.add_argument("--latency-ms", type=int, default=300, help="задержка ответов и AJAX стенда")
+    parser.add_argument("--engine", action="append", choices=("sync", "async"), help="по умолчанию оба")
+    parser.add_argument("--json", action="store_true", help="вывести результат в JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.cases, args.concurrency, args.pace_factor, args.latency_ms,
+                            args.engine or ["sync", "async"])
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    keys = ("filed", "seconds", "cases_per_hour", "peak_rss_mb", "rss_per_concurrent_case_mb")
+    print(f"{'':<28}" + "".join(f"{r['engine']:>12}" for r in results))
+    for key in keys:
+        print(f"{key:<28}" + "".join(f"{r[key]:>12}" for r in results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Офлайн-стенд office.sud.kz для бенчмарков: локальный HTTP-сервер с одной
+страницей, где есть все элементы, которые трогают Filler, ParticipantModal
+и FileUploader (подписи полей, лоадер, модалки участников, кнопки загрузки,
+#xmlToSign0 с талоном). Задержка AJAX и ответов сервера задаётся latency_ms.
+
+    python -m application.officesud.benchmarks.standin --port 8765 --latency-ms 300
+"""
+import argparse
+import itertools
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+CABINET_PATH = "/form/proceedings/services.xhtml"
+TALON_PATH = "/talon.xhtml"
+OPTION_IDS = range(1, 31)
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>office.sud.kz stand-in</title>
+<style>.d-none{display:none} .loader{width:24px;height:24px} .modal{border:1px solid #999;padding:8px}</style>
+</head><body>
+<div class="loader d-none"></div>
+<span class="rf-st-stop" style=""></span>
+<a href="#" id="send">Құжаттарды жіберу</a>
+
+<section id="step1" style="display:none">
+  <label for="kind">Сот ісін жүргізу түрі</label>
+  <select id="kind"><option value=""></option><option value="CIVIL">CIVIL</option></select>
+  <label for="stage">Саты</label>
+  <select id="stage"><option value=""></option><option value="FIRSTINSTANCE">FIRSTINSTANCE</option></select>
+  <label for="doctype">Құжат түрі</label>
+  <select id="doctype"><option value=""></option><option value="3">3</option></select>
+  <button type="button" id="submit-kind">Жіберу</button>
+</section>
+
+<section id="step2" style="display:none">
+  <label for="proc">Іс бойынша іс жүргізу түрі</label>
+  <select id="proc"><option value=""></option><option value="2">2</option></select>
+  <label for="category">Іс санаты</label>
+  <select id="category"><option value=""></option><option value="27">27</option></select>
+  <label for="nature">Арыз сипаты</label>
+  <select id="nature"><option value=""></option><option value="1">1</option></select>
+  <label for="region">Облыс (астана, республикалық маңызы бар қала)</label>
+  <select id="region"><option value=""></option>%(options)s</select>
+  <span id="court-box" style="display:none">
+    <label for="court">Сот органы</label>
+    <select id="court"><option value=""></option>%(options)s</select>
+  </span>
+  <button type="button" id="add-participant">Процесс қатысушысын қосу</button>
+  <ul id="participants"></ul>
+</section>
+
+<section id="step3" style="display:none">
+  <select id="payment-kind"><option value=""></option><option value="2">2</option></select>
+  <input name="p:edit-totalSum"><input name="p:edit-duty">
+  <input type="checkbox" name="p:isonline-payment">
+  <button type="button" class="upload" data-input="payment-file">Файлды қоса тіркеу</button>
+  <input type="file" id="payment-file" multiple style="display:none">
+</section>
+
+<section id="step4" style="display:none">
+  <textarea id="summary"></textarea><textarea id="basis"></textarea>
+  <button type="button" class="upload" data-input="main-file">Талап арызды жүктеу</button>
+  <input type="file" id="main-file" multiple style="display:none">
+  <button type="button" class="upload" data-input="other-file">Файлды қоса тіркеу</button>
+  <input type="file" id="other-file" multiple style="display:none">
+</section>
+
+<div class="button-orange" id="next-box" style="display:none"><button type="button" id="next">Ары қарай</button></div>
+
+<div id="selectSideModalDialog" class="modal" style="display:none">
+  <select id="m:pp-type"><option value=""></option><option value="true">true</option><option value="false">false</option></select>
+  <select id="m:pp-side"><option value=""></option>%(options)s</select>
+  <input type="button" value="Ары қарай" id="side-next">
+</div>
+<div id="jurModalDialog" class="modal" style="display:none">
+  <input id="j:org-bin"><button type="button" class="gbdSearch">GBD</button>
+  <input name="j:org-factAddress"><input name="j:org-bankDetails">
+  <input type="button" value="Сақтау" class="save">
+</div>
+<div id="fizModalDialog" class="modal" style="display:none">
+  <input id="f:person-iin"><button type="button" class="gbdSearch">GBD</button>
+  <input id="f:person-phone"><input id="f:person-email">
+  <input type="button" value="Сақтау" class="save">
+</div>
+
+<script>
+const LATENCY = %(latency)d;
+const $ = (id) => document.getElementById(id);
+const show = (id, visible) => { $(id).style.display = visible ? "" : "none"; };
+const loader = document.querySelector(".loader");
+const status = document.querySelector(".rf-st-stop");
+let step = 2;
+
+// AJAX-цикл RichFaces: лоадер и индикатор статуса на время «запроса»
+function ajax(done) {
+  loader.classList.remove("d-none");
+  status.setAttribute("style", "display:none");
+  setTimeout(() => {
+    loader.classList.add("d-none");
+    status.setAttribute("style", "");
+    if (done) done();
+  }, LATENCY);
+}
+
+$("send").onclick = (e) => { e.preventDefault(); ajax(() => show("step1", true)); };
+for (const id of ["kind", "stage", "doctype", "proc", "category", "nature", "court", "payment-kind"]) {
+  $(id).onchange = () => ajax();
+}
+$("region").onchange = () => ajax(() => show("court-box", true));
+$("submit-kind").onclick = () => ajax(() => { show("step2", true); show("next-box", true); });
+$("add-participant").onclick = () => ajax(() => show("selectSideModalDialog", true));
+$("m:pp-type").onchange = () => ajax();
+$("m:pp-side").onchange = () => ajax();
+$("side-next").onclick = () => ajax(() => {
+  show("selectSideModalDialog", false);
+  show($("m:pp-type").value === "true" ? "jurModalDialog" : "fizModalDialog", true);
+});
+for (const modal of ["jurModalDialog", "fizModalDialog"]) {
+  $(modal).querySelector(".gbdSearch").onclick = () => ajax();
+  $(modal).querySelector(".save").onclick = () => ajax(() => {
+    show(modal, false);
+    const item = document.createElement("li");
+    item.textContent = $(modal).querySelector("input").value;
+    $("participants").appendChild(item);
+  });
+}
+for (const button of document.querySelectorAll(".upload")) {
+  button.onclick = () => $(button.dataset.input).click();
+}
+$("next").onclick = () => {
+  if (step === 4) { ajax(() => { location.href = "%(talon_path)s"; }); return; }
+  ajax(() => {
+    show("step1", false); show("step2", false);
+    show("step" + step, false); step += 1; show("step" + step, true);
+  });
+};
+</script>
+</body></html>
+"""
+
+TALON_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"></head><body>
+<input type="hidden" id="xmlToSign0" value="&lt;root&gt;&lt;f1&gt;%(talon)s&lt;/f1&gt;&lt;/root&gt;">
+</body></html>
+"""
+
+
+class StandInServer:
+    """Стенд в фоновом потоке: with StandInServer(latency_ms=300) as server: server.url ..."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: int = 300):
+        self.latency_ms = latency_ms
+        self.talons = itertools.count(1)
+        page = PAGE % {
+            "latency": latency_ms,
+            "options": "".join(f'<option value="{i}">{i}</option>' for i in OPTION_IDS),
+            "talon_path": TALON_PATH,
+        }
+        self._page = page.encode("utf-8")
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = urlparse(self.path).path
+                # ответ сервера JSF приходит не мгновенно
+                time.sleep(server.latency_ms / 1000)
+                if path == TALON_PATH:
+                    body = (TALON_PAGE % {"talon": f"STANDIN-{next(server.talons)}"}).encode("utf-8")
+                elif path in ("/", CABINET_PATH):
+                    body = server._page
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline office.sud.kz stand-in")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=int, default=300)
+    args = parser.parse_args()
+    server = StandInServer(port=args.port, latency_ms=args.latency_ms)
+    print(f"Stand-in at {server.url} (OFFICESUD_SITE_URL={server.url})")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,139 @@
 # application/officesud/server_worker.py
+import multiprocessing
+import os
+
 from application.officesud.System import sqlite  # noqa
 from application.officesud.System.case_processor import CaseProcessor
+from application.officesud.System.control import BatchControl
+from application.officesud.System.heartbeat import Heartbeat, default_worker_id
 from application.officesud.System.modal import logger
+from application.officesud.System.remote import run_remote_worker
+
 
+def _run_batch_shard(batch_id: str, worker_id=None) -> None:
+    heartbeat = Heartbeat(batch_id, worker_id=worker_id) if worker_id else None
+    processor = CaseProcessor(batch_id=batch_id, stop_event=BatchControl(batch_id), heartbeat=heartbeat)
+    processor.run_process()
 
-class DummyStopEvent:
-    @staticmethod
-    def is_set() -> bool:
-        return False
 
+def _run_batch_async(batch_id: str, concurrency: int) -> None:
+    from application.officesud.System.aio.case_processor import AsyncCaseProcessor
 
-def run_batch(batch_id: str) -> str:
-    sqlite.check_and_initialize_db()
-    processor = CaseProcessor(batch_id=batch_id, stop_event=DummyStopEvent())
+    processor = AsyncCaseProcessor(batch_id=batch_id, stop_event=BatchControl(batch_id), concurrency=concurrency)
     processor.run_process()
+
+
+def run_batch(
+    batch_id: str, shards: int = 1, engine: str = "sync", concurrency: int = None, preprocess: bool = False
+) -> str:
+    """
+    shards > 1 — несколько процессов с отдельными браузерами разбирают один пакет:
+    дела выдаются в аренду по одному, так что дубликатов подачи нет.
+    engine="async" — один процесс ведёт concurrency дел на одном браузере.
+    preprocess — до запуска браузеров сжать документы пакета (System/preprocess.py).
+    """
+    sqlite.check_and_initialize_db()
+    if preprocess:
+        from application.officesud.System.preprocess import preprocess_batch_documents
+
+        try:
+            preprocess_batch_documents(batch_id)
+        except Exception:
+            # предобработка — только оптимизация, исходные документы остаются годными
+            logger.exception("Document preprocessing failed for batch %s", batch_id)
+    if engine == "async":
+        from application.officesud.System.aio.case_processor import ASYNC_CONCURRENCY
+
+        _run_batch_async(batch_id, concurrency or ASYNC_CONCURRENCY)
+        return batch_id
+    if shards <= 1:
+        _run_batch_shard(batch_id)
+        return batch_id
+
+    base_worker_id = default_worker_id()
+    _run_processes([
+        multiprocessing.Process(
+            target=_run_batch_shard,
+            args=(batch_id, f"{base_worker_id}-{index}"),
+            name=f"officesud-shard-{index}",
+        )
+        for index in range(shards)
+    ])
     return batch_id
 
 
+def _run_processes(processes) -> None:
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+def run_remote(api_url: str, token: str, batch_id=None, processes: int = 1, idle_poll_interval=None) -> None:
+    """
+    Удалённый режим: воркер ничего не делит с Django, кроме HTTP.
+    processes > 1 — несколько независимых воркеров на одной машине.
+    """
+    if processes <= 1:
+        run_remote_worker(api_url, token, batch_id=batch_id, idle_poll_interval=idle_poll_interval)
+        return
+
+    base_worker_id = default_worker_id()
+    _run_processes([
+        multiprocessing.Process(
+            target=run_remote_worker,
+            args=(api_url, token),
+            kwargs={
+                "batch_id": batch_id,
+                "worker_id": f"{base_worker_id}-{index}",
+                "idle_poll_interval": idle_poll_interval,
+            },
+            name=f"officesud-worker-{index}",
+        )
+        for index in range(processes)
+    ])
+
+
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description="Run Office.sud batch by batch_id (server mode)")
-    parser.add_argument("batch_id", type=str, help="BatchID, созданный через dataloader.load_excel_to_db(...)")
+    parser.add_argument("batch_id", type=str, nargs="?", help="BatchID, созданный через dataloader.load_excel_to_db(...)")
+    parser.add_argument(
+        "--remote",
+        metavar="URL",
+        default=os.environ.get("OFFICESUD_API_URL"),
+        help="Брать дела через worker API Django по этому адресу вместо общей SQLite",
+    )
+    parser.add_argument("--token", default=os.environ.get("OFFICESUD_WORKER_TOKEN", ""), help="Токен worker API")
+    parser.add_argument("--processes", type=int, default=1, help="Число локальных воркеров (только --remote)")
+    parser.add_argument("--shards", type=int, default=1, help="Число параллельных воркеров на один пакет")
+    parser.add_argument(
+        "--engine",
+        choices=("sync", "async"),
+        default="sync",
+        help="async — один процесс и браузер на --concurrency дел (только локальный режим)",
+    )
+    parser.add_argument("--concurrency", type=int, default=None, help="Дел одновременно для --engine async")
+    parser.add_argument(
+        "--preprocess",
+        action="store_true",
+        help="Перед подачей сжать PDF и изображения пакета в пуле процессов (нужны pikepdf/Pillow)",
+    )
+    parser.add_argument(
+        "--poll",
+        type=float,
+        default=None,
+        help="Не выходить, когда дел нет, а опрашивать сервер с этим интервалом (секунды)",
+    )
     args = parser.parse_args()
 
-    logger.info("Starting batch: %s", args.batch_id)
-    run_batch(args.batch_id)
-    logger.info("Finished batch: %s", args.batch_id)
+    if args.remote:
+        logger.info("Starting remote worker(s) against %s, batch=%s", args.remote, args.batch_id or "any")
+        run_remote(args.remote, args.token, args.batch_id, args.processes, args.poll)
+    else:
+        if not args.batch_id:
+            parser.error("batch_id обязателен без --remote")
+        logger.info("Starting batch: %s", args.batch_id)
+        run_batch(args.batch_id, args.shards, args.engine, args.concurrency, args.preprocess)
+        logger.info("Finished batch: %s", args.batch_id)
@@ -1,10 +1,247 @@
+import os
+
 from unfold.admin import ModelAdmin
 from django.contrib import admin
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
 
-from server.apps.applications.models import Application
+from application.officesud.System import sqlite as office_sqlite, tracing
+from server.apps.applications.docker_client import DockerError, get_docker_client
+from server.apps.applications.models import Application, OfficeSudTask, RateLimit, WorkerHeartbeat
+from server.apps.applications.workers import get_container_status
 
 
 @admin.register(Application)
 class ApplicationAdmin(ModelAdmin):
     list_display = ('name', 'url')
     #TODO: При сохранении URL добавляется схема http:// (проверить что не критично)
+
+
+@admin.register(OfficeSudTask)
+class OfficeSudTaskAdmin(ModelAdmin):
+    list_display = ('__str__', 'user', 'batch_id', 'status', 'short_container_id', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('batch_id', 'batch_name', 'container_id', 'user__username')
+    readonly_fields = (
+        'container_state', 'container_resources', 'container_logs', 'order_savings', 'document_savings', 'case_errors',
+        'failure_traces',
+    )
+
+    @admin.display(description='Контейнер')
+    def short_container_id(self, obj):
+        return obj.container_id[:12]
+
+    def _container_status(self, obj):
+        # Один запрос к Docker на карточку задачи, а не на каждое поле. Кэш — на объекте
+        # текущего запроса: ModelAdmin один на все потоки, его атрибуты общие.
+        if not hasattr(obj, '_container_status'):
+            try:
+                obj._container_status = get_container_status(obj)
+            except (DockerError, OSError) as e:
+                obj._container_status = {'state': f'Docker API недоступен: {e}', 'running': False, 'exit_code': None}
+        return obj._container_status
+
+    @admin.display(description='Состояние контейнера')
+    def container_state(self, obj):
+        status = self._container_status(obj)
+        return format_html(
+            '{} (exit code: {}{})',
+            status.get('state') or '—',
+            status.get('exit_code') if status.get('exit_code') is not None else '—',
+            ', OOM' if status.get('oom_killed') else '',
+        )
+
+    @admin.display(description='Ресурсы')
+    def container_resources(self, obj):
+        stats = self._container_status(obj).get('stats')
+        if not stats:
+            return '—'
+        return format_html(
+            'CPU {}%, RAM {} / {} MiB, PIDs {}',
+            stats['cpu_percent'],
+            stats['memory_usage'] // (1024 * 1024),
+            stats['memory_limit'] // (1024 * 1024),
+            stats['pids'] if stats['pids'] is not None else '—',
+        )
+
+    @admin.display(description='Логи контейнера')
+    def container_logs(self, obj):
+        if not obj.container_id:
+            return '—'
+        try:
+            logs = get_docker_client().container_logs(obj.container_id, tail=100)
+        except (DockerError, OSError):
+            return '—'
+        return format_html('<pre style="max-height:400px;overflow:auto">{}</pre>', logs)
+
+    @admin.display(description='Группировка дел по суду')
+    def order_savings(self, obj):
+        if not obj.batch_id:
+            return '—'
+        savings = office_sqlite.get_batch_order_savings(obj.batch_id)
+        if not savings:
+            return '—'
+        if 'predicted_saved_seconds' not in savings:
+            return format_html(
+                'без перестановки; повторно использовано выборов: {}, сэкономлено {} с',
+                savings['measured_reused_selects'],
+                savings['measured_saved_seconds'],
+            )
+        return format_html(
+            'групп судов: {} на {} дел; прогноз: +{} с от перестановки ({} с всего); '
+            'факт: повторно использовано выборов {}, сэкономлено {} с',
+            savings['court_groups'],
+            savings['cases'],
+            savings['predicted_saved_seconds'],
+            savings['predicted_reuse_seconds'],
+            savings['measured_reused_selects'],
+            savings['measured_saved_seconds'],
+        )
+
+    @admin.display(description='Предобработка документов')
+    def document_savings(self, obj):
+        if not obj.batch_id:
+            return '—'
+        stats = office_sqlite.get_batch_document_savings(obj.batch_id)
+        if not stats:
+            return '—'
+        text = format_html(
+            'документов: {} (сжато {}, из кэша {}, ошибок {}); {} → {} МБ, '
+            'сэкономлено {} МБ, ~{} с загрузки; заняло {} с',
+            stats['documents'],
+            stats['optimized'],
+            stats['cached'],
+            stats['failed'],
+            round(stats['bytes_before'] / 2 ** 20, 1),
+            round(stats['bytes_after'] / 2 ** 20, 1),
+            round(stats['bytes_saved'] / 2 ** 20, 1),
+            stats['predicted_upload_seconds_saved'],
+            stats['seconds'],
+        )
+        if not stats.get('violations'):
+            return text
+        return format_html(
+            '{}<br>Сверх лимитов сайта (дела на разборе):<ul>{}</ul>',
+            text,
+            format_html_join('', '<li>{}</li>', ((violation,) for violation in stats['violations'])),
+        )
+
+    @admin.display(description='Сбои дел')
+    def case_errors(self, obj):
+        if not obj.batch_id:
+            return '—'
+        summary = office_sqlite.get_batch_errors(obj.batch_id)
+        if not summary['classes']:
+            return '—'
+        classes = ', '.join(f'{kind}: {count}' for kind, count in summary['classes'].items())
+        if not summary['needs_review']:
+            return classes
+        return format_html(
+            '{}<br>Ждут разбора (повторно не подаются):<ul>{}</ul>',
+            classes,
+            format_html_join(
+                '',
+                '<li>дело {} — {} после {} попыт.: {}</li>',
+                (
+                    (case['InternalID'], case['ErrorClass'], case['AttemptCount'], case['LastError'])
+                    for case in summary['needs_review']
+                ),
+            ),
+        )
+
+    @admin.display(description='Трассы сбоев')
+    def failure_traces(self, obj):
+        if not obj.batch_id:
+            return '—'
+        traces = office_sqlite.get_batch_traces(obj.batch_id)
+        if not traces:
+            return '—'
+        rows = []
+        for trace in traces:
+            path = tracing.trace_path(trace.get('file') or '')
+            if path and os.path.isfile(path):
+                link = format_html(
+                    '<a href="{}">{}</a>',
+                    reverse('applications:office_sud_trace', args=[obj.pk, trace['file']]),
+                    os.path.basename(path),
+                )
+            else:
+                link = 'удалена по сроку хранения'
+            rows.append((
+                trace['CreatedAt'], trace['InternalID'], trace['Status'],
+                (trace.get('bytes') or 0) // 1024, link,
+            ))
+        return format_html(
+            '<ul>{}</ul>',
+            format_html_join('', '<li>{} — дело {} ({}, {} KiB): {}</li>', rows),
+        )
+
+
+@admin.register(WorkerHeartbeat)
+class WorkerHeartbeatAdmin(ModelAdmin):
+    list_display = (
+        'worker_id', 'batch_id', 'internal_id', 'step', 'cases_done',
+        'process_rss_mb', 'browser_rss_mb', 'updated_at', 'progress_at', 'liveness',
+    )
+    search_fields = ('worker_id', 'batch_id', 'internal_id')
+    list_filter = ('step',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        # Таблицу создаёт воркер; на свежей БД создадим её сами.
+        office_sqlite.check_and_initialize_db()
+        return super().changelist_view(request, extra_context)
+
+    @admin.display(description='RSS Python, MiB')
+    def process_rss_mb(self, obj):
+        return obj.process_rss // (1024 * 1024) if obj.process_rss is not None else '—'
+
+    @admin.display(description='RSS Chromium, MiB')
+    def browser_rss_mb(self, obj):
+        return obj.browser_rss // (1024 * 1024) if obj.browser_rss is not None else '—'
+
+    @admin.display(description='Состояние')
+    def liveness(self, obj):
+        if obj.is_finished:
+            return obj.step
+        if not obj.is_alive:
+            return format_html('<span style="color:#dc2626">нет heartbeat</span>')
+        if obj.is_stalled:
+            return format_html('<span style="color:#d97706">завис</span>')
+        return format_html('<span style="color:#16a34a">работает</span>')
+
+
+@admin.register(RateLimit)
+class RateLimitAdmin(ModelAdmin):
+    list_display = ('key', 'rate_per_minute', 'burst', 'available_tokens', 'updated_at')
+    list_editable = ('rate_per_minute', 'burst')
+    search_fields = ('key',)
+    fields = ('key', 'rate_per_minute', 'burst', 'available_tokens', 'updated_at')
+    readonly_fields = ('available_tokens', 'updated_at')
+
+    def get_readonly_fields(self, request, obj=None):
+        # ключ — первичный ключ корзины, переименование создало бы новую строку
+        return self.readonly_fields + (('key',) if obj else ())
+
+    def changelist_view(self, request, extra_context=None):
+        office_sqlite.check_and_initialize_db()
+        return super().changelist_view(request, extra_context)
+
+    def save_model(self, request, obj, form, change):
+        # новые лимиты действуют сразу: корзина начинается заново с полного всплеска
+        obj.tokens = None
+        obj.refilled_at = None
+        super().save_model(request, obj, form, change)
+
+    @admin.display(description='Доступно сейчас')
+    def available_tokens(self, obj):
+        if not obj.rate_per_minute:
+            return 'без ограничения'
+        if obj.tokens is None:
+            return obj.burst
+        return round(obj.tokens, 2)
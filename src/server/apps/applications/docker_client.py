@@ -0,0 +1,265 @@
+import http.client
+import json
+import socket
+import struct
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+
+DOCKER_SOCKET_PATH = getattr(settings, "DOCKER_SOCKET_PATH", "/var/run/docker.sock")
+DOCKER_API_VERSION = getattr(settings, "DOCKER_API_VERSION", "v1.41")
+DOCKER_TIMEOUT = getattr(settings, "DOCKER_API_TIMEOUT", 30)
+
+
+class DockerError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"Docker API error {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class ContainerNotFound(DockerError):
+    pass
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP-соединение поверх unix-сокета Docker Engine."""
+
+    def __init__(self, socket_path: str, timeout: float = DOCKER_TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class DockerClient:
+    """
+    Минимальный клиент Docker Engine API.
+    Держит одно keep-alive соединение на процесс, запросы сериализуются блокировкой.
+    """
+
+    def __init__(self, socket_path: str = DOCKER_SOCKET_PATH, api_version: str = DOCKER_API_VERSION):
+        self.socket_path = socket_path
+        self.api_version = api_version
+        self._conn: Optional[UnixHTTPConnection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> UnixHTTPConnection:
+        if self._conn is None:
+            self._conn = UnixHTTPConnection(self.socket_path)
+        return self._conn
+
+    def _reset(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = None
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        body: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ):
+        url = f"/{self.api_version}{path}"
+        if params:
+            url = f"{url}?{urlencode(params)}"
+        payload = json.dumps(body).encode() if body is not None else None
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+
+        with self._lock:
+            # Docker закрывает простаивающие соединения — одна повторная попытка на свежем сокете.
+            for attempt in range(2):
+                conn = self._connection()
+                conn.timeout = timeout or DOCKER_TIMEOUT
+                if conn.sock is not None:
+                    conn.sock.settimeout(conn.timeout)
+                try:
+                    conn.request(method, url, body=payload, headers=headers)
+                    response = conn.getresponse()
+                    data = response.read()
+                except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                    self._reset()
+                    if attempt:
+                        raise
+                    continue
+                except Exception:
+                    self._reset()
+                    raise
+                if response.will_close:
+                    self._reset()
+                break
+
+        if response.status == 404:
+            raise ContainerNotFound(response.status, _error_message(data))
+        if response.status >= 400:
+            raise DockerError(response.status, _error_message(data))
+        return response.status, response.getheader("Content-Type", ""), data
+
+    def _json(self, *args, **kwargs) -> Any:
+        _, _, data = self._request(*args, **kwargs)
+        return json.loads(data) if data else None
+
+    def create_container(
+        self,
+        image: str,
+        cmd: Optional[List[str]] = None,
+        env: Optional[Dict[str, str]] = None,
+        volumes_from: Iterable[str] = (),
+        auto_remove: bool = False,
+        name: Optional[str] = None,
+        labels: Optional[Dict[str, str]] = None,
+    ) -> str:
+        body = {
+            "Image": image,
+            "Cmd": cmd or [],
+            "Env": [f"{key}={value}" for key, value in (env or {}).items()],
+            "Labels": labels or {},
+            "HostConfig": {
+                "AutoRemove": auto_remove,
+                "VolumesFrom": list(volumes_from),
+            },
+        }
+        params = {"name": name} if name else None
+        return self._json("POST", "/containers/create", params=params, body=body)["Id"]
+
+    def start_container(self, container_id: str) -> None:
+        self._request("POST", f"/containers/{quote(container_id)}/start")
+
+    def run_container(self, image: str, **kwargs) -> str:
+        """
+        Аналог `docker run -d`: create + start, возвращает полный ID контейнера.
+        Если start не прошёл, созданный контейнер удаляется, чтобы не копились мёртвые.
+        """
+        container_id = self.create_container(image, **kwargs)
+        try:
+            self.start_container(container_id)
+        except BaseException:
+            try:
+                self.remove_container(container_id, force=True)
+            except (DockerError, OSError):
+                pass
+            raise
+        return container_id
+
+    def remove_container(self, container_id: str, force: bool = False) -> None:
+        self._request("DELETE", f"/containers/{quote(container_id)}", params={"force": int(force)})
+
+    def inspect_container(self, container_id: str) -> Dict[str, Any]:
+        return self._json("GET", f"/containers/{quote(container_id)}/json")
+
+    def stop_container(self, container_id: str, timeout: int = 10) -> None:
+        self._request(
+            "POST",
+            f"/containers/{quote(container_id)}/stop",
+            params={"t": timeout},
+            timeout=DOCKER_TIMEOUT + timeout,
+        )
+
+    def wait_container(self, container_id: str, timeout: Optional[float] = None) -> int:
+        data = self._json("POST", f"/containers/{quote(container_id)}/wait", timeout=timeout)
+        return data.get("StatusCode")
+
+    def container_logs(self, container_id: str, tail: int = 200, timestamps: bool = False) -> str:
+        _, content_type, data = self._request(
+            "GET",
+            f"/containers/{quote(container_id)}/logs",
+            params={
+                "stdout": 1,
+                "stderr": 1,
+                "tail": tail,
+                "timestamps": int(timestamps),
+            },
+        )
+        if "multiplexed" in content_type or _looks_multiplexed(data):
+            data = _demultiplex(data)
+        return data.decode("utf-8", errors="replace")
+
+    def container_stats(self, container_id: str) -> Dict[str, Any]:
+        return self._json(
+            "GET",
+            f"/containers/{quote(container_id)}/stats",
+            params={"stream": "false"},
+        )
+
+    def container_status(self, container_id: str) -> Dict[str, Any]:
+        """
+        Сводка по контейнеру задачи: состояние, код выхода и потребление ресурсов.
+        Для уже удалённого контейнера возвращает state="removed".
+        """
+        try:
+            info = self.inspect_container(container_id)
+        except ContainerNotFound:
+            return {"state": "removed", "running": False, "exit_code": None}
+
+        state = info.get("State", {})
+        status = {
+            "state": state.get("Status"),
+            "running": bool(state.get("Running")),
+            "exit_code": state.get("ExitCode"),
+            "oom_killed": bool(state.get("OOMKilled")),
+            "error": state.get("Error") or "",
+            "started_at": state.get("StartedAt"),
+            "finished_at": state.get("FinishedAt"),
+        }
+        if status["running"]:
+            status["stats"] = summarize_stats(self.container_stats(container_id))
+        return status
+
+
+def summarize_stats(stats: Dict[str, Any]) -> Dict[str, Any]:
+    cpu = stats.get("cpu_stats", {})
+    precpu = stats.get("precpu_stats", {})
+    cpu_delta = cpu.get("cpu_usage", {}).get("total_usage", 0) - precpu.get("cpu_usage", {}).get("total_usage", 0)
+    system_delta = cpu.get("system_cpu_usage", 0) - precpu.get("system_cpu_usage", 0)
+    online_cpus = cpu.get("online_cpus") or len(cpu.get("cpu_usage", {}).get("percpu_usage") or []) or 1
+    cpu_percent = (cpu_delta / system_delta) * online_cpus * 100 if system_delta > 0 else 0.0
+
+    memory = stats.get("memory_stats", {})
+    cache = memory.get("stats", {}).get("inactive_file", 0)
+    return {
+        "cpu_percent": round(cpu_percent, 2),
+        "memory_usage": max(memory.get("usage", 0) - cache, 0),
+        "memory_limit": memory.get("limit", 0),
+        "pids": stats.get("pids_stats", {}).get("current"),
+    }
+
+
+def _error_message(data: bytes) -> str:
+    try:
+        return json.loads(data).get("message", "")
+    except (ValueError, AttributeError):
+        return data.decode("utf-8", errors="replace")
+
+
+def _looks_multiplexed(data: bytes) -> bool:
+    return len(data) >= 8 and data[0] in (0, 1, 2) and data[1:4] == b"\x00\x00\x00"
+
+
+def _demultiplex(data: bytes) -> bytes:
+    """Снимает 8-байтовые заголовки потоков stdout/stderr из ответа /logs."""
+    chunks = []
+    offset = 0
+    while offset + 8 <= len(data):
+        _, size = struct.unpack(">BxxxL", data[offset:offset + 8])
+        offset += 8
+        chunks.append(data[offset:offset + size])
+        offset += size
+    return b"".join(chunks)
+
+
+_client: Optional[DockerClient] = None
+
+
+def get_docker_client() -> DockerClient:
+    global _client
+    if _client is None:
+        _client = DockerClient()
+    return _client
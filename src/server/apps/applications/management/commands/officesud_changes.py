@@ -0,0 +1,45 @@
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from application.officesud.System import export, sqlite as office_sqlite
+
+
+class Command(BaseCommand):
+    help = "Выгружает дела Office.sud, изменённые после курсора (лента изменений), в JSONL или CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", type=int, default=None, help="Курсор: ChangeSeq последнего полученного изменения")
+        parser.add_argument(
+            "--cursor-file",
+            help="Файл с курсором: читается вместо --since и обновляется после успешной выгрузки",
+        )
+        parser.add_argument("--limit", type=int, default=export.CHANGES_LIMIT, help="Не больше стольких дел за запуск")
+        parser.add_argument("--batch", dest="batch_id", default=None, help="Только дела этого пакета")
+        parser.add_argument("--format", choices=sorted(export.CHANGE_FORMATS), default="jsonl")
+        parser.add_argument("--output", "-o", help="Файл для выгрузки; по умолчанию stdout")
+
+    def handle(self, *args, **options):
+        cursor_file = Path(options["cursor_file"]) if options["cursor_file"] else None
+        since = options["since"]
+        if since is None:
+            since = int(cursor_file.read_text().strip() or 0) if cursor_file and cursor_file.exists() else 0
+        if options["limit"] < 1:
+            raise CommandError("--limit должен быть положительным")
+
+        office_sqlite.check_and_initialize_db()
+        until, has_more = office_sqlite.get_change_window(since, options["limit"], options["batch_id"])
+        chunks = export.iter_changes(since, until, options["format"], options["batch_id"])
+        if options["output"]:
+            with open(options["output"], "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+
+        if cursor_file:
+            cursor_file.write_text(f"{until}\n")
+        self.stderr.write(f"next_cursor={until} has_more={int(has_more)}")
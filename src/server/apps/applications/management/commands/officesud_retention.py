@@ -0,0 +1,44 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from application.officesud.System import archive
+from server.apps.applications.retention import run_retention
+
+
+class Command(BaseCommand):
+    help = (
+        "Архивирует завершённые пакеты Office.sud, удаляет брошенные загрузки и документы, "
+        "сжимает БД. С --restore возвращает пакет из архива."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Работать постоянно, с паузой --interval")
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=getattr(settings, "OFFICESUD_RETENTION_INTERVAL", 86400),
+            help="Пауза между проходами в секундах",
+        )
+        parser.add_argument("--restore", metavar="BATCH_ID", help="Вернуть пакет из архива в БД")
+        parser.add_argument("--keep-archive", action="store_true", help="С --restore: не удалять файл архива")
+
+    def handle(self, *args, **options):
+        if options["restore"]:
+            try:
+                stats = archive.restore_batch(options["restore"], keep_archive=options["keep_archive"])
+            except archive.ArchiveError as e:
+                raise CommandError(str(e))
+            self.stdout.write("restored={batch_id} cases={cases} events={events}".format(**stats))
+            return
+
+        while True:
+            summary = run_retention()
+            self.stdout.write(
+                "archived={archived} cases={cases} failed={failed} uploads_removed={uploads_removed} "
+                "documents_removed={documents_removed} vacuum={vacuum} bytes_freed={bytes_freed}".format(**summary)
+            )
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from server.apps.applications.reconciler import AUTO_REQUEUE, reconcile_tasks
+
+
+class Command(BaseCommand):
+    help = "Закрывает зависшие задачи Office.sud, чьи контейнеры воркеров уже не работают."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Работать постоянно, с паузой --interval")
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=getattr(settings, "OFFICESUD_RECONCILE_INTERVAL", 30),
+            help="Пауза между проходами в секундах",
+        )
+        parser.add_argument(
+            "--requeue",
+            action="store_true",
+            default=AUTO_REQUEUE,
+            help="Перезапускать пакеты с необработанными делами",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            summary = reconcile_tasks(requeue=options["requeue"])
+            self.stdout.write(
+                "checked={checked} success={success} error={error} requeued={requeued}".format(**summary)
+            )
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
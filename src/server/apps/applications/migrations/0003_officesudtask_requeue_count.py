@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-19 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("applications", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="officesudtask",
+            name="requeue_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="Перезапусков"),
+        ),
+    ]
@@ -0,0 +1,125 @@
+# Generated by Django 4.2.20 on 2026-10-19 15:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("applications", "0003_officesudtask_requeue_count"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WorkerHeartbeat",
+            fields=[
+                (
+                    "worker_id",
+                    models.CharField(
+                        db_column="WorkerID",
+                        max_length=128,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Воркер",
+                    ),
+                ),
+                (
+                    "batch_id",
+                    models.CharField(
+                        blank=True,
+                        db_column="BatchID",
+                        max_length=64,
+                        null=True,
+                        verbose_name="Batch ID",
+                    ),
+                ),
+                (
+                    "internal_id",
+                    models.CharField(
+                        blank=True,
+                        db_column="InternalID",
+                        max_length=255,
+                        null=True,
+                        verbose_name="Текущее дело",
+                    ),
+                ),
+                (
+                    "step",
+                    models.CharField(
+                        blank=True,
+                        db_column="Step",
+                        max_length=64,
+                        null=True,
+                        verbose_name="Шаг",
+                    ),
+                ),
+                (
+                    "cases_done",
+                    models.IntegerField(
+                        db_column="CasesDone", default=0, verbose_name="Готово дел"
+                    ),
+                ),
+                (
+                    "process_rss",
+                    models.BigIntegerField(
+                        blank=True,
+                        db_column="ProcessRSS",
+                        null=True,
+                        verbose_name="RSS Python",
+                    ),
+                ),
+                (
+                    "browser_rss",
+                    models.BigIntegerField(
+                        blank=True,
+                        db_column="BrowserRSS",
+                        null=True,
+                        verbose_name="RSS Chromium",
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(
+                        blank=True,
+                        db_column="LastError",
+                        null=True,
+                        verbose_name="Последняя ошибка",
+                    ),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(
+                        blank=True,
+                        db_column="StartedAt",
+                        null=True,
+                        verbose_name="Запущен",
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        blank=True,
+                        db_column="UpdatedAt",
+                        null=True,
+                        verbose_name="Последний heartbeat",
+                    ),
+                ),
+                (
+                    "progress_at",
+                    models.DateTimeField(
+                        blank=True,
+                        db_column="ProgressAt",
+                        null=True,
+                        verbose_name="Последний прогресс",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Воркер Office.sud",
+                "verbose_name_plural": "Воркеры Office.sud",
+                "db_table": "WorkerHeartbeats",
+                "ordering": ["-updated_at"],
+                "managed": False,
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.20 on 2026-10-19 15:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("applications", "0004_workerheartbeat"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="officesudtask",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Ожидает запуска"),
+                    ("running", "В процессе"),
+                    ("paused", "На паузе"),
+                    ("success", "Завершено"),
+                    ("error", "Ошибка"),
+                    ("cancelled", "Отменено"),
+                ],
+                default="pending",
+                max_length=16,
+                verbose_name="Статус",
+            ),
+        ),
+    ]
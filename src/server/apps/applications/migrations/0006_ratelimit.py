@@ -0,0 +1,81 @@
+# Generated by Django 4.2.20 on 2026-10-19 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("applications", "0005_officesudtask_paused_cancelled"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RateLimit",
+            fields=[
+                (
+                    "key",
+                    models.CharField(
+                        db_column="LimitKey",
+                        max_length=128,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Ключ",
+                    ),
+                ),
+                (
+                    "rate_per_minute",
+                    models.FloatField(
+                        blank=True,
+                        db_column="RatePerMinute",
+                        help_text="Пусто или 0 — без ограничения.",
+                        null=True,
+                        verbose_name="Запросов в минуту",
+                    ),
+                ),
+                (
+                    "burst",
+                    models.FloatField(
+                        blank=True,
+                        db_column="Burst",
+                        help_text="Сколько запросов подряд можно сделать без ожидания.",
+                        null=True,
+                        verbose_name="Всплеск",
+                    ),
+                ),
+                (
+                    "tokens",
+                    models.FloatField(
+                        blank=True,
+                        db_column="Tokens",
+                        editable=False,
+                        null=True,
+                        verbose_name="Токенов",
+                    ),
+                ),
+                (
+                    "refilled_at",
+                    models.FloatField(
+                        blank=True, db_column="RefilledAt", editable=False, null=True
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        blank=True,
+                        db_column="UpdatedAt",
+                        editable=False,
+                        null=True,
+                        verbose_name="Последний запрос",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Лимит запросов Office.sud",
+                "verbose_name_plural": "Лимиты запросов Office.sud",
+                "db_table": "RateLimits",
+                "ordering": ["key"],
+                "managed": False,
+            },
+        ),
+    ]
@@ -1,4 +1,7 @@
+from datetime import timedelta
+
 from django.apps import apps
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models, transaction
 from django.utils import timezone
@@ -52,14 +55,23 @@ class OfficeSudTask(models.Model):
     STATUS_RUNNING = "running"
     STATUS_SUCCESS = "success"
     STATUS_ERROR = "error"
+    STATUS_PAUSED = "paused"
+    STATUS_CANCELLED = "cancelled"
 
     STATUS_CHOICES = [
         (STATUS_PENDING, "Ожидает запуска"),
         (STATUS_RUNNING, "В процессе"),
+        (STATUS_PAUSED, "На паузе"),
         (STATUS_SUCCESS, "Завершено"),
         (STATUS_ERROR, "Ошибка"),
+        (STATUS_CANCELLED, "Отменено"),
     ]
 
+    # Задачи, которые держат контейнер воркера и занимают слот MAX_WORKERS.
+    # Пауза слот не освобождает намеренно: контейнер живёт и ждёт resume с открытым
+    # браузером и сессией кабинета, а дел в аренде на паузе не держит.
+    ACTIVE_STATUSES = [STATUS_PENDING, STATUS_RUNNING, STATUS_PAUSED]
+
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='offices_sud_tasks',
     )
@@ -91,6 +103,7 @@ class OfficeSudTask(models.Model):
     created_at = models.DateTimeField('Создано', default=timezone.now)
     updated_at = models.DateTimeField('Обновлено', auto_now=True)
     last_error = models.TextField('Последняя ошибка', blank=True, null=True)
+    requeue_count = models.PositiveIntegerField('Перезапусков', default=0)
 
     class Meta:
         verbose_name = 'Office.sud задача'
@@ -99,3 +112,93 @@ class OfficeSudTask(models.Model):
 
     def __str__(self):
         return f"{self.batch_name or self.batch_id or self.pk} ({self.get_status_display()})"
+
+
+class WorkerHeartbeat(models.Model):
+    """
+    Heartbeat воркера Playwright. Таблицу ведёт сам воркер
+    (application.officesud.System.sqlite), Django её только читает.
+    """
+
+    worker_id = models.CharField('Воркер', max_length=128, primary_key=True, db_column='WorkerID')
+    batch_id = models.CharField('Batch ID', max_length=64, blank=True, null=True, db_column='BatchID')
+    internal_id = models.CharField('Текущее дело', max_length=255, blank=True, null=True, db_column='InternalID')
+    step = models.CharField('Шаг', max_length=64, blank=True, null=True, db_column='Step')
+    cases_done = models.IntegerField('Готово дел', default=0, db_column='CasesDone')
+    process_rss = models.BigIntegerField('RSS Python', blank=True, null=True, db_column='ProcessRSS')
+    browser_rss = models.BigIntegerField('RSS Chromium', blank=True, null=True, db_column='BrowserRSS')
+    last_error = models.TextField('Последняя ошибка', blank=True, null=True, db_column='LastError')
+    started_at = models.DateTimeField('Запущен', blank=True, null=True, db_column='StartedAt')
+    updated_at = models.DateTimeField('Последний heartbeat', blank=True, null=True, db_column='UpdatedAt')
+    progress_at = models.DateTimeField('Последний прогресс', blank=True, null=True, db_column='ProgressAt')
+
+    FINAL_STEPS = ('finished', 'failed', 'cancelled')
+    # Воркер ждёт сам по себе (пауза, очередь повторов, пустой пул remote-воркера):
+    # шаг не меняется, но это не зависание
+    IDLE_STEPS = ('paused', 'retry_wait', 'idle')
+
+    class Meta:
+        managed = False
+        db_table = 'WorkerHeartbeats'
+        verbose_name = 'Воркер Office.sud'
+        verbose_name_plural = 'Воркеры Office.sud'
+        ordering = ['-updated_at']
+
+    def __str__(self):
+        return self.worker_id
+
+    @property
+    def is_finished(self) -> bool:
+        return self.step in self.FINAL_STEPS
+
+    @property
+    def is_alive(self) -> bool:
+        threshold = getattr(settings, 'OFFICESUD_HEARTBEAT_DEAD_SECONDS', 60)
+        return (
+            not self.is_finished
+            and self.updated_at is not None
+            and self.updated_at >= timezone.now() - timedelta(seconds=threshold)
+        )
+
+    @property
+    def is_stalled(self) -> bool:
+        """Heartbeat идёт, но ни дело, ни шаг не менялись дольше порога."""
+        threshold = getattr(settings, 'OFFICESUD_HEARTBEAT_STALL_SECONDS', 300)
+        return (
+            not self.is_finished
+            and self.step not in self.IDLE_STEPS
+            and self.progress_at is not None
+            and self.progress_at < timezone.now() - timedelta(seconds=threshold)
+        )
+
+
+class RateLimit(models.Model):
+    """
+    Корзина общего лимита запросов воркеров к office.sud.kz: "site" — на весь сайт,
+    "court:<CourtID>" — на один суд, "court:*" — шаблон для судов без своей строки.
+    Таблицу ведут воркеры (application.officesud.System.sqlite), в админке
+    правятся только лимиты.
+    """
+
+    key = models.CharField('Ключ', max_length=128, primary_key=True, db_column='LimitKey')
+    rate_per_minute = models.FloatField(
+        'Запросов в минуту', blank=True, null=True, db_column='RatePerMinute',
+        help_text='Пусто или 0 — без ограничения.',
+    )
+    burst = models.FloatField(
+        'Всплеск', blank=True, null=True, db_column='Burst',
+        help_text='Сколько запросов подряд можно сделать без ожидания.',
+    )
+    tokens = models.FloatField('Токенов', blank=True, null=True, editable=False, db_column='Tokens')
+    refilled_at = models.FloatField(blank=True, null=True, editable=False, db_column='RefilledAt')
+    updated_at = models.DateTimeField('Последний запрос', blank=True, null=True, editable=False, db_column='UpdatedAt')
+
+    class Meta:
+        managed = False
+        db_table = 'RateLimits'
+        verbose_name = 'Лимит запросов Office.sud'
+        verbose_name_plural = 'Лимиты запросов Office.sud'
+        ordering = ['key']
+
+    def __str__(self):
+        return self.key
@@ -0,0 +1,157 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from application.officesud.System import sqlite as office_sqlite
+from server.apps.applications.docker_client import DockerError, get_docker_client
+from server.apps.applications.models import OfficeSudTask, WorkerHeartbeat
+from server.apps.applications.workers import get_container_status, launch_worker, remove_container
+
+PENDING_TIMEOUT = getattr(settings, "OFFICESUD_PENDING_TIMEOUT", 300)
+AUTO_REQUEUE = getattr(settings, "OFFICESUD_AUTO_REQUEUE", False)
+MAX_REQUEUES = getattr(settings, "OFFICESUD_MAX_REQUEUES", 2)
+CANCEL_GRACE = getattr(settings, "OFFICESUD_CANCEL_GRACE", 60)
+MAX_CASE_ATTEMPTS = getattr(settings, "OFFICESUD_MAX_CASE_ATTEMPTS", 3)
+
+logger = logging.getLogger(__name__)
+
+
+def reconcile_tasks(requeue: bool = AUTO_REQUEUE) -> dict:
+    """
+    Сверяет активные задачи OfficeSudTask с реальным состоянием контейнеров
+    и heartbeat воркеров. Контейнеры зависших воркеров останавливаются.
+    Задачи, чей контейнер уже не работает, закрываются (SUCCESS/ERROR)
+    и освобождают слот MAX_WORKERS, а сам контейнер удаляется. При
+    requeue=True недоделанный пакет запускается заново — воркер сам
+    пропускает дела, у которых уже есть TalonID. Пакет закончен, когда
+    каждое дело подано или отложено на разбор. Контейнеры задач,
+    закрытых в другом месте, тоже удаляются.
+    """
+    summary = {"checked": 0, "success": 0, "error": 0, "requeued": 0}
+    office_sqlite.check_and_initialize_db()
+
+    active = OfficeSudTask.objects.filter(status__in=OfficeSudTask.ACTIVE_STATUSES)
+    for task in active:
+        summary["checked"] += 1
+        try:
+            outcome = _reconcile_task(task, requeue)
+        except (DockerError, OSError) as e:
+            logger.warning("Docker API unavailable, reconciliation of task_id=%s skipped: %s", task.pk, e)
+            continue
+        if outcome:
+            summary[outcome] += 1
+
+    _remove_finished_containers()
+    return summary
+
+
+def _remove_finished_containers() -> None:
+    """
+    Убирает контейнеры закрытых задач. Задачу закрывает не только reconciler:
+    опрос прогресса переводит её в SUCCESS, оператор — в CANCELLED, а такие
+    контейнеры reconciler выше уже не видит. Воркер закрытой задачи сам выходит
+    за секунды; если нет — контейнер останавливается. Удалённый контейнер
+    забывается, чтобы не проверять его снова.
+    """
+    deadline = timezone.now() - timedelta(seconds=CANCEL_GRACE)
+    finished = OfficeSudTask.objects.filter(
+        status__in=(OfficeSudTask.STATUS_SUCCESS, OfficeSudTask.STATUS_ERROR, OfficeSudTask.STATUS_CANCELLED),
+        updated_at__lt=deadline,
+    ).exclude(container_id="")
+    for task in finished:
+        try:
+            if get_container_status(task)["running"]:
+                logger.warning("Task %s is %s but its container still runs, stopping it", task.pk, task.status)
+                get_docker_client().stop_container(task.container_id)
+            remove_container(task.container_id)
+        except (DockerError, OSError) as e:
+            logger.warning("Failed to remove container of finished task_id=%s: %s", task.pk, e)
+            continue
+        # update(), а не save(): updated_at задачи остаётся временем её закрытия
+        OfficeSudTask.objects.filter(pk=task.pk).update(container_id="")
+
+
+def _reconcile_task(task: OfficeSudTask, requeue: bool):
+    if task.status == OfficeSudTask.STATUS_PENDING and not task.container_id:
+        if task.updated_at > timezone.now() - timedelta(seconds=PENDING_TIMEOUT):
+            return None
+        return _mark_error(task, "Воркер не был запущен")
+
+    if not task.container_id:
+        # remote-режим: за пакет отвечает пул воркеров, брошенные дела вернутся по истечении аренды
+        filed, parked, total = office_sqlite.get_batch_progress(task.batch_id, MAX_CASE_ATTEMPTS)
+        if total > 0 and filed + parked >= total and task.status == OfficeSudTask.STATUS_RUNNING:
+            return _mark_success(task, filed, parked, total)
+        return None
+
+    container = get_container_status(task)
+    stalled = ""
+    if container["running"]:
+        heartbeat = _stalled_heartbeat(task.batch_id)
+        if heartbeat is None:
+            return None
+        # Воркер жив, но не продвигается (например, завис в goto(timeout=0)) — останавливаем.
+        stalled = f"; воркер {heartbeat.worker_id} завис на шаге {heartbeat.step} ({heartbeat.internal_id})"
+        logger.warning("Task %s stalled%s, stopping container", task.pk, stalled)
+        get_docker_client().stop_container(task.container_id)
+        container = get_container_status(task)
+
+    # состояние и код выхода прочитаны — контейнер больше не нужен, в т.ч. при перезапуске пакета
+    try:
+        remove_container(task.container_id)
+    except (DockerError, OSError) as e:
+        logger.warning("Failed to remove container %s of task_id=%s: %s", task.container_id[:12], task.pk, e)
+
+    filed, parked, total = office_sqlite.get_batch_progress(task.batch_id, MAX_CASE_ATTEMPTS)
+    processed = filed + parked
+    if total > 0 and processed >= total:
+        return _mark_success(task, filed, parked, total)
+
+    reason = (
+        f"Контейнер {task.container_id[:12]} завершился "
+        f"(state={container['state']}, exit_code={container['exit_code']}), "
+        f"обработано {processed} из {total} дел{stalled}"
+    )
+    if requeue and task.requeue_count < MAX_REQUEUES:
+        logger.warning("Task %s: %s; requeueing", task.pk, reason)
+        task.requeue_count += 1
+        task.last_error = reason
+        task.save(update_fields=["requeue_count", "last_error", "updated_at"])
+        try:
+            launch_worker(task)
+        except (DockerError, OSError):
+            return "error"
+        return "requeued"
+
+    return _mark_error(task, reason)
+
+
+def _stalled_heartbeat(batch_id: str):
+    """Heartbeat зависшего воркера, если ни один воркер пакета не продвигается; иначе None."""
+    heartbeats = [
+        heartbeat
+        for heartbeat in WorkerHeartbeat.objects.filter(batch_id=batch_id)
+        if not heartbeat.is_finished
+    ]
+    if heartbeats and all(heartbeat.is_stalled for heartbeat in heartbeats):
+        return heartbeats[0]
+    return None
+
+
+def _mark_success(task: OfficeSudTask, filed: int, parked: int, total: int) -> str:
+    """Пакет закончен: каждое дело подано или отложено на разбор (воркер его больше не возьмёт)."""
+    logger.info("Task %s finished: %s of %s cases filed, %s need review", task.pk, filed, total, parked)
+    task.status = OfficeSudTask.STATUS_SUCCESS
+    task.last_error = f"Подано {filed} из {total}, ждут разбора: {parked}" if parked else task.last_error
+    task.save(update_fields=["status", "last_error", "updated_at"])
+    return "success"
+
+
+def _mark_error(task: OfficeSudTask, reason: str) -> str:
+    logger.warning("Task %s marked as failed: %s", task.pk, reason)
+    task.status = OfficeSudTask.STATUS_ERROR
+    task.last_error = reason
+    task.save(update_fields=["status", "last_error", "updated_at"])
+    return "error"
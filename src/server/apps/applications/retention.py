@@ -0,0 +1,95 @@
+import logging
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from application.officesud.System import archive, docstore, sqlite as office_sqlite
+from server.apps.applications.models import OfficeSudTask
+
+ARCHIVE_AFTER_DAYS = getattr(settings, "OFFICESUD_ARCHIVE_AFTER_DAYS", 30)
+UPLOAD_ORPHAN_HOURS = getattr(settings, "OFFICESUD_UPLOAD_ORPHAN_HOURS", 24)
+DOCUMENT_RETENTION_DAYS = getattr(settings, "OFFICESUD_DOCUMENT_RETENTION_DAYS", 30)
+VACUUM_FREE_RATIO = getattr(settings, "OFFICESUD_VACUUM_FREE_RATIO", 0.25)
+UPLOAD_DIR = Path(getattr(settings, "OFFICESUD_UPLOAD_DIR", Path(settings.BASE_DIR) / "officesud_uploads"))
+
+FINISHED_STATUSES = [
+    OfficeSudTask.STATUS_SUCCESS,
+    OfficeSudTask.STATUS_ERROR,
+    OfficeSudTask.STATUS_CANCELLED,
+]
+
+logger = logging.getLogger(__name__)
+
+
+def archive_finished_batches(days: int = ARCHIVE_AFTER_DAYS) -> dict:
+    """
+    Переносит в архив пакеты задач, завершённых больше days дней назад. Пакет,
+    который снова в работе у другой задачи (перезапуск), не трогается.
+    """
+    summary = {"archived": 0, "cases": 0, "failed": 0}
+    deadline = timezone.now() - timedelta(days=days)
+    active = set(
+        OfficeSudTask.objects.filter(status__in=OfficeSudTask.ACTIVE_STATUSES).values_list("batch_id", flat=True)
+    )
+    batch_ids = set(
+        OfficeSudTask.objects.filter(status__in=FINISHED_STATUSES, updated_at__lt=deadline)
+        .exclude(batch_id="")
+        .values_list("batch_id", flat=True)
+    )
+    for batch_id in sorted(batch_ids - active):
+        if archive.is_archived(batch_id) or not office_sqlite.count_batch_rows(batch_id)[0]:
+            continue
+        try:
+            stats = archive.archive_batch(batch_id)
+        except (archive.ArchiveError, OSError) as e:
+            logger.warning("Batch %s not archived: %s", batch_id, e)
+            summary["failed"] += 1
+            continue
+        summary["archived"] += 1
+        summary["cases"] += stats["cases"]
+    return summary
+
+
+def prune_orphaned_uploads(hours: int = UPLOAD_ORPHAN_HOURS, directory: Path = UPLOAD_DIR) -> int:
+    """
+    Удаляет загруженные Excel старше hours часов, кроме файлов активных задач:
+    пакет загружается в БД при старте, после этого файл не нужен, а загрузки,
+    не ставшие задачей (ошибка проверки), иначе копятся вечно.
+    """
+    directory = Path(directory)
+    if not directory.is_dir():
+        return 0
+    keep = {
+        name
+        for names in OfficeSudTask.objects.filter(status__in=OfficeSudTask.ACTIVE_STATUSES)
+        .values_list("excel_file", flat=True)
+        for name in names.split(", ")
+    }
+    cutoff = time.time() - hours * 3600
+    removed = 0
+    for path in directory.iterdir():
+        if not path.is_file() or path.name in keep:
+            continue
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                removed += 1
+        except OSError as e:
+            logger.warning("Failed to remove upload %s: %s", path, e)
+    return removed
+
+
+def run_retention() -> dict:
+    """Один проход обслуживания: архивация, чистка загрузок и документов, сжатие БД."""
+    office_sqlite.check_and_initialize_db()
+    summary = archive_finished_batches()
+    summary["uploads_removed"] = prune_orphaned_uploads()
+    summary["documents_removed"] = docstore.prune_unreferenced(max_age_days=DOCUMENT_RETENTION_DAYS)
+    compacted = office_sqlite.compact_db(full_vacuum_ratio=VACUUM_FREE_RATIO)
+    summary["vacuum"] = compacted["mode"]
+    summary["bytes_freed"] = compacted["bytes_before"] - compacted["bytes_after"]
+    logger.info("OfficeSud retention pass: %s", summary)
+    return summary
@@ -1,3 +1,2170 @@
-from django.test import TestCase
+import asyncio
+import http.server
+import io
+import json
+import os
+import socketserver
+import sqlite3
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import Counter
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from application.officesud.System import archive, dataloader, docstore, errors, export, ordering, pacing, preprocess, sqlite as office_sqlite, tracing, watchdog
+from application.officesud.System.talon import extract_talon
+from server.apps.applications import reconciler, worker_api, workers
+from server.apps.applications.admin import OfficeSudTaskAdmin
+from server.apps.applications.docker_client import DockerClient, DockerError
+from server.apps.applications.models import OfficeSudTask, WorkerHeartbeat
+
+
+class OfficeSudSQLiteMixin:
+    """Тесты на отдельной временной SQLite вместо общей БД пакетов."""
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.db_path = os.path.join(tmp.name, "officesud.sqlite3")
+        patcher = mock.patch.object(office_sqlite, "db_path", self.db_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        office_sqlite.check_and_initialize_db()
+
+    def insert_cases(self, batch_id, count):
+        conn = sqlite3.connect(self.db_path)
+        conn.executemany(
+            "INSERT INTO Cases (BatchID, InternalID) VALUES (?, ?)",
+            [(batch_id, f"{batch_id}-{i}") for i in range(count)],
+        )
+        conn.commit()
+        conn.close()
+
+
+class OfficeSudSQLiteTestCase(OfficeSudSQLiteMixin, SimpleTestCase):
+    pass
+
+
+class OfficeSudTaskTestCase(OfficeSudSQLiteMixin, TestCase):
+    """Временная SQLite пакетов плюс тестовая БД Django — для задач OfficeSudTask."""
+
+    def create_task(self, batch_id, status=OfficeSudTask.STATUS_RUNNING, container_id=""):
+        user, _ = get_user_model().objects.get_or_create(
+            username="officesud", defaults={"email": "officesud@example.com"},
+        )
+        return OfficeSudTask.objects.create(
+            user=user, excel_file="cases.xlsx", batch_id=batch_id, status=status, container_id=container_id,
+        )
+
+
+class ClaimCaseTests(OfficeSudSQLiteTestCase):
+    def test_every_case_is_claimed_exactly_once_by_concurrent_workers(self):
+        self.insert_cases("B1", 200)
+        claimed = []
+        claimed_lock = threading.Lock()
+        start = threading.Barrier(16)
+
+        def worker(index):
+            start.wait()
+            while True:
+                case = office_sqlite.claim_case(f"worker-{index}", lease_seconds=600, batch_id="B1")
+                if case is None:
+                    return
+                with claimed_lock:
+                    claimed.append(case["InternalID"])
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        counts = Counter(claimed)
+        self.assertEqual(len(counts), 200)
+        self.assertEqual(max(counts.values()), 1)
+
+    def test_claim_is_scoped_to_batch_and_skips_filed_cases(self):
+        self.insert_cases("B1", 2)
+        self.insert_cases("B2", 1)
+        first = office_sqlite.claim_case("w", lease_seconds=600, batch_id="B1")
+        office_sqlite.save_case_talon(first["DB_Case_ID"], "T-1")
+        second = office_sqlite.claim_case("w", lease_seconds=600, batch_id="B1")
+
+        self.assertEqual(second["InternalID"], "B1-1")
+        self.assertIsNone(office_sqlite.claim_case("w", lease_seconds=600, batch_id="B1"))
+
+    def test_expired_lease_returns_case_to_pool(self):
+        self.insert_cases("B1", 1)
+        crashed = office_sqlite.claim_case("crashed", lease_seconds=-1, batch_id="B1")
+        reclaimed = office_sqlite.claim_case("healthy", lease_seconds=600, batch_id="B1")
+
+        self.assertEqual(reclaimed["DB_Case_ID"], crashed["DB_Case_ID"])
+        self.assertEqual(reclaimed["ClaimedBy"], "healthy")
+        self.assertEqual(reclaimed["AttemptCount"], 2)
+        self.assertFalse(office_sqlite.renew_lease(crashed["DB_Case_ID"], "crashed", 600))
+
+    def test_case_is_not_claimed_after_max_attempts(self):
+        self.insert_cases("B1", 1)
+        for _ in range(3):
+            case = office_sqlite.claim_case("w", lease_seconds=600, batch_id="B1", max_attempts=3)
+            office_sqlite.release_case(case["DB_Case_ID"], "w")
+
+        self.assertIsNone(office_sqlite.claim_case("w", lease_seconds=600, batch_id="B1", max_attempts=3))
+
+    def test_cancel_release_does_not_count_as_attempt(self):
+        self.insert_cases("B1", 1)
+        case = office_sqlite.claim_case("w", lease_seconds=600, batch_id="B1")
+        office_sqlite.release_case(case["DB_Case_ID"], "w", failed=False)
+
+        again = office_sqlite.claim_case("w", lease_seconds=600, batch_id="B1")
+        self.assertEqual(again["AttemptCount"], 1)
+
+    def test_paused_batch_is_not_claimed(self):
+        self.insert_cases("B1", 1)
+        office_sqlite.set_batch_command("B1", "pause")
+
+        self.assertIsNone(office_sqlite.claim_case("w", lease_seconds=600))
+
+
+class RetryQueueTests(OfficeSudSQLiteTestCase):
+    def test_classify_errors(self):
+        from playwright.sync_api import Error, TimeoutError
+
+        self.assertEqual(errors.classify(TimeoutError("Timeout 30000ms exceeded")), errors.TIMEOUT)
+        self.assertEqual(errors.classify(Error("strict mode violation: resolved to 2 elements")), errors.SELECTOR_DRIFT)
+        self.assertEqual(errors.classify(TimeoutError("did not find some options")), errors.VALIDATION)
+        self.assertEqual(errors.classify(FileNotFoundError("a.pdf")), errors.MISSING_DOCUMENT)
+        self.assertEqual(errors.classify(RuntimeError("Modal window disappeared")), errors.TRANSIENT)
+        self.assertIsNone(errors.retry_delay(errors.SUBMITTED_NO_TALON, 1))
+        self.assertEqual(errors.retry_delay(errors.TRANSIENT, 3), errors.RETRY_BACKOFF[errors.TRANSIENT] * 4)
+
+    def test_failed_case_is_retried_after_backoff_and_after_fresh_cases(self):
+        self.insert_cases("B1", 2)
+        failed = office_sqlite.claim_case("w", lease_seconds=600, batch_id="B1")
+        office_sqlite.release_case(failed["DB_Case_ID"], "w", error_class=errors.TIMEOUT, error="slow", retry_in=60)
+
+        fresh = office_sqlite.claim_case("w", lease_seconds=600, batch_id="B1")
+        self.assertEqual(fresh["InternalID"], "B1-1")
+        self.assertIsNone(office_sqlite.claim_case("w", lease_seconds=600, batch_id="B1"))
+        self.assertAlmostEqual(office_sqlite.next_retry_in("B1"), 60, delta=5)
+
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE Cases SET RetryAfter = '2000-01-01 00:00:00.000000' WHERE DB_Case_ID = ?",
+                      (failed["DB_Case_ID"],))
+        conn.commit()
+        conn.close()
+        retried = office_sqlite.claim_case("w", lease_seconds=600, batch_id="B1")
+        self.assertEqual(retried["DB_Case_ID"], failed["DB_Case_ID"])
+        self.assertEqual(retried["ErrorClass"], errors.TIMEOUT)
+
+        office_sqlite.save_case_talon(retried["DB_Case_ID"], "T-1")
+        self.assertEqual(office_sqlite.get_batch_errors("B1")["classes"], {})
+
+    def test_submitted_case_without_talon_is_never_refiled(self):
+        from application.officesud.System.case_processor import CaseProcessor
+
+        self.insert_cases("B1", 1)
+        processor = CaseProcessor("B1", threading.Event())
+        case = office_sqlite.claim_case(processor.heartbeat.worker_id, lease_seconds=600, batch_id="B1")
+
+        kind = processor._fail_case(case, TimeoutError("load"), submitted=True)
+
+        self.assertEqual(kind, errors.SUBMITTED_NO_TALON)
+        self.assertIsNone(office_sqlite.claim_case("w", lease_seconds=-1, batch_id="B1"))
+        self.assertIsNone(office_sqlite.next_retry_in("B1"))
+        review = office_sqlite.get_batch_errors("B1")["needs_review"]
+        self.assertEqual([c["InternalID"] for c in review], ["B1-0"])
+
+
+class BatchCompletionTests(OfficeSudTaskTestCase):
+    def park_and_file(self, batch_id):
+        """Первое дело уходит на разбор, остальные подаются."""
+        parked = office_sqlite.claim_case("w", lease_seconds=600, batch_id=batch_id)
+        office_sqlite.release_case(
+            parked["DB_Case_ID"], "w", error_class=errors.VALIDATION, error="bad IIN", needs_review=True,
+        )
+        while True:
+            case = office_sqlite.claim_case("w", lease_seconds=600, batch_id=batch_id)
+            if case is None:
+                break
+            office_sqlite.save_case_talon(case["DB_Case_ID"], f"T-{case['DB_Case_ID']}")
+
+    def test_parked_case_counts_as_done(self):
+        self.insert_cases("B1", 3)
+        self.park_and_file("B1")
+
+        self.assertEqual(office_sqlite.get_batch_progress("B1"), (2, 1, 3))
+
+    def test_case_out_of_attempts_is_parked_once_its_lease_expires(self):
+        self.insert_cases("B1", 1)
+        case = office_sqlite.claim_case("w", lease_seconds=600, batch_id="B1")
+
+        self.assertEqual(office_sqlite.get_batch_progress("B1", max_attempts=1), (0, 0, 1))
+        office_sqlite.renew_lease(case["DB_Case_ID"], "w", -1)
+        self.assertEqual(office_sqlite.get_batch_progress("B1", max_attempts=1), (0, 1, 1))
+
+    def test_remote_task_with_parked_case_completes(self):
+        self.insert_cases("B1", 3)
+        task = self.create_task("B1")
+        self.park_and_file("B1")
+
+        summary = reconciler.reconcile_tasks()
+
+        task.refresh_from_db()
+        self.assertEqual(summary["success"], 1)
+        self.assertEqual(task.status, OfficeSudTask.STATUS_SUCCESS)
+        self.assertIn("ждут разбора: 1", task.last_error)
+
+    def test_docker_task_with_parked_case_is_not_requeued(self):
+        self.insert_cases("B1", 2)
+        task = self.create_task("B1", container_id="c0ffee")
+        self.park_and_file("B1")
+        exited = {"running": False, "state": "exited", "exit_code": 0}
+
+        with mock.patch.object(reconciler, "get_container_status", return_value=exited), \
+                mock.patch.object(reconciler, "remove_container") as remove, \
+                mock.patch.object(reconciler, "launch_worker") as launch:
+            reconciler.reconcile_tasks(requeue=True)
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, OfficeSudTask.STATUS_SUCCESS)
+        launch.assert_not_called()
+        remove.assert_called_once_with("c0ffee")
+
+    def test_progress_reports_review_count_and_completes_task(self):
+        self.insert_cases("B1", 2)
+        task = self.create_task("B1")
+        self.park_and_file("B1")
+        self.client.force_login(task.user)
+
+        response = self.client.get(reverse("applications:office_sud_progress", args=[task.pk]), HTTP_HOST="localhost")
+
+        self.assertEqual(
+            {key: response.json()[key] for key in ("progress", "processed", "needs_review", "total", "status")},
+            {"progress": 100, "processed": 1, "needs_review": 1, "total": 2, "status": OfficeSudTask.STATUS_SUCCESS},
+        )
+
+    def test_progress_does_not_reopen_cancelled_or_failed_task(self):
+        for batch_id, status in (("B1", OfficeSudTask.STATUS_CANCELLED), ("B2", OfficeSudTask.STATUS_ERROR)):
+            self.insert_cases(batch_id, 2)
+            task = self.create_task(batch_id, status=status)
+            self.park_and_file(batch_id)
+            self.client.force_login(task.user)
+
+            response = self.client.get(
+                reverse("applications:office_sud_progress", args=[task.pk]), HTTP_HOST="localhost",
+            )
+
+            task.refresh_from_db()
+            self.assertEqual((response.json()["progress"], response.json()["status"]), (100, status))
+            self.assertEqual(task.status, status)
+
+
+class BatchControlTests(OfficeSudTaskTestCase):
+    def control(self, task, action):
+        return self.client.post(
+            reverse("applications:office_sud_control", args=[task.pk, action]), HTTP_HOST="localhost",
+        )
+
+    def test_pause_resume_cancel_transitions(self):
+        task = self.create_task("B1")
+        self.client.force_login(task.user)
+
+        steps = [
+            ("pause", 200, OfficeSudTask.STATUS_PAUSED, "pause"),
+            ("pause", 409, OfficeSudTask.STATUS_PAUSED, "pause"),
+            ("resume", 200, OfficeSudTask.STATUS_RUNNING, "run"),
+            ("resume", 409, OfficeSudTask.STATUS_RUNNING, "run"),
+            ("cancel", 200, OfficeSudTask.STATUS_CANCELLED, "cancel"),
+            ("pause", 409, OfficeSudTask.STATUS_CANCELLED, "cancel"),
+        ]
+        for action, code, status, command in steps:
+            response = self.control(task, action)
+            task.refresh_from_db()
+            self.assertEqual(
+                (response.status_code, task.status, office_sqlite.get_batch_command("B1")),
+                (code, status, command),
+                action,
+            )
+
+    def test_paused_task_can_be_cancelled(self):
+        task = self.create_task("B1", status=OfficeSudTask.STATUS_PAUSED)
+        self.client.force_login(task.user)
+
+        self.assertEqual(self.control(task, "cancel").status_code, 200)
+        task.refresh_from_db()
+        self.assertEqual(task.status, OfficeSudTask.STATUS_CANCELLED)
+
+    def test_unknown_action_and_foreign_task_are_not_found(self):
+        task = self.create_task("B1")
+        other = get_user_model().objects.create(username="other", email="other@example.com")
+        self.client.force_login(other)
+
+        self.assertEqual(self.control(task, "pause").status_code, 404)
+        self.client.force_login(task.user)
+        self.assertEqual(self.control(task, "restart").status_code, 404)
+        self.assertIsNone(office_sqlite.get_batch_command("B1"))
+
+    def test_wait_while_paused_returns_on_resume_and_cancel(self):
+        from application.officesud.System import control
+
+        for command in ("run", "cancel"):
+            office_sqlite.set_batch_command("B1", "pause")
+            batch = control.BatchControl("B1", poll_interval=0)
+            on_pause = mock.Mock()
+            with mock.patch.object(control.time, "sleep", side_effect=lambda _: office_sqlite.set_batch_command("B1", command)):
+                batch.wait_while_paused(on_pause=on_pause)
+
+            on_pause.assert_called_once_with()
+            self.assertEqual(batch.is_set(), command == "cancel")
+
+
+class PausedWorkerLeaseTests(OfficeSudSQLiteTestCase):
+    def processor(self, batch_id):
+        from application.officesud.System.case_processor import CaseProcessor
+        from application.officesud.System.control import BatchControl
+
+        processor = CaseProcessor(batch_id, BatchControl(batch_id, poll_interval=0), heartbeat=mock.Mock(worker_id="w"))
+        processor.session = mock.Mock()
+        processor.profile = mock.Mock()
+        processor.watchdog = mock.Mock(**{"due.return_value": None})
+        processor._open_browser = mock.Mock(return_value=(mock.Mock(), mock.Mock()))
+        processor._open_pages = mock.Mock(return_value=mock.Mock())
+        return processor
+
+    def leased(self, batch_id):
+        conn = sqlite3.connect(self.db_path)
+        count = conn.execute(
+            "SELECT COUNT(*) FROM Cases WHERE BatchID = ? AND ClaimedBy IS NOT NULL AND TalonID IS NULL", (batch_id,),
+        ).fetchone()[0]
+        conn.close()
+        return count
+
+    def test_paused_worker_holds_no_lease(self):
+        from application.officesud.System import case_processor, control
+
+        self.insert_cases("B1", 2)
+        processor = self.processor("B1")
+        filed = []
+
+        def file_case(filler, case_data):
+            filed.append(case_data["InternalID"])
+            if len(filed) == 1:
+                # пауза приходит, пока подаётся первое дело
+                office_sqlite.set_batch_command("B1", "pause")
+            office_sqlite.save_case_talon(case_data["DB_Case_ID"], f"T-{case_data['DB_Case_ID']}")
+            case_data["TalonID"] = "T"
+
+        def while_paused(_):
+            self.assertEqual(self.leased("B1"), 0)
+            office_sqlite.set_batch_command("B1", "run")
+
+        processor._process_single_case = file_case
+        with mock.patch.object(case_processor, "sync_playwright"), \
+                mock.patch.object(control.time, "sleep", side_effect=while_paused) as sleep:
+            processor.run_process()
+
+        sleep.assert_called_once()
+        self.assertEqual(filed, ["B1-0", "B1-1"])
+        processor.heartbeat.update.assert_any_call(step="paused", internal_id=None)
+
+    def test_pause_returns_prefetched_case_to_pool(self):
+        self.insert_cases("B1", 1)
+        processor = self.processor("B1")
+        processor._spare_filler = mock.Mock(prepared_case_id=None)
+        processor._upcoming = office_sqlite.claim_case("w", lease_seconds=600, batch_id="B1")
+        processor._spare_filler.prepared_case_id = processor._upcoming["DB_Case_ID"]
+
+        processor._on_pause()
+
+        self.assertIsNone(processor._upcoming)
+        self.assertIsNone(processor._spare_filler.prepared_case_id)
+        self.assertEqual(self.leased("B1"), 0)
+        self.assertEqual(office_sqlite.claim_case("x", lease_seconds=600, batch_id="B1")["AttemptCount"], 1)
+
+
+class WorkerAPITests(OfficeSudTaskTestCase):
+    TOKEN = "worker-secret"
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(worker_api, "WORKER_TOKEN", self.TOKEN)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, name, payload, args=(), token=TOKEN):
+        return self.client.post(
+            reverse(f"applications:{name}", args=args),
+            json.dumps(payload),
+            content_type="application/json",
+            HTTP_HOST="localhost",
+            HTTP_AUTHORIZATION=f"Bearer {token}",
+        )
+
+    def claim(self, worker_id, batch_id=None):
+        return self.post("office_sud_worker_claim", {"worker_id": worker_id, "batch_id": batch_id})
+
+    def test_token_is_required(self):
+        self.insert_cases("B1", 1)
+
+        self.assertEqual(self.post("office_sud_worker_claim", {"worker_id": "w"}, token="wrong").status_code, 401)
+        response = self.client.post(
+            reverse("applications:office_sud_worker_claim"), "{}", content_type="application/json", HTTP_HOST="localhost",
+        )
+        self.assertEqual(response.status_code, 401)
+        with mock.patch.object(worker_api, "WORKER_TOKEN", ""):
+            self.assertEqual(self.claim("w", "B1").status_code, 503)
+        self.assertIsNone(office_sqlite.get_case_by_id(1)["ClaimedBy"])
+
+    def test_claim_returns_case_with_document_links(self):
+        self.insert_cases("B1", 1)
+
+        response = self.claim("w", "B1")
+
+        case = response.json()
+        self.assertEqual((case["InternalID"], case["ClaimedBy"]), ("B1-0", "w"))
+        self.assertEqual(set(case["Documents"]), set(office_sqlite.DOCUMENT_COLUMNS))
+        self.assertEqual(self.claim("w", "B1").status_code, 204)
+
+    def test_claim_without_batch_takes_only_active_tasks(self):
+        self.insert_cases("DONE", 1)
+        self.insert_cases("LIVE", 1)
+        self.create_task("DONE", status=OfficeSudTask.STATUS_SUCCESS)
+        self.create_task("LIVE")
+
+        self.assertEqual(self.claim("w").json()["BatchID"], "LIVE")
+        self.assertEqual(self.claim("w").status_code, 204)
+
+    def test_claim_without_batch_and_without_tasks_is_empty(self):
+        self.insert_cases("B1", 1)
+
+        self.assertEqual(self.claim("w").status_code, 204)
+
+    def test_talon_requires_lease(self):
+        self.insert_cases("B1", 1)
+        case_id = self.claim("owner", "B1").json()["DB_Case_ID"]
+
+        stranger = self.post("office_sud_worker_talon", {"worker_id": "stranger", "talon_id": "T-1"}, args=[case_id])
+        self.assertEqual((stranger.status_code, stranger.json()["code"]), (409, "lease_lost"))
+        self.assertIsNone(office_sqlite.get_case_by_id(case_id)["TalonID"])
+
+        owner = self.post("office_sud_worker_talon", {"worker_id": "owner", "talon_id": "T-1"}, args=[case_id])
+        self.assertEqual(owner.status_code, 200)
+        self.assertEqual(office_sqlite.get_case_by_id(case_id)["TalonID"], "T-1")
+
+    def test_talon_of_reclaimed_case_is_rejected(self):
+        self.insert_cases("B1", 1)
+        case_id = self.claim("slow", "B1").json()["DB_Case_ID"]
+        office_sqlite.renew_lease(case_id, "slow", -1)
+        self.claim("fast", "B1")
+
+        response = self.post("office_sud_worker_talon", {"worker_id": "slow", "talon_id": "T-1"}, args=[case_id])
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(office_sqlite.get_case_by_id(case_id)["ClaimedBy"], "fast")
+
+    def test_lease_renewal_and_release(self):
+        self.insert_cases("B1", 1)
+        case_id = self.claim("w", "B1").json()["DB_Case_ID"]
+
+        self.assertEqual(self.post("office_sud_worker_lease", {"worker_id": "x"}, args=[case_id]).status_code, 409)
+        self.assertEqual(self.post("office_sud_worker_lease", {"worker_id": "w"}, args=[case_id]).status_code, 200)
+        self.post("office_sud_worker_release", {"worker_id": "w", "failed": False}, args=[case_id])
+        self.assertEqual(self.claim("w2", "B1").json()["AttemptCount"], 1)
+
+    def test_bad_lease_and_retry_durations_are_rejected(self):
+        self.insert_cases("B1", 1)
+        for lease_seconds in ("soon", -5, 0, [900]):
+            response = self.post(
+                "office_sud_worker_claim", {"worker_id": "w", "batch_id": "B1", "lease_seconds": lease_seconds},
+            )
+            self.assertEqual(response.status_code, 400, lease_seconds)
+        self.assertIsNone(office_sqlite.get_case_by_id(1)["ClaimedBy"])
+
+        case_id = self.claim("w", "B1").json()["DB_Case_ID"]
+        for name, payload in (
+            ("office_sud_worker_lease", {"worker_id": "w", "lease_seconds": "NaN"}),
+            ("office_sud_worker_events", {"WorkerID": "w", "Step": "fill", "lease_seconds": -1}),
+            ("office_sud_worker_release", {"worker_id": "w", "retry_in": "later"}),
+            ("office_sud_worker_release", {"worker_id": "w", "retry_in": -30}),
+        ):
+            self.assertEqual(self.post(name, payload, args=[case_id]).status_code, 400, payload)
+        self.assertEqual(office_sqlite.get_case_by_id(case_id)["ClaimedBy"], "w")
+
+        response = self.post("office_sud_worker_release", {"worker_id": "w", "retry_in": 0}, args=[case_id])
+        self.assertEqual(response.status_code, 200)
+
+    def test_heartbeat_returns_batch_command(self):
+        office_sqlite.set_batch_command("B1", "pause")
+
+        response = self.post("office_sud_worker_heartbeat", {"WorkerID": "w", "BatchID": "B1", "Step": "paused"})
+
+        self.assertEqual(response.json(), {"batch_id": "B1", "command": "pause"})
+        self.assertEqual(self.post("office_sud_worker_heartbeat", {}).status_code, 400)
+
+
+class FakeDockerEngine(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Docker Engine API на unix-сокете: ответы по (метод, путь), запросы — в журнал."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, routes):
+        self.routes = routes
+        self.requests = []
+        super().__init__(socket_path, FakeDockerHandler)
+
+
+class FakeDockerHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self):
+        path, _, query = self.path.partition("?")
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        self.server.requests.append((self.command, path.split("/", 2)[2], query, body))
+        status, payload, content_type = self.server.routes.get(
+            (self.command, "/" + path.split("/", 2)[2]), (404, {"message": "no such container"}, None),
+        )
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type or "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+
+    do_GET = do_POST = do_DELETE = _handle
+
+    def address_string(self):
+        return "docker.sock"
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DockerClientTests(SimpleTestCase):
+    def engine(self, routes):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        engine = FakeDockerEngine(os.path.join(tmp.name, "docker.sock"), routes)
+        threading.Thread(target=engine.serve_forever, daemon=True).start()
+        self.addCleanup(engine.server_close)
+        self.addCleanup(engine.shutdown)
+        return engine, DockerClient(socket_path=engine.server_address)
+
+    def test_run_container_creates_and_starts_without_auto_remove(self):
+        engine, client = self.engine({
+            ("POST", "/containers/create"): (201, {"Id": "c0ffee"}, None),
+            ("POST", "/containers/c0ffee/start"): (204, b"", None),
+        })
+
+        self.assertEqual(client.run_container("worker:latest", cmd=["B1"], env={"A": "1"}), "c0ffee")
+
+        create = engine.requests[0]
+        self.assertEqual(create[3]["HostConfig"]["AutoRemove"], False)
+        self.assertEqual(create[3]["Env"], ["A=1"])
+        self.assertEqual([(method, path) for method, path, _, _ in engine.requests],
+                         [("POST", "containers/create"), ("POST", "containers/c0ffee/start")])
+
+    def test_failed_start_removes_created_container(self):
+        engine, client = self.engine({
+            ("POST", "/containers/create"): (201, {"Id": "c0ffee"}, None),
+            ("POST", "/containers/c0ffee/start"): (500, {"message": "no such image layer"}, None),
+            ("DELETE", "/containers/c0ffee"): (204, b"", None),
+        })
+
+        with self.assertRaisesMessage(DockerError, "no such image layer"):
+            client.run_container("worker:latest")
+
+        self.assertEqual(engine.requests[-1][:3], ("DELETE", "containers/c0ffee", "force=1"))
+
+    def test_status_of_exited_and_removed_container(self):
+        engine, client = self.engine({
+            ("GET", "/containers/c0ffee/json"): (200, {"State": {"Status": "exited", "ExitCode": 3}}, None),
+        })
+
+        exited = client.container_status("c0ffee")
+        removed = client.container_status("dead")
+
+        self.assertEqual((exited["state"], exited["running"], exited["exit_code"]), ("exited", False, 3))
+        self.assertEqual(removed, {"state": "removed", "running": False, "exit_code": None})
+
+    def test_logs_are_demultiplexed(self):
+        frames = b"".join(struct.pack(">BxxxL", stream, len(text)) + text for stream, text in ((1, b"out\n"), (2, b"err\n")))
+        engine, client = self.engine({
+            ("GET", "/containers/c0ffee/logs"): (200, frames, "application/vnd.docker.multiplexed-stream"),
+        })
+
+        self.assertEqual(client.container_logs("c0ffee"), "out\nerr\n")
+
+
+class ContainerCleanupTests(OfficeSudTaskTestCase):
+    def test_exited_container_is_removed_after_its_exit_code_is_read(self):
+        self.insert_cases("B1", 2)
+        task = self.create_task("B1", container_id="c0ffee")
+        client = mock.Mock(**{"container_status.return_value": {"state": "exited", "running": False, "exit_code": 137}})
+
+        with mock.patch.object(workers, "get_docker_client", return_value=client):
+            reconciler.reconcile_tasks(requeue=False)
+
+        task.refresh_from_db()
+        self.assertEqual(task.status, OfficeSudTask.STATUS_ERROR)
+        self.assertIn("exit_code=137", task.last_error)
+        client.remove_container.assert_called_once_with("c0ffee")
+
+    def test_containers_of_tasks_closed_elsewhere_are_removed_once(self):
+        closed_at = timezone.now() - timedelta(seconds=reconciler.CANCEL_GRACE + 5)
+        tasks = {
+            "exited": self.create_task("B1", status=OfficeSudTask.STATUS_SUCCESS, container_id="exited"),
+            "running": self.create_task("B2", status=OfficeSudTask.STATUS_CANCELLED, container_id="running"),
+            "fresh": self.create_task("B3", status=OfficeSudTask.STATUS_ERROR, container_id="fresh"),
+        }
+        OfficeSudTask.objects.exclude(pk=tasks["fresh"].pk).update(updated_at=closed_at)
+        client = mock.Mock(**{
+            "container_status.side_effect": lambda cid: {"state": cid, "running": cid == "running", "exit_code": 0},
+        })
+
+        with mock.patch.object(workers, "get_docker_client", return_value=client), \
+                mock.patch.object(reconciler, "get_docker_client", return_value=client):
+            reconciler.reconcile_tasks(requeue=False)
+            reconciler.reconcile_tasks(requeue=False)
+
+        client.stop_container.assert_called_once_with("running")
+        self.assertEqual(sorted(c.args[0] for c in client.remove_container.call_args_list), ["exited", "running"])
+        container_ids = dict(OfficeSudTask.objects.values_list("batch_id", "container_id"))
+        self.assertEqual(container_ids, {"B1": "", "B2": "", "B3": "fresh"})
+        self.assertEqual(OfficeSudTask.objects.get(pk=tasks["exited"].pk).status, OfficeSudTask.STATUS_SUCCESS)
+
+    def test_admin_caches_container_status_per_object(self):
+        task = self.create_task("B1", container_id="c0ffee")
+        model_admin = OfficeSudTaskAdmin(OfficeSudTask, None)
+
+        with mock.patch("server.apps.applications.admin.get_container_status", return_value={"state": "running"}) as status:
+            model_admin.container_state(task)
+            model_admin.container_resources(task)
+            model_admin.container_state(OfficeSudTask.objects.get(pk=task.pk))
+
+        self.assertEqual(status.call_count, 2)
+        self.assertFalse(hasattr(model_admin, "_status_cache"))
+
+
+class StallDetectionTests(OfficeSudTaskTestCase):
+    @classmethod
+    def setUpClass(cls):
+        # таблицу ведут воркеры (managed = False): в тестовой БД её создаём сами
+        with connection.schema_editor() as editor:
+            editor.create_model(WorkerHeartbeat)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connection.schema_editor() as editor:
+            editor.delete_model(WorkerHeartbeat)
+
+    def heartbeat(self, step, idle_seconds=3600, **fields):
+        now = timezone.now()
+        return WorkerHeartbeat(
+            worker_id=fields.pop("worker_id", "w"), batch_id="B1", step=step,
+            updated_at=now, progress_at=now - timedelta(seconds=idle_seconds), **fields,
+        )
+
+    def test_waiting_steps_are_not_stalled(self):
+        for step in ("paused", "retry_wait", "idle", "finished"):
+            self.assertFalse(self.heartbeat(step).is_stalled, step)
+        self.assertTrue(self.heartbeat("participant:defendant:1").is_stalled)
+        self.assertFalse(self.heartbeat("participant:defendant:1", idle_seconds=10).is_stalled)
+
+    def reconcile_running(self, *heartbeats):
+        for heartbeat in heartbeats:
+            heartbeat.save()
+        self.insert_cases("B1", 1)
+        self.create_task("B1", container_id="c0ffee")
+        client = mock.Mock()
+        running = {"state": "running", "running": True, "exit_code": None}
+        with mock.patch.object(reconciler, "get_container_status", return_value=running), \
+                mock.patch.object(reconciler, "get_docker_client", return_value=client), \
+                mock.patch.object(reconciler, "remove_container"):
+            reconciler.reconcile_tasks()
+        return client
+
+    def test_stalled_worker_container_is_stopped(self):
+        client = self.reconcile_running(self.heartbeat("submit"))
+
+        client.stop_container.assert_called_once_with("c0ffee")
+
+    def test_worker_waiting_for_retry_is_left_running(self):
+        client = self.reconcile_running(self.heartbeat("retry_wait"))
+
+        client.stop_container.assert_not_called()
+
+    def test_one_advancing_shard_keeps_the_batch_running(self):
+        client = self.reconcile_running(
+            self.heartbeat("submit", worker_id="w1"),
+            self.heartbeat("submit", idle_seconds=5, worker_id="w2"),
+        )
+
+        client.stop_container.assert_not_called()
+
+
+class HeartbeatWriterTests(SimpleTestCase):
+    def make(self, **kwargs):
+        from application.officesud.System.heartbeat import Heartbeat
+
+        written = []
+        return Heartbeat("B1", worker_id="w", writer=written.append, **kwargs), written
+
+    def test_progress_moves_only_on_change(self):
+        heartbeat, written = self.make()
+        with mock.patch.object(office_sqlite, "utc_now", side_effect=["t1", "t2", "t3", "t4"]):
+            heartbeat.update(step="submit", internal_id="A-1")
+            heartbeat.update(step="submit", internal_id="A-1")
+            heartbeat.case_done()
+
+        state = heartbeat.snapshot()
+        self.assertEqual((state["Step"], state["CasesDone"], state["ProgressAt"]), ("submit", 1, "t2"))
+
+    def test_thread_writes_until_stopped(self):
+        heartbeat, written = self.make(interval=0.01)
+
+        heartbeat.start()
+        heartbeat.update(step="retry_wait")
+        time.sleep(0.1)
+        heartbeat.stop()
+
+        self.assertGreater(len(written), 2)
+        self.assertEqual(written[-1]["Step"], "finished")
+        self.assertEqual({row["WorkerID"] for row in written}, {"w"})
+
+    def test_writer_failure_does_not_raise(self):
+        from application.officesud.System.heartbeat import Heartbeat
+
+        heartbeat = Heartbeat("B1", worker_id="w", writer=mock.Mock(side_effect=sqlite3.OperationalError("locked")))
+
+        with self.assertLogs("Heartbeat", level="ERROR"):
+            heartbeat.beat()
+
+
+class SessionReuseTests(OfficeSudSQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        from application.officesud.System.case_processor import CaseProcessor
+        from application.officesud.System.session import SessionStore
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = SessionStore(account="user@example.kz", directory=tmp.name, max_age=3600)
+        self.processor = CaseProcessor("B1", threading.Event(), heartbeat=mock.Mock(worker_id="w"))
+        self.processor.session = self.store
+        self.context = mock.Mock()
+
+    def login(self, resumed):
+        filler = mock.Mock(**{"resume_session.return_value": resumed, "wait_for_login.return_value": True})
+        self.processor._login(self.context, filler, self.store.load())
+        return filler
+
+    def test_fresh_state_skips_interactive_login(self):
+        self.store.save_state({"cookies": [{"name": "JSESSIONID", "value": "abc"}]})
+
+        filler = self.login(resumed=True)
+
+        filler.resume_session.assert_called_once_with()
+        filler.starting_process.assert_not_called()
+        filler.wait_for_login.assert_not_called()
+        self.assertEqual(os.stat(self.store.path).st_mode & 0o777, 0o600)
+
+    def test_state_expired_on_site_falls_back_to_interactive_login(self):
+        self.store.save_state({"cookies": []})
+
+        filler = self.login(resumed=False)
+
+        filler.starting_process.assert_called_once_with()
+        filler.wait_for_login.assert_called_once_with()
+        # старое состояние удалено, новое записано из контекста после входа
+        self.context.storage_state.assert_called_once()
+        self.assertTrue(os.path.exists(self.store.path))
+
+    def test_stale_state_file_is_not_tried(self):
+        self.store.save_state({"cookies": []})
+        old = time.time() - 2 * 3600
+        os.utime(self.store.path, (old, old))
+        self.assertIsNone(self.store.load())
+
+        filler = self.login(resumed=True)
+
+        filler.resume_session.assert_not_called()
+        filler.starting_process.assert_called_once_with()
+
+    def test_persistent_profile_gets_saved_cookies(self):
+        cookies = [{"name": "JSESSIONID", "value": "abc", "domain": "office.sud.kz", "path": "/"}]
+        self.store.save_state({"cookies": cookies, "origins": []})
+
+        self.store.apply(self.context, self.store.load())
+
+        self.context.add_cookies.assert_called_once_with(cookies)
+
+
+class ChangeFeedTests(OfficeSudSQLiteTestCase):
+    def test_only_case_changes_advance_the_sequence(self):
+        self.insert_cases("B1", 3)
+        case = office_sqlite.claim_case("w1", lease_seconds=60, batch_id="B1")
+        office_sqlite.renew_lease(case["DB_Case_ID"], "w1", 60)
+        self.assertEqual(office_sqlite.get_change_window(0, 10), (3, False))
+
+        office_sqlite.save_case_talon(case["DB_Case_ID"], "T-1")
+        until, has_more = office_sqlite.get_change_window(3, 10)
+        self.assertEqual((until, has_more), (4, False))
+        changes = [
+            json.loads(line)
+            for line in b"".join(export.iter_changes(3, until, "jsonl")).decode("utf-8").splitlines()
+        ]
+        self.assertEqual([(c["InternalID"], c["TalonID"], c["ChangeSeq"]) for c in changes], [("B1-0", "T-1", 4)])
+        self.assertNotIn("LeaseExpiresAt", changes[0])
+
+    def test_window_is_bounded_by_limit(self):
+        self.insert_cases("B1", 5)
+        self.insert_cases("B2", 2)
+        self.assertEqual(office_sqlite.get_change_window(0, 2), (2, True))
+        self.assertEqual(office_sqlite.get_change_window(0, 2, batch_id="B2"), (7, False))
+        rows = [row for chunk in office_sqlite.iter_changes(2, 5, ["InternalID"], chunk_size=2) for row in chunk]
+        self.assertEqual(rows, [("B1-2",), ("B1-3",), ("B1-4",)])
+
+
+class RateTokenTests(OfficeSudSQLiteTestCase):
+    def set_limit(self, key, rate, burst):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "INSERT INTO RateLimits (LimitKey, RatePerMinute, Burst) VALUES (?, ?, ?)",
+            (key, rate, burst),
+        )
+        conn.commit()
+        conn.close()
+
+    def test_burst_is_free_then_waits_queue_up(self):
+        waits = [office_sqlite.acquire_rate_token("site", 60, 2) for _ in range(4)]
+
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertAlmostEqual(waits[2], 1.0, delta=0.1)
+        self.assertAlmostEqual(waits[3], 2.0, delta=0.1)
+
+    def test_new_court_uses_court_template(self):
+        self.set_limit("court:*", 6, 1)
+        office_sqlite.acquire_rate_token("court:42", 600, 100)
+
+        self.assertAlmostEqual(office_sqlite.acquire_rate_token("court:42", 600, 100), 10.0, delta=0.1)
+
+    def test_empty_rate_means_unlimited(self):
+        self.set_limit("site", None, None)
+
+        self.assertEqual([office_sqlite.acquire_rate_token("site", 60, 1) for _ in range(5)], [0.0] * 5)
+
+
+class AdaptivePacerTests(SimpleTestCase):
+    def pacer(self, **kwargs):
+        patcher = mock.patch.object(pacing, "log")
+        self.log = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.slept = []
+        return pacing.AdaptivePacer(**{"adaptive": True, "min_factor": 0.3, "max_factor": 4, **kwargs}, sleep=self.slept.append)
+
+    def test_fast_response_decreases_factor_additively(self):
+        pacer = self.pacer()
+
+        pacer.observe("loader", 0.2)
+        pacer.observe("richfaces", 0.1)
+
+        self.assertAlmostEqual(pacer.factor, 1.0 - 2 * pacing.PACE_DECREASE_STEP)
+
+    def test_failure_and_slow_response_back_off_multiplicatively(self):
+        pacer = self.pacer()
+
+        pacer.failure("modal_timeout")
+        self.assertAlmostEqual(pacer.factor, pacing.PACE_ERROR_BACKOFF)
+
+        pacer.observe("richfaces", pacing.SLOW_SECONDS["richfaces"] + 1)
+        self.assertAlmostEqual(pacer.factor, pacing.PACE_ERROR_BACKOFF * pacing.PACE_SLOW_BACKOFF)
+        self.assertEqual(self.log.info.call_count, 2)
+
+    def test_factor_is_clamped_to_min_and_max(self):
+        pacer = self.pacer()
+
+        for _ in range(100):
+            pacer.observe("loader", 0.1)
+        self.assertEqual(pacer.factor, 0.3)
+
+        for _ in range(10):
+            pacer.failure("loader_timeout")
+        self.assertEqual(pacer.factor, 4)
+
+    def test_pause_scales_range_by_factor(self):
+        pacer = self.pacer()
+        pacer.failure("loader_timeout")
+
+        with mock.patch.object(pacing.random, "uniform", return_value=1.5):
+            self.assertAlmostEqual(pacer.pause(1, 2), 1.5 * pacing.PACE_ERROR_BACKOFF)
+        self.assertEqual(self.slept, [1.5 * pacing.PACE_ERROR_BACKOFF])
+
+    def test_non_adaptive_pacer_keeps_fixed_delays(self):
+        pacer = self.pacer(adaptive=False)
+
+        pacer.failure("loader_timeout")
+        pacer.observe("loader", 60)
+        pacer.observe("loader", 0.1)
+
+        self.assertEqual(pacer.factor, 1.0)
+        with mock.patch.object(pacing.random, "uniform", return_value=1.5):
+            self.assertEqual(pacer.pause(1, 2), 1.5)
+
+    def test_metrics_report_latency_and_reset_sleep(self):
+        pacer = self.pacer()
+        pacer.observe("loader", 1.0)
+        pacer.observe("loader", 2.0)
+        pacer.failure("modal_gone")
+        with mock.patch.object(pacing.random, "uniform", return_value=0.5):
+            pacer.pause(0, 1)
+
+        metrics = pacer.metrics()
+
+        self.assertEqual(metrics["loader_ms_avg"], 1200)
+        self.assertEqual(metrics["pace_errors"], {"modal_gone": 1})
+        self.assertEqual(metrics["pace_factor"], round(pacer.factor, 3))
+        self.assertEqual(metrics["pace_sleep_ms"], int(0.5 * pacer.factor * 1000))
+        self.assertEqual(pacer.metrics()["pace_sleep_ms"], 0)
+
+
+class CaseOrderingTests(OfficeSudSQLiteTestCase):
+    def insert_court_cases(self, batch_id, rows):
+        conn = sqlite3.connect(self.db_path)
+        conn.executemany(
+            "INSERT INTO Cases (BatchID, InternalID, RegionID, CourtID, DefendantID) VALUES (?, ?, ?, ?, ?)",
+            [(batch_id, internal_id, region, court, defendants) for internal_id, region, court, defendants in rows],
+        )
+        conn.commit()
+        conn.close()
+
+    def test_cases_are_claimed_grouped_by_court_and_shape(self):
+        self.insert_court_cases("B1", [
+            ("1", "10", "A", "x"),
+            ("2", "20", "B", "x"),
+            ("3", "10", "A", "x*y"),
+            ("4", "20", "B", "x"),
+            ("5", "10", "A", "x"),
+        ])
+
+        stats = ordering.optimize_batch_order("B1")
+        claimed = []
+        while True:
+            case = office_sqlite.claim_case("w", lease_seconds=600, batch_id="B1")
+            if case is None:
+                break
+            claimed.append(case["InternalID"])
+
+        self.assertEqual(claimed, ["1", "5", "3", "2", "4"])
+        self.assertEqual(stats["court_groups"], 2)
+        self.assertGreater(stats["reused_selects_after"], stats["reused_selects_before"])
+        self.assertGreater(stats["predicted_saved_seconds"], 0)
+
+    def test_reordered_batch_does_not_jump_ahead_of_older_batches(self):
+        self.insert_court_cases("OLD", [("old", "10", "A", "x")])
+        self.insert_court_cases("NEW", [("new-1", "20", "B", "x"), ("new-2", "10", "A", "x")])
+        ordering.optimize_batch_order("NEW")
+
+        self.assertEqual(office_sqlite.claim_case("w", lease_seconds=600)["InternalID"], "old")
+
+    def test_savings_report_combines_prediction_and_measurement(self):
+        self.insert_court_cases("B1", [("1", "10", "A", "x"), ("2", "10", "A", "x")])
+        ordering.optimize_batch_order("B1")
+        office_sqlite.record_step_event({
+            "BatchID": "B1", "InternalID": "2", "Step": "open_form", "Status": "ok",
+            "Details": {"form_reused": 2, "form_saved_ms": 5500},
+        })
+
+        savings = office_sqlite.get_batch_order_savings("B1")
+        self.assertEqual(savings["measured_reused_selects"], 2)
+        self.assertEqual(savings["measured_saved_seconds"], 5.5)
+        self.assertEqual(savings["cases"], 2)
+
+
+class TalonExtractionTests(SimpleTestCase):
+    def test_talon_from_full_page(self):
+        body = (
+            '<input type="hidden" id="form:xmlToSign0" value="'
+            '&amp;lt;?xml version=&amp;quot;1.0&amp;quot;?&amp;gt;&amp;lt;root&amp;gt;'
+            '&amp;lt;f1&amp;gt;T-123&amp;lt;/f1&amp;gt;&amp;lt;/root&amp;gt;"/>'
+        )
+        self.assertEqual(extract_talon(body), "T-123")
+
+    def test_talon_from_richfaces_partial_response(self):
+        body = (
+            '<partial-response><changes><update id="form"><![CDATA['
+            '<input id="xmlToSign0" value="&lt;root&gt;&lt;f1&gt;T-7&lt;/f1&gt;&lt;/root&gt;" />'
+            ']]></update></changes></partial-response>'
+        )
+        self.assertEqual(extract_talon(body), "T-7")
+
+    def test_unrelated_response_has_no_talon(self):
+        self.assertIsNone(extract_talon("<html><body><f1>not a talon</f1></body></html>"))
+
+
+class FakePage:
+    url = "https://office.sud.kz/form.xhtml"
+
+    def content(self):
+        return "<html><body>form</body></html>"
+
+    def screenshot(self, **kwargs):
+        return b"\xff\xd8jpeg"
+
+
+class FailureTraceTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def test_ring_buffer_keeps_last_actions_and_snapshots(self):
+        trace = tracing.FailureTrace(enabled=True, actions=3, snapshots=2)
+        page = FakePage()
+        for step in ("open_form", "participants", "payment_and_lawsuit"):
+            trace.action("step", step=step)
+            trace.snapshot(page, step)
+
+        written = trace.write(page, {"reason": "failed"})
+        self.addCleanup(os.remove, written["path"])
+        with zipfile.ZipFile(written["path"]) as archive:
+            names = archive.namelist()
+        self.assertIn("final.jpg", names)
+        self.assertIn("snapshots/02-payment_and_lawsuit.html", names)
+        self.assertNotIn("snapshots/01-open_form.html", names)
+        self.assertEqual((written["actions"], written["snapshots"]), (3, 3))
+
+    def test_retention_drops_expired_and_oldest_over_size(self):
+        paths = []
+        for age_days in (30, 3, 2, 1):
+            path = os.path.join(self.directory, "B1", f"case-{age_days}.zip")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"x" * 600 * 1024)
+            mtime = time.time() - age_days * 86400
+            os.utime(path, (mtime, mtime))
+            paths.append(path)
+
+        removed = tracing.enforce_retention(self.directory, max_age_days=14, max_mb=1)
+        self.assertEqual(removed, 3)
+        self.assertEqual([os.path.exists(p) for p in paths], [False, False, False, True])
+
+    def test_trace_path_stays_inside_trace_dir(self):
+        self.assertIsNone(tracing.trace_path("../db.sqlite3", self.directory))
+        self.assertIsNone(tracing.trace_path("B1/../../secret.zip", self.directory))
+        self.assertEqual(
+            tracing.trace_path("B1/case-a1.zip", self.directory),
+            os.path.join(self.directory, "B1", "case-a1.zip"),
+        )
+
+
+class DocumentStoreTests(OfficeSudSQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def bundle(self, files):
+        path = os.path.join(self.directory, f"bundle-{len(os.listdir(self.directory))}.zip")
+        with zipfile.ZipFile(path, "w") as archive:
+            for name, content in files.items():
+                archive.writestr(name, content)
+        return path
+
+    def test_identical_documents_are_stored_once_and_paths_rewritten(self):
+        first = docstore.ingest_bundle(self.bundle({
+            "Иванов/иск.pdf": b"%PDF-1.4 ivanov",
+            "Петров/иск.pdf": b"%PDF-1.4 petrov",
+        }), self.directory)
+        second = docstore.ingest_bundle(self.bundle({"docs/иск.pdf": b"%PDF-1.4 ivanov"}), self.directory)
+
+        self.assertEqual((first.stats["new"], second.stats["deduplicated"]), (2, 1))
+        value = second.rewrite("C:\\Иски\\иск.pdf*D:\\квитанция.pdf")
+        ref, unmatched = value.split("*")
+        self.assertEqual(unmatched, "D:\\квитанция.pdf")
+        self.assertEqual(first.lookup("C:\\Иски\\Петров\\иск.pdf"), first.lookup("Петров/иск.pdf"))
+
+        resolved = docstore.resolve(ref, self.directory)
+        self.assertEqual(os.path.basename(resolved), "иск.pdf")
+        with open(resolved, "rb") as f:
+            self.assertEqual(f.read(), b"%PDF-1.4 ivanov")
+
+    def test_invalid_document_rejects_bundle(self):
+        with self.assertRaises(docstore.BundleError):
+            docstore.ingest_bundle(self.bundle({"иск.pdf": b"not a pdf"}), self.directory)
+
+    def test_eviction_skips_documents_of_unfiled_cases(self):
+        refs = []
+        for index in range(3):
+            ref, _, _ = docstore.ingest_stream(
+                io.BytesIO(bytes([index]) * 400 * 1024), f"doc-{index}.bin", self.directory
+            )
+            data = os.path.join(self.directory, ref[6:8], docstore.parse_ref(ref)[0], docstore.DATA_NAME)
+            os.utime(data, (time.time() - (10 - index) * 60,) * 2)
+            refs.append(ref)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO Cases (BatchID, MainDocPath) VALUES ('B1', ?)", (refs[0],))
+        conn.commit()
+        conn.close()
+
+        self.assertEqual(docstore.enforce_size(self.directory, max_mb=1), 1)
+        exists = [os.path.exists(docstore.resolve(ref, self.directory)) for ref in refs]
+        self.assertEqual(exists, [True, False, True])
+
+    def test_refs_cannot_escape_the_store(self):
+        self.assertIsNone(docstore.parse_ref("store:" + "a" * 64 + "/../../db.sqlite3"))
+        self.assertIsNone(docstore.parse_ref("store:../x/y.pdf"))
+
+
+@skipUnless(preprocess.Image is not None, "Pillow не установлен")
+class DocumentPreprocessTests(OfficeSudSQLiteTestCase):
+    def test_oversized_image_is_shrunk_once_and_limits_flag_the_case(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        buffer = io.BytesIO()
+        preprocess.Image.effect_noise((3000, 2000), 30).save(buffer, "PNG")
+        ref, _, size = docstore.ingest_stream(io.BytesIO(buffer.getvalue()), "скан.png", tmp.name)
+        conn = sqlite3.connect(self.db_path)
+        conn.executemany(
+            "INSERT INTO Cases (BatchID, InternalID, MainDocPath) VALUES ('B1', ?, ?)",
+            [("B1-0", ref), ("B1-1", ref)],
+        )
+        conn.commit()
+        conn.close()
+
+        with mock.patch.object(preprocess, "UPLOAD_MAX_MB", size / 2 ** 20 / 10):
+            stats = preprocess.preprocess_batch_documents("B1", tmp.name, workers=1)
+        self.assertEqual((stats["optimized"], stats["cases_rewritten"], stats["cases_flagged"]), (1, 2, 2))
+        self.assertEqual(stats["bytes_saved"], stats["bytes_before"] - stats["bytes_after"])
+        self.assertGreater(stats["bytes_saved"], 0)
+
+        case = office_sqlite.get_case_participants("B1")[0]
+        self.assertEqual(case["NeedsReview"], 1)
+        self.assertTrue(case["MainDocPath"].endswith("/скан.png"))
+        self.assertNotEqual(case["MainDocPath"], ref)
+        with preprocess.Image.open(docstore.resolve(case["MainDocPath"], tmp.name)) as image:
+            self.assertEqual(max(image.size), preprocess.MAX_IMAGE_PX)
+
+        again = preprocess.preprocess_batch_documents("B1", tmp.name, workers=1)
+        self.assertEqual((again["optimized"], again["cached"]), (0, 1))
+
+
+class BatchExportTests(OfficeSudSQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.insert_cases("B1", 5)
+        self.insert_cases("B2", 2)
+
+    def test_csv_streams_in_chunks_without_service_columns(self):
+        chunks = list(export.iter_csv("B1", chunk_rows=2))
+        self.assertEqual(len(chunks), 1 + 3)
+        lines = b"".join(chunks).decode("utf-8-sig").splitlines()
+        self.assertEqual(lines[0].split(",")[0], "InternalID")
+        self.assertNotIn("BatchID", lines[0].split(","))
+        self.assertEqual([line.split(",")[0] for line in lines[1:]], [f"B1-{i}" for i in range(5)])
+
+    def test_xlsx_is_written_in_constant_memory_mode(self):
+        import openpyxl
+
+        target = io.BytesIO()
+        self.assertEqual(export.write_xlsx("B1", target, chunk_rows=2), 5)
+        sheet = openpyxl.load_workbook(target, read_only=True).active
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(sheet.title, export.SHEET_NAME)
+        self.assertEqual([row[0] for row in rows], ["InternalID"] + [f"B1-{i}" for i in range(5)])
+
+
+class BatchArchiveTests(OfficeSudSQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.insert_cases("B1", 5)
+        self.insert_cases("B2", 2)
+        office_sqlite.record_step_event({"BatchID": "B1", "InternalID": "B1-0", "Step": "login", "Status": "ok"})
+        patcher = mock.patch.object(archive, "ARCHIVE_DIR", os.path.join(os.path.dirname(self.db_path), "archive"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_archived_batch_is_exported_and_restored(self):
+        stats = archive.archive_batch("B1")
+
+        self.assertEqual((stats["cases"], stats["events"]), (5, 1))
+        self.assertEqual(office_sqlite.count_batch_rows("B1"), (0, 0))
+        self.assertEqual(office_sqlite.count_batch_rows("B2"), (2, 0))
+        lines = b"".join(export.iter_csv("B1", chunk_rows=2)).decode("utf-8-sig").splitlines()
+        self.assertEqual([line.split(",")[0] for line in lines[1:]], [f"B1-{i}" for i in range(5)])
+
+        archive.restore_batch("B1")
+        self.assertEqual(office_sqlite.count_batch_rows("B1"), (5, 1))
+        self.assertFalse(archive.is_archived("B1"))
+
+    def test_leased_batch_stays_in_db(self):
+        office_sqlite.claim_case("w1", lease_seconds=60, batch_id="B1")
+
+        with self.assertRaises(archive.ArchiveError):
+            archive.archive_batch("B1")
+        self.assertEqual(office_sqlite.count_batch_rows("B1"), (5, 1))
+        self.assertFalse(archive.is_archived("B1"))
+
+    def test_compact_switches_to_incremental_vacuum(self):
+        self.assertEqual(office_sqlite.compact_db()["mode"], "full")
+        self.assertEqual(office_sqlite.compact_db()["mode"], "incremental")
+
+
+class ImportDuplicateTests(OfficeSudSQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(dataloader, "DB_PATH", self.db_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_excel(self, rows):
+        import pandas as pd
+
+        path = os.path.join(os.path.dirname(self.db_path), f"cases-{uuid.uuid4().hex}.xlsx")
+        pd.DataFrame(rows, columns=["InternalID", "PlaintiffName", "ClaimAmount"]).to_excel(path, index=False)
+        return path
+
+    def batch_cases(self, batch_id):
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(
+            "SELECT InternalID, ErrorClass, NeedsReview FROM Cases WHERE BatchID = ? ORDER BY DB_Case_ID",
+            (batch_id,),
+        ).fetchall()
+        conn.close()
+        return rows
+
+    def test_filed_cases_are_flagged_or_skipped_in_later_batches(self):
+        path = self.write_excel([("A-1", "Иванов", "1000"), ("A-2", "Петров", "500")])
+        first = dataloader.load_excel_to_db(path)
+        office_sqlite.save_case_talon(office_sqlite.get_case_data_by_internal_id("A-1")["DB_Case_ID"], "T-1")
+        self.assertEqual(office_sqlite.find_import_file(dataloader.file_sha256(path))["BatchID"], first)
+
+        # та же строка с другими пробелами/регистром и 1000.0 вместо 1000 — тот же RowHash
+        second = dataloader.load_excel_to_db(self.write_excel([
+            ("A-9", " иванов ", "1000.0"), ("A-2", "Петров", "500"), ("A-3", "Сидоров", "10"),
+        ]))
+        self.assertEqual(self.batch_cases(second), [
+            ("A-9", dataloader.DUPLICATE, 1), ("A-2", None, 0), ("A-3", None, 0),
+        ])
+        self.assertEqual(office_sqlite.get_batch_import(second)["Duplicates"], 1)
+        # поданное дело находится и после архивации его пакета
+        with mock.patch.object(archive, "ARCHIVE_DIR", os.path.join(os.path.dirname(self.db_path), "archive")):
+            archive.archive_batch(first)
+        third = dataloader.load_excel_to_db(self.write_excel([("A-1", "Иванов", "1")]), duplicates="skip")
+        self.assertEqual(self.batch_cases(third), [])
+        self.assertEqual(office_sqlite.get_batch_import(third)["Skipped"], 1)
+
+    def test_internal_id_lookup_prefers_filed_case(self):
+        path = self.write_excel([("A-1", "Иванов", "1000")])
+        first = dataloader.load_excel_to_db(path, duplicates="allow")
+        second = dataloader.load_excel_to_db(path, duplicates="allow")
+        office_sqlite.save_case_talon(office_sqlite.get_case_data_by_internal_id("A-1", first)["DB_Case_ID"], "T-1")
+
+        self.assertEqual(office_sqlite.get_case_data_by_internal_id("A-1")["TalonID"], "T-1")
+        self.assertIsNone(office_sqlite.get_case_data_by_internal_id("A-1", second)["TalonID"])
+        self.assertEqual(office_sqlite.find_import_file(dataloader.file_sha256(path))["BatchID"], second)
+
+
+class FlaggedImportCompletionTests(OfficeSudTaskTestCase):
+    def test_batch_with_flagged_duplicates_completes(self):
+        import pandas as pd
+
+        patcher = mock.patch.object(dataloader, "DB_PATH", self.db_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        path = os.path.join(os.path.dirname(self.db_path), "cases.xlsx")
+        pd.DataFrame([("A-1", "Иванов")], columns=["InternalID", "PlaintiffName"]).to_excel(path, index=False)
+        first = dataloader.load_excel_to_db(path)
+        office_sqlite.save_case_talon(office_sqlite.get_case_data_by_internal_id("A-1")["DB_Case_ID"], "T-1")
+
+        pd.DataFrame(
+            [("A-1", "Иванов"), ("A-2", "Петров")], columns=["InternalID", "PlaintiffName"],
+        ).to_excel(path, index=False)
+        second = dataloader.load_excel_to_db(path)
+        task = self.create_task(second)
+        case = office_sqlite.claim_case("w", lease_seconds=600, batch_id=second)
+        self.assertEqual(case["InternalID"], "A-2")
+        self.assertIsNone(office_sqlite.claim_case("w", lease_seconds=600, batch_id=second))
+        office_sqlite.save_case_talon(case["DB_Case_ID"], "T-2")
+
+        reconciler.reconcile_tasks()
+
+        task.refresh_from_db()
+        self.assertNotEqual(first, second)
+        self.assertEqual(office_sqlite.get_batch_progress(second), (1, 1, 2))
+        self.assertEqual(task.status, OfficeSudTask.STATUS_SUCCESS)
+
+
+class MultiFileImportTests(OfficeSudSQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(dataloader, "DB_PATH", self.db_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_all_sheets_of_all_files_become_one_batch_with_sources(self):
+        import pandas as pd
+
+        directory = os.path.dirname(self.db_path)
+        first, second = os.path.join(directory, "first.xlsx"), os.path.join(directory, "second.xlsx")
+        columns = ["InternalID", "PlaintiffName"]
+        with pd.ExcelWriter(first) as writer:
+            pd.DataFrame([("A-1", "Иванов"), (None, None), ("A-2", "Петров")], columns=columns).to_excel(
+                writer, sheet_name="Январь", index=False,
+            )
+            pd.DataFrame([("Заполните лист по шаблону",)], columns=["Инструкция"]).to_excel(
+                writer, sheet_name="Инструкция", index=False,
+            )
+            pd.DataFrame([("B-1", "Сидоров")], columns=columns).to_excel(writer, sheet_name="Февраль", index=False)
+        pd.DataFrame([("C-1", "Смирнов")], columns=columns).to_excel(second, index=False)
+
+        with self.assertLogs("DataLoader", level="INFO") as logs:
+            batch_id = dataloader.load_files_to_db([first, second], file_names=["Иски.xlsx", "Ещё.xlsx"], workers=2)
+
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute(
+            "SELECT InternalID, SourceFile, SourceSheet, SourceRow FROM Cases WHERE BatchID = ? ORDER BY DB_Case_ID",
+            (batch_id,),
+        ).fetchall()
+        conn.close()
+        self.assertEqual(rows, [
+            ("A-1", "Иски.xlsx", "Январь", 2),
+            ("A-2", "Иски.xlsx", "Январь", 4),
+            ("B-1", "Иски.xlsx", "Февраль", 2),
+            ("C-1", "Ещё.xlsx", "Sheet1", 2),
+        ])
+        imported = office_sqlite.get_batch_import(batch_id)
+        self.assertEqual((imported["Files"], imported["Rows"]), (2, 4))
+        self.assertIn("WARNING:DataLoader:Лист 'Инструкция' файла Иски.xlsx пропущен: нет колонок таблицы Cases", logs.output)
+
+
+class MultiFileUploadViewTests(OfficeSudTaskTestCase):
+    def setUp(self):
+        super().setUp()
+        from server.apps.applications import views
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.upload_dir = os.path.join(tmp.name, "uploads")
+        self.launch_worker = mock.Mock()
+        for target, name, value in (
+            (dataloader, "DB_PATH", self.db_path),
+            (views, "UPLOAD_DIR", Path(self.upload_dir)),
+            (views, "launch_worker", self.launch_worker),
+        ):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.views = views
+        self.user = get_user_model().objects.create(username="officesud", email="officesud@example.com")
+        self.client.force_login(self.user)
+
+    def excel(self, name, rows):
+        import pandas as pd
+
+        content = io.BytesIO()
+        pd.DataFrame(rows, columns=["InternalID", "PlaintiffName"]).to_excel(content, index=False)
+        return SimpleUploadedFile(name, content.getvalue())
+
+    def upload(self, *files, **data):
+        return self.client.post(
+            reverse("applications:office_sud_start"), {"excel_file": list(files), **data}, HTTP_HOST="localhost",
+        )
+
+    def test_several_files_become_one_batch(self):
+        response = self.upload(
+            self.excel("Январь.xlsx", [("A-1", "Иванов"), ("A-2", "Петров")]),
+            self.excel("Февраль.xlsx", [("B-1", "Сидоров")]),
+        )
+
+        self.assertEqual(response.status_code, 200, response.content)
+        body = response.json()
+        self.assertEqual(len(body["files"]), 2)
+        self.assertEqual(body["import"], {"files": 2, "rows": 3, "duplicates": 0, "skipped": 0})
+        task = OfficeSudTask.objects.get(pk=body["task_id"])
+        self.assertEqual(task.batch_id, body["batch_id"])
+        self.launch_worker.assert_called_once_with(task)
+        conn = sqlite3.connect(self.db_path)
+        sources = conn.execute(
+            "SELECT InternalID, SourceFile FROM Cases WHERE BatchID = ? ORDER BY DB_Case_ID", (task.batch_id,),
+        ).fetchall()
+        conn.close()
+        self.assertEqual(sources, [("A-1", "Январь.xlsx"), ("A-2", "Январь.xlsx"), ("B-1", "Февраль.xlsx")])
+        # загрузки удаляются после импорта
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+    def test_too_many_files_are_rejected(self):
+        with mock.patch.object(self.views, "IMPORT_MAX_FILES", 1):
+            response = self.upload(self.excel("a.xlsx", [("A-1", "Иванов")]), self.excel("b.xlsx", [("B-1", "Петров")]))
+
+        self.assertEqual((response.status_code, response.json()["code"]), (400, "too_many_files"))
+        self.assertFalse(OfficeSudTask.objects.exists())
+
+    def test_file_already_imported_is_refused_unless_forced(self):
+        first = self.upload(self.excel("a.xlsx", [("A-1", "Иванов")])).json()
+        OfficeSudTask.objects.filter(pk=first["task_id"]).update(status=OfficeSudTask.STATUS_SUCCESS)
+
+        repeated = self.upload(self.excel("b.xlsx", [("B-1", "Петров")]), self.excel("a.xlsx", [("A-1", "Иванов")]))
+
+        self.assertEqual(repeated.status_code, 409)
+        self.assertEqual((repeated.json()["code"], repeated.json()["batch_id"]), ("duplicate_file", first["batch_id"]))
+        self.assertEqual(os.listdir(self.upload_dir), [])
+        forced = self.upload(self.excel("a.xlsx", [("A-1", "Иванов")]), force_reimport="1")
+        self.assertEqual(forced.status_code, 200)
+
+
+class MemoryWatchdogTests(SimpleTestCase):
+    def make_watchdog(self, browser_rss_mb, renderer_rss_mb, **kwargs):
+        memory = {"browser": browser_rss_mb, "renderer": renderer_rss_mb}
+        sample = lambda: (memory["browser"] * watchdog.MB, memory["renderer"] * watchdog.MB)
+        return watchdog.MemoryWatchdog(**kwargs, sample=sample), memory
+
+    def test_thresholds_pick_browser_over_context(self):
+        dog, memory = self.make_watchdog(500, 300, renderer_mb=400, browser_mb=1000, context_cases=0, browser_cases=0)
+        self.assertIsNone(dog.due())
+        memory["renderer"] = 450
+        self.assertEqual(dog.due()[0], watchdog.CONTEXT)
+        memory["browser"] = 1200
+        self.assertEqual(dog.due()[0], watchdog.BROWSER)
+
+    def test_case_counts_reset_and_recycles_reported_once(self):
+        dog, _ = self.make_watchdog(100, 50, renderer_mb=0, browser_mb=0, context_cases=2, browser_cases=3)
+        dog.case_done()
+        self.assertIsNone(dog.due())
+        dog.case_done()
+        self.assertEqual(dog.due(), (watchdog.CONTEXT, "2 cases"))
+        dog.recycled(watchdog.CONTEXT, "2 cases", 1.5)
+        dog.case_done()
+        self.assertEqual(dog.due(), (watchdog.BROWSER, "3 cases"))
+
+        metrics = dog.metrics()
+        self.assertEqual(metrics["recycles"], {"context": 1, "browser": 0})
+        self.assertEqual((metrics["recycle"], metrics["recycle_ms"], metrics["browser_rss_mb"]), ("context", 1500, 100))
+        self.assertNotIn("recycle", dog.metrics())
+
+
+class IterParticipantsTests(SimpleTestCase):
+    def test_split_values_and_shared_side(self):
+        from application.officesud.System.case_processor import iter_participants
+
+        participants = list(iter_participants({
+            "PlaintiffID": "111*222",
+            "PlaintiffSide": "1",
+            "PlaintiffType": "1",
+            "PlaintiffPhone": "+7700*",
+            "DefendantID": "333",
+            "DefendantSide": "2",
+            "DefendantType": "0",
+        }))
+
+        self.assertEqual(
+            [(role, index) for role, index, _ in participants],
+            [("plaintiff", 1), ("plaintiff", 2), ("defendant", 1)],
+        )
+        self.assertEqual(participants[1][2]["id_value"], "222")
+        self.assertEqual(participants[1][2]["side_value"], "1")
+        self.assertEqual(participants[2][2]["participant_type"], "0")
+
+
+class ModalPage:
+    """Страница для ParticipantModal: ответы evaluate по очереди, остальные вызовы — в журнал."""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = []
+
+    def evaluate(self, script, arg):
+        self.calls.append(("evaluate", arg))
+        return self.results.pop(0)
+
+    def locator(self, selector):
+        page = self
+
+        class Locator:
+            def fill(self, value):
+                page.calls.append(("fill", selector, value))
+
+            def is_visible(self):
+                page.calls.append(("is_visible", selector))
+                return True
+
+        return Locator()
+
+
+class ParticipantModalProbeTests(SimpleTestCase):
+    def _modal(self, page):
+        from application.officesud.System.modal import ParticipantModal
+
+        return ParticipantModal(page, pacer=mock.Mock())
+
+    def test_bulk_fill_is_one_round_trip(self):
+        page = ModalPage({"modal": True, "filled": True, "missing": []})
+        modal = self._modal(page)
+
+        modal.fill_fields("#jur", "Jur", {"#address": "Алматы", "#bank": "KZ00"})
+
+        self.assertEqual([call[0] for call in page.calls], ["evaluate"])
+        self.assertEqual(modal.calls_saved, 3)
+
+    def test_bulk_fill_falls_back_when_fields_not_ready(self):
+        page = ModalPage({"modal": True, "filled": False, "missing": ["#bank"]})
+        modal = self._modal(page)
+
+        modal.fill_fields("#jur", "Jur", {"#address": "Алматы", "#bank": "KZ00"})
+
+        self.assertEqual(
+            [call[:2] for call in page.calls if call[0] == "fill"],
+            [("fill", "#address"), ("fill", "#bank")],
+        )
+
+    def test_settle_raises_when_modal_closed(self):
+        page = ModalPage({"modal": False, "loader_busy": False, "richfaces_idle": True, "fields": {}})
+
+        with self.assertRaises(RuntimeError):
+            self._modal(page)._settle("#fiz", "Fiz")
+
+
+class AsyncLocator:
+    def __init__(self, page, selector):
+        self.page = page
+        self.selector = selector
+
+    async def input_value(self, timeout=None):
+        return self.page.values.get(self.selector)
+
+    async def select_option(self, value):
+        self.page.calls.append(("select_option", self.selector, value))
+        self.page.values[self.selector] = value
+
+    async def fill(self, value):
+        self.page.calls.append(("fill", self.selector, value))
+
+    async def is_visible(self, timeout=None):
+        self.page.calls.append(("is_visible", self.selector))
+        return True
+
+    async def is_checked(self):
+        return self.page.values.get(self.selector) == "checked"
+
+    async def check(self):
+        self.page.calls.append(("check", self.selector))
+
+    async def click(self, **kwargs):
+        self.page.calls.append(("click", self.selector))
+
+    @property
+    def first(self):
+        return self
+
+
+class AsyncFakePage:
+    """Страница для async-движка: значения полей по подписи, evaluate по очереди, вызовы — в журнал."""
+
+    def __init__(self, values=None, results=()):
+        self.values = dict(values or {})
+        self.results = list(results)
+        self.calls = []
+        self.chosen_files = []
+
+    def get_by_label(self, label):
+        return AsyncLocator(self, label)
+
+    def get_by_role(self, role, name):
+        return AsyncLocator(self, name)
+
+    def locator(self, selector):
+        return AsyncLocator(self, selector)
+
+    async def evaluate(self, script, arg):
+        self.calls.append(("evaluate", arg))
+        return self.results.pop(0)
+
+    def expect_file_chooser(self):
+        page = self
+
+        class FileChooser:
+            async def set_files(self, paths):
+                page.chosen_files.append(paths)
+
+        class Info:
+            async def __aenter__(self):
+                self.value = asyncio.sleep(0, result=FileChooser())
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+        return Info()
+
+
+def async_pacer():
+    return mock.Mock(pause_async=mock.AsyncMock(return_value=0.0))
+
+
+class AsyncFillerTests(SimpleTestCase):
+    def test_select_skips_value_kept_from_previous_case(self):
+        from application.officesud.System.aio.filler import AsyncFiller
+
+        page = AsyncFakePage({"Саты": "FIRSTINSTANCE"})
+        filler = AsyncFiller(page, pacer=async_pacer())
+        filler._select_cost["Саты"] = 1.5
+
+        changed = asyncio.run(filler.select("Саты", "FIRSTINSTANCE"))
+        forced = asyncio.run(filler.select("Саты", "FIRSTINSTANCE", reuse=False))
+
+        self.assertEqual((changed, forced), (False, True))
+        self.assertEqual(page.calls, [("select_option", "Саты", "FIRSTINSTANCE")])
+        self.assertEqual(filler.take_form_metrics(), {"form_reused": 1, "form_saved_ms": 1500})
+
+    def test_bulk_fill_is_one_round_trip(self):
+        from application.officesud.System.aio.modal import AsyncParticipantModal
+
+        page = AsyncFakePage(results=[{"modal": True, "filled": True, "missing": []}])
+        modal = AsyncParticipantModal(page, pacer=async_pacer())
+
+        asyncio.run(modal.fill_fields("#jur", "Jur", {"#address": "Алматы", "#bank": "KZ00"}))
+
+        self.assertEqual([call[0] for call in page.calls], ["evaluate"])
+        self.assertEqual(modal.calls_saved, 3)
+
+    def test_bulk_fill_falls_back_when_fields_not_ready(self):
+        from application.officesud.System.aio.modal import AsyncParticipantModal
+
+        page = AsyncFakePage(results=[{"modal": True, "filled": False, "missing": ["#bank"]}])
+        modal = AsyncParticipantModal(page, pacer=async_pacer())
+
+        asyncio.run(modal.fill_fields("#jur", "Jur", {"#address": "Алматы", "#bank": "KZ00"}))
+
+        self.assertEqual([call[:2] for call in page.calls if call[0] == "fill"], [("fill", "#address"), ("fill", "#bank")])
+
+    def test_uploader_sets_existing_files_and_skips_missing(self):
+        from application.officesud.System.aio.uploader import AsyncFileUploader
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        present = os.path.join(tmp.name, "claim.pdf")
+        open(present, "wb").close()
+        page = AsyncFakePage()
+        uploader = AsyncFileUploader(page, async_pacer())
+
+        asyncio.run(uploader.handle_payment_files(f"{present}*{os.path.join(tmp.name, 'missing.pdf')}"))
+        asyncio.run(uploader.upload_file("Талап арызды жүктеу", " * "))
+
+        self.assertEqual(page.chosen_files, [[present]])
+        self.assertIn(("check", "input[name$='isonline-payment']"), page.calls)
+
+
+class FakeAsyncFiller:
+    def __init__(self, page, governor=None, pacer=None):
+        self.page = page
+        self.submitted = False
+
+    async def resume_session(self):
+        return True
+
+    async def open_cabinet(self):
+        pass
+
+
+class FakeAsyncContext:
+    async def new_page(self):
+        return mock.AsyncMock()
+
+    async def close(self):
+        pass
+
+
+class AsyncCaseProcessorTests(OfficeSudSQLiteTestCase):
+    def processor(self, batch_id, concurrency):
+        from application.officesud.System.aio.case_processor import AsyncCaseProcessor
+
+        processor = AsyncCaseProcessor(
+            batch_id, threading.Event(), heartbeat=mock.Mock(worker_id="w"), concurrency=concurrency,
+        )
+        processor.trace = mock.Mock(enabled=False)
+        return processor
+
+    def run_lanes(self, processor, process):
+        from application.officesud.System.aio import case_processor
+
+        browser = mock.Mock(new_context=mock.AsyncMock(side_effect=lambda **kwargs: FakeAsyncContext()))
+        processor._process_single_case = process
+
+        async def lanes():
+            return await asyncio.gather(
+                *(processor._lane(lane, browser, None) for lane in range(processor.concurrency)),
+                return_exceptions=True,
+            )
+
+        with mock.patch.object(case_processor, "AsyncFiller", FakeAsyncFiller):
+            return asyncio.run(lanes())
+
+    def test_lanes_file_every_case_once_concurrently(self):
+        self.insert_cases("B1", 9)
+        processor = self.processor("B1", concurrency=3)
+        filed = []
+        in_flight = Counter()
+
+        async def process(filler, case_data):
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            await asyncio.to_thread(office_sqlite.save_case_talon, case_data["DB_Case_ID"], "T", "w")
+            case_data["TalonID"] = "T"
+            filed.append(case_data["InternalID"])
+            in_flight["now"] -= 1
+
+        self.assertEqual(self.run_lanes(processor, process), [None, None, None])
+        self.assertEqual(sorted(filed), sorted(f"B1-{i}" for i in range(9)))
+        self.assertEqual(in_flight["max"], 3)
+        self.assertEqual(office_sqlite.get_batch_progress("B1"), (9, 0, 9))
+
+    def test_failed_case_is_parked_and_lane_moves_on_with_a_fresh_page(self):
+        self.insert_cases("B1", 3)
+        processor = self.processor("B1", concurrency=1)
+        pages = []
+
+        async def process(filler, case_data):
+            pages.append(filler.page)
+            if case_data["InternalID"] == "B1-0":
+                raise errors.CaseValidationError("bad IIN")
+            await asyncio.to_thread(office_sqlite.save_case_talon, case_data["DB_Case_ID"], "T", "w")
+            case_data["TalonID"] = "T"
+
+        self.run_lanes(processor, process)
+
+        self.assertEqual(office_sqlite.get_batch_progress("B1"), (2, 1, 3))
+        self.assertIsNot(pages[0], pages[1])
+        pages[0].close.assert_awaited_once()
+
+
+CHROME_PATH = "/opt/google/chrome/chrome"
+
+
+@skipUnless(os.path.exists(CHROME_PATH), "Google Chrome не установлен (воркер запускает channel=\"chrome\")")
+class AsyncEngineStandInTests(SimpleTestCase):
+    def test_async_engine_files_batch_on_standin(self):
+        from application.officesud.benchmarks import engine_benchmark
+
+        src = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(engine_benchmark.__file__)))))
+        result = subprocess.run(
+            [
+                sys.executable, "-m", "application.officesud.benchmarks.engine_benchmark",
+                "--engine", "async", "--cases", "6", "--concurrency", "3",
+                "--pace-factor", "0.01", "--latency-ms", "20", "--json",
+            ],
+            cwd=src, capture_output=True, text=True, timeout=600,
+        )
+
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        report = json.loads(result.stdout[result.stdout.index("["):])[0]
+        self.assertEqual((report["engine"], report["filed"], report["cases"]), ("async", 6, 6))
+
+
+class FormLocator:
+    def __init__(self, page, name):
+        self.page = page
+        self.name = name
+
+    def input_value(self, timeout=None):
+        return self.page.values.get(self.name)
+
+    def select_option(self, value):
+        self.page.calls.append(("select_option", self.name, value))
+        self.page.values[self.name] = value
+
+    def is_visible(self, timeout=None):
+        return self.page.visible.pop(0) if self.page.visible else True
+
+    def count(self):
+        return 0
+
+    def click(self):
+        self.page.calls.append(("click", self.name))
+
+    def wait_for(self, state=None, timeout=None):
+        if self.name in self.page.missing:
+            from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+            raise PlaywrightTimeoutError(f"{self.name} not visible")
+
+
+class FormPage:
+    """Страница формы подачи для sync Filler: значения полей по подписи, вызовы — в журнал."""
+
+    def __init__(self, values=None, visible=(), missing=()):
+        self.values = dict(values or {})
+        self.visible = list(visible)
+        self.missing = set(missing)
+        self.calls = []
+
+    def get_by_label(self, label):
+        return FormLocator(self, label)
+
+    def get_by_role(self, role, name):
+        return FormLocator(self, name)
+
+    def locator(self, selector):
+        return FormLocator(self, selector)
+
+    def wait_for_load_state(self, *args, **kwargs):
+        pass
+
+    def goto(self, url, **kwargs):
+        self.calls.append(("goto", url))
+
+
+class FillerFormReuseTests(SimpleTestCase):
+    def filler(self, page):
+        from application.officesud.System.filler import Filler
+
+        return Filler(page, pacer=mock.Mock(**{"pause.return_value": 0.0}))
+
+    def test_saved_time_is_the_running_average_of_real_selects(self):
+        from application.officesud.System import filler as filler_module
+
+        page = FormPage()
+        filler = self.filler(page)
+        with mock.patch.object(filler_module.time, "monotonic", side_effect=[0.0, 2.0, 10.0, 11.0]):
+            self.assertTrue(filler.select("Саты", "FIRSTINSTANCE"))
+            self.assertFalse(filler.select("Саты", "FIRSTINSTANCE"))
+            self.assertEqual(filler.take_form_metrics(), {"form_reused": 1, "form_saved_ms": 2000})
+
+            # принудительный выбор того же значения обновляет оценку: (2.0 + 1.0) / 2
+            self.assertTrue(filler.select("Саты", "FIRSTINSTANCE", reuse=False))
+            self.assertFalse(filler.select("Саты", "FIRSTINSTANCE"))
+
+        self.assertEqual(filler.take_form_metrics(), {"form_reused": 1, "form_saved_ms": 1500})
+        self.assertEqual(filler.take_form_metrics(), {})
+        self.assertEqual(len([call for call in page.calls if call[0] == "select_option"]), 2)
+
+    def test_reuse_disabled_always_selects(self):
+        page = FormPage({"Саты": "FIRSTINSTANCE"})
+        filler = self.filler(page)
+        filler.form_reuse = False
+
+        self.assertTrue(filler.select("Саты", "FIRSTINSTANCE"))
+        self.assertEqual(filler.take_form_metrics(), {})
+
+    def test_modal_savings_are_reported_and_reset(self):
+        filler = self.filler(FormPage())
+        filler.modal.calls_saved = 4
+
+        self.assertEqual(filler.take_form_metrics(), {"modal_calls_saved": 4})
+        self.assertEqual(filler.modal.calls_saved, 0)
+
+    def test_region_and_court_kept_from_previous_case_are_not_reselected(self):
+        from application.officesud.System.filler import COURT_LABEL, REGION_LABEL
+
+        page = FormPage({REGION_LABEL: "5", COURT_LABEL: "7"})
+        filler = self.filler(page)
+
+        filler.open_lawsuit_filing_form("5", "7")
+
+        selected = [call[1] for call in page.calls if call[0] == "select_option"]
+        self.assertNotIn(REGION_LABEL, selected)
+        self.assertNotIn(COURT_LABEL, selected)
+        self.assertEqual((filler.court_id, filler.take_form_metrics()["form_reused"]), ("7", 2))
+
+    def test_failed_attempt_forces_reselection(self):
+        from application.officesud.System.filler import COURT_LABEL, REGION_LABEL
+
+        # первая попытка: поле суда так и не появилось — форме больше не доверяем
+        page = FormPage({REGION_LABEL: "5", COURT_LABEL: "7"}, visible=[False])
+        filler = self.filler(page)
+
+        filler.open_lawsuit_filing_form("5", "7")
+
+        selected = [call[1:] for call in page.calls if call[0] == "select_option"]
+        self.assertIn((REGION_LABEL, "5"), selected)
+        self.assertIn((COURT_LABEL, "7"), selected)
+        self.assertEqual(filler.take_form_metrics()["form_reused"], 1)
+        self.assertEqual(filler.court_id, "7")
+
+
+class FillerDeepLinkTests(SimpleTestCase):
+    DEEP_LINK = "https://office.sud.kz/form/lawsuit/new.xhtml"
+
+    def setUp(self):
+        from application.officesud.System import filler as filler_module
+
+        patcher = mock.patch.object(filler_module, "FILING_FORM_URL", self.DEEP_LINK)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.filler_module = filler_module
+
+    def filler(self, page):
+        return self.filler_module.Filler(page, governor=mock.Mock(), pacer=mock.Mock(**{"pause.return_value": 0.0}))
+
+    def navigation(self, page):
+        return [call for call in page.calls if call[0] in ("goto", "click")][:3]
+
+    def test_deep_link_opens_form_without_cabinet(self):
+        page = FormPage()
+        filler = self.filler(page)
+
+        filler.open_lawsuit_filing_form("5", "7")
+
+        self.assertEqual(self.navigation(page), [("goto", self.DEEP_LINK), ("click", "Жіберу")])
+        self.assertEqual(filler.court_id, "7")
+
+    def test_deep_link_falls_back_to_cabinet(self):
+        page = FormPage(missing={"Сот ісін жүргізу түрі"})
+        filler = self.filler(page)
+
+        filler.open_lawsuit_filing_form("5", "7")
+
+        self.assertEqual(self.navigation(page), [
+            ("goto", self.DEEP_LINK),
+            ("goto", self.filler_module.CABINET_URL),
+            ("click", "Құжаттарды жіберу"),
+        ])
+        # токен лимита — на каждую навигацию: ссылка, кабинет, кнопка «Құжаттарды жіберу»
+        self.assertGreaterEqual(filler.governor.acquire.call_count, 3)
+        self.assertEqual(filler.court_id, "7")
+
+    def test_open_cabinet_is_skipped_with_deep_link(self):
+        page = FormPage()
+
+        self.filler(page).open_cabinet()
+
+        self.assertEqual(page.calls, [])
+
+    def test_open_cabinet_without_deep_link(self):
+        page = FormPage()
+
+        with mock.patch.object(self.filler_module, "FILING_FORM_URL", ""):
+            self.filler(page).open_cabinet()
+
+        self.assertEqual(page.calls, [("goto", self.filler_module.CABINET_URL)])
+
+
+class BrowserProfileTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+
+    def profile(self, **kwargs):
+        from application.officesud.System.browser_profile import BrowserProfile
+
+        profile = BrowserProfile(root=self.root, **kwargs)
+        self.addCleanup(profile.release)
+        return profile
+
+    def cache_file(self, slot, name, size, age):
+        directory = os.path.join(self.root, f"profile-{slot}", "Default", "Cache")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_workers_take_separate_slots(self):
+        first, second = self.profile(slots=2), self.profile(slots=2)
+
+        self.assertNotEqual(first.acquire(), second.acquire())
+        with self.assertRaisesMessage(RuntimeError, "busy"):
+            self.profile(slots=2).acquire()
+
+        first.release()
+        self.assertEqual(self.profile(slots=2).acquire(), os.path.join(self.root, "profile-0"))
+
+    def test_oldest_cache_of_free_profiles_is_evicted_first(self):
+        old = self.cache_file(1, "old", 600 * 1024, age=300)
+        new = self.cache_file(1, "new", 600 * 1024, age=10)
+        cookies = os.path.join(self.root, "profile-1", "Default", "Cookies")
+        with open(cookies, "wb") as f:
+            f.write(b"x" * 2 * 1024 * 1024)
+
+        freed = self.profile(max_mb=1).enforce_limit()
+
+        self.assertEqual(freed, 600 * 1024)
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
+        self.assertTrue(os.path.exists(cookies))
+
+    def test_cache_of_busy_profile_is_left_to_chromium(self):
+        busy = self.profile(slots=1)
+        busy.acquire()
+        cached = self.cache_file(0, "entry", 2 * 1024 * 1024, age=300)
+
+        self.assertEqual(self.profile(max_mb=1, slots=2).enforce_limit(), 0)
+        self.assertTrue(os.path.exists(cached))
+
+    def test_disk_cache_size_is_a_share_of_the_cap(self):
+        self.assertEqual(self.profile(max_mb=512, slots=4).launch_args(), ["--disk-cache-size=134217728"])
+        self.assertEqual(self.profile(max_mb=16, slots=16).launch_args(), [f"--disk-cache-size={16 * 1024 * 1024}"])
+
+
+class PersistentBrowserTests(OfficeSudSQLiteTestCase):
+    def processor(self, profile):
+        from application.officesud.System.case_processor import CaseProcessor
+
+        processor = CaseProcessor("B1", threading.Event(), heartbeat=mock.Mock(worker_id="w"))
+        processor.profile = profile
+        processor.session = mock.Mock()
+        return processor
+
+    def test_persistent_profile_launches_with_cache_cap_and_saved_cookies(self):
+        from application.officesud.System.browser_profile import BrowserProfile
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        profile = BrowserProfile(root=tmp.name, max_mb=64, slots=2)
+        self.addCleanup(profile.release)
+        processor = self.processor(profile)
+        playwright = mock.Mock()
+
+        browser, context = processor._open_browser(playwright, "/sessions/default.json")
+
+        self.assertIsNone(browser)
+        self.assertIs(context, playwright.chromium.launch_persistent_context.return_value)
+        args, kwargs = playwright.chromium.launch_persistent_context.call_args
+        self.assertEqual(args, (os.path.join(tmp.name, "profile-0"),))
+        self.assertEqual(kwargs["args"], [f"--disk-cache-size={32 * 1024 * 1024}"])
+        processor.session.apply.assert_called_once_with(context, "/sessions/default.json")
+        playwright.chromium.launch.assert_not_called()
+
+    def test_without_cache_dir_context_is_disposable(self):
+        from application.officesud.System.browser_profile import BrowserProfile
+
+        processor = self.processor(BrowserProfile(root=""))
+        playwright = mock.Mock()
+
+        browser, context = processor._open_browser(playwright, None)
+
+        self.assertIs(browser, playwright.chromium.launch.return_value)
+        browser.new_context.assert_called_once_with(viewport=mock.ANY, storage_state=None)
+        playwright.chromium.launch_persistent_context.assert_not_called()
+
+    def test_worker_container_gets_cache_settings(self):
+        task = mock.Mock(pk=1, batch_id="B1")
+        client = mock.Mock(**{"run_container.return_value": "c0ffee"})
+
+        with mock.patch.object(workers, "get_docker_client", return_value=client), \
+                mock.patch.object(workers, "WORKER_MODE", "docker"), \
+                mock.patch.object(workers, "BROWSER_CACHE_DIR", "/data/browser"), \
+                mock.patch.object(workers, "BROWSER_CACHE_MAX_MB", 256):
+            workers.launch_worker(task)
+
+        env = client.run_container.call_args.kwargs["env"]
+        self.assertEqual(
+            (env["OFFICESUD_BROWSER_CACHE_DIR"], env["OFFICESUD_BROWSER_CACHE_MAX_MB"]), ("/data/browser", "256"),
+        )
+
+
+class PipelinePrefetchTests(OfficeSudSQLiteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fillers = {
+            label: mock.Mock(label=label, prepared_case_id=None, submitted=False, **{"take_form_metrics.return_value": {}})
+            for label in ("A", "B")
+        }
+        self.seen = []
+
+    def make_processor(self):
+        from application.officesud.System.case_processor import CaseProcessor
+
+        processor = CaseProcessor("B1", threading.Event(), heartbeat=mock.Mock(worker_id="w"), pipeline=True)
+        processor.session = mock.Mock()
+        processor.profile = mock.Mock()
+        processor.trace = mock.Mock(enabled=False)
+        processor.watchdog = mock.Mock(**{"due.return_value": None, "metrics.return_value": {}})
+        processor._open_browser = mock.Mock(return_value=(mock.Mock(), mock.Mock()))
+        processor._fresh_page = lambda filler: filler
+
+        def open_pages(context, session_state):
+            processor.filler, processor._spare_filler = self.fillers["A"], self.fillers["B"]
+            return self.fillers["A"]
+
+        processor._open_pages = open_pages
+        return processor
+
+    def file_case(self, filler, case_data):
+        """Вместо формы: запоминаем вкладку и заранее открытую форму, подаём дело и готовим следующее."""
+        self.seen.append((filler.label, case_data["InternalID"], filler.prepared_case_id == case_data["DB_Case_ID"]))
+        filler.prepared_case_id = None
+        office_sqlite.save_case_talon(case_data["DB_Case_ID"], f"T-{case_data['DB_Case_ID']}", "w")
+        case_data["TalonID"] = "T"
+        self.processor._after_case(filler)
+
+    def run_processor(self, process):
+        from application.officesud.System import case_processor
+
+        self.processor = self.make_processor()
+        self.processor._process_single_case = process
+        with mock.patch.object(case_processor, "sync_playwright"):
+            self.processor.run_process()
+
+    def test_next_case_runs_on_the_page_prepared_while_the_current_one_settled(self):
+        self.insert_cases("B1", 3)
+
+        self.run_processor(self.file_case)
+
+        self.assertEqual(self.seen, [("A", "B1-0", False), ("B", "B1-1", True), ("A", "B1-2", True)])
+        self.fillers["B"].open_lawsuit_filing_form.assert_called_once()
+        self.assertEqual(office_sqlite.get_batch_progress("B1"), (3, 0, 3))
+
+    def test_failed_prefetch_leaves_the_case_to_be_opened_normally(self):
+        self.insert_cases("B1", 2)
+        self.fillers["B"].open_lawsuit_filing_form.side_effect = RuntimeError("court list did not load")
+
+        with self.assertLogs("CaseProcessor", level="ERROR"):
+            self.run_processor(self.file_case)
+
+        self.assertEqual(self.seen, [("A", "B1-0", False), ("B", "B1-1", False)])
+        self.assertEqual(self.fillers["B"].open_cabinet.call_count, 2)
+        self.assertEqual(office_sqlite.get_batch_progress("B1"), (2, 0, 2))
+
+    def test_prefetched_case_is_released_when_current_case_fails(self):
+        self.insert_cases("B1", 2)
+
+        def process(filler, case_data):
+            if case_data["InternalID"] == "B1-0":
+                self.processor._after_case(filler)
+                raise errors.CaseValidationError("bad IIN")
+            self.file_case(filler, case_data)
+
+        self.run_processor(process)
+
+        self.assertEqual(self.seen, [("A", "B1-1", False)])
+        self.assertEqual(office_sqlite.get_case_by_id(2)["AttemptCount"], 1)
+        self.assertEqual(office_sqlite.get_batch_progress("B1"), (1, 1, 2))
+
+    def test_case_returned_to_pool_after_an_empty_prefetch_is_still_claimed(self):
+        self.insert_cases("B1", 2)
+        held = office_sqlite.claim_case("other", 600, batch_id="B1")
+        # пока воркер делает паузу после подачи, другой воркер возвращает своё дело
+        self.fillers["A"].return_to_cabinet_home.side_effect = (
+            lambda: office_sqlite.release_case(held["DB_Case_ID"], "other", failed=False)
+        )
+
+        self.run_processor(self.file_case)
+
+        self.assertEqual([(label, prepared) for label, _, prepared in self.seen], [("A", False), ("A", False)])
+        self.assertEqual(self.seen[1][1], held["InternalID"])
+        self.fillers["B"].open_lawsuit_filing_form.assert_not_called()
+        self.assertEqual(office_sqlite.get_batch_progress("B1"), (2, 0, 2))
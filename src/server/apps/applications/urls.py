@@ -1,10 +1,47 @@
 from django.urls import path
-from server.apps.applications.views import start_officesud_batch, get_officesud_progress
+
+from server.apps.applications import worker_api
+from server.apps.applications.views import (
+    control_officesud_task,
+    download_officesud_trace,
+    export_officesud_task,
+    get_officesud_changes,
+    get_officesud_container,
+    get_officesud_progress,
+    start_officesud_batch,
+)
 
 app_name = "applications"
 
 urlpatterns = [
     path("office-sud/start/", start_officesud_batch, name="office_sud_start"),
     path("office-sud/progress/<int:task_id>/", get_officesud_progress, name="office_sud_progress"),
+    path("office-sud/container/<int:task_id>/", get_officesud_container, name="office_sud_container"),
+    path("office-sud/changes/", get_officesud_changes, name="office_sud_changes"),
+    path(
+        "office-sud/<int:task_id>/traces/<path:name>",
+        download_officesud_trace,
+        name="office_sud_trace",
+    ),
+    path("office-sud/<int:task_id>/export/", export_officesud_task, name="office_sud_export"),
+    path(
+        "office-sud/<int:task_id>/<str:action>/",
+        control_officesud_task,
+        name="office_sud_control",
+    ),
+
+    path("office-sud/worker/claim/", worker_api.claim_case, name="office_sud_worker_claim"),
+    path("office-sud/worker/heartbeat/", worker_api.heartbeat, name="office_sud_worker_heartbeat"),
+    path("office-sud/worker/rate/", worker_api.acquire_rate_token, name="office_sud_worker_rate"),
+    path(
+        "office-sud/worker/cases/<int:case_id>/documents/<str:column>/<int:index>/",
+        worker_api.download_document,
+        name="office_sud_worker_document",
+    ),
+    path("office-sud/worker/cases/<int:case_id>/events/", worker_api.report_event, name="office_sud_worker_events"),
+    path("office-sud/worker/cases/<int:case_id>/lease/", worker_api.renew_lease, name="office_sud_worker_lease"),
+    path("office-sud/worker/cases/<int:case_id>/talon/", worker_api.report_talon, name="office_sud_worker_talon"),
+    path("office-sud/worker/cases/<int:case_id>/release/", worker_api.release_case, name="office_sud_worker_release"),
+    path("office-sud/worker/cases/<int:case_id>/trace/", worker_api.upload_trace, name="office_sud_worker_trace"),
 
 ]
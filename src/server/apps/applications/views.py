@@ -1,23 +1,39 @@
+import hashlib
+import hmac
 import logging
 import os
+import tempfile
 import uuid
-import subprocess
 from http import HTTPStatus
 from pathlib import Path
 
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.http import HttpRequest, HttpResponseBadRequest, JsonResponse
-from django.views.decorators.http import require_GET
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpRequest,
+    HttpResponseBadRequest,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.utils.http import content_disposition_header
+from django.views.decorators.http import require_GET, require_POST
 
-from application.officesud.System import dataloader, sqlite as office_sqlite  # NEW
+from application.officesud.System import archive, dataloader, docstore, export, ordering, sqlite as office_sqlite, tracing  # NEW
+from application.officesud.System.control import COMMAND_CANCEL, COMMAND_PAUSE, COMMAND_RUN
+from server.apps.applications.docker_client import DockerError
 from server.apps.applications.models import OfficeSudTask  # NEW
+from server.apps.applications.workers import get_container_status, launch_worker
 
-PLAYWRIGHT_IMAGE = getattr(settings, "OFFICESUD_PLAYWRIGHT_IMAGE", "dj_pw_officesud_worker:latest")
 UPLOAD_DIR = getattr(settings, "OFFICESUD_UPLOAD_DIR", Path(settings.BASE_DIR) / "officesud_uploads")
 MAX_WORKERS = getattr(settings, "PLAYWRIGHT_MAX_WORKERS", 3)
-
-DOCKER_DJANGO_CONTAINER = getattr(settings, "DOCKER_DJANGO_CONTAINER", "app")
+OPTIMIZE_CASE_ORDER = getattr(settings, "OFFICESUD_OPTIMIZE_CASE_ORDER", False)
+CHANGES_TOKEN = getattr(settings, "OFFICESUD_CHANGES_TOKEN", "")
+IMPORT_MAX_FILES = getattr(settings, "OFFICESUD_IMPORT_MAX_FILES", 20)
+MAX_CASE_ATTEMPTS = getattr(settings, "OFFICESUD_MAX_CASE_ATTEMPTS", 3)
+DUPLICATE_CASES = getattr(settings, "OFFICESUD_DUPLICATE_CASES", dataloader.DUPLICATES)
 
 db_host_dir = str(settings.OFFICESUD_DB_DIR)  # src/officesud_db
 
@@ -33,7 +49,7 @@ def start_officesud_batch(request: HttpRequest):
 
     user_has_active = OfficeSudTask.objects.filter(
         user=user,
-        status__in=[OfficeSudTask.STATUS_PENDING, OfficeSudTask.STATUS_RUNNING],
+        status__in=OfficeSudTask.ACTIVE_STATUSES,
     ).exists()
 
     if user_has_active:
@@ -47,7 +63,7 @@ def start_officesud_batch(request: HttpRequest):
         )
 
     active_tasks = OfficeSudTask.objects.filter(
-        status__in=[OfficeSudTask.STATUS_PENDING, OfficeSudTask.STATUS_RUNNING],
+        status__in=OfficeSudTask.ACTIVE_STATUSES,
     ).count()
 
     if active_tasks >= MAX_WORKERS:
@@ -60,47 +76,100 @@ def start_officesud_batch(request: HttpRequest):
             status=HTTPStatus.TOO_MANY_REQUESTS,
         )
 
-    excel_file = request.FILES.get("excel_file")
-    if not excel_file:
+    excel_files = request.FILES.getlist("excel_file")
+    if not excel_files:
         return HttpResponseBadRequest("Требуется загрузить EXCEL-файл")
+    if len(excel_files) > IMPORT_MAX_FILES:
+        return JsonResponse(
+            {"error": f"Не больше {IMPORT_MAX_FILES} файлов за одну загрузку", "code": "too_many_files"},
+            status=HTTPStatus.BAD_REQUEST,
+        )
 
     UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
-    ext = os.path.splitext(excel_file.name)[1]
-    filename = f"{user.id}_{uuid.uuid4().hex}{ext}"
-    file_path = UPLOAD_DIR / filename
-
-    with file_path.open("wb+") as dest:
-        for chunk in excel_file.chunks():
-            dest.write(chunk)
+    # Все файлы загрузки становятся одним пакетом; каждый хэшируется при записи на диск
+    file_paths, filenames, file_hashes = [], [], []
+    for excel_file in excel_files:
+        ext = os.path.splitext(excel_file.name)[1]
+        filename = f"{user.id}_{uuid.uuid4().hex}{ext}"
+        file_path = UPLOAD_DIR / filename
+        file_hash = hashlib.sha256()
+        with file_path.open("wb+") as dest:
+            for chunk in excel_file.chunks():
+                file_hash.update(chunk)
+                dest.write(chunk)
+        file_paths.append(file_path)
+        filenames.append(filename)
+        file_hashes.append(file_hash.hexdigest())
     logger.info(
-        "OfficeSud batch start requested by user_id=%s, filename=%s, size=%s bytes",
+        "OfficeSud batch start requested by user_id=%s, files=%s, size=%s bytes",
         user.id,
-        excel_file.name,
-        excel_file.size,
+        [excel_file.name for excel_file in excel_files],
+        sum(excel_file.size for excel_file in excel_files),
     )
     logger.info(
         "Using OFFICESUD_DB_PATH=%s",
         settings.OFFICESUD_DB_PATH,
     )
+
+    def discard_uploads():
+        for path in file_paths:
+            path.unlink(missing_ok=True)
+
+    if not request.POST.get("force_reimport"):
+        for excel_file, file_hash in zip(excel_files, file_hashes):
+            previous = _previous_import(file_hash, user)
+            if previous:
+                discard_uploads()
+                return JsonResponse(
+                    dict(
+                        previous,
+                        error=f"Файл {excel_file.name} уже загружен: пакет {previous['batch_id']}. "
+                              "Чтобы загрузить его ещё раз, отметьте «Загрузить повторно».",
+                        code="duplicate_file",
+                    ),
+                    status=HTTPStatus.CONFLICT,
+                )
+
+    # Архив документов распаковывается в хранилище потоково, прямо из загрузки;
+    # пути из Excel, найденные в архиве, становятся ссылками на хранилище.
+    documents = None
+    documents_zip = request.FILES.get("documents_zip")
+    if documents_zip:
+        try:
+            documents = docstore.ingest_bundle(documents_zip)
+        except docstore.BundleError as e:
+            logger.warning("Document bundle rejected for user_id=%s: %s", user.id, e)
+            discard_uploads()
+            return JsonResponse(
+                {"error": str(e), "code": "documents_bundle_error"},
+                status=HTTPStatus.BAD_REQUEST,
+            )
+
     try:
         logger.info("Initializing OfficeSud SQLite DB...")
         office_sqlite.check_and_initialize_db()
-        logger.info("DB initialized, loading Excel into DB from %s", file_path)
+        logger.info("DB initialized, loading Excel into DB from %s", file_paths)
 
-        batch_id = dataloader.load_excel_to_db(str(file_path))
+        batch_id = dataloader.load_files_to_db(
+            file_paths,
+            documents=documents,
+            duplicates=DUPLICATE_CASES,
+            file_names=[excel_file.name for excel_file in excel_files],
+        )
         logger.info("Excel loaded to DB successfully, batch_id=%s", batch_id)
 
-        try:
-            file_path.unlink()
-            logger.info("Uploaded Excel file %s deleted after import", file_path)
-        except OSError as e:
-            logger.warning("Не удалось удалить Excel %s: %s", file_path, e)
+        for file_path in file_paths:
+            try:
+                file_path.unlink()
+                logger.info("Uploaded Excel file %s deleted after import", file_path)
+            except OSError as e:
+                logger.warning("Не удалось удалить Excel %s: %s", file_path, e)
     except Exception as e:
         logger.exception(
-            "Excel parsing/DB load failed for user_id=%s, file=%s",
+            "Excel parsing/DB load failed for user_id=%s, files=%s",
             user.id,
-            file_path,
+            file_paths,
         )
         return JsonResponse(
             {
@@ -109,9 +178,17 @@ def start_officesud_batch(request: HttpRequest):
             },
             status=HTTPStatus.BAD_REQUEST,
         )
+
+    if request.POST.get("optimize_order") or OPTIMIZE_CASE_ORDER:
+        try:
+            ordering.optimize_batch_order(batch_id)
+        except Exception:
+            # порядок дел — только оптимизация, пакет подаём и в порядке Excel
+            logger.exception("Case order optimization failed for batch_id=%s", batch_id)
+
     task = OfficeSudTask.objects.create(
         user=user,
-        excel_file=str(filename),
+        excel_file=", ".join(filenames)[:OfficeSudTask._meta.get_field("excel_file").max_length],
         batch_id=batch_id,
         status=OfficeSudTask.STATUS_PENDING,
     )
@@ -122,45 +199,40 @@ def start_officesud_batch(request: HttpRequest):
         user.id,
     )
     try:
-        logger.info("Starting worker for batch_id=%s", batch_id)
-        container_id = subprocess.check_output(
-            [
-                "docker", "run", "-d", "--rm",
-                "--volumes-from", DOCKER_DJANGO_CONTAINER,
-                "-e", f"OFFICESUD_DB_PATH={settings.OFFICESUD_DB_PATH}",
-                PLAYWRIGHT_IMAGE,
-                batch_id,  # <-- передаём batch_id, а не путь к файлу
-            ],
-            text=True,
-            stderr=subprocess.STDOUT,
-        ).strip()
-        logger.info(
-            "Worker started for batch_id=%s, container_id=%s",
-            batch_id,
-            container_id,
-        )
-    except subprocess.CalledProcessError as e:
-        logger.error(
-            "Failed to start worker for %s: code=%s, output=%r",
-            batch_id, e.returncode, e.output,
-        )
-        task.status = OfficeSudTask.STATUS_ERROR
-        task.last_error = e.output
-        task.save(update_fields=["status", "last_error", "updated_at"])
+        launch_worker(task)
+    except (DockerError, OSError):
         return JsonResponse({"error": "Failed to start worker"}, status=HTTPStatus.INTERNAL_SERVER_ERROR)
 
-    task.container_id = container_id
-    task.status = OfficeSudTask.STATUS_RUNNING
-    task.save(update_fields=["status", "container_id", "updated_at"])
+    response = {
+        "status": "started",
+        "file": filenames[0],
+        "files": filenames,
+        "task_id": task.pk,
+        "batch_id": batch_id,
+    }
+    if documents is not None:
+        response["documents"] = dict(documents.stats, unmatched=sorted(documents.unmatched)[:50])
+    imported = office_sqlite.get_batch_import(batch_id)
+    if imported:
+        response["import"] = {key.lower(): imported[key] for key in ("Files", "Rows", "Duplicates", "Skipped")}
+    return JsonResponse(response)
 
-    return JsonResponse(
-        {
-            "status": "started",
-            "file": filename,
-            "task_id": task.pk,
-            "batch_id": batch_id,
-        }
-    )
+
+def _previous_import(file_hash: str, user):
+    """Пакет, в который уже загружен файл с таким содержимым, если он ещё есть в БД или архиве."""
+    office_sqlite.check_and_initialize_db()
+    previous = office_sqlite.find_import_file(file_hash)
+    if previous is None:
+        return None
+    batch_id = previous["BatchID"]
+    if not office_sqlite.count_batch_rows(batch_id)[0] and not archive.is_archived(batch_id):
+        return None
+    found = {"batch_id": batch_id, "uploaded_at": previous["CreatedAt"], "task_id": None}
+    task = OfficeSudTask.objects.filter(batch_id=batch_id).first()
+    # задачу другого пользователя не показываем — только сам факт загрузки
+    if task is not None and (task.user_id == user.id or user.is_staff):
+        found.update(task_id=task.pk, status=task.status)
+    return found
 
 
 @login_required
@@ -178,12 +250,13 @@ def get_officesud_progress(request: HttpRequest, task_id: int):
                 "status": task.status,
                 "progress": 0,
                 "processed": 0,
+                "needs_review": 0,
                 "total": 0,
             }
         )
 
     try:
-        processed, total = office_sqlite.get_batch_progress(batch_id)
+        filed, parked, total = office_sqlite.get_batch_progress(batch_id, MAX_CASE_ATTEMPTS)
     except Exception as exc:
         task.status = OfficeSudTask.STATUS_ERROR
         task.last_error = str(exc)
@@ -196,12 +269,14 @@ def get_officesud_progress(request: HttpRequest, task_id: int):
             status=HTTPStatus.INTERNAL_SERVER_ERROR,
         )
 
+    # отложенные на разбор дела воркер больше не возьмёт: для прогресса они обработаны
     if total <= 0:
         percent = 0
     else:
-        percent = int((processed / total) * 100)
+        percent = int(((filed + parked) / total) * 100)
 
-    if percent >= 100 and task.status != OfficeSudTask.STATUS_SUCCESS:
+    # отменённую оператором или упавшую задачу не переписываем в SUCCESS
+    if percent >= 100 and task.status in OfficeSudTask.ACTIVE_STATUSES:
         task.status = OfficeSudTask.STATUS_SUCCESS
         task.save(update_fields=["status", "updated_at"])
 
@@ -209,7 +284,169 @@ def get_officesud_progress(request: HttpRequest, task_id: int):
         {
             "status": task.status,
             "progress": percent,
-            "processed": processed,
+            "processed": filed,
+            "needs_review": parked,
             "total": total,
         }
-    )
\ No newline at end of file
+    )
+
+@login_required
+@require_GET
+def get_officesud_container(request: HttpRequest, task_id: int):
+    try:
+        task = OfficeSudTask.objects.get(pk=task_id, user=request.user)
+    except OfficeSudTask.DoesNotExist:
+        return JsonResponse({"error": "Задача не найдена"}, status=HTTPStatus.NOT_FOUND)
+
+    try:
+        container = get_container_status(task)
+    except (DockerError, OSError) as exc:
+        logger.warning("Docker API unavailable for task_id=%s: %s", task.pk, exc)
+        return JsonResponse(
+            {"error": "Docker API недоступен", "code": "docker_unavailable"},
+            status=HTTPStatus.SERVICE_UNAVAILABLE,
+        )
+
+    return JsonResponse(
+        {
+            "task_id": task.pk,
+            "status": task.status,
+            "container_id": task.container_id,
+            "container": container,
+        }
+    )
+
+
+@staff_member_required
+@require_GET
+def download_officesud_trace(request: HttpRequest, task_id: int, name: str):
+    """Архив трассы сбоя из карточки задачи в админке."""
+    try:
+        task = OfficeSudTask.objects.get(pk=task_id)
+    except OfficeSudTask.DoesNotExist:
+        raise Http404("Задача не найдена")
+
+    # отдаём только трассы, записанные для пакета этой задачи
+    if not task.batch_id or name not in {t.get("file") for t in office_sqlite.get_batch_traces(task.batch_id)}:
+        raise Http404("Трасса не найдена")
+    path = tracing.trace_path(name)
+    if path is None or not os.path.isfile(path):
+        raise Http404("Трасса удалена по сроку хранения")
+    return FileResponse(open(path, "rb"), as_attachment=True, filename=os.path.basename(path))
+
+
+@login_required
+@require_GET
+def export_officesud_task(request: HttpRequest, task_id: int):
+    """
+    Результаты пакета задачи: ?format=xlsx (по умолчанию), csv или parquet.
+    CSV отдаётся потоком прямо из курсора; xlsx и Parquet пишутся порциями
+    во временный файл (формат дописывает оглавление в конце) и отдаются с диска.
+    """
+    try:
+        task = OfficeSudTask.objects.get(pk=task_id)
+    except OfficeSudTask.DoesNotExist:
+        raise Http404("Задача не найдена")
+    if task.user_id != request.user.id and not request.user.is_staff:
+        raise Http404("Задача не найдена")
+    if not task.batch_id:
+        raise Http404("У задачи нет пакета")
+
+    fmt = request.GET.get("format", "xlsx")
+    if fmt not in export.available_formats():
+        return JsonResponse(
+            {"error": f"Формат выгрузки недоступен: {fmt}", "formats": export.available_formats()},
+            status=HTTPStatus.BAD_REQUEST,
+        )
+    filename = f"{task.batch_id}.{fmt}"
+    logger.info("OfficeSudTask %s: %s export requested by user_id=%s", task.pk, fmt, request.user.id)
+
+    if fmt == "csv":
+        response = StreamingHttpResponse(export.iter_csv(task.batch_id), content_type=export.FORMATS[fmt])
+        response["Content-Disposition"] = content_disposition_header(True, filename)
+        return response
+
+    # анонимный временный файл: удаляется, как только FileResponse его закроет
+    tmp = tempfile.TemporaryFile()
+    try:
+        export.export_batch(task.batch_id, tmp, fmt)
+    except Exception:
+        tmp.close()
+        raise
+    tmp.seek(0)
+    return FileResponse(tmp, as_attachment=True, filename=filename, content_type=export.FORMATS[fmt])
+
+
+def _changes_authorized(request: HttpRequest) -> bool:
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    header = request.headers.get("Authorization", "")
+    token = header[len("Bearer "):] if header.startswith("Bearer ") else ""
+    return bool(CHANGES_TOKEN) and hmac.compare_digest(token.encode(), CHANGES_TOKEN.encode())
+
+
+@require_GET
+def get_officesud_changes(request: HttpRequest):
+    """
+    Лента изменений дел для внешних систем: ?since=<курсор>&limit=&format=jsonl|csv&batch_id=.
+    Следующий курсор — в заголовке X-Next-Cursor (и в ChangeSeq последней строки),
+    X-Has-More: 1 — забрать следующую порцию сразу. Доступ: staff или Bearer OFFICESUD_CHANGES_TOKEN.
+    """
+    if not _changes_authorized(request):
+        return JsonResponse({"error": "Нет доступа к ленте изменений"}, status=HTTPStatus.UNAUTHORIZED)
+    try:
+        since = max(int(request.GET.get("since", 0)), 0)
+        limit = min(max(int(request.GET.get("limit", export.CHANGES_LIMIT)), 1), export.CHANGES_LIMIT)
+    except ValueError:
+        return JsonResponse({"error": "since и limit должны быть целыми"}, status=HTTPStatus.BAD_REQUEST)
+    fmt = request.GET.get("format", "jsonl")
+    if fmt not in export.CHANGE_FORMATS:
+        return JsonResponse({"error": f"Неизвестный формат: {fmt}"}, status=HTTPStatus.BAD_REQUEST)
+    batch_id = request.GET.get("batch_id") or None
+
+    office_sqlite.check_and_initialize_db()
+    until, has_more = office_sqlite.get_change_window(since, limit, batch_id)
+    response = StreamingHttpResponse(
+        export.iter_changes(since, until, fmt, batch_id),
+        content_type=export.CHANGE_FORMATS[fmt],
+    )
+    response["X-Next-Cursor"] = str(until)
+    response["X-Has-More"] = "1" if has_more else "0"
+    return response
+
+
+# Переходы статусов по командам управления: (допустимые исходные статусы, команда воркеру, новый статус)
+CONTROL_TRANSITIONS = {
+    "cancel": (OfficeSudTask.ACTIVE_STATUSES, COMMAND_CANCEL, OfficeSudTask.STATUS_CANCELLED),
+    "pause": ([OfficeSudTask.STATUS_RUNNING], COMMAND_PAUSE, OfficeSudTask.STATUS_PAUSED),
+    "resume": ([OfficeSudTask.STATUS_PAUSED], COMMAND_RUN, OfficeSudTask.STATUS_RUNNING),
+}
+
+
+@login_required
+@require_POST
+def control_officesud_task(request: HttpRequest, task_id: int, action: str):
+    if action not in CONTROL_TRANSITIONS:
+        return JsonResponse({"error": "Неизвестное действие"}, status=HTTPStatus.NOT_FOUND)
+    try:
+        task = OfficeSudTask.objects.get(pk=task_id, user=request.user)
+    except OfficeSudTask.DoesNotExist:
+        return JsonResponse({"error": "Задача не найдена"}, status=HTTPStatus.NOT_FOUND)
+
+    allowed_statuses, command, new_status = CONTROL_TRANSITIONS[action]
+    if task.status not in allowed_statuses:
+        return JsonResponse(
+            {
+                "error": f"Нельзя выполнить «{action}» для задачи в статусе «{task.get_status_display()}»",
+                "code": "invalid_task_status",
+            },
+            status=HTTPStatus.CONFLICT,
+        )
+
+    office_sqlite.check_and_initialize_db()
+    office_sqlite.set_batch_command(task.batch_id, command)
+    task.status = new_status
+    task.save(update_fields=["status", "updated_at"])
+    logger.info("OfficeSudTask %s: %s requested by user_id=%s", task.pk, action, request.user.id)
+
+    return JsonResponse({"task_id": task.pk, "status": task.status})
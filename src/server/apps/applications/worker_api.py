@@ -0,0 +1,290 @@
+"""
+Worker API: удалённые воркеры Playwright берут дела в аренду, скачивают документы
+и присылают события шагов, талоны и heartbeat только по HTTP — без общего тома с Django.
+"""
+import hmac
+import json
+import logging
+import math
+import os
+import shutil
+import tempfile
+from functools import wraps
+from http import HTTPStatus
+
+from django.conf import settings
+from django.http import FileResponse, HttpRequest, HttpResponse, JsonResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from application.officesud.System import docstore, sqlite as office_sqlite, tracing
+from server.apps.applications.models import OfficeSudTask
+
+WORKER_TOKEN = getattr(settings, "OFFICESUD_WORKER_TOKEN", "")
+DEFAULT_LEASE_SECONDS = getattr(settings, "OFFICESUD_LEASE_SECONDS", 900)
+MAX_CASE_ATTEMPTS = getattr(settings, "OFFICESUD_MAX_CASE_ATTEMPTS", 3)
+
+logger = logging.getLogger(__name__)
+
+
+def worker_token_required(view):
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request: HttpRequest, *args, **kwargs):
+        if not WORKER_TOKEN:
+            return JsonResponse({"error": "Worker API disabled"}, status=HTTPStatus.SERVICE_UNAVAILABLE)
+        header = request.headers.get("Authorization", "")
+        token = header[len("Bearer "):] if header.startswith("Bearer ") else ""
+        if not hmac.compare_digest(token.encode(), WORKER_TOKEN.encode()):
+            return JsonResponse({"error": "Invalid worker token"}, status=HTTPStatus.UNAUTHORIZED)
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def _json_body(request: HttpRequest) -> dict:
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _seconds(data: dict, key: str, default=None, positive: bool = False):
+    """
+    Длительность из тела запроса. Нет ключа — default; не число, бесконечность,
+    отрицательное (или ноль при positive=True) — ValueError.
+    """
+    value = data.get(key)
+    if value is None:
+        return default
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{key} must be a number")
+    if not math.isfinite(seconds) or seconds < 0 or (positive and seconds == 0):
+        raise ValueError(f"{key} must be a {'positive' if positive else 'non-negative'} number")
+    return seconds
+
+
+def _lease_seconds(data: dict) -> float:
+    return _seconds(data, "lease_seconds", DEFAULT_LEASE_SECONDS, positive=True)
+
+
+def _split_paths(value) -> list:
+    return [p.strip() for p in (value or "").split("*") if p.strip()]
+
+
+def _case_payload(case: dict) -> dict:
+    """Дело для воркера: пути к документам заменены ссылками на скачивание."""
+    payload = dict(case)
+    payload["Documents"] = {
+        column: [
+            {
+                "name": os.path.basename(path),
+                "url": reverse(
+                    "applications:office_sud_worker_document",
+                    args=[case["DB_Case_ID"], column, index],
+                ),
+            }
+            for index, path in enumerate(_split_paths(case.get(column)))
+        ]
+        for column in office_sqlite.DOCUMENT_COLUMNS
+    }
+    return payload
+
+
+@worker_token_required
+@require_POST
+def claim_case(request: HttpRequest):
+    data = _json_body(request)
+    worker_id = data.get("worker_id")
+    if not worker_id:
+        return JsonResponse({"error": "worker_id is required"}, status=HTTPStatus.BAD_REQUEST)
+
+    try:
+        lease_seconds = _lease_seconds(data)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=HTTPStatus.BAD_REQUEST)
+
+    batch_id = data.get("batch_id") or None
+    # воркер без пакета берёт дела только живых задач, а не завершённых или отменённых пакетов
+    batch_ids = None if batch_id else list(
+        OfficeSudTask.objects.filter(status__in=OfficeSudTask.ACTIVE_STATUSES).values_list("batch_id", flat=True)
+    )
+
+    office_sqlite.check_and_initialize_db()
+    case = office_sqlite.claim_case(
+        worker_id,
+        lease_seconds,
+        batch_id=batch_id,
+        max_attempts=MAX_CASE_ATTEMPTS,
+        batch_ids=batch_ids,
+    )
+    if case is None:
+        response = HttpResponse(status=HTTPStatus.NO_CONTENT)
+        # свежих дел нет, но упавшие ждут повтора — воркер подождёт, а не завершится
+        retry_in = office_sqlite.next_retry_in(batch_id, MAX_CASE_ATTEMPTS, batch_ids=batch_ids)
+        if retry_in is not None:
+            response["Retry-After"] = str(math.ceil(retry_in))
+        return response
+
+    logger.info("Case %s (%s) leased to worker %s", case["DB_Case_ID"], case["InternalID"], worker_id)
+    return JsonResponse(_case_payload(case))
+
+
+@worker_token_required
+@require_GET
+def download_document(request: HttpRequest, case_id: int, column: str, index: int):
+    if column not in office_sqlite.DOCUMENT_COLUMNS:
+        return JsonResponse({"error": "Unknown document column"}, status=HTTPStatus.NOT_FOUND)
+    case = office_sqlite.get_case_by_id(case_id)
+    if case is None:
+        return JsonResponse({"error": "Case not found"}, status=HTTPStatus.NOT_FOUND)
+
+    paths = _split_paths(case.get(column))
+    if index >= len(paths):
+        return JsonResponse({"error": "Document not found"}, status=HTTPStatus.NOT_FOUND)
+
+    # Отдаём только файлы, на которые ссылается само дело — как их видел бы локальный воркер.
+    file_path = docstore.resolve(paths[index])
+    if not os.path.isfile(file_path):
+        return JsonResponse({"error": f"File missing on server: {paths[index]}"}, status=HTTPStatus.NOT_FOUND)
+    return FileResponse(open(file_path, "rb"), as_attachment=True, filename=os.path.basename(file_path))
+
+
+@worker_token_required
+@require_POST
+def report_event(request: HttpRequest, case_id: int):
+    data = _json_body(request)
+    try:
+        lease_seconds = _lease_seconds(data)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=HTTPStatus.BAD_REQUEST)
+    office_sqlite.record_step_event(data)
+    renewed = office_sqlite.renew_lease(case_id, data.get("WorkerID"), lease_seconds)
+    if not renewed:
+        return JsonResponse({"error": "Lease lost", "code": "lease_lost"}, status=HTTPStatus.CONFLICT)
+    return JsonResponse({"status": "ok"})
+
+
+@worker_token_required
+@require_POST
+def renew_lease(request: HttpRequest, case_id: int):
+    data = _json_body(request)
+    try:
+        lease_seconds = _lease_seconds(data)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=HTTPStatus.BAD_REQUEST)
+    renewed = office_sqlite.renew_lease(case_id, data.get("worker_id"), lease_seconds)
+    if not renewed:
+        return JsonResponse({"error": "Lease lost", "code": "lease_lost"}, status=HTTPStatus.CONFLICT)
+    return JsonResponse({"status": "ok"})
+
+
+@worker_token_required
+@require_POST
+def report_talon(request: HttpRequest, case_id: int):
+    data = _json_body(request)
+    talon_id = (data.get("talon_id") or "").strip()
+    if not talon_id:
+        return JsonResponse({"error": "talon_id is required"}, status=HTTPStatus.BAD_REQUEST)
+    worker_id = data.get("worker_id")
+    if not worker_id:
+        return JsonResponse({"error": "worker_id is required"}, status=HTTPStatus.BAD_REQUEST)
+    if not office_sqlite.save_case_talon(case_id, talon_id, worker_id):
+        # дело подано, но аренда уже у другого воркера: талон сохраняем хотя бы в журнале
+        logger.warning("Case %s: TalonID=%s from worker %s rejected, lease lost", case_id, talon_id, worker_id)
+        return JsonResponse({"error": "Lease lost", "code": "lease_lost"}, status=HTTPStatus.CONFLICT)
+    logger.info("Case %s filed by worker %s, TalonID=%s", case_id, worker_id, talon_id)
+    return JsonResponse({"status": "ok"})
+
+
+@worker_token_required
+@require_POST
+def release_case(request: HttpRequest, case_id: int):
+    data = _json_body(request)
+    try:
+        retry_in = _seconds(data, "retry_in")
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=HTTPStatus.BAD_REQUEST)
+    office_sqlite.release_case(
+        case_id,
+        data.get("worker_id"),
+        failed=bool(data.get("failed", True)),
+        error_class=data.get("error_class"),
+        error=data.get("error"),
+        retry_in=retry_in,
+        needs_review=bool(data.get("needs_review")),
+    )
+    return JsonResponse({"status": "ok"})
+
+
+@worker_token_required
+@require_POST
+def upload_trace(request: HttpRequest, case_id: int):
+    """Архив трассы упавшего дела; имя на сервере строится по самому делу, а не по запросу."""
+    case = office_sqlite.get_case_by_id(case_id)
+    if case is None:
+        return JsonResponse({"error": "Case not found"}, status=HTTPStatus.NOT_FOUND)
+    try:
+        details = json.loads(request.GET.get("details") or "{}")
+    except ValueError:
+        details = {}
+
+    fd, tmp_path = tempfile.mkstemp(prefix="officesud-trace-", suffix=".zip")
+    try:
+        # поток, а не request.body: архив может быть больше DATA_UPLOAD_MAX_MEMORY_SIZE
+        with os.fdopen(fd, "wb") as dest:
+            shutil.copyfileobj(request, dest, 1024 * 1024)
+        name = tracing.trace_name(case)
+        tracing.store_trace(name, tmp_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    office_sqlite.record_step_event({
+        "BatchID": case["BatchID"],
+        "InternalID": case["InternalID"],
+        "WorkerID": details.pop("WorkerID", None),
+        "Step": "trace",
+        "Status": details.get("reason") or "failed",
+        "Details": dict(details, file=name),
+    })
+    return JsonResponse({"status": "ok", "file": name})
+
+
+@worker_token_required
+@require_POST
+def acquire_rate_token(request: HttpRequest):
+    data = _json_body(request)
+    key = data.get("key")
+    if not key:
+        return JsonResponse({"error": "key is required"}, status=HTTPStatus.BAD_REQUEST)
+    try:
+        default_rate = float(data["default_rate"])
+        default_burst = float(data["default_burst"])
+    except (KeyError, TypeError, ValueError):
+        return JsonResponse({"error": "default_rate and default_burst are required"}, status=HTTPStatus.BAD_REQUEST)
+
+    wait = office_sqlite.acquire_rate_token(key, default_rate, default_burst)
+    return JsonResponse({"wait": wait})
+
+
+@worker_token_required
+@require_POST
+def heartbeat(request: HttpRequest):
+    data = _json_body(request)
+    if not data.get("WorkerID"):
+        return JsonResponse({"error": "WorkerID is required"}, status=HTTPStatus.BAD_REQUEST)
+
+    columns = (
+        "WorkerID", "BatchID", "InternalID", "Step", "CasesDone", "ProcessRSS",
+        "BrowserRSS", "LastError", "StartedAt", "UpdatedAt", "ProgressAt",
+    )
+    office_sqlite.upsert_heartbeat({column: data.get(column) for column in columns})
+
+    batch_id = data.get("BatchID")
+    command = office_sqlite.get_batch_command(batch_id) if batch_id else None
+    return JsonResponse({"batch_id": batch_id, "command": command})
@@ -0,0 +1,79 @@
+import logging
+
+from django.conf import settings
+
+from application.officesud.System import sqlite as office_sqlite
+from application.officesud.System.control import COMMAND_RUN
+from server.apps.applications.docker_client import ContainerNotFound, DockerError, get_docker_client
+from server.apps.applications.models import OfficeSudTask
+
+PLAYWRIGHT_IMAGE = getattr(settings, "OFFICESUD_PLAYWRIGHT_IMAGE", "dj_pw_officesud_worker:latest")
+DOCKER_DJANGO_CONTAINER = getattr(settings, "DOCKER_DJANGO_CONTAINER", "app")
+WORKER_MODE = getattr(settings, "OFFICESUD_WORKER_MODE", "docker")
+BATCH_SHARDS = getattr(settings, "OFFICESUD_BATCH_SHARDS", 1)
+BROWSER_CACHE_DIR = getattr(settings, "OFFICESUD_BROWSER_CACHE_DIR", "")
+BROWSER_CACHE_MAX_MB = getattr(settings, "OFFICESUD_BROWSER_CACHE_MAX_MB", 512)
+PREPROCESS_DOCUMENTS = getattr(settings, "OFFICESUD_PREPROCESS_DOCUMENTS", False)
+
+logger = logging.getLogger(__name__)
+
+
+def launch_worker(task: OfficeSudTask) -> str:
+    """
+    Запускает контейнер воркера для batch_id задачи (аналог `docker run -d`)
+    и переводит задачу в RUNNING. Контейнер не удаляется сам (без --rm): код выхода
+    читает reconciler и удаляет его через remove_container. В режиме remote только открывает пакет для
+    удалённых воркеров. При ошибке Docker задача помечается ERROR,
+    исключение пробрасывается дальше.
+    """
+    logger.info("Starting worker for batch_id=%s", task.batch_id)
+    # сбрасываем cancel/pause, оставшиеся от прошлого запуска этого пакета
+    office_sqlite.set_batch_command(task.batch_id, COMMAND_RUN)
+    if WORKER_MODE == "remote":
+        # Контейнер не нужен: дела пакета разберут удалённые воркеры через worker API.
+        task.status = OfficeSudTask.STATUS_RUNNING
+        task.save(update_fields=["status", "updated_at"])
+        return ""
+    env = {"OFFICESUD_DB_PATH": settings.OFFICESUD_DB_PATH}
+    if BROWSER_CACHE_DIR:
+        env["OFFICESUD_BROWSER_CACHE_DIR"] = str(BROWSER_CACHE_DIR)
+        env["OFFICESUD_BROWSER_CACHE_MAX_MB"] = str(BROWSER_CACHE_MAX_MB)
+    cmd = [task.batch_id, "--shards", str(BATCH_SHARDS)]
+    if PREPROCESS_DOCUMENTS:
+        cmd.append("--preprocess")
+    try:
+        container_id = get_docker_client().run_container(
+            PLAYWRIGHT_IMAGE,
+            cmd=cmd,
+            env=env,
+            volumes_from=[DOCKER_DJANGO_CONTAINER],
+            labels={"officesud.task_id": str(task.pk), "officesud.batch_id": task.batch_id},
+        )
+    except (DockerError, OSError) as e:
+        logger.error("Failed to start worker for %s: %s", task.batch_id, e)
+        task.status = OfficeSudTask.STATUS_ERROR
+        task.last_error = str(e)
+        task.save(update_fields=["status", "last_error", "updated_at"])
+        raise
+
+    logger.info("Worker started for batch_id=%s, container_id=%s", task.batch_id, container_id)
+    task.container_id = container_id
+    task.status = OfficeSudTask.STATUS_RUNNING
+    task.save(update_fields=["status", "container_id", "updated_at"])
+    return container_id
+
+
+def get_container_status(task: OfficeSudTask) -> dict:
+    if not task.container_id:
+        return {"state": None, "running": False, "exit_code": None}
+    return get_docker_client().container_status(task.container_id)
+
+
+def remove_container(container_id: str) -> None:
+    """Удаляет завершившийся контейнер воркера; уже удалённый — не ошибка."""
+    if not container_id:
+        return
+    try:
+        get_docker_client().remove_container(container_id)
+    except ContainerNotFound:
+        pass
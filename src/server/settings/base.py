@@ -152,3 +152,41 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 OFFICESUD_PLAYWRIGHT_IMAGE = "dj_pw_officesud_worker:latest"
 OFFICESUD_UPLOAD_DIR = BASE_DIR / "officesud_uploads"
 PLAYWRIGHT_MAX_WORKERS = 10
+
+DOCKER_SOCKET_PATH = os.environ.get("DOCKER_SOCKET_PATH", "/var/run/docker.sock")
+DOCKER_API_VERSION = "v1.41"
+
+OFFICESUD_RECONCILE_INTERVAL = 30
+OFFICESUD_PENDING_TIMEOUT = 300
+OFFICESUD_AUTO_REQUEUE = False
+OFFICESUD_MAX_REQUEUES = 2
+OFFICESUD_CANCEL_GRACE = 60
+OFFICESUD_HEARTBEAT_DEAD_SECONDS = 60
+OFFICESUD_HEARTBEAT_STALL_SECONDS = 300
+
+# docker — отдельный контейнер на пакет; remote — пакеты разбирают воркеры через worker API
+OFFICESUD_WORKER_MODE = os.environ.get("OFFICESUD_WORKER_MODE", "docker")
+OFFICESUD_WORKER_TOKEN = os.environ.get("OFFICESUD_WORKER_TOKEN", "")
+# Токен внешних систем для ленты изменений дел (/office-sud/changes/); пусто — только staff
+OFFICESUD_CHANGES_TOKEN = os.environ.get("OFFICESUD_CHANGES_TOKEN", "")
+OFFICESUD_LEASE_SECONDS = 900
+OFFICESUD_MAX_CASE_ATTEMPTS = 3
+# Сколько воркеров (процессов с браузером) параллельно разбирают один пакет в docker-режиме
+OFFICESUD_BATCH_SHARDS = int(os.environ.get("OFFICESUD_BATCH_SHARDS", "1"))
+# Группировать дела пакета по региону/суду, даже если пользователь не отметил это при загрузке
+OFFICESUD_OPTIMIZE_CASE_ORDER = False
+# Постоянные профили Chromium с HTTP-кэшем для воркеров; пусто — каждый запуск с пустым кэшем
+OFFICESUD_BROWSER_CACHE_DIR = os.environ.get("OFFICESUD_BROWSER_CACHE_DIR", "")
+OFFICESUD_BROWSER_CACHE_MAX_MB = 512
+# Сжимать PDF и изображения пакета перед подачей (в контейнере воркера, нужны pikepdf/Pillow)
+OFFICESUD_PREPROCESS_DOCUMENTS = os.environ.get("OFFICESUD_PREPROCESS_DOCUMENTS", "0") in ("1", "true", "True")
+# Дела, уже поданные в других пакетах, при загрузке: flag — на разбор, skip — не загружать, allow — подать снова
+OFFICESUD_DUPLICATE_CASES = os.environ.get("OFFICESUD_DUPLICATE_CASES", "flag")
+# Сколько файлов Excel можно загрузить одним пакетом (листы разбираются в пуле процессов)
+OFFICESUD_IMPORT_MAX_FILES = 20
+# Хранение: завершённые пакеты старше N дней уходят в сжатый архив (officesud_retention)
+OFFICESUD_ARCHIVE_AFTER_DAYS = 30
+OFFICESUD_UPLOAD_ORPHAN_HOURS = 24
+OFFICESUD_DOCUMENT_RETENTION_DAYS = 30
+OFFICESUD_VACUUM_FREE_RATIO = 0.25
+OFFICESUD_RETENTION_INTERVAL = 86400